@@ -81,11 +81,6 @@ import sys
 import subprocess
 from subprocess import Popen, CREATE_NEW_CONSOLE
 
-
-# For accessing functions from DLL
-import ctypes
-from ctypes import *
-
 try:
     sys.path.append(glob.glob('../carla/dist/carla-*%d.%d-%s.egg' % (
         sys.version_info.major,
@@ -94,6 +89,9 @@ try:
 except IndexError:
     pass
 
+# Shared motion platform modules (Chitsein-SmartCitiesREU-Scripts/smartcities)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 
 # ==============================================================================
 # -- imports -------------------------------------------------------------------
@@ -111,9 +109,25 @@ import logging
 import math
 import random
 import re
+import time
 import weakref
 import math
 
+from smartcities.controls.calibration import input_layout
+from smartcities.controls.force_feedback import ForceFeedback, LogitechWheelSDK, SteeringSampler
+from smartcities.controls.input_device import BACKENDS, DEFAULT_BACKEND, InputDeviceService, create_backend
+from smartcities.motion.blue_tiger import FakeBlueTiger
+from smartcities.motion.config import load_eleetus_config
+from smartcities.motion.eleetus import MotionPlatform
+from smartcities.motion.extrapolation import KinematicsPredictor
+from smartcities.motion.headless import TickRateMeter
+from smartcities.motion.kinematics import KinematicsSampler
+from smartcities.motion.scheduler import MotionScheduler, SnapshotSlot
+from smartcities.motion.telemetry import TelemetryRecorder
+from smartcities.motion.tracing import LatencyTracer, NullTracer
+from smartcities.motion.udp import MotionUdpPublisher, parse_address
+from smartcities.sensors.lidar import LidarRasterizer
+
 try:
     import pygame
     from pygame.locals import KMOD_CTRL
@@ -219,6 +233,8 @@ class World(object):
     def __init__(self, carla_world, hud, args):
         self.world = carla_world
         self.sync = args.sync
+        # Headless batch run: no camera is streamed
+        self.headless = args.headless
         self.actor_role_name = args.rolename
         try:
             self.map = self.world.get_map()
@@ -240,6 +256,10 @@ class World(object):
         self._actor_filter = args.filter
         self._actor_generation = args.generation
         self._gamma = args.gamma
+        # Hero kinematics of the current frame, shared by the HUD, the motion platform and the loggers
+        self.kinematics = KinematicsSampler(self.world, self.sync)
+        # Road wheel angle and lateral acceleration of the hero, for the wheel force feedback
+        self.steering = SteeringSampler(carla.VehicleWheelLocation.FL_Wheel)
         self.restart()
         self.world.on_tick(hud.on_world_tick)
         self.recording_enabled = False
@@ -313,7 +333,10 @@ class World(object):
         self.imu_sensor = IMUSensor(self.player)
         self.camera_manager = CameraManager(self.player, self.hud, self._gamma)
         self.camera_manager.transform_index = cam_pos_index
-        self.camera_manager.set_sensor(cam_index, notify=False)
+        if not self.headless:
+            self.camera_manager.set_sensor(cam_index, notify=False)
+        self.kinematics.set_actor(self.player)
+        self.steering.set_actor(self.player)
         actor_type = get_actor_display_name(self.player)
         self.hud.notification(actor_type)
 
@@ -361,6 +384,7 @@ class World(object):
             pass
 
     def tick(self, clock):
+        self.kinematics.update()
         self.hud.tick(self, clock)
 
     def render(self, display):
@@ -396,7 +420,7 @@ class World(object):
 
 class KeyboardControl(object):
     """Class that handles keyboard input."""
-    def __init__(self, world, start_in_autopilot, joystick, args):
+    def __init__(self, world, start_in_autopilot, input_device, args):
         self._autopilot_enabled = start_in_autopilot
         self._ackermann_enabled = False
         self._ackermann_reverse = 1
@@ -415,60 +439,45 @@ class KeyboardControl(object):
         self._steer_cache = 0.0
         world.hud.notification("Press 'H' or '?' for help.", seconds=4.0)
 
-        # Joystick additions
-        self.joystick = joystick
-        self.wheel_axis_val = 0
-        self.right_pedal_axis_val = 1
-        self.middle_pedal_axis_val = 1
-        self.left_pedal_axis_val = 1
-        self.wheel_sensitivity = float(args.wheel_sensitivity)
+        # Joystick additions, the wheel and pedals are polled by the InputDeviceService thread
+        self.input_device = input_device
+        self.input_state = input_device.latest()
+        self.use_pedals = args.pedals
+        self.wheel_sensitivity = args.motion_config.wheel_sensitivity
         self.joystick_in_use = True
 
 
-    # Axis 0: wheel
-    # Axis 1: rightmost pedal
-    # Axis 2: middle pedal
-    # Axis 4: leftmost pedal
     def get_joystick_input(self):
-        if (self.wheel_axis_val != self.joystick.get_axis(0) or self.right_pedal_axis_val != self.joystick.get_axis(1) or  self.middle_pedal_axis_val != self.joystick.get_axis(2) or  self.left_pedal_axis_val != self.joystick.get_axis(4)):
-            self.wheel_axis_val = self.joystick.get_axis(0)
-
-            # ***Issues with getting pedals working, so commenting out these pedal axis vals for now***
-
-            # self.right_pedal_axis_val = self.joystick.get_axis(1)
-            # self.middle_pedal_axis_val = self.joystick.get_axis(2)
-            # self.left_pedal_axis_val = self.joystick.get_axis(4)
+        # Latest calibrated state of the wheel and pedals (see smartcities.controls.input_device)
+        if not self.input_device.threaded:
+            # SDL is not thread safe, the pygame wheel is read here once per frame after the events are pumped
+            pygame.event.pump()
+            self.input_device.poll()
+        self.input_state = self.input_device.latest()
 
 
     def _parse_joystick_input(self):
-        
-        # Temporary fix while pedals are broken
-        # Top right red button on wheel controls acceleration
-        # Top left white button on wheel controls brakes
+        state = self.input_state
 
-        if self.joystick.get_button(3):
-            self._control.throttle = min(self._control.throttle + 0.01, 1.00)
+        if self.use_pedals:
+            self._control.throttle = state.throttle
+            self._control.brake = state.brake
         else:
-            self._control.throttle = 0
+            # Temporary fix while pedals are broken (enable them with --pedals)
+            # Top right red button on wheel controls acceleration
+            # Top left white button on wheel controls brakes
 
-        if self.joystick.get_button(7):
-            self._control.brake = min(self._control.brake + 0.2, 1)
-        else:
-            self._control.brake = 0
-
-        # ***Issues with getting pedals working, so commenting out these pedal axis vals for now***
+            if state.pressed(3):
+                self._control.throttle = min(self._control.throttle + 0.01, 1.00)
+            else:
+                self._control.throttle = 0
 
-        # if self.right_pedal_axis_val < 0.99:
-        #     self._control.throttle = (1 - self.right_pedal_axis_val)/2
-        # else:
-        #     self._control.throttle = 0
-        
-        # if self.middle_pedal_axis_val < 0.75:
-        #     self._control.brake = (1 - self.middle_pedal_axis_val)/2
-        # else:
-        #     self._control.brake = 0
+            if state.pressed(7):
+                self._control.brake = min(self._control.brake + 0.2, 1)
+            else:
+                self._control.brake = 0
 
-        self._steer_cache = self.wheel_sensitivity * self.wheel_axis_val
+        self._steer_cache = self.wheel_sensitivity * state.steer
         self._control.steer = self._steer_cache
 
 
@@ -808,10 +817,10 @@ class HUD(object):
 
     def tick(self, world, clock):
         self._notifications.tick(world, clock)
-        if not self._show_info:
+        if not self._show_info or world.kinematics.kinematics is None:
             return
-        t = world.player.get_transform()
-        v = world.player.get_velocity()
+        t = world.kinematics.kinematics.transform
+        v = world.kinematics.kinematics.velocity
         c = world.player.get_control()
         compass = world.imu_sensor.compass
         heading = 'N' if compass > 270.5 or compass < 89.5 else ''
@@ -1271,6 +1280,8 @@ class CameraManager(object):
                     bp.set_attribute(attr_name, attr_value)
                     if attr_name == 'range':
                         self.lidar_range = float(attr_value)
+                # Bird's-eye view image and scratch arrays kept from one sweep to the next
+                self.lidar_rasterizer = LidarRasterizer(hud.dim[0], hud.dim[1], self.lidar_range)
 
             item.append(bp)
         self.index = None
@@ -1324,18 +1335,8 @@ class CameraManager(object):
         if not self:
             return
         if self.sensors[self.index][0].startswith('sensor.lidar'):
-            points = np.frombuffer(image.raw_data, dtype=np.dtype('f4'))
-            points = np.reshape(points, (int(points.shape[0] / 4), 4))
-            lidar_data = np.array(points[:, :2])
-            lidar_data *= min(self.hud.dim) / (2.0 * self.lidar_range)
-            lidar_data += (0.5 * self.hud.dim[0], 0.5 * self.hud.dim[1])
-            lidar_data = np.fabs(lidar_data)  # pylint: disable=E1111
-            lidar_data = lidar_data.astype(np.int32)
-            lidar_data = np.reshape(lidar_data, (-1, 2))
-            lidar_img_size = (self.hud.dim[0], self.hud.dim[1], 3)
-            lidar_img = np.zeros((lidar_img_size), dtype=np.uint8)
-            lidar_img[tuple(lidar_data.T)] = (255, 255, 255)
-            self.surface = pygame.surfarray.make_surface(lidar_img)
+            # make_surface copies the image, the rasterizer draws the next sweep into it
+            self.surface = pygame.surfarray.make_surface(self.lidar_rasterizer.rasterize(image.raw_data))
         elif self.sensors[self.index][0].startswith('sensor.camera.dvs'):
             # Example of converting the raw_data from a carla.DVSEventArray
             # sensor into a NumPy array and using it as an image
@@ -1364,247 +1365,19 @@ class CameraManager(object):
 
 
 # ==============================================================================
-# -- Motion Platform -------------------------------------------------------------
+# -- game_loop() ---------------------------------------------------------------
 # ==============================================================================
 
 
-class MotionPlatform(object):
-    def __init__(self, args):
-        # Load Eleetus Blue Tiger DLL into memory
-        self.blue_tiger_api = ctypes.WinDLL(args.dll_path)
-
-        self.blue_tiger_init = self.blue_tiger_api['BTInit']
-        self.blue_tiger_init.argtypes = (
-            ctypes.c_char_p, # Company name (null-terminated character string of up to 40 characters)
-            ctypes.c_char_p, # Software product name (null-terminated character string of up to 40 characters)
-            ctypes.c_char_p # Software version (null-terminated character string of up to 40 characters)
-        )
-        self.blue_tiger_init.restype = ctypes.c_ushort
-
-        company = "Chitsein Htun - UNLV Smart Cities REU"
-        product = "Manual Control - Eleetus"
-        version = "v1.0"
-
-        company_char_p = company.encode('utf-8')
-        product_char_p = product.encode('utf-8')
-        version_char_p = version.encode('utf-8')
-
-        return_code = self.blue_tiger_init(ctypes.c_char_p(company_char_p), ctypes.c_char_p(product_char_p), ctypes.c_char_p(version_char_p))
-
-        while return_code != 0 and args.no_motion != True:
-            print("return code error: " + str(return_code))
-            decision = input("There was an error with initializing the Blue Tiger Motion Platform. Would you like to continue without motion? (Y/N)")
-            if decision.upper() == "Y":
-                args.no_motion = True
-                return
-            elif decision.upper() == "N":
-                return_code = self.blue_tiger_init(ctypes.c_char_p(company_char_p), ctypes.c_char_p(product_char_p), ctypes.c_char_p(version_char_p))
-
-        if return_code == 0:
-            print("Blue Tiger Initialization was successful.")
-
-        # For calculating angular acceleration later on
-        self.last_tick = None
-        self.prev_rot_vel = None
-
-        # Sensitivity parameters
-        self.distance_sensitivity = float(args.distance_sensitivity)
-        self.rotational_sensitivity = float(args.rotational_sensitivity)
-
-        # Function parameters
-        self.function_call_hertz = float(args.function_call_hertz)
-
-        # ***DLL Function Definition Set Up***
-
-        # Pitch Roll Data
-        self.blue_tiger_pitch_roll_data = self.blue_tiger_api['BTPitchRollData']
-        self.blue_tiger_pitch_roll_data.argtypes = (
-            ctypes.c_float, # pitch
-            ctypes.c_float # roll
-        )
-        self.blue_tiger_pitch_roll_data.restype = ctypes.c_ushort
-
-        # Rotation Vector Data
-        self.blue_tiger_pitch_rotation_vector_data = self.blue_tiger_api['BTRotationVectorData']
-        self.blue_tiger_pitch_rotation_vector_data.argtypes = (
-            ctypes.c_float, # xRotation
-            ctypes.c_float, # yRotation
-            ctypes.c_float, # zRotation
-            ctypes.c_float # aRotation
-        )
-        self.blue_tiger_pitch_rotation_vector_data.restype = ctypes.c_ushort
-
-        # Acceleration Data
-        self.blue_tiger_acceleration_data = self.blue_tiger_api['BTAccelerationData']
-        self.blue_tiger_acceleration_data.argtypes = (
-            ctypes.c_float, # xAccel
-            ctypes.c_float, # yAccel
-            ctypes.c_float, # zAccel
-            ctypes.c_float, # xRotAccel
-            ctypes.c_float, # yRotAccel
-            ctypes.c_float, # zRotAccel
-            ctypes.c_float, # xForward
-            ctypes.c_float, # yForward
-            ctypes.c_float, # zForward
-            ctypes.c_float, # xRight
-            ctypes.c_float, # yRight
-            ctypes.c_float # zRight
-        )
-        self.blue_tiger_acceleration_data.restype = ctypes.c_ushort
-
-        # Pause
-        self.blue_tiger_pause = self.blue_tiger_api['BTPause']
-        self.blue_tiger_pause.argtypes = None
-        self.blue_tiger_pause.restype = ctypes.c_ushort
-
-        # Resume
-        self.blue_tiger_resume = self.blue_tiger_api['BTResume']
-        self.blue_tiger_resume.argtypes = None
-        self.blue_tiger_resume.restype = ctypes.c_ushort
-
-        # Shutdown
-        self.blue_tiger_shutdown = self.blue_tiger_api['BTShutdown']
-        self.blue_tiger_shutdown.argtypes = None
-        self.blue_tiger_shutdown.restype = ctypes.c_ushort
-
-        # Status
-        self.blue_tiger_status = self.blue_tiger_api["BTStatus"]
-        self.blue_tiger_status.argtypes = None
-        self.blue_tiger_status.restype = ctypes.c_ushort
-
-
-        self.last_function_call_time = None
-
-        # More functions can be included from the API documentation folder. These are only the few functions that may be used within this program.
-
-    def status(self):
-        return self.blue_tiger_status()
-
-    def pause(self):
-        return_code = self.blue_tiger_pause()
-        if return_code != 0:
-            print("Failed to pause Eleetus Blue Tiger Motion Platform")
-
-    def resume(self):
-        return_code = self.blue_tiger_resume()
-        if return_code != 0:
-            print("Failed to resume Eleetus Blue Tiger Motion Platform")
-
-    def shutdown(self):
-        return_code = self.blue_tiger_shutdown()
-        if return_code != 0:
-            print("Failed to shutdown Eleetus Blue Tiger Motion Platform")
-    
-    def update_motion_platform(self, rotation, accel_vector, rot_velocity_vector, local_forward_vector, local_right_vector, time):
-
-        # Important Information about world axis for Eleetus Blue Tiger Motion Platform API:
-        # Forward vector -> A vector that defines the local negative z-axis in world coordinates.
-        # Right vector   -> A vector that defines the local positive x-axis in world coordinates.
-        # Up vector      -> A vector that defines the local positive y-axis in world coordinates.
-
-        # In Carla, positive x is forward vector, positive y is right vector, and positive z is up vector
-
-        # Angles are in radians -> Carla angles are in degrees, so must convert.
-        pitch_raw = rotation.pitch * self.rotational_sensitivity * math.pi / 180
-        yaw_raw = rotation.yaw * self.rotational_sensitivity * math.pi / 180
-        roll_raw = rotation.roll * self.rotational_sensitivity * math.pi / 180
-
-        if (pitch_raw > math.pi / 4):
-            pitch_raw = math.pi / 4
-        if (pitch_raw < -1 * math.pi / 4):
-            pitch_raw = -1 * math.pi / 4
-        if (yaw_raw > math.pi / 4):
-            yaw_raw = math.pi / 4
-        if (yaw_raw < -1 * math.pi / 4):
-            yaw_raw = -1 * math.pi / 4
-        if (roll_raw > math.pi / 4):
-            roll_raw = math.pi / 4
-        if (roll_raw < -1 * math.pi / 4):
-            roll_raw = -1 * math.pi / 4 
-
-        pitch = ctypes.c_float(pitch_raw)
-        yaw = ctypes.c_float(yaw_raw)
-        roll = ctypes.c_float(roll_raw)
-
-
-        # Refer to API Documentation for more details
-        
-        # If first pass through, set the values
-        if (self.last_function_call_time == None):
-            self.last_function_call_time = time.get_ticks()
-        if (self.last_tick == None):
-            self.last_tick = time.get_ticks()
-        if (self.prev_rot_vel == None):
-            self.prev_rot_vel = rot_velocity_vector
-
-        delta_t = time.get_ticks() - self.last_tick
-        
-        # Calculate rotational acceleration vector
-        if delta_t > 0:
-            xRotAccel_float = (rot_velocity_vector.x - self.prev_rot_vel.x) / delta_t
-            yRotAccel_float = (rot_velocity_vector.y - self.prev_rot_vel.y) / delta_t
-            zRotAccel_float = (rot_velocity_vector.z - self.prev_rot_vel.z) / delta_t
-        else:
-            xRotAccel_float = 0.0
-            yRotAccel_float = 0.0
-            zRotAccel_float = 0.0
-
-        # Keep in mind that carla coordinate system is translated to BT coordinate system
-        xAccel = ctypes.c_float(accel_vector.y * self.distance_sensitivity)
-        yAccel = ctypes.c_float(accel_vector.z * self.distance_sensitivity)
-        zAccel = ctypes.c_float(-1 * accel_vector.x * self.distance_sensitivity)
-        xRotAccel = ctypes.c_float(yRotAccel_float * self.rotational_sensitivity)
-        yRotAccel = ctypes.c_float(zRotAccel_float * self.rotational_sensitivity)
-        zRotAccel = ctypes.c_float(-1 * xRotAccel_float * self.rotational_sensitivity)
-        xForward = ctypes.c_float(local_forward_vector.y)
-        yForward = ctypes.c_float(local_forward_vector.z)
-        zForward = ctypes.c_float(-1 * local_forward_vector.x)
-        xRight = ctypes.c_float(local_right_vector.y)
-        yRight = ctypes.c_float(local_right_vector.z)
-        zRight = ctypes.c_float(-1 * local_right_vector.x)
-
-
-        # Call motion function every time period
-        if time.get_ticks() - self.last_function_call_time > (1000 / self.function_call_hertz):
-            status = self.blue_tiger_status()
-            # print("pitch: " + str(pitch))
-            # print("roll: " + str(roll))
-            # print("Status code: " + str(status))
-            # print("xAccel: " + str(xAccel))
-            # print("yAccel: " + str(yAccel))
-            # print("zAccel: " + str(zAccel))
-            # print("xRotAccel: " + str(xRotAccel))
-            # print("yRotAccel: " + str(yRotAccel))
-            # print("zRotAccel: " + str(zRotAccel))
-            # print("xForward: " + str(xForward))
-            # print("yForward: " + str(yForward))
-            # print("zForward: " + str(zForward))
-            # print("xRight: " + str(xRight))
-            # print("yRight: " + str(yRight))
-            # print("zRight: " + str(zRight))
-            self.last_function_call_time = time.get_ticks()
-
-            # Using pitch roll data
-            # return_code = self.blue_tiger_pitch_roll_data(pitch, roll)
-
-            # Using acceleration data
-            return_code = self.blue_tiger_acceleration_data(xAccel, yAccel, zAccel, xRotAccel, yRotAccel, zRotAccel, xForward, yForward, zForward, xRight, yRight, zRight)
-
-            if return_code != 0:
-                print("Failed to move Eleetus Blue Tiger Motion Platform")
-        
-
-        # Store the last time and rotational velocity values
-        self.last_tick = time.get_ticks()
-        self.prev_rot_vel = rot_velocity_vector
-
-        
-
-
-
-# ==============================================================================
-# -- game_loop() ---------------------------------------------------------------
-# ==============================================================================
+def motion_sample(kinematics):
+    """Snapshot of the motion thread: (frame, arguments of update_motion_platform())."""
+    return (kinematics.frame, (
+        kinematics.transform.rotation,
+        kinematics.acceleration,
+        kinematics.angular_velocity,
+        kinematics.forward,
+        kinematics.right
+        ))
 
 
 def game_loop(args):
@@ -1612,6 +1385,13 @@ def game_loop(args):
     pygame.font.init()
     world = None
     original_settings = None
+    motion_scheduler = None
+    recorder = None
+    motion_udp = None
+    input_device = None
+    force_feedback_scheduler = None
+    meter = None
+    tracer = NullTracer()
 
     try:
         client = carla.Client(args.host, args.port)
@@ -1624,6 +1404,8 @@ def game_loop(args):
             if not settings.synchronous_mode:
                 settings.synchronous_mode = True
                 settings.fixed_delta_seconds = 0.05
+            if args.headless:
+                settings.fixed_delta_seconds = args.fixed_delta
             sim_world.apply_settings(settings)
 
             traffic_manager = client.get_trafficmanager()
@@ -1633,24 +1415,77 @@ def game_loop(args):
             print("WARNING: You are currently in asynchronous mode and could "
                   "experience some issues with the traffic simulation")
 
-        display = pygame.display.set_mode(
-            (args.width, args.height),
-            pygame.HWSURFACE | pygame.DOUBLEBUF)
-        display.fill((0,0,0))
-        pygame.display.flip()
+        if not args.headless:
+            display = pygame.display.set_mode(
+                (args.width, args.height),
+                pygame.HWSURFACE | pygame.DOUBLEBUF)
+            display.fill((0,0,0))
+            pygame.display.flip()
+
+            pygame.joystick.init()
+            joysticks = [pygame.joystick.Joystick(i) for i in range(pygame.joystick.get_count())]
+            # for joystick in joysticks:
+            #     print(joystick.get_name())
 
-        pygame.joystick.init()
-        joysticks = [pygame.joystick.Joystick(i) for i in range(pygame.joystick.get_count())]
-        # for joystick in joysticks:
-        #     print(joystick.get_name())
+        if args.trace:
+            tracer = LatencyTracer()
+            sim_world.on_tick(lambda snapshot: tracer.mark('server_tick', snapshot.frame))
 
         hud = HUD(args.width, args.height)
         world = World(sim_world, hud, args)
-        # **Assumption that Logitech G27 joystick is the first one in the list**
-        controller = KeyboardControl(world, args.autopilot, joysticks[0], args)
-        motion_platform = MotionPlatform(args)
-        if args.no_motion:
+        if args.headless:
+            # No driver in the batch runs, see smartcities.motion.headless
+            world.player.set_autopilot(True)
+        else:
+            # **Assumption that Logitech G27 joystick is the first one in the list**
+            # Axis mapping of the wheel from its calibration profile (util/calibrate_wheel.py)
+            input_backend = create_backend(args.input_backend, joysticks[0] if joysticks else None)
+            input_device = InputDeviceService(
+                input_backend, layout=input_layout(args.calibration, input_backend, args.driver), rate_hz=args.input_rate)
+            if input_device.threaded:
+                input_device.start()
+            controller = KeyboardControl(world, args.autopilot, input_device, args)
+        if args.force_feedback and not args.headless:
+            # The wheel torque is computed and sent from its own thread, the render loop only
+            # publishes the steering state of each frame
+            force_feedback = ForceFeedback(LogitechWheelSDK(args.force_feedback_dll))
+            force_feedback_snapshot = SnapshotSlot()
+            force_feedback_scheduler = MotionScheduler(
+                force_feedback_snapshot,
+                force_feedback.update,
+                args.force_feedback_rate,
+                name='ForceFeedback',
+                label='force feedback')
+            force_feedback_scheduler.start()
+        if args.motion_udp:
+            # The motion platform is driven by util/motion_udp_receiver.py on the rig host
+            motion_udp = MotionUdpPublisher(parse_address(args.motion_udp, '127.0.0.1'))
             motion_platform = None
+        else:
+            motion_platform = MotionPlatform(args, FakeBlueTiger() if args.fake_motion else None)
+        if args.no_motion or motion_udp is not None:
+            motion_platform = None
+        else:
+            # Optional latency compensation in front of the platform
+            predictor = KinematicsPredictor(args.predict_latency) if args.predict_latency > 0 else None
+
+            def drive_motion_platform(sample, timestamp):
+                frame, motion = sample
+                begin = tracer.begin()
+                if predictor is not None:
+                    motion = predictor.predict_motion(*motion, timestamp)
+                motion_platform.update_motion_platform(*motion, timestamp)
+                tracer.end('update_motion_platform', begin, frame)
+
+            # The platform is driven from its own thread at function_call_hertz, the render loop
+            # only publishes the latest kinematics
+            motion_snapshot = SnapshotSlot()
+            motion_scheduler = MotionScheduler(
+                motion_snapshot,
+                drive_motion_platform,
+                motion_platform.function_call_hertz)
+            motion_scheduler.start()
+        recorder = TelemetryRecorder(args.record) if args.record else None
         
 
 
@@ -1659,29 +1494,118 @@ def game_loop(args):
         else:
             sim_world.wait_for_tick()
 
+        if args.headless:
+            # Fixed step batch run: each tick waits until the motion thread took the sample of
+            # the previous one, so the server runs as fast as the platform consumes the samples.
+            # The UDP samples are paced to real time for the rig host, --no_motion runs unpaced.
+            if motion_udp is not None:
+                waiting_for = 'real time'
+            elif motion_scheduler is not None:
+                waiting_for = 'the motion stack'
+            else:
+                waiting_for = None
+                print('Warning: nothing paces the headless run with --no_motion, the server ticks as fast as it can')
+            meter = TickRateMeter(args.fixed_delta, args.report_interval, waiting_for=waiting_for)
+            meter.begin()
+            while not args.ticks or meter.ticks < args.ticks:
+                loop_begin = tracer.begin()
+                sim_world.tick()
+                kinematics = world.kinematics.update()
+                frame = kinematics.frame if kinematics is not None else -1
+                if recorder is not None:
+                    recorder.record(kinematics)
+                waited = 0.0
+                if motion_udp is not None and kinematics is not None:
+                    begin = tracer.begin()
+                    motion_udp.publish(kinematics)
+                    tracer.end('motion_udp_publish', begin, frame)
+                    waited = meter.pace()
+                elif motion_scheduler is not None and kinematics is not None:
+                    seq = motion_snapshot.publish(motion_sample(kinematics), kinematics.timestamp)
+                    begin = time.perf_counter()
+                    if not motion_scheduler.wait_consumed(seq, timeout=1.0) and motion_scheduler.error is not None:
+                        raise motion_scheduler.error
+                    waited = time.perf_counter() - begin
+                tracer.end('game_loop', loop_begin, frame)
+                report = meter.tick(waited)
+                if report is not None:
+                    print(report)
+            return
+
         clock = pygame.time.Clock()
-        time = pygame.time
         while True:
+            # A thread that failed keeps its error, the drive does not go on without the platform or the wheel
+            for scheduler in (motion_scheduler, force_feedback_scheduler):
+                if scheduler is not None and scheduler.error is not None:
+                    raise scheduler.error
+            loop_begin = tracer.begin()
             if args.sync:
                 sim_world.tick()
             clock.tick_busy_loop(60)
+            begin = tracer.begin()
             if controller.parse_events(client, world, clock, args.sync):
                 return
+            tracer.end('parse_events', begin)
+            begin = tracer.begin()
             world.tick(clock)
+            kinematics = world.kinematics.kinematics
+            frame = kinematics.frame if kinematics is not None else -1
+            tracer.end('World.tick', begin, frame)
+            if force_feedback_scheduler is not None:
+                force_feedback_snapshot.publish(world.steering.sample(kinematics))
+            begin = tracer.begin()
             world.render(display)
+            tracer.end('World.render', begin, frame)
+            begin = tracer.begin()
             pygame.display.flip()
-            if args.no_motion == False:
-                motion_platform.update_motion_platform(
-                world.player.get_transform().rotation,
-                world.player.get_acceleration(),
-                world.player.get_angular_velocity(),
-                world.player.get_transform().get_forward_vector(),
-                world.player.get_transform().get_right_vector(),
-                time
-                )
+            tracer.end('display.flip', begin, frame)
+            if recorder is not None:
+                recorder.record(kinematics)
+            if motion_udp is not None and kinematics is not None:
+                begin = tracer.begin()
+                motion_udp.publish(kinematics)
+                tracer.end('motion_udp_publish', begin, frame)
+            elif args.no_motion == False and kinematics is not None:
+                motion_snapshot.publish(motion_sample(kinematics), kinematics.timestamp)
+            tracer.end('game_loop', loop_begin, frame)
 
     finally:
 
+        if meter is not None:
+            print(meter)
+
+        if input_device is not None:
+            input_device.stop()
+            print(input_device)
+
+        if force_feedback_scheduler is not None:
+            force_feedback_scheduler.stop()
+            force_feedback.close()
+            print(force_feedback_scheduler.stats)
+
+        if motion_scheduler is not None:
+            motion_scheduler.stop()
+            print(motion_scheduler.stats)
+
+        if recorder is not None:
+            recorder.close()
+
+        if motion_udp is not None:
+            motion_udp.close()
+            print('%d motion packets sent, %d send errors' % (motion_udp.seq, motion_udp.send_errors))
+
+        if isinstance(tracer, LatencyTracer):
+            # Without motion there is no stage the server tick leads to
+            if motion_udp is not None:
+                latencies = [('server_tick', 'motion_udp_publish')]
+            elif args.no_motion:
+                latencies = []
+            else:
+                latencies = [('server_tick', 'update_motion_platform')]
+            print(tracer.report(latencies))
+            tracer.export_chrome_trace(args.trace)
+            print('Chrome trace written to ' + args.trace)
+
         try:
             motion_platform.shutdown()
             print("motion platform shutdown successfully.")
@@ -1726,7 +1650,7 @@ def main():
         metavar='config_path',
         default="null",
         type=str,
-        help='config_path set automatically to simcraft_config.txt in current working directory')
+        help='config_path set automatically to config_eleetus.txt in current working directory (.toml and .json files are also accepted)')
     argparser.add_argument(
         '--dll_path',
         metavar='dll_path',
@@ -1737,6 +1661,104 @@ def main():
         '--no_motion',
         action='store_true',
         help='start driving simulation without motion platform capabilities')
+    argparser.add_argument(
+        '--fake_motion',
+        action='store_true',
+        help='use a fake Blue Tiger API instead of the DLL (for testing without the motion platform)')
+    argparser.add_argument(
+        '--washout',
+        action='store_true',
+        help='drive the motion platform with washout filter cues (BTPitchRollData) instead of the raw vehicle '
+             'accelerations (BTAccelerationData); rotational_sensitivity then has no effect and distance_sensitivity '
+             'scales the cues. Not validated on the platform yet')
+    argparser.add_argument(
+        '--motion_udp',
+        metavar='HOST:PORT',
+        default=None,
+        help='send the kinematics to util/motion_udp_receiver.py on the motion rig host instead of driving the platform from this process (default port: 2070)')
+    argparser.add_argument(
+        '--predict_latency',
+        metavar='SECONDS',
+        default=0.0,
+        type=float,
+        help='extrapolate the motion cues by this latency, e.g. the median of --trace (default: 0, off)')
+    argparser.add_argument(
+        '--input_backend',
+        choices=BACKENDS,
+        default=DEFAULT_BACKEND,
+        help='how the wheel and pedals are read: winmm (joyGetPosEx, Windows only), pygame or synthetic (scripted '
+             'drive, no wheel needed). Only winmm and synthetic are sampled in the background at --input_rate, pygame '
+             'is sampled at the render rate, once per frame, as SDL is not thread safe '
+             '(default: winmm on Windows, pygame elsewhere)')
+    argparser.add_argument(
+        '--input_rate',
+        metavar='HZ',
+        default=500.0,
+        type=float,
+        help='poll rate of the wheel and pedals by the input thread, not used by the pygame backend, which is polled at the render rate (default: 500)')
+    argparser.add_argument(
+        '--pedals',
+        action='store_true',
+        help='drive with the throttle and brake pedals instead of the wheel buttons 3 and 7')
+    argparser.add_argument(
+        '--calibration',
+        metavar='calibration',
+        default="null",
+        type=str,
+        help='calibration set automatically to calibration_profiles.json in current working directory, see util/calibrate_wheel.py')
+    argparser.add_argument(
+        '--driver',
+        metavar='NAME',
+        default=None,
+        help='use the wheel calibration profile of this driver (default: the default profile of the wheel)')
+    argparser.add_argument(
+        '--force_feedback',
+        action='store_true',
+        help='steering wheel force feedback (centering, self-aligning torque and road feel) through the Logitech Steering Wheel SDK')
+    argparser.add_argument(
+        '--force_feedback_dll',
+        metavar='force_feedback_dll',
+        default="null",
+        type=str,
+        help='force_feedback_dll set automatically to LogitechSteeringWheelEnginesWrapper.dll in current working directory')
+    argparser.add_argument(
+        '--force_feedback_rate',
+        metavar='HZ',
+        default=200.0,
+        type=float,
+        help='update rate of the wheel torque (default: 200)')
+    argparser.add_argument(
+        '--headless',
+        action='store_true',
+        help='batch run without window, camera or driver input: the hero drives on autopilot and the server is ticked in synchronous mode as fast as the motion platform consumes the samples')
+    argparser.add_argument(
+        '--fixed_delta',
+        metavar='SECONDS',
+        default=0.05,
+        type=float,
+        help='simulation step of the headless run, also the tick period when the samples go over UDP (default: 0.05)')
+    argparser.add_argument(
+        '--ticks',
+        metavar='N',
+        default=0,
+        type=int,
+        help='number of ticks of the headless run (default: 0, until Ctrl+C)')
+    argparser.add_argument(
+        '--report_interval',
+        metavar='SECONDS',
+        default=5.0,
+        type=float,
+        help='seconds between two tick rate reports of the headless run (default: 5)')
+    argparser.add_argument(
+        '--record',
+        metavar='PATH',
+        default=None,
+        help='record the hero kinematics of every frame to a .npz file, for util/motion_replay.py (the frames recorded so far stay in PATH.parts if the client is killed)')
+    argparser.add_argument(
+        '--trace',
+        metavar='PATH',
+        default=None,
+        help='trace the latency from the server tick to the motion platform and write a Chrome trace JSON file on exit')
     argparser.add_argument(
         '-v', '--verbose',
         action='store_true',
@@ -1790,97 +1812,33 @@ def main():
 
     args.width, args.height = [int(x) for x in args.res.split('x')]
 
+    # The headless run ticks the server itself, with the hero on autopilot
+    if args.headless:
+        args.sync = True
+        args.autopilot = True
+
+    # If not specified by user, the wheel calibration profiles are defined as calibration_profiles.json within the cwd
+    if args.calibration == "null":
+        args.calibration = os.getcwd() + "\\calibration_profiles.json"
+
+    # If not specified by user, the Logitech Steering Wheel SDK is defined as LogitechSteeringWheelEnginesWrapper.dll within the cwd
+    if args.force_feedback_dll == "null":
+        args.force_feedback_dll = os.getcwd() + "\\LogitechSteeringWheelEnginesWrapper.dll"
+
     print()
 
     # If not specified by user, configuration file is defined as config_eleetus.txt within the cwd
     if args.config_path == "null":
         args.config_path = os.getcwd() + "\\config_eleetus.txt"
 
-    try:
-        config = open(args.config_path, 'r').readlines()
-
-        for var in config:
-            var = var.strip("\n")
-            input_sense_var_index = var.find("wheel_sensitivity=")
-            distance_sense_var_index = var.find("distance_sensitivity=")
-            rotation_sense_var_index = var.find("rotational_sensitivity=")
-            function_call_hertz_index = var.find("function_call_hertz=")
-            dll_path_index = var.find("dll_path=")
-            
-            if dll_path_index != -1:
-                args.dll_path = var[dll_path_index + len("dll_path="):]
-                print("Using platform motion .dll path from configuration file: " + args.dll_path)
-
-            if input_sense_var_index != -1:
-                args.wheel_sensitivity = var[input_sense_var_index + len("wheel_sensitivity="):]
-                print("Using wheel sensitivity from configuration file: " + args.wheel_sensitivity)
-                try:
-                    float(args.wheel_sensitivity)
-                except:
-                    print("Wheel sensitivity is not configured correctly. Make sure that it is only a float value.")
-                    args.wheel_sensitivity = 0.25
-                if float(args.wheel_sensitivity) <= 0:
-                    print("Wheel sensitivity value is not valid. Please choose one that is greater than 0. Setting wheel sensitivity to default (0.25)")
-                    args.wheel_sensitivity = 0.25
-            else:
-                args.wheel_sensitivity = 0.25
-
-            if distance_sense_var_index != -1:
-                args.distance_sensitivity = var[distance_sense_var_index + len("distance_sensitivity="):]
-                print("Using distance sensitivity from configuration file: " + args.distance_sensitivity)
-                try:
-                    float(args.distance_sensitivity)
-                except:
-                    print("Distance sensitivity is not configured correctly. Make sure that it is only a float value.")
-                    args.distance_sensitivity = 0.5
-                if float(args.distance_sensitivity) <= 0:
-                    print("Distance sensitivity value is not valid. Please choose one that is greater than 0. Setting distance sensitivity to default (0.5)")
-                    args.distance_sensitivity = 0.5
-                if float(args.distance_sensitivity) > 5:
-                    print("Warning! Distance sensitivity value is set too high! Please choose one that is less than 5. Setting distance sensitivity to default (0.5)")
-                    args.distance_sensitivity = 0.5
-            else:
-                args.distance_sensitivity = 0.5
-
-            if rotation_sense_var_index != -1:
-                args.rotational_sensitivity = var[rotation_sense_var_index + len("rotational_sensitivity="):]
-                print("Using rotational sensitivity from configuration file: " + args.rotational_sensitivity)
-                try:
-                    float(args.rotational_sensitivity)
-                except:
-                    print("Rotational sensitivity is not configured correctly. Make sure that it is only a float value.")
-                    args.rotational_sensitivity = 75.0
-                if float(args.rotational_sensitivity) <= 0:
-                    print("Rotational sensitivity value is not valid. Please choose one that is greater than 0. Setting rotational sensitivity to default (75.0)")
-                    args.rotational_sensitivity = 75.0
-                if float(args.distance_sensitivity) > 100:
-                    print("Warning! Rotational sensitivity value is set too high! Please choose one that is less than 100. Setting distance sensitivity to default (75.0)")
-                    args.distance_sensitivity = 75.0
-            else:
-                args.rotational_sensitivity = 75.0
-
-            if function_call_hertz_index != -1:
-                args.function_call_hertz = var[function_call_hertz_index + len("function_call_hertz="):]
-                print("Using function call hertz from configuration file: " + args.function_call_hertz)
-                try:
-                    float(args.function_call_hertz)
-                except:
-                    print("Function call hertz is not configured correctly. Make sure that it is only a float value.")
-                    args.function_call_hertz = 20.0
-                if float(args.function_call_hertz) <= 0:
-                    print("Function call hertz value is not valid. Please choose one that is greater than 0. Setting function call hertz to default (20.0)")
-                    args.function_call_hertz = 20.0
-            else:
-                args.function_call_hertz = 20.0
-
-    except:
-        print("Configuration file not found. Continuing with default values.")
-
-    print()
-
+    # Read and validated once, the configuration file overrides the command line .dll path.
     # If not specified by user or config file, platform motion .dll path is defined as BTApi_x64.dll within the cwd
     if args.dll_path == "null":
         args.dll_path = os.getcwd() + "\\BTApi_x64.dll"
+    args.motion_config = load_eleetus_config(args.config_path, dll_path=args.dll_path)
+    args.dll_path = args.motion_config.dll_path
+
+    print()
 
 
 
@@ -1893,8 +1851,9 @@ def main():
 
     
     pygame.init()
-    pygame.display.set_caption('game base')
-    screen = pygame.display.set_mode((500, 500), 0, 32)
+    if not args.headless:
+        pygame.display.set_caption('game base')
+        screen = pygame.display.set_mode((500, 500), 0, 32)
     clock = pygame.time.Clock()
 
     try:
@@ -26,6 +26,9 @@ try:
 except IndexError:
     pass
 
+# Shared modules (Chitsein-SmartCitiesREU-Scripts/smartcities)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 
 # ==============================================================================
 # -- imports -------------------------------------------------------------------
@@ -46,6 +49,11 @@ import re
 import weakref
 import math
 
+from smartcities.prediction.bev import BirdEyeView, map_road_raster
+from smartcities.prediction.lanes import map_lane_graph
+from smartcities.prediction.predictors import PREDICTORS, create_predictor
+from smartcities.prediction.tracking import ActorTracker
+
 try:
     import pygame
     from pygame import *
@@ -70,6 +78,10 @@ DARK_GREY = (64, 64, 64)
 # Preset values
 FPS = 60
 FramePerSec = pygame.time.Clock()
+# Distance between the road waypoints in metres
+ROAD_SPACING = 1.0
+# Type of the ego vehicle, the first one found is followed
+EGO_TYPE = "vehicle.lincoln.mkz_2017"
 
 
 # ==============================================================================
@@ -84,136 +96,21 @@ def get_actor_display_name(actor, truncate=250):
 
 
 # ==============================================================================
-# -- Surrounding Objects ---------------------------------------------------------------------
+# -- Bird's-eye view -----------------------------------------------------------
 # ==============================================================================
 
 
-class StaticObject(pygame.sprite.Sprite):
-    def __init__(self, global_position_x, global_position_y, width, height, rotation, args):
-        super().__init__()
-        self.global_position_x = global_position_x
-        self.global_position_y = global_position_y
-        self.local_position_x = 0
-        self.local_position_y = 0
-        self.rect = pygame.Rect((0, 0), (width, height))
-        self.SCREEN_WIDTH = args.width
-        self.SCREEN_HEIGHT = args.height
-        self.surface = pygame.Surface((width, height))
-        self.surface.set_colorkey(BLACK)
-        self.rotation = rotation
-
-    def update(self, ego_position_x, ego_position_y, args):
-        self.local_position_x = int((self.global_position_x - ego_position_x) * args.scale_multiplier + self.SCREEN_WIDTH/2)
-        self.local_position_y = int((self.global_position_y - ego_position_y) * args.scale_multiplier + self.SCREEN_HEIGHT/2)
-            
-
-    def draw(self, ego_rotation):
-        self.surface.fill(DARK_GREY)
-        rotated_surface = pygame.transform.rotate(self.surface, ego_rotation - self.rotation)
-        return rotated_surface
-
-class DynamicObject(pygame.sprite.Sprite):
-    def __init__(self, global_position_x, global_position_y, width, height, rotation, args):
-        super().__init__()
-        self.global_position_x = int(global_position_x)
-        self.global_position_y = int(global_position_y)
-        self.local_position_x = 0
-        self.local_position_y = 0
-        self.rotation = rotation
-        self.width = width
-        self.height = height
-        self.rect = pygame.Rect((0,0), (int(width), int(height)))
-        self.trajectory = (2, 60)
-        self.trajectory_width = args.trajectory_thickness
-        self.SCREEN_WIDTH = args.width
-        self.SCREEN_HEIGHT = args.height
-        self.surface = pygame.Surface((int(width), int(height)))
-        self.surface.set_colorkey(BLACK)
-        self.traj_surface = pygame.Surface((args.width, args.height))
-        self.traj_surface.set_colorkey(BLACK)
-        
-
-    def update(self, ego_position_x, ego_position_y, args):
-        self.local_position_x = int((self.global_position_x - ego_position_x) * args.scale_multiplier + self.SCREEN_WIDTH/2 - self.width/4)
-        self.local_position_y = int((self.global_position_y - ego_position_y) * args.scale_multiplier + self.SCREEN_HEIGHT/2 - self.height/4)
-            
-
-    def draw(self, ego_rotation):
-        # Car Body
-        self.surface.fill(GREEN)
-        rotated_surface = pygame.transform.rotate(self.surface, ego_rotation - self.rotation)
-        return rotated_surface
+def road_raster(lanes, args):
+    """RoadRaster of the map, rasterized from its lane graph on the first run and cached, see smartcities.prediction.bev."""
+    return map_road_raster(args.map, lanes, ROAD_SPACING, args.scale_multiplier)
 
-    def draw_trajectory(self):
-        # Predicted Trajectory
-        if (self.trajectory[0] != 0 or self.trajectory[1] != 0):
-            pygame.draw.line(self.traj_surface, WHITE, (self.local_position_x + self.width/4, self.local_position_y + self.height), (self.local_position_x + self.width/4 + self.trajectory[0], self.local_position_y + self.height + self.trajectory[1]), self.trajectory_width)
-        return self.traj_surface
-
-
-
-# ==============================================================================
-# -- Ego ---------------------------------------------------------------------
-# ==============================================================================
-
-
-class Ego(pygame.sprite.Sprite):
-    def __init__(self, width, height, args):
-        super().__init__()
-        self.rect = pygame.Rect((0, 0), (int(width), int(height)))
-        self.width = width
-        self.height = height
-        self.local_position_x = int(args.width/2 - self.width/2)
-        self.local_position_y = int(args.height/2 - self.height/2)
-        self.trajectory = (0, 0)
-        self.trajectory_width = args.trajectory_thickness
-        self.surface = pygame.Surface((int(width), int(height)))
-        self.surface.set_colorkey(BLACK)
-        self.traj_surface = pygame.Surface((args.width, args.height))
-        self.traj_surface.set_colorkey(BLACK)
-
-    def update(self):
-         self.trajectory = (-5, -80)
-
-    def draw(self):
-        # Car Body
-        self.surface.fill(RED)
-        return self.surface
-
-    def draw_trajectory(self):
-        # Predicted Trajectory
-        if (self.trajectory[0] != 0 or self.trajectory[1] != 0):
-            pygame.draw.line(self.traj_surface, WHITE, (self.local_position_x + self.width/2, self.local_position_y + self.height/2), (self.local_position_x + self.width/2 + self.trajectory[0], self.local_position_y + self.height/2 + self.trajectory[1]), self.trajectory_width)
-        return self.traj_surface
-
-        
-
-class RoadLines(pygame.sprite.Sprite):
-    def __init__(self, line_width, world, args):
-        super().__init__()
-        self.local_position_x = 0
-        self.local_position_y = 0
-        self.line_width = line_width
-        self.surface = pygame.Surface((args.width, args.height))
-        self.surface.set_colorkey(BLACK)
-        self.world = world
-        self.all_waypoints = args.map.generate_waypoints(1)
-
-    def update(self):
-        self.surface.set_colorkey(BLACK)
-        
-
-    def draw(self, args):
-        ego_waypoint = args.map.get_waypoint(self.world.get_actor(args.ego_vehicle_id).get_location())
-        for waypoint in self.all_waypoints:
-            position = ((int((waypoint.transform.location.x - ego_waypoint.transform.location.x) * args.scale_multiplier + args.width/2)), int(((waypoint.transform.location.y - ego_waypoint.transform.location.y) * args.scale_multiplier + args.height/2)))
-            pygame.draw.circle(self.surface, LIGHT_GREY, position, self.line_width)
-        
-        print("Points generated.")
-
-        return self.surface
-        
 
+def find_ego(tracker):
+    """Id of the first tracked vehicle of EGO_TYPE, None if there is none."""
+    for row, type_id in enumerate(tracker.type_ids):
+        if type_id == EGO_TYPE:
+            return int(tracker.ids[row])
+    return None
 
 
 # ==============================================================================
@@ -226,6 +123,7 @@ def game_loop(args):
     pygame.font.init()
     world = None
     original_settings = None
+    tracker = None
 
     try:
         client = carla.Client(args.host, args.port)
@@ -252,55 +150,32 @@ def game_loop(args):
         default_position = list((20, 20))
         default_rotation = 0
         args.ego_vehicle_id = None
-        found_ego = False
-        vehicles = list()
         try:
             print("Actors:")
             for actor in sim_world.get_actors():
                 print(actor.type_id)
             print()
-
-            for actor in sim_world.get_actors():
-                if (actor.type_id == "vehicle.lincoln.mkz_2017" and found_ego == False):
-                    args.ego_vehicle_id = actor.id
-                    found_ego = True
-                elif "vehicle" in actor.type_id:
-                    if (actor.bounding_box.extent.y <= 0 or actor.bounding_box.extent.x <= 0):
-                        continue
-                    vehicles.append(DynamicObject(actor.get_location().x,
-                                                  actor.get_location().y,
-                                                  int(actor.bounding_box.extent.x * 2 * args.scale_multiplier),
-                                                  int(actor.bounding_box.extent.y * 2 * args.scale_multiplier),
-                                                  actor.get_transform().rotation.yaw,
-                                                  args))
-                    
-
-            if args.ego_vehicle_id == None:
-                print("Couldn't find the Lincoln MKZ 2017 vehicle. Ego vehicle position will be set to a traffic light cam position.")
         except:
-            print("Failed to get actors. Ego vehicle position will be set to a traffic light cam position.")
-
-        if args.ego_vehicle_id == None:
-                ego_position = default_position
-                ego_rotation = default_rotation
-        else:
-            ego_position = list((int(sim_world.get_actor(args.ego_vehicle_id).get_location().x), int(sim_world.get_actor(args.ego_vehicle_id).get_location().y)))
-            ego_rotation = sim_world.get_actor(args.ego_vehicle_id).bounding_box.rotation.yaw # Birds eye view rotation
-            ego_vehicle = Ego(int(sim_world.get_actor(args.ego_vehicle_id).bounding_box.extent.y * 2 * args.scale_multiplier),
-                              int(sim_world.get_actor(args.ego_vehicle_id).bounding_box.extent.x * 2 * args.scale_multiplier),
-                              args)
-
-        print("Ego vehicle id: " + str(args.ego_vehicle_id))
-        print("Ego rotation: " + str(ego_rotation))
-        print("Ego location: " + str(ego_position))
-        print("Ego vehicle size:\nx: " + str(sim_world.get_actor(args.ego_vehicle_id).bounding_box.extent.y * 2 * args.scale_multiplier) + " y: " + str(sim_world.get_actor(args.ego_vehicle_id).bounding_box.extent.x * 2 * args.scale_multiplier))
-
-
-        
-
-        road_lines = RoadLines(4, sim_world, args)
-        final_road_lines = road_lines.draw(args)
-        
+            print("Failed to get actors.")
+
+        # Every vehicle, updated from the world snapshots without per actor calls
+        tracker = ActorTracker(sim_world, args.filter, history_length=args.history)
+        tracker.update(sim_world.get_snapshot())
+
+        # Lane centre waypoints and topology, cached on disk for each version of the map
+        lanes = map_lane_graph(args.map, ROAD_SPACING)
+        # One batched prediction for all the vehicles each new frame
+        predictor = create_predictor(args.predictor, args.horizon, args.step, lanes)
+        trajectories = np.zeros((0, args.horizon + 1, 2))
+
+        # The road is rasterized once per map version, the view samples the part around the ego every frame
+        view = BirdEyeView(args.width, args.height, args.scale_multiplier, road_raster(lanes, args))
+        for color in (GREEN, RED, WHITE):
+            view.color(color)
+        # 8 bit surface holding the palette of the view, SDL expands it at the blit
+        surface = pygame.Surface((args.width, args.height), depth=8)
+        surface.set_palette(view.palette.tolist())
+        print("Road raster: %dx%d pixels" % view.road.image.shape)
 
         clock = pygame.time.Clock()
         time = pygame.time
@@ -311,40 +186,43 @@ def game_loop(args):
                     pygame.quit()
                     sys.exit()
 
-            # Update ego position based on Carla
-            
-
-            ego_vehicle.update()
-            road_lines.update()
-            for vehicle in vehicles:
-                vehicle.update(ego_position[0], ego_position[1], args)
-            
-            display.fill(BLACK)
-
-            rotated_ego = ego_vehicle.draw()
-            ego_trajectory = ego_vehicle.draw_trajectory()
-            rotated_vehicles = list()
-            vehicle_trajectories = list()
-            for vehicle in vehicles:
-                rotated_vehicles.append(vehicle.draw(ego_rotation))
-                vehicle_trajectories.append(vehicle.draw_trajectory())
-
-
-
-            display.blit(final_road_lines, (road_lines.local_position_x, road_lines.local_position_y))
-            for i in range(len(rotated_vehicles)):
-                display.blit(rotated_vehicles[i], (vehicles[i].local_position_x, vehicles[i].local_position_y))
-                display.blit(vehicle_trajectories[i], (0, 0))
-            display.blit(rotated_ego, (ego_vehicle.local_position_x, ego_vehicle.local_position_y))
-            display.blit(ego_trajectory, (0, 0))
-            
-            
+            # Update the actors, their predictions and the ego position, based on Carla
+            if tracker.update() or len(trajectories) != tracker.count:
+                # Drawn from the current position of each vehicle
+                trajectories = np.concatenate((tracker.state()[:, np.newaxis, :2],
+                                               predictor.predict(tracker.history(), tracker.history_dt)), axis=1)
+            ego = tracker.index(args.ego_vehicle_id)
+            if ego is None:
+                args.ego_vehicle_id = find_ego(tracker)
+                ego = tracker.index(args.ego_vehicle_id)
+                if ego is None:
+                    ego_position = default_position
+                    ego_rotation = default_rotation
+                else:
+                    print("Ego vehicle id: " + str(args.ego_vehicle_id))
+                    print("Ego vehicle size:\nx: " + str(tracker.half_width[ego] * 2 * args.scale_multiplier) + " y: " + str(tracker.half_length[ego] * 2 * args.scale_multiplier))
+            if ego is not None:
+                ego_position = (tracker.x[ego], tracker.y[ego])
+                ego_rotation = tracker.yaw[ego] # Birds eye view rotation
+
+            view.begin(ego_position[0], ego_position[1], ego_rotation)
+            view.draw_polylines(trajectories, WHITE, args.trajectory_thickness)
+            view.draw_boxes(tracker.x, tracker.y, tracker.yaw, tracker.half_length, tracker.half_width, GREEN)
+            if ego is not None:
+                view.draw_boxes(tracker.x[ego:ego + 1], tracker.y[ego:ego + 1], tracker.yaw[ego:ego + 1],
+                                tracker.half_length[ego], tracker.half_width[ego], RED)
+
+            pygame.surfarray.blit_array(surface, view.buffer.T)
+            display.blit(surface, (0, 0))
         
             pygame.display.update()
             FramePerSec.tick(FPS)
 
     finally:
 
+        if tracker is not None:
+            tracker.destroy()
+
         if (world and world.recording_enabled):
             client.stop_recorder()
 
@@ -398,6 +276,26 @@ def main():
         '--sync',
         action='store_true',
         help='Activate synchronous mode execution')
+    argparser.add_argument(
+        '--predictor',
+        default='cv',
+        choices=sorted(PREDICTORS),
+        help='trajectory predictor: constant velocity, constant turn rate or lane following (default: cv)')
+    argparser.add_argument(
+        '--history',
+        default=10,
+        type=int,
+        help='frames of history given to the predictor (default: 10)')
+    argparser.add_argument(
+        '--horizon',
+        default=30,
+        type=int,
+        help='predicted positions per vehicle (default: 30)')
+    argparser.add_argument(
+        '--step',
+        default=0.1,
+        type=float,
+        help='seconds between two predicted positions (default: 0.1)')
     args = argparser.parse_args()
 
     args.width, args.height = [int(x) for x in args.res.split('x')]
@@ -32,6 +32,9 @@ try:
 except IndexError:
     pass
 
+# Shared modules (Chitsein-SmartCitiesREU-Scripts/smartcities)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 
 # ==============================================================================
 # -- imports -------------------------------------------------------------------
@@ -49,8 +52,21 @@ import logging
 import math
 import random
 import re
+import time
 import weakref
 
+from smartcities.prediction.lanes import map_lane_graph
+from smartcities.prediction.predictors import PREDICTORS, create_predictor
+from smartcities.prediction.track_log import TrackLogger
+from smartcities.prediction.tracking import ActorTracker
+from smartcities.sensors.dataset import DatasetWriter
+from smartcities.sensors.dataset import camera_arrays, dvs_arrays, gnss_arrays, imu_arrays
+from smartcities.sensors.dataset import lidar_arrays, optical_flow_arrays, roi_arrays
+from smartcities.sensors.lidar import MODES as LIDAR_MODES
+from smartcities.sensors.lidar import LidarRasterizer
+from smartcities.sensors.rig import RigCollector, load_rig
+from smartcities.sensors.roi import RoiCropper, parse_roi
+
 
 FOV = float(90.0)
 
@@ -105,6 +121,16 @@ try:
 except ImportError:
     raise RuntimeError('cannot import numpy, make sure numpy package is installed')
 
+# Distance between the lane waypoints of the lane following predictor in metres
+LANE_SPACING = 1.0
+
+# Dataset streams recorded next to the one of the main sensor, the predictions are the
+# trajectories of the tracked actors (see World.record_predictions)
+SIDE_STREAMS = ('gnss', 'imu', 'predictions')
+
+# Actors of the tracker of the client, whose tracks are logged and trajectories predicted while recording
+TRACKED_ACTORS = ('vehicle.*', 'walker.*')
+
 
 def find_weather_presets():
     rgx = re.compile('.+?(?:(?<=[a-z])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])|$)')
@@ -167,10 +193,23 @@ class World(object):
         self._weather_index = 0
         self._sensor_choice = args.sensor_choice
         self._gamma = args.gamma
+        self._lidar_mode = args.lidar_mode
+        self._rois = tuple(args.roi or ())
+        self._dataset_dir = args.out
+        self._dataset_workers = args.writers
+        # Background writer of the sensor records and log of the actor tracks while recording, None otherwise
+        self.writer = None
+        self.track_logger = None
+        # Roadside units of the --rig file, recorded with the other sensors
+        self.rig = None
         self.restart()
         self.world.on_tick(hud.on_world_tick)
         self.recording_enabled = False
         self.recording_start = 0
+        # Predicted positions (N, H, 2) of the actors in the rows of the actor tracker while
+        # recording, and the time the prediction took in seconds
+        self.predictions = None
+        self.prediction_time = 0.0
         self.constant_velocity_enabled = False
         self.show_vehicle_telemetry = False
         self.doors_are_open = False
@@ -230,9 +269,10 @@ class World(object):
         # Set up the sensors.
         self.gnss_sensor = GnssSensor(self.sensor_control)
         self.imu_sensor = IMUSensor(self.sensor_control)
-        self.sensor_manager = SensorManager(self.sensor_control, self.hud, self._gamma)
+        self.sensor_manager = SensorManager(self.sensor_control, self.hud, self._gamma, self._lidar_mode, self._rois)
         self.sensor_manager.transform_index = cam_pos_index
         self.sensor_manager.set_sensor(cam_index, notify=False)
+        self._attach_writer()
         actor_type = get_actor_display_name(self.sensor_control)
         self.hud.notification(actor_type)
 
@@ -271,6 +311,55 @@ class World(object):
             self.radar_sensor = None
 
 
+    def toggle_recording(self):
+        if self.writer is None:
+            dirname = os.path.join(self._dataset_dir, datetime.datetime.now().strftime('%Y%m%d_%H%M%S'))
+            self.writer = DatasetWriter(
+                dirname, (self.sensor_manager.stream()[0],) + self.sensor_manager.other_streams,
+                workers=self._dataset_workers)
+            self._attach_writer()
+            self.track_logger = TrackLogger(os.path.join(dirname, 'tracks'))
+            self.hud.notification('Recording to %s' % dirname)
+        else:
+            self.stop_recording()
+            self.hud.notification('Recording Off')
+
+    def stop_recording(self):
+        writer, self.writer = self.writer, None
+        if writer is not None:
+            self._attach_writer()
+            writer.close()
+            print(writer)
+        if self.track_logger is not None:
+            self.track_logger.close()
+            self.track_logger = None
+        self.predictions = None
+
+    def record_predictions(self, tracker, predictions):
+        """Add the predicted trajectories of the actors of a tracker to the record of its frame."""
+        self.writer.put('predictions', tracker.frame, {
+            'timestamp': np.array(tracker.timestamp),
+            'ids': tracker.ids.copy(),
+            'positions': predictions.astype(np.float32)})
+
+    def record_tracks(self, tracker):
+        """Log the actors of the tracker after each of its updates, while recording."""
+        if self.track_logger is not None:
+            self.track_logger.record(tracker)
+
+    def set_rig(self, rig):
+        self.rig = rig
+        self._attach_writer()
+
+    def _attach_writer(self):
+        # The sensor callbacks read the attribute once per measurement
+        self.sensor_manager.writer = self.writer
+        self.sensor_manager.other_streams = SIDE_STREAMS + (self.rig.rig.streams if self.rig is not None else ())
+        self.gnss_sensor.writer = self.writer
+        self.imu_sensor.writer = self.writer
+        if self.rig is not None:
+            self.rig.collector.writer = self.writer
+
     def tick(self, clock):
         self.hud.tick(self, clock)
 
@@ -353,7 +442,7 @@ class SensorControl(object):
                         index_ctrl = 9
                     world.sensor_manager.set_sensor(event.key - 1 - K_0 + index_ctrl)
                 elif event.key == K_r and not (pygame.key.get_mods() & KMOD_CTRL):
-                    world.sensor_manager.toggle_recording()
+                    world.toggle_recording()
                 elif event.key == K_r and (pygame.key.get_mods() & KMOD_CTRL):
                     if (world.recording_enabled):
                         client.stop_recorder()
@@ -482,6 +571,25 @@ class HUD(object):
             '']
         self._info_text += [
             'Number of vehicles: % 8d' % len(vehicles)]
+        if world.predictions is not None:
+            self._info_text += [
+                'Predictions: % 7d in %4.1f ms' % (len(world.predictions), world.prediction_time * 1e3)]
+        if world.writer is not None:
+            stats = world.writer.summary()
+            self._info_text += [
+                'Recorded: % 13d frames' % stats['written'],
+                'Dropped: % 8d  queue % 3d' % (stats['dropped'] + stats['late'], stats['queue_depth'])]
+        if world.track_logger is not None:
+            self._info_text += [
+                'Track rows: % 15d' % world.track_logger.rows]
+        if world.sensor_manager.roi_cropper is not None:
+            self._info_text += [
+                'Regions: % 3d  1/%.1f of the image' % (
+                    len(world.sensor_manager.roi_cropper.rois), world.sensor_manager.roi_cropper.ratio)]
+        if world.rig is not None:
+            stats = world.rig.collector.summary()
+            self._info_text += [
+                'Rig: % 3d sensors % 7.1f MB/s' % (stats['sensors'], stats['megabytes_per_s'])]
         if len(vehicles) > 1:
             self._info_text += ['Nearby vehicles:']
             distance = lambda l: math.sqrt((l.x - t.location.x)**2 + (l.y - t.location.y)**2 + (l.z - t.location.z)**2)
@@ -612,6 +720,7 @@ class GnssSensor(object):
         self._parent = parent_actor
         self.lat = 0.0
         self.lon = 0.0
+        self.writer = None
         world = self._parent.get_world()
         bp = world.get_blueprint_library().find('sensor.other.gnss')
         self.sensor = world.spawn_actor(bp, carla.Transform(), attach_to=self._parent)
@@ -627,6 +736,9 @@ class GnssSensor(object):
             return
         self.lat = event.latitude
         self.lon = event.longitude
+        writer = self.writer
+        if writer is not None:
+            writer.put('gnss', event.frame, gnss_arrays(event))
 
 
 # ==============================================================================
@@ -641,6 +753,7 @@ class IMUSensor(object):
         self.accelerometer = (0.0, 0.0, 0.0)
         self.gyroscope = (0.0, 0.0, 0.0)
         self.compass = 0.0
+        self.writer = None
         world = self._parent.get_world()
         bp = world.get_blueprint_library().find('sensor.other.imu')
         self.sensor = world.spawn_actor(
@@ -666,6 +779,9 @@ class IMUSensor(object):
             max(limits[0], min(limits[1], math.degrees(sensor_data.gyroscope.y))),
             max(limits[0], min(limits[1], math.degrees(sensor_data.gyroscope.z))))
         self.compass = math.degrees(sensor_data.compass)
+        writer = self.writer
+        if writer is not None:
+            writer.put('imu', sensor_data.frame, imu_arrays(sensor_data))
 
 
 # ==============================================================================
@@ -733,18 +849,71 @@ class RadarSensor(object):
                 persistent_lines=False,
                 color=carla.Color(r, g, b))
 
+# ==============================================================================
+# -- SensorRig -----------------------------------------------------------------
+# ==============================================================================
+
+
+class SensorRig(object):
+    """Sensors of the roadside units of a rig file, spawned with one batch of commands."""
+    def __init__(self, client, world, rig, role_name):
+        self.rig = rig
+        self.collector = RigCollector(rig)
+        library = world.get_blueprint_library()
+        batch = []
+        for _, sensor, location, rotation in rig.sensors():
+            bp = library.find(sensor.type_id)
+            if bp.has_attribute('role_name'):
+                bp.set_attribute('role_name', role_name)
+            for name, value in sensor.attributes.items():
+                if not bp.has_attribute(name):
+                    raise ValueError('%s has no attribute %s' % (sensor.type_id, name))
+                bp.set_attribute(name, value)
+            transform = carla.Transform(carla.Location(*location), carla.Rotation(*rotation))
+            batch.append(carla.command.SpawnActor(bp, transform))
+        start = time.time()
+        responses = client.apply_batch_sync(batch)
+        self.spawn_time = time.time() - start
+        errors = [response.error for response in responses if response.error]
+        actors = {actor.id: actor for actor in world.get_actors(
+            [response.actor_id for response in responses if not response.error])}
+        self.sensors = [actors[response.actor_id] for response in responses if not response.error]
+        if errors:
+            self.destroy(client)
+            raise RuntimeError('%d of %d rig sensors failed to spawn: %s' % (len(errors), len(batch), errors[0]))
+        for (stream, sensor, _, _), actor in zip(rig.sensors(), self.sensors):
+            actor.listen(self.collector.callback(stream, sensor))
+        self.collector.reset()
+
+    def destroy(self, client):
+        for sensor in self.sensors:
+            sensor.stop()
+        client.apply_batch_sync([carla.command.DestroyActor(sensor) for sensor in self.sensors])
+        self.sensors = []
+
+
 # ==============================================================================
 # -- SensorManager -------------------------------------------------------------
 # ==============================================================================
 
 
 class SensorManager(object):
-    def __init__(self, parent_actor, hud, gamma_correction):
+    def __init__(self, parent_actor, hud, gamma_correction, lidar_mode='occupancy', rois=()):
         self.sensor = None
         self.surface = None
         self._parent = parent_actor
         self.hud = hud
-        self.recording = False
+        self.lidar_rasterizer = None
+        # Regions of interest of the cameras, the only pixels converted, shown and recorded
+        self.roi_cropper = RoiCropper(rois, hud.dim[0], hud.dim[1]) if rois else None
+        if self.roi_cropper is not None:
+            self._roi_arrays = roi_arrays(self.roi_cropper)
+            self._roi_pixels = np.empty(self.roi_cropper.size, dtype=np.uint8)
+        # (surface, position) of each region of the latest image
+        self.roi_surfaces = []
+        self.writer = None
+        # Dataset streams recorded with the one of this sensor
+        self.other_streams = SIDE_STREAMS
         Attachment = carla.AttachmentType
 
         self._camera_transforms = [(carla.Transform(carla.Location(), carla.Rotation(pitch=-20.0)), Attachment.SpringArmGhost),
@@ -788,6 +957,8 @@ class SensorManager(object):
                     bp.set_attribute(attr_name, attr_value)
                     if attr_name == 'range':
                         self.lidar_range = float(attr_value)
+                # Bird's-eye view image and scratch arrays kept from one sweep to the next
+                self.lidar_rasterizer = LidarRasterizer(hud.dim[0], hud.dim[1], self.lidar_range, lidar_mode)
 
             item.append(bp)
         self.index = None
@@ -804,6 +975,7 @@ class SensorManager(object):
             if self.sensor is not None:
                 self.sensor.destroy()
                 self.surface = None
+                self.roi_surfaces = []
             self.sensor = self._parent.get_world().spawn_actor(
                 self.sensors[index][-1],
                 self._camera_transforms[self.transform_index][0],
@@ -816,36 +988,47 @@ class SensorManager(object):
         if notify:
             self.hud.notification(self.sensors[index][2])
         self.index = index
+        if self.writer is not None:
+            self.writer.set_streams((self.stream()[0],) + self.other_streams)
 
     def next_sensor(self):
         self.set_sensor(self.index + 1)
 
-    def toggle_recording(self):
-        self.recording = not self.recording
-        self.hud.notification('Recording %s' % ('On' if self.recording else 'Off'))
+    def stream(self):
+        """Dataset stream name of the current sensor and the function copying its measurements."""
+        sensor_type = self.sensors[self.index][0]
+        if sensor_type.startswith('sensor.lidar'):
+            return 'lidar', lidar_arrays
+        if sensor_type.startswith('sensor.camera.dvs'):
+            return 'dvs', dvs_arrays
+        if sensor_type.startswith('sensor.camera.optical_flow'):
+            return 'optical_flow', optical_flow_arrays
+        if self.roi_cropper is not None:
+            return 'camera', self._roi_arrays
+        return 'camera', camera_arrays
 
     def render(self, display):
         if self.surface is not None:
             display.blit(self.surface, (0, 0))
+        roi_surfaces = self.roi_surfaces
+        if roi_surfaces:
+            display.fill((0, 0, 0))
+            for surface, position in roi_surfaces:
+                display.blit(surface, position)
 
     @staticmethod
     def _parse_image(weak_self, image):
         self = weak_self()
         if not self:
             return
+        writer = self.writer
+        if writer is not None:
+            # Only a copy of the raw buffer here, the writer threads encode and save it
+            stream, arrays = self.stream()
+            writer.put(stream, image.frame, arrays(image))
         if self.sensors[self.index][0].startswith('sensor.lidar'):
-            points = np.frombuffer(image.raw_data, dtype=np.dtype('f4'))
-            points = np.reshape(points, (int(points.shape[0] / 4), 4))
-            lidar_data = np.array(points[:, :2])
-            lidar_data *= min(self.hud.dim) / (2.0 * self.lidar_range)
-            lidar_data += (0.5 * self.hud.dim[0], 0.5 * self.hud.dim[1])
-            lidar_data = np.fabs(lidar_data)  # pylint: disable=E1111
-            lidar_data = lidar_data.astype(np.int32)
-            lidar_data = np.reshape(lidar_data, (-1, 2))
-            lidar_img_size = (self.hud.dim[0], self.hud.dim[1], 3)
-            lidar_img = np.zeros((lidar_img_size), dtype=np.uint8)
-            lidar_img[tuple(lidar_data.T)] = (255, 255, 255)
-            self.surface = pygame.surfarray.make_surface(lidar_img)
+            # make_surface copies the image, the rasterizer draws the next sweep into it
+            self.surface = pygame.surfarray.make_surface(self.lidar_rasterizer.rasterize(image.raw_data))
         elif self.sensors[self.index][0].startswith('sensor.camera.dvs'):
             # Example of converting the raw_data from a carla.DVSEventArray
             # sensor into a NumPy array and using it as an image
@@ -862,6 +1045,13 @@ class SensorManager(object):
             array = array[:, :, :3]
             array = array[:, :, ::-1]
             self.surface = pygame.surfarray.make_surface(array.swapaxes(0, 1))
+        elif self.roi_cropper is not None:
+            image.convert(self.sensors[self.index][1])
+            # Only the regions are flipped to RGB, in a buffer make_surface copies from
+            regions = self.roi_cropper.crop(image.raw_data, self._roi_pixels)
+            self.surface = None
+            self.roi_surfaces = [(pygame.surfarray.make_surface(region.swapaxes(0, 1)), (roi.x, roi.y))
+                                 for roi, region in zip(self.roi_cropper.rois, regions.values())]
         else:
             image.convert(self.sensors[self.index][1])
             array = np.frombuffer(image.raw_data, dtype=np.dtype("uint8"))
@@ -869,8 +1059,6 @@ class SensorManager(object):
             array = array[:, :, :3]
             array = array[:, :, ::-1]
             self.surface = pygame.surfarray.make_surface(array.swapaxes(0, 1))
-        if self.recording:
-            image.save_to_disk('_out/%08d' % image.frame)
 
 
 # ==============================================================================
@@ -883,6 +1071,7 @@ def game_loop(args):
     pygame.font.init()
     world = None
     original_settings = None
+    tracker = None
 
     try:
         client = carla.Client(args.host, args.port)
@@ -918,6 +1107,17 @@ def game_loop(args):
         hud = HUD(args.width, args.height)
         world = World(sim_world, hud, args)     
         controller = SensorControl(world)
+        if args.rig:
+            rig = load_rig(args.rig)
+            world.set_rig(SensorRig(client, sim_world, rig, args.rolename))
+            hud.notification('Rig %s: %d sensors spawned in %.0f ms' % (
+                rig.name, len(rig.streams), world.rig.spawn_time * 1e3))
+
+        # Every vehicle and walker and, while recording, their tracks and predicted trajectories:
+        # one tracker and one batched prediction per frame, recorded with the sensor data
+        tracker = ActorTracker(sim_world, TRACKED_ACTORS, history_length=args.history)
+        lanes = map_lane_graph(world.map, LANE_SPACING) if args.predictor == 'lane' else None
+        predictor = create_predictor(args.predictor, args.horizon, args.step, lanes)
         
         
 
@@ -934,6 +1134,13 @@ def game_loop(args):
             clock.tick_busy_loop(60)
             if controller.parse_events(client, world, clock, args.sync):
                 return
+            # The tracker always updates, so the history is full when the recording starts
+            if tracker.update() and world.writer is not None:
+                world.record_tracks(tracker)
+                start = time.time()
+                world.predictions = predictor.predict(tracker.history(), tracker.history_dt)
+                world.prediction_time = time.time() - start
+                world.record_predictions(tracker, world.predictions)
             world.tick(clock)
             world.render(display)
             pygame.display.flip()
@@ -943,11 +1150,18 @@ def game_loop(args):
         if original_settings:
             sim_world.apply_settings(original_settings)
 
+        if tracker is not None:
+            tracker.destroy()
+
         if (world and world.recording_enabled):
             client.stop_recorder()
 
         if world is not None:
             world.destroy()
+            if world.rig is not None:
+                world.rig.destroy(client)
+                print(world.rig.collector)
+            world.stop_recording()
 
         pygame.quit()
 
@@ -1015,6 +1229,51 @@ def main():
         type=str,
         default='camera_rgb',
         help='Choose a sensor (camera_rgb, camera_depth, camera_segmentation, lidar, lidar_semantic, radar)')
+    argparser.add_argument(
+        '--predictor',
+        default='cv',
+        choices=sorted(PREDICTORS),
+        help='trajectory predictor of the predictions recorded with the sensor data: constant velocity, constant turn rate or lane following (default: cv)')
+    argparser.add_argument(
+        '--history',
+        default=10,
+        type=int,
+        help='frames of history given to the predictor (default: 10)')
+    argparser.add_argument(
+        '--horizon',
+        default=30,
+        type=int,
+        help='predicted positions per vehicle (default: 30)')
+    argparser.add_argument(
+        '--step',
+        default=0.1,
+        type=float,
+        help='seconds between two predicted positions (default: 0.1)')
+    argparser.add_argument(
+        '--out',
+        default='_out',
+        help='directory of the recordings, one sub directory per recording (default: _out)')
+    argparser.add_argument(
+        '--writers',
+        default=2,
+        type=int,
+        help='threads encoding and writing the recorded frames (default: 2)')
+    argparser.add_argument(
+        '--rig',
+        metavar='FILE',
+        help='rig file of roadside sensor units to spawn and record, as rigs/town10hd_intersection.json')
+    argparser.add_argument(
+        '--lidar_mode',
+        default='occupancy',
+        choices=LIDAR_MODES,
+        help='colours of the LiDAR view: %s (default: occupancy)' % ', '.join(LIDAR_MODES))
+    argparser.add_argument(
+        '--roi',
+        metavar='NAME=X,Y,W,H',
+        action='append',
+        type=parse_roi,
+        help='region of interest of the camera in pixels of --res, the only pixels shown and recorded '
+             '(repeat for more regions)')
     args = argparser.parse_args()
 
     args.width, args.height = [int(x) for x in args.res.split('x')]
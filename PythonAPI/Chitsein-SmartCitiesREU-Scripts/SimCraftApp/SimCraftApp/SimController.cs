@@ -7,6 +7,7 @@ using System.Timers;
 using SCN6;
 using System.Text;
 using System.IO.Pipes;
+using System.IO.MemoryMappedFiles;
 
 
 namespace TRC.Services
@@ -64,6 +65,36 @@ namespace TRC.Services
 		private int tempCount = 0;
 
 		private string MOTION_DATA_PIPE_FILE_PATH;
+
+		// Memory-mapped motion ring buffer written by smartcities/motion/shared_memory.py
+		// (layout must match the Python side)
+		private const uint MOTION_RING_MAGIC = 0x524D4353; // 'SCMR'
+		private const uint MOTION_RING_VERSION = 2;
+		private const int MOTION_RING_HEADER_SIZE = 64;
+		private const int MOTION_RING_WRITE_SEQ_OFFSET = 16;
+		private const int MOTION_RING_COMMAND_SEQ_OFFSET = 40;
+		private const int MOTION_RING_REPORTS_OFFSET = 48;
+		private const int MOTION_RING_FLAGS_OFFSET = 56;
+		private const uint MOTION_RING_FLAG_PULSE_TARGETS = 0x1;
+		private const int MOTION_RING_SLOT_SIZE = 64;
+		private const int MOTION_RING_VALUES_OFFSET = 16;
+		private const int MOTION_RING_TARGETS_OFFSET = 36;
+		private const int MOTION_RING_MAX_RETRIES = 8;
+
+		private bool useMotionCsv;
+		private MemoryMappedFile motionRingFile;
+		private MemoryMappedViewAccessor motionRing;
+		private uint motionRingCapacity;
+		private ulong lastMotionSeq;
+
+		// The actuator thread reports the sample of its last command, the headless runs of the
+		// Python side wait for it (see MotionRingPublisher.wait_consumed in shared_memory.py)
+		private ulong motionReports;
+
+		// Pulses of the SCN6 axes 0, 1 and 2 computed and limited by the Python side
+		// (see smartcities/motion/scn6.py), used instead of the mapping of UpdateDevice when set
+		private bool motionPulseTargets;
+		private int[] targetPulses = new int[3];
 		#endregion
 
 		#region Public Static Methods
@@ -104,13 +135,14 @@ namespace TRC.Services
 			SimController instance = new SimController();
 			instance.previousPulses = new int[3];
 
-			if (false)
+			// The Python client passes the motion data path as the first argument
+			if (args.Length > 0)
 			{
-				instance.SetMotionFilePath(System.IO.Directory.GetCurrentDirectory() + "\\MOTION_DATA_PIPE.csv");
+				instance.SetMotionFilePath(args[0]);
 			}
 			else
 			{
-				instance.SetMotionFilePath(System.IO.Directory.GetCurrentDirectory() + "\\MOTION_DATA_PIPE.csv");
+				instance.SetMotionFilePath(System.IO.Directory.GetCurrentDirectory() + "\\MOTION_DATA_PIPE.bin");
 			}
 
 			instance.SetTimer();
@@ -187,7 +219,10 @@ namespace TRC.Services
 
 		private void OnTimedEvent(object sender, EventArgs e)
 		{
-			ReadMotionCSV();
+			if (useMotionCsv)
+				ReadMotionCSV();
+			else
+				ReadMotionSharedMemory();
 			FixedUpdate();
 		}
 
@@ -195,6 +230,17 @@ namespace TRC.Services
 		/// Actions to perform each frame rendered
 		/// </summary>
 		private void FixedUpdate()
+		{
+			UpdateAngles();
+
+			// Finally, we set the semaphore
+			semaphore.Set();
+		}
+
+		/// <summary>
+		/// Convert the angles of the last motion sample for the actuator thread
+		/// </summary>
+		private void UpdateAngles()
 		{
 			// We lock the mutex, then we set the important informations for the actuator thread
 			mutex.WaitOne();
@@ -216,9 +262,6 @@ namespace TRC.Services
 			// ***currentAngularVelocity = carRigidbody.angularVelocity.Y;*** -> SetAngularVelocityY() in radians!
 			// ****currentVelocity = carRigidbody.velocity.magnitude;*** -> SetVelocity()
 			mutex.ReleaseMutex();
-
-			// Finally, we set the semaphore
-			semaphore.Set();
 		}
 
 		/// <summary>
@@ -271,6 +314,8 @@ namespace TRC.Services
 				semaphore.WaitOne();
 				semaphore.Reset();
 
+				ulong sampleSeq = lastMotionSeq;
+
 				// Locking mutex to avoid changes on working variables
 				mutex.WaitOne();
 
@@ -286,6 +331,14 @@ namespace TRC.Services
 					(int) (10000 - currentAngularVelocity * 10000 / 6),
 					20000 - (int) (AdaptAngle(angles.Z) / .00175f)
 				};
+				// The Python side sends the same mapping, surge cue included, shaped by its placeholder axis limits
+				bool pulseTargets = motionPulseTargets;
+				if (pulseTargets)
+				{
+					pulses[0] = targetPulses[1];
+					pulses[1] = targetPulses[2];
+					pulses[2] = targetPulses[0];
+				}
 				// We release the mutex
 				mutex.ReleaseMutex();
 
@@ -383,7 +436,7 @@ namespace TRC.Services
 				//  - Axis #0 => Z axis
 				//  - Axis #1 => X axis
 				//  - Axis #2 => Y axis
-				if (currentVelocity > memcurvel)
+				if (!pulseTargets && currentVelocity > memcurvel)
 				{
 					Console.WriteLine("\n currentvelocity" + currentVelocity);
 					Console.WriteLine("\n memcurvel ; " + memcurvel);
@@ -408,6 +461,8 @@ namespace TRC.Services
 
 					SCN6_Driver.Check_And_Fix_Alarm(i);
 				}
+
+				ReportMotionCommand(sampleSeq);
 			}
 		}
 
@@ -557,30 +612,8 @@ namespace TRC.Services
 			}
 			else
 			{
-				float pitch = float.Parse(values[0]);
-				float yaw = float.Parse(values[1]);
-				float roll = float.Parse(values[2]);
-				float angularVelocityY = float.Parse(values[3]);
-				// Angular velocity needs to be converted to radians!!
-				angularVelocityY = angularVelocityY * 2 * (float) Math.PI / 360;
-				float velocity = float.Parse(values[4]);
-				// Convert said angles from Carla/Unreal Engine coordinate system to Unity coordinate system -> Unity is [Z forward, X right, Y up], Unreal is [X forward, Y right, Z up]
-
-				// Also must be from range 0 to 360!
-				pitch *= -1;
-				yaw *= -1;
-				roll *= -1;
-				if (pitch < 0)
-					pitch += 360;
-				if (yaw < 0)
-					yaw += 360;
-				if (roll < 0)
-					roll += 360;
-
-
-				SetAngles(pitch, yaw, roll); // Sets angle such that it is represented like Unity EulerAngle (forward, right, up)
-				SetAngularVelocityY(angularVelocityY);
-				SetVelocity(velocity * 5);
+				ApplyMotionSample(float.Parse(values[0]), float.Parse(values[1]), float.Parse(values[2]),
+					float.Parse(values[3]), float.Parse(values[4]));
 				if (tempCount >= 100)
 					Console.WriteLine("Set values from CSV file in SimController variables");
 			}
@@ -591,6 +624,126 @@ namespace TRC.Services
 
 		}
 
+		/// <summary>
+		/// Map the motion ring buffer written by the Python client
+		/// </summary>
+		private void OpenMotionRing()
+		{
+			// Writable for the consumer reports in the header
+			FileStream stream = new FileStream(MOTION_DATA_PIPE_FILE_PATH, FileMode.Open, FileAccess.ReadWrite, FileShare.ReadWrite);
+			motionRingFile = MemoryMappedFile.CreateFromFile(stream, null, 0, MemoryMappedFileAccess.ReadWrite,
+				null, HandleInheritability.None, false);
+			motionRing = motionRingFile.CreateViewAccessor(0, 0, MemoryMappedFileAccess.ReadWrite);
+
+			if (motionRing.ReadUInt32(0) != MOTION_RING_MAGIC || motionRing.ReadUInt32(4) != MOTION_RING_VERSION
+				|| motionRing.ReadUInt32(12) != MOTION_RING_SLOT_SIZE)
+			{
+				Console.WriteLine("Motion data file is not a motion ring buffer (version " + MOTION_RING_VERSION + ")");
+				Environment.Exit(1);
+			}
+			motionRingCapacity = motionRing.ReadUInt32(8);
+			lastMotionSeq = 0;
+		}
+
+		/// <summary>
+		/// Read the newest sample of the motion ring buffer. Older samples are skipped,
+		/// the actuator only needs the latest state.
+		/// </summary>
+		private void ReadMotionSharedMemory()
+		{
+			if (motionRing == null)
+			{
+				if (!File.Exists(MOTION_DATA_PIPE_FILE_PATH))
+				{
+					Console.WriteLine("Failed to find path at the set location");
+					Environment.Exit(1);
+				}
+				OpenMotionRing();
+			}
+
+			ulong seq = motionRing.ReadUInt64(MOTION_RING_WRITE_SEQ_OFFSET);
+			// The Python client resets the sequence when it is restarted
+			if (seq < lastMotionSeq)
+				lastMotionSeq = 0;
+			if (seq == lastMotionSeq)
+				return;
+			if (ReadMotionSlot(seq))
+				lastMotionSeq = seq;
+		}
+
+		/// <summary>
+		/// Report the sample of the last command to the Python side
+		/// </summary>
+		private void ReportMotionCommand(ulong sampleSeq)
+		{
+			if (motionRing == null)
+				return;
+			motionReports++;
+			motionRing.Write(MOTION_RING_COMMAND_SEQ_OFFSET, sampleSeq);
+			motionRing.Write(MOTION_RING_REPORTS_OFFSET, motionReports);
+		}
+
+		/// <summary>
+		/// Copy the sample 'seq' of the motion ring buffer for the actuator thread
+		/// </summary>
+		/// <returns>False if the slot no longer holds the sample</returns>
+		private bool ReadMotionSlot(ulong seq)
+		{
+			long offset = MOTION_RING_HEADER_SIZE + (long) ((seq - 1) % motionRingCapacity) * MOTION_RING_SLOT_SIZE;
+			bool hasTargets = (motionRing.ReadUInt32(MOTION_RING_FLAGS_OFFSET) & MOTION_RING_FLAG_PULSE_TARGETS) != 0;
+			for (int attempt = 0; attempt < MOTION_RING_MAX_RETRIES; attempt++)
+			{
+				// The slot sequence number is zeroed while the Python side rewrites the slot,
+				// so a sample is only accepted if it is unchanged around the copy
+				ulong before = motionRing.ReadUInt64(offset);
+				float pitch = motionRing.ReadSingle(offset + MOTION_RING_VALUES_OFFSET);
+				float yaw = motionRing.ReadSingle(offset + MOTION_RING_VALUES_OFFSET + 4);
+				float roll = motionRing.ReadSingle(offset + MOTION_RING_VALUES_OFFSET + 8);
+				float angularVelocityY = motionRing.ReadSingle(offset + MOTION_RING_VALUES_OFFSET + 12);
+				float velocity = motionRing.ReadSingle(offset + MOTION_RING_VALUES_OFFSET + 16);
+				int[] pulses = new int[3];
+				for (int axis = 0; axis < 3; axis++)
+					pulses[axis] = (int) motionRing.ReadSingle(offset + MOTION_RING_TARGETS_OFFSET + 4 * axis);
+				ulong after = motionRing.ReadUInt64(offset);
+
+				if (before == seq && after == seq)
+				{
+					ApplyMotionSample(pitch, yaw, roll, angularVelocityY, velocity);
+					SetPulseTargets(hasTargets ? pulses : null);
+					return true;
+				}
+				if (after > seq)
+					return false;
+			}
+			return false;
+		}
+
+		/// <summary>
+		/// Convert a CARLA motion sample and store it for the actuator thread
+		/// </summary>
+		private void ApplyMotionSample(float pitch, float yaw, float roll, float angularVelocityY, float velocity)
+		{
+			// Angular velocity needs to be converted to radians!!
+			angularVelocityY = angularVelocityY * 2 * (float) Math.PI / 360;
+			// Convert said angles from Carla/Unreal Engine coordinate system to Unity coordinate system -> Unity is [Z forward, X right, Y up], Unreal is [X forward, Y right, Z up]
+
+			// Also must be from range 0 to 360!
+			pitch *= -1;
+			yaw *= -1;
+			roll *= -1;
+			if (pitch < 0)
+				pitch += 360;
+			if (yaw < 0)
+				yaw += 360;
+			if (roll < 0)
+				roll += 360;
+
+
+			SetAngles(pitch, yaw, roll); // Sets angle such that it is represented like Unity EulerAngle (forward, right, up)
+			SetAngularVelocityY(angularVelocityY);
+			SetVelocity(velocity * 5);
+		}
+
 		public void SetAngles(float eulerXAxis, float eulerYAxis, float eulerZAxis)
 		{
 			angless = new Vector3(eulerXAxis, eulerYAxis, eulerZAxis);
@@ -606,9 +759,22 @@ namespace TRC.Services
 			currentVelocity = velocity;
 		}
 
+		/// <summary>
+		/// Pulses of the SCN6 axes computed by the Python side, null to use the mapping of UpdateDevice
+		/// </summary>
+		private void SetPulseTargets(int[] pulses)
+		{
+			mutex.WaitOne();
+			if (pulses != null)
+				targetPulses = pulses;
+			motionPulseTargets = pulses != null;
+			mutex.ReleaseMutex();
+		}
+
 		private void SetMotionFilePath(string path)
 		{
 			MOTION_DATA_PIPE_FILE_PATH = path;
+			useMotionCsv = path.EndsWith(".csv", StringComparison.OrdinalIgnoreCase);
 		}
 
 		// Misc. Methods
@@ -89,6 +89,9 @@ try:
 except IndexError:
     pass
 
+# Shared motion platform modules (Chitsein-SmartCitiesREU-Scripts/smartcities)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..')))
+
 
 # ==============================================================================
 # -- imports -------------------------------------------------------------------
@@ -99,6 +102,22 @@ import carla
 
 from carla import ColorConverter as cc
 
+from smartcities.controls.calibration import input_layout
+from smartcities.controls.force_feedback import ForceFeedback, LogitechWheelSDK, SteeringSampler
+from smartcities.controls.input_device import BACKENDS, DEFAULT_BACKEND, InputDeviceService, create_backend
+from smartcities.motion.config import load_simcraft_config
+from smartcities.motion.headless import TickRateMeter
+from smartcities.motion.kinematics import KinematicsSampler
+from smartcities.motion.scheduler import MotionScheduler, SnapshotSlot
+from smartcities.motion.scn6 import PlatformKinematics
+from smartcities.motion.shared_memory import MotionRingPublisher
+from smartcities.motion.simcraft import SimcraftSampler
+from smartcities.motion.telemetry import TelemetryRecorder
+from smartcities.motion.tracing import LatencyTracer, NullTracer
+from smartcities.motion.udp import MotionUdpPublisher, parse_address
+from smartcities.motion.washout import ClassicalWashout
+from smartcities.sensors.lidar import LidarRasterizer
+
 import argparse
 import collections
 import datetime
@@ -106,6 +125,7 @@ import logging
 import math
 import random
 import re
+import time
 import weakref
 
 try:
@@ -213,6 +233,8 @@ class World(object):
     def __init__(self, carla_world, hud, args):
         self.world = carla_world
         self.sync = args.sync
+        # Headless batch run: no camera is streamed
+        self.headless = args.headless
         self.actor_role_name = args.rolename
         try:
             self.map = self.world.get_map()
@@ -234,6 +256,10 @@ class World(object):
         self._actor_filter = args.filter
         self._actor_generation = args.generation
         self._gamma = args.gamma
+        # Hero kinematics of the current frame, shared by the HUD, the motion platform and the loggers
+        self.kinematics = KinematicsSampler(self.world, self.sync)
+        # Road wheel angle and lateral acceleration of the hero, for the wheel force feedback
+        self.steering = SteeringSampler(carla.VehicleWheelLocation.FL_Wheel)
         self.restart()
         self.world.on_tick(hud.on_world_tick)
         self.recording_enabled = False
@@ -307,7 +333,10 @@ class World(object):
         self.imu_sensor = IMUSensor(self.player)
         self.camera_manager = CameraManager(self.player, self.hud, self._gamma)
         self.camera_manager.transform_index = cam_pos_index
-        self.camera_manager.set_sensor(cam_index, notify=False)
+        if not self.headless:
+            self.camera_manager.set_sensor(cam_index, notify=False)
+        self.kinematics.set_actor(self.player)
+        self.steering.set_actor(self.player)
         actor_type = get_actor_display_name(self.player)
         self.hud.notification(actor_type)
 
@@ -355,6 +384,7 @@ class World(object):
             pass
 
     def tick(self, clock):
+        self.kinematics.update()
         self.hud.tick(self, clock)
 
     def render(self, display):
@@ -390,7 +420,7 @@ class World(object):
 
 class KeyboardControl(object):
     """Class that handles keyboard input."""
-    def __init__(self, world, start_in_autopilot, joystick, args):
+    def __init__(self, world, start_in_autopilot, input_device, args):
         self._autopilot_enabled = start_in_autopilot
         self._ackermann_enabled = False
         self._ackermann_reverse = 1
@@ -409,40 +439,30 @@ class KeyboardControl(object):
         self._steer_cache = 0.0
         world.hud.notification("Press 'H' or '?' for help.", seconds=4.0)
 
-        # Joystick additions
-        self.joystick = joystick
-        self.wheel_axis_val = 0
-        self.right_pedal_axis_val = 1
-        self.middle_pedal_axis_val = 1
-        self.left_pedal_axis_val = 1
-        self.wheel_sensitivity = float(args.wheel_sensitivity)
+        # Joystick additions, the wheel and pedals are polled by the InputDeviceService thread
+        self.input_device = input_device
+        self.input_state = input_device.latest()
+        self.wheel_sensitivity = args.motion_config.wheel_sensitivity
         self.joystick_in_use = True
 
-    # Axis 0: wheel
-    # Axis 1: rightmost pedal
-    # Axis 2: middle pedal
-    # Axis 4: leftmost pedal
     def get_joystick_input(self):
-        if (self.wheel_axis_val != self.joystick.get_axis(0) or self.right_pedal_axis_val != self.joystick.get_axis(1) or  self.middle_pedal_axis_val != self.joystick.get_axis(2) or  self.left_pedal_axis_val != self.joystick.get_axis(4)):
-            self.wheel_axis_val = self.joystick.get_axis(0)
-            self.right_pedal_axis_val = self.joystick.get_axis(1)
-            self.middle_pedal_axis_val = self.joystick.get_axis(2)
-            self.left_pedal_axis_val = self.joystick.get_axis(4)
+        # Latest calibrated state of the wheel and pedals (see smartcities.controls.input_device)
+        if not self.input_device.threaded:
+            # SDL is not thread safe, the pygame wheel is read here once per frame after the events are pumped
+            pygame.event.pump()
+            self.input_device.poll()
+        self.input_state = self.input_device.latest()
 
 
     def _parse_joystick_input(self):
-        
-        if self.right_pedal_axis_val < 0.99:
-            self._control.throttle = (1 - self.right_pedal_axis_val)/2
-        else:
-            self._control.throttle = 0
-        
-        if self.middle_pedal_axis_val < 0.75:
-            self._control.brake = (1 - self.middle_pedal_axis_val)/2
-        else:
-            self._control.brake = 0
+        state = self.input_state
+
+        # Without a calibration profile, the pedal deadzones of G27_LAYOUT ignore the first 0.5% of the
+        # throttle and 12.5% of the brake travel
+        self._control.throttle = state.throttle
+        self._control.brake = state.brake
 
-        self._steer_cache = self.wheel_sensitivity * self.wheel_axis_val
+        self._steer_cache = self.wheel_sensitivity * state.steer
         self._control.steer = self._steer_cache
 
 
@@ -782,10 +802,10 @@ class HUD(object):
 
     def tick(self, world, clock):
         self._notifications.tick(world, clock)
-        if not self._show_info:
+        if not self._show_info or world.kinematics.kinematics is None:
             return
-        t = world.player.get_transform()
-        v = world.player.get_velocity()
+        t = world.kinematics.kinematics.transform
+        v = world.kinematics.kinematics.velocity
         c = world.player.get_control()
         compass = world.imu_sensor.compass
         heading = 'N' if compass > 270.5 or compass < 89.5 else ''
@@ -1245,6 +1265,8 @@ class CameraManager(object):
                     bp.set_attribute(attr_name, attr_value)
                     if attr_name == 'range':
                         self.lidar_range = float(attr_value)
+                # Bird's-eye view image and scratch arrays kept from one sweep to the next
+                self.lidar_rasterizer = LidarRasterizer(hud.dim[0], hud.dim[1], self.lidar_range)
 
             item.append(bp)
         self.index = None
@@ -1298,18 +1320,8 @@ class CameraManager(object):
         if not self:
             return
         if self.sensors[self.index][0].startswith('sensor.lidar'):
-            points = np.frombuffer(image.raw_data, dtype=np.dtype('f4'))
-            points = np.reshape(points, (int(points.shape[0] / 4), 4))
-            lidar_data = np.array(points[:, :2])
-            lidar_data *= min(self.hud.dim) / (2.0 * self.lidar_range)
-            lidar_data += (0.5 * self.hud.dim[0], 0.5 * self.hud.dim[1])
-            lidar_data = np.fabs(lidar_data)  # pylint: disable=E1111
-            lidar_data = lidar_data.astype(np.int32)
-            lidar_data = np.reshape(lidar_data, (-1, 2))
-            lidar_img_size = (self.hud.dim[0], self.hud.dim[1], 3)
-            lidar_img = np.zeros((lidar_img_size), dtype=np.uint8)
-            lidar_img[tuple(lidar_data.T)] = (255, 255, 255)
-            self.surface = pygame.surfarray.make_surface(lidar_img)
+            # make_surface copies the image, the rasterizer draws the next sweep into it
+            self.surface = pygame.surfarray.make_surface(self.lidar_rasterizer.rasterize(image.raw_data))
         elif self.sensors[self.index][0].startswith('sensor.camera.dvs'):
             # Example of converting the raw_data from a carla.DVSEventArray
             # sensor into a NumPy array and using it as an image
@@ -1342,11 +1354,25 @@ class CameraManager(object):
 # ==============================================================================
 
 
+def check_motion_stack(args, force_feedback_scheduler):
+    """Raise the error of a failed force feedback thread, or if SimcraftApp exited, once per frame."""
+    if force_feedback_scheduler is not None and force_feedback_scheduler.error is not None:
+        raise force_feedback_scheduler.error
+    if args.motion_process is not None and args.motion_process.poll() is not None:
+        raise RuntimeError('SimcraftApp exited with code %d, the platform no longer follows the drive'
+                           % args.motion_process.returncode)
+
+
 def game_loop(args):
     pygame.init()
     pygame.font.init()
     world = None
     original_settings = None
+    recorder = None
+    input_device = None
+    force_feedback_scheduler = None
+    meter = None
+    tracer = NullTracer()
 
     try:
         client = carla.Client(args.host, args.port)
@@ -1359,6 +1385,8 @@ def game_loop(args):
             if not settings.synchronous_mode:
                 settings.synchronous_mode = True
                 settings.fixed_delta_seconds = 0.05
+            if args.headless:
+                settings.fixed_delta_seconds = args.fixed_delta
             sim_world.apply_settings(settings)
 
             traffic_manager = client.get_trafficmanager()
@@ -1368,21 +1396,48 @@ def game_loop(args):
             print("WARNING: You are currently in asynchronous mode and could "
                   "experience some issues with the traffic simulation")
 
-        display = pygame.display.set_mode(
-            (args.width, args.height),
-            pygame.HWSURFACE | pygame.DOUBLEBUF)
-        display.fill((0,0,0))
-        pygame.display.flip()
+        if not args.headless:
+            display = pygame.display.set_mode(
+                (args.width, args.height),
+                pygame.HWSURFACE | pygame.DOUBLEBUF)
+            display.fill((0,0,0))
+            pygame.display.flip()
+
+            pygame.joystick.init()
+            joysticks = [pygame.joystick.Joystick(i) for i in range(pygame.joystick.get_count())]
+            # for joystick in joysticks:
+            #     print(joystick.get_name())
 
-        pygame.joystick.init()
-        joysticks = [pygame.joystick.Joystick(i) for i in range(pygame.joystick.get_count())]
-        # for joystick in joysticks:
-        #     print(joystick.get_name())
+        if args.trace:
+            tracer = LatencyTracer()
+            sim_world.on_tick(lambda snapshot: tracer.mark('server_tick', snapshot.frame))
 
         hud = HUD(args.width, args.height)
         world = World(sim_world, hud, args)
-        # **Assumption that Logitech G27 joystick is the first one in the list**
-        controller = KeyboardControl(world, args.autopilot, joysticks[0], args)
+        if args.headless:
+            # No driver in the batch runs, see smartcities.motion.headless
+            world.player.set_autopilot(True)
+        else:
+            # **Assumption that Logitech G27 joystick is the first one in the list**
+            # Axis mapping of the wheel from its calibration profile (util/calibrate_wheel.py)
+            input_backend = create_backend(args.input_backend, joysticks[0] if joysticks else None)
+            input_device = InputDeviceService(
+                input_backend, layout=input_layout(args.calibration, input_backend, args.driver), rate_hz=args.input_rate)
+            if input_device.threaded:
+                input_device.start()
+            controller = KeyboardControl(world, args.autopilot, input_device, args)
+        if args.force_feedback and not args.headless:
+            # The wheel torque is computed and sent from its own thread, the render loop only
+            # publishes the steering state of each frame
+            force_feedback = ForceFeedback(LogitechWheelSDK(args.force_feedback_dll))
+            force_feedback_snapshot = SnapshotSlot()
+            force_feedback_scheduler = MotionScheduler(
+                force_feedback_snapshot,
+                force_feedback.update,
+                args.force_feedback_rate,
+                name='ForceFeedback',
+                label='force feedback')
+            force_feedback_scheduler.start()
 
         
         
@@ -1393,21 +1448,109 @@ def game_loop(args):
         else:
             sim_world.wait_for_tick()
 
+        # With --washout, motion cueing at the simulation step: the fixed delta of the world settings, otherwise
+        # the difference of the frame timestamps, see smartcities.motion.washout
+        fixed_delta = sim_world.get_settings().fixed_delta_seconds
+        washout = ClassicalWashout(fixed_delta or 1.0 / 60) if args.washout else None
+        sampler = SimcraftSampler(washout, fixed_delta)
+        recorder = TelemetryRecorder(args.record) if args.record else None
+
+        if args.headless:
+            # Fixed step batch run: each tick waits until SimcraftApp commanded the actuators with
+            # the previous samples, so the server runs as fast as the platform consumes them. The
+            # UDP and CSV samples have no local consumer to wait on, they are paced to real time.
+            waiting_for = 'the motion stack' if args.motion_publisher is not None else 'real time'
+            meter = TickRateMeter(args.fixed_delta, args.report_interval, waiting_for=waiting_for)
+            meter.begin()
+            while not args.ticks or meter.ticks < args.ticks:
+                check_motion_stack(args, force_feedback_scheduler)
+                loop_begin = tracer.begin()
+                sim_world.tick()
+                kinematics = world.kinematics.update()
+                frame = kinematics.frame if kinematics is not None else -1
+                waited = 0.0
+                if kinematics is not None:
+                    if recorder is not None:
+                        recorder.record(kinematics)
+                    begin = tracer.begin()
+                    if args.motion_udp_publisher is not None:
+                        args.motion_udp_publisher.publish(kinematics)
+                    else:
+                        store_car_motion_info(args, *sampler.sample(kinematics))
+                    tracer.end('store_car_motion_info', begin, frame)
+                    if args.motion_publisher is not None:
+                        # Unpaced until SimcraftApp reports, e.g. if it could not be started
+                        begin = time.perf_counter()
+                        args.motion_publisher.wait_consumed(timeout=1.0)
+                        waited = time.perf_counter() - begin
+                    else:
+                        waited = meter.pace()
+                tracer.end('game_loop', loop_begin, frame)
+                report = meter.tick(waited)
+                if report is not None:
+                    print(report)
+            return
+
         clock = pygame.time.Clock()
         while True:
+            check_motion_stack(args, force_feedback_scheduler)
+            loop_begin = tracer.begin()
             if args.sync:
                 sim_world.tick()
             clock.tick_busy_loop(60)
+            begin = tracer.begin()
             if controller.parse_events(client, world, clock, args.sync):
                 return
+            tracer.end('parse_events', begin)
+            begin = tracer.begin()
             world.tick(clock)
+            kinematics = world.kinematics.kinematics
+            frame = kinematics.frame if kinematics is not None else -1
+            tracer.end('World.tick', begin, frame)
+            if force_feedback_scheduler is not None:
+                force_feedback_snapshot.publish(world.steering.sample(kinematics))
+            begin = tracer.begin()
             world.render(display)
+            tracer.end('World.render', begin, frame)
+            begin = tracer.begin()
             pygame.display.flip()
-            velo_magnitude = world.player.get_velocity().length()
-            store_car_motion_info(args, world.player.get_transform().rotation.pitch, world.player.get_transform().rotation.yaw, world.player.get_transform().rotation.roll, world.player.get_angular_velocity().z, velo_magnitude)
+            tracer.end('display.flip', begin, frame)
+            if kinematics is None:
+                continue
+            if recorder is not None:
+                recorder.record(kinematics)
+            # The SimcraftApp executable moves the actuators, the client side ends with the hand-off
+            begin = tracer.begin()
+            if args.motion_udp_publisher is not None:
+                # The washout runs on the rig host, see util/motion_udp_receiver.py
+                args.motion_udp_publisher.publish(kinematics)
+            else:
+                store_car_motion_info(args, *sampler.sample(kinematics))
+            tracer.end('store_car_motion_info', begin, frame)
+            tracer.end('game_loop', loop_begin, frame)
 
     finally:
 
+        if meter is not None:
+            print(meter)
+
+        if input_device is not None:
+            input_device.stop()
+            print(input_device)
+
+        if force_feedback_scheduler is not None:
+            force_feedback_scheduler.stop()
+            force_feedback.close()
+            print(force_feedback_scheduler.stats)
+
+        if recorder is not None:
+            recorder.close()
+
+        if isinstance(tracer, LatencyTracer):
+            print(tracer.report([('server_tick', 'store_car_motion_info')]))
+            tracer.export_chrome_trace(args.trace)
+            print('Chrome trace written to ' + args.trace)
+
         if original_settings:
             sim_world.apply_settings(original_settings)
 
@@ -1423,9 +1566,12 @@ def game_loop(args):
 import csv
 import os
 
-# Make sure that the CSV file is within the same folder as both the python script and the SimcraftApp executable file, and that the python script is run within the folder.
+# The motion data is handed to the SimcraftApp executable through the memory-mapped ring buffer at args.data_path.
+# A data path ending in .csv falls back to rewriting the legacy CSV file every frame.
 def store_car_motion_info(args, pitch, yaw, roll, angularVelocityY, velocityMagnitude):
-    current_working_directory = os.getcwd()
+    if args.motion_publisher is not None:
+        args.motion_publisher.publish(pitch, yaw, roll, angularVelocityY, velocityMagnitude)
+        return
     # Path for Motion data pipeline CSV file from args.data_path
     with open(args.data_path, 'w', newline="") as csvfile:
         datawriter = csv.writer(csvfile, delimiter=',', quotechar='|', quoting=csv.QUOTE_MINIMAL)
@@ -1452,7 +1598,7 @@ def main():
         metavar='data_path',
         default="null",
         type=str,
-        help='data_path set automatically to MOTION_DATA_PIPE.csv in current working directory')
+        help='data_path set automatically to MOTION_DATA_PIPE.bin in current working directory (a .csv path uses the legacy CSV hand-off)')
     argparser.add_argument(
         '--motion_exe_path',
         metavar='motion_exe_path',
@@ -1464,7 +1610,13 @@ def main():
         metavar='config_path',
         default="null",
         type=str,
-        help='config_path set automatically to simcraft_config.txt in current working directory')
+        help='config_path set automatically to config_simcraft.txt in current working directory (.toml and .json files are also accepted)')
+    argparser.add_argument(
+        '--scn6_limits',
+        action='store_true',
+        help='compute the actuator pulses in Python, shaped by the placeholder SCN6 axis limits of '
+             'smartcities.motion.scn6, instead of the SimcraftApp mapping. Experimental, the limits are neither '
+             'from the datasheet nor measured on the rig and do not protect the hardware (off by default)')
     argparser.add_argument(
         '-v', '--verbose',
         action='store_true',
@@ -1514,10 +1666,106 @@ def main():
         '--sync',
         action='store_true',
         help='Activate synchronous mode execution')
+    argparser.add_argument(
+        '--washout',
+        action='store_true',
+        help='send washout filter cues to the SimCraft platform instead of the raw vehicle attitude (not validated '
+             'on the platform yet)')
+    argparser.add_argument(
+        '--motion_udp',
+        metavar='HOST:PORT',
+        default=None,
+        help='send the kinematics to util/motion_udp_receiver.py on the motion rig host instead of running SimCraftApp.exe locally (default port: 2070)')
+    argparser.add_argument(
+        '--input_backend',
+        choices=BACKENDS,
+        default=DEFAULT_BACKEND,
+        help='how the wheel and pedals are read: winmm (joyGetPosEx, Windows only), pygame or synthetic (scripted '
+             'drive, no wheel needed). Only winmm and synthetic are sampled in the background at --input_rate, pygame '
+             'is sampled at the render rate, once per frame, as SDL is not thread safe '
+             '(default: winmm on Windows, pygame elsewhere)')
+    argparser.add_argument(
+        '--input_rate',
+        metavar='HZ',
+        default=500.0,
+        type=float,
+        help='poll rate of the wheel and pedals by the input thread, not used by the pygame backend, which is polled at the render rate (default: 500)')
+    argparser.add_argument(
+        '--calibration',
+        metavar='calibration',
+        default="null",
+        type=str,
+        help='calibration set automatically to calibration_profiles.json in current working directory, see util/calibrate_wheel.py')
+    argparser.add_argument(
+        '--driver',
+        metavar='NAME',
+        default=None,
+        help='use the wheel calibration profile of this driver (default: the default profile of the wheel)')
+    argparser.add_argument(
+        '--force_feedback',
+        action='store_true',
+        help='steering wheel force feedback (centering, self-aligning torque and road feel) through the Logitech Steering Wheel SDK')
+    argparser.add_argument(
+        '--force_feedback_dll',
+        metavar='force_feedback_dll',
+        default="null",
+        type=str,
+        help='force_feedback_dll set automatically to LogitechSteeringWheelEnginesWrapper.dll in current working directory')
+    argparser.add_argument(
+        '--force_feedback_rate',
+        metavar='HZ',
+        default=200.0,
+        type=float,
+        help='update rate of the wheel torque (default: 200)')
+    argparser.add_argument(
+        '--headless',
+        action='store_true',
+        help='batch run without window, camera or driver input: the hero drives on autopilot and the server is ticked in synchronous mode as fast as SimCraftApp consumes the samples')
+    argparser.add_argument(
+        '--fixed_delta',
+        metavar='SECONDS',
+        default=0.05,
+        type=float,
+        help='simulation step of the headless run, also the tick period when the samples go over UDP or to a CSV file (default: 0.05)')
+    argparser.add_argument(
+        '--ticks',
+        metavar='N',
+        default=0,
+        type=int,
+        help='number of ticks of the headless run (default: 0, until Ctrl+C)')
+    argparser.add_argument(
+        '--report_interval',
+        metavar='SECONDS',
+        default=5.0,
+        type=float,
+        help='seconds between two tick rate reports of the headless run (default: 5)')
+    argparser.add_argument(
+        '--record',
+        metavar='PATH',
+        default=None,
+        help='record the hero kinematics of every frame to a .npz file, for util/motion_replay.py (the frames recorded so far stay in PATH.parts if the client is killed)')
+    argparser.add_argument(
+        '--trace',
+        metavar='PATH',
+        default=None,
+        help='trace the latency from the server tick to the motion hand-off and write a Chrome trace JSON file on exit')
     args = argparser.parse_args()
 
     args.width, args.height = [int(x) for x in args.res.split('x')]
 
+    # The headless run ticks the server itself, with the hero on autopilot
+    if args.headless:
+        args.sync = True
+        args.autopilot = True
+
+    # If not specified by user, the wheel calibration profiles are defined as calibration_profiles.json within the cwd
+    if args.calibration == "null":
+        args.calibration = os.getcwd() + "\\calibration_profiles.json"
+
+    # If not specified by user, the Logitech Steering Wheel SDK is defined as LogitechSteeringWheelEnginesWrapper.dll within the cwd
+    if args.force_feedback_dll == "null":
+        args.force_feedback_dll = os.getcwd() + "\\LogitechSteeringWheelEnginesWrapper.dll"
+
     print()
     # If not specified by user, config path is defined as simcraft_config.txt within the cwd
     if args.config_path == "null":
@@ -1525,53 +1773,39 @@ def main():
     
     print("Using configuration file from: " + args.config_path + "\n")
 
-    try:
-        config = open(args.config_path, 'r').readlines()
-
-        for var in config:
-            var = var.strip("\n")
-            sense_var_index = var.find("wheel_sensitivity=")
-            motion_exe_index = var.find("motion_exe_path=")
-            data_path_index = var.find("data_path=")
-            
-            if motion_exe_index != -1:
-                args.motion_exe_path = var[motion_exe_index + len("motion_exe_path="):]
-                print("Using motion exe path from configuration file: " + args.motion_exe_path)
-            
-            if data_path_index != -1:
-                args.data_path = var[data_path_index + len("data_path="):]
-                print("Using data path from configuration file: " + args.data_path)
-
-            if sense_var_index != -1:
-                args.wheel_sensitivity = var[sense_var_index + len("wheel_sensitivity="):]
-                print("Using wheel sensitivity from configuration file: " + args.wheel_sensitivity)
-                try:
-                    float(args.wheel_sensitivity)
-                except:
-                    print("Wheel sensitivity is not configured correctly. Make sure that it is only a float value.")
-                    args.wheel_sensitivity = 0.25
-                if float(args.wheel_sensitivity) <= 0:
-                    print("Wheel sensitivity value is not valid. Please choose one that is greater than 0. Setting wheel sensitivity to default (0.25)")
-                    args.wheel_sensitivity = 0.25
-            else:
-                args.wheel_sensitivity = 0.25
-
-    except:
-        print("Configuration file not found. Continuing with default values.")
-
-    print()
-
-    
+    # Read and validated once, the configuration file overrides the command line paths.
     # If not specified by user, platform motion executable path is defined as SimCraftApp.exe within the cwd
     if args.motion_exe_path == "null":
         args.motion_exe_path = os.getcwd() + "\\SimCraftApp.exe"
-    # If not specified by user, motion data pipeline is defined as MOTION_DATA_PIPE.csv within the cwd
+    # If not specified by user, motion data pipeline is defined as MOTION_DATA_PIPE.bin within the cwd
     if args.data_path == "null":
-        args.data_path = os.getcwd() + "\\MOTION_DATA_PIPE.csv"
+        args.data_path = os.getcwd() + "\\MOTION_DATA_PIPE.bin"
+    args.motion_config = load_simcraft_config(
+        args.config_path, motion_exe_path=args.motion_exe_path, data_path=args.data_path)
+    args.motion_exe_path = args.motion_config.motion_exe_path
+    args.data_path = args.motion_config.data_path
+
+    print()
+
+    # The SimcraftApp executable maps the ring buffer on start up, so it has to exist before the executable is run
+    args.motion_udp_publisher = None
+    if args.motion_udp:
+        # SimcraftApp runs on the rig host, fed by util/motion_udp_receiver.py
+        args.motion_publisher = None
+        args.motion_udp_publisher = MotionUdpPublisher(parse_address(args.motion_udp, '127.0.0.1'))
+    elif args.data_path.lower().endswith(".csv"):
+        args.motion_publisher = None
+    else:
+        # With --scn6_limits the actuator pulses are computed in Python, see smartcities.motion.scn6, otherwise
+        # SimcraftApp applies its own mapping
+        kinematics = PlatformKinematics(args.motion_config.pitch_sensitivity) if args.scn6_limits else None
+        args.motion_publisher = MotionRingPublisher(args.data_path, kinematics=kinematics)
     
 
+    args.motion_process = None
     try:
-        motion_process = subprocess.Popen([args.motion_exe_path, args.data_path], creationflags=CREATE_NEW_CONSOLE)
+        if args.motion_udp_publisher is None:
+            args.motion_process = subprocess.Popen([args.motion_exe_path, args.data_path], creationflags=CREATE_NEW_CONSOLE)
     except:
         print("Simcraft Motion Platform Executable could not be run. Starting driving simulation without motion active.")
 
@@ -1584,8 +1818,9 @@ def main():
 
     
     pygame.init()
-    pygame.display.set_caption('game base')
-    screen = pygame.display.set_mode((500, 500), 0, 32)
+    if not args.headless:
+        pygame.display.set_caption('game base')
+        screen = pygame.display.set_mode((500, 500), 0, 32)
     clock = pygame.time.Clock()
 
     try:
@@ -1594,11 +1829,19 @@ def main():
 
     except KeyboardInterrupt:
         try:
-            motion_process.kill()
+            args.motion_process.kill()
         except:
             print("motion wasn't activated.")
         print('\nCancelled by user. Bye!')
 
+    finally:
+        if args.motion_publisher is not None:
+            args.motion_publisher.close()
+        if args.motion_udp_publisher is not None:
+            args.motion_udp_publisher.close()
+            print('%d motion packets sent, %d send errors' % (
+                args.motion_udp_publisher.seq, args.motion_udp_publisher.send_errors))
+
 
 if __name__ == '__main__':
 
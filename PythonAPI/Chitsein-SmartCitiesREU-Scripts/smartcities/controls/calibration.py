@@ -0,0 +1,222 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Per-device and per-driver calibration of the wheel and pedal axes.
+
+util/calibrate_wheel.py records the raw axes while the driver follows the
+CALIBRATION_STEPS (rest, full sweeps of the wheel and of each pedal, then
+each pedal held at what feels like half travel), and fit_profile() finds:
+
+  * which raw axis is which control, the axis that moved most in its step,
+    so wheels with another layout than the G27 (e.g. G29) need no change;
+  * the range of each axis and its rest position;
+  * the deadzone, from the rest offset and noise of the axis;
+  * the response curve of the pedals, the exponent bringing the half press
+    of the driver to 0.5.
+
+The profiles are kept in a JSON file (CalibrationStore), under the guid of
+the device and the driver name. At run time input_layout() turns the profile
+into AxisLookup tables, one entry per 16 bit position of the raw axis, so the
+input thread maps each axis with a single table read.
+"""
+
+import array
+import collections
+import json
+import math
+import os
+
+import numpy as np
+
+from smartcities.controls.input_device import AXES, AxisCalibration, G27_LAYOUT
+
+# (step, instruction), in the order the driver follows them
+CALIBRATION_STEPS = (
+    ('rest', 'Center the wheel and release every pedal'),
+    ('steer', 'Turn the wheel slowly to full lock on both sides'),
+    ('throttle', 'Press the throttle pedal to the floor and release it'),
+    ('brake', 'Press the brake pedal to the floor and release it'),
+    ('clutch', 'Press the clutch pedal to the floor and release it'),
+    ('throttle_half', 'Hold the throttle pedal at what feels like half throttle'),
+    ('brake_half', 'Hold the brake pedal at what feels like half braking'),
+)
+
+PEDALS = ('throttle', 'brake', 'clutch')
+
+# Positions of a 16 bit axis, the resolution of the WinMM and pygame joystick values
+LOOKUP_SIZE = 65536
+
+PROFILE_VERSION = 1
+
+
+def calibrate_array(calibration, raw):
+    """AxisCalibration.apply() of an array of raw values."""
+    raw = np.asarray(raw, dtype=np.float64)
+    value = np.clip((raw - calibration.low) / (calibration.high - calibration.low), 0.0, 1.0)
+    if calibration.centered:
+        value = 2.0 * value - 1.0
+    magnitude = np.abs(value)
+    shaped = np.maximum(magnitude - calibration.deadzone, 0.0) / (1.0 - calibration.deadzone)
+    return np.where(magnitude <= calibration.deadzone, 0.0, np.copysign(shaped ** calibration.exponent, value))
+
+
+class AxisLookup(object):
+    """
+    AxisCalibration tabulated over the 16 bit positions of the raw axis. The
+    raw value must be in [-1, 1], as returned by the input backends.
+    """
+
+    __slots__ = ('calibration', 'table', '_scale')
+
+    def __init__(self, calibration, size=LOOKUP_SIZE):
+        self.calibration = calibration
+        self._scale = 0.5 * (size - 1)
+        self.table = array.array('d', calibrate_array(calibration, np.arange(size) / self._scale - 1.0).tolist())
+
+    def apply(self, raw):
+        return self.table[int((raw + 1.0) * self._scale + 0.5)]
+
+
+class CalibrationProfile(collections.namedtuple('CalibrationProfile', ['guid', 'driver', 'name', 'axes'])):
+    """
+    Calibration of a device for a driver. 'axes' maps the AXES names to
+    (raw axis index, AxisCalibration), 'driver' is None for the default
+    profile of the device.
+    """
+
+    __slots__ = ()
+
+    def layout(self, lookup=True):
+        """Layout of InputDeviceService, with AxisLookup tables if 'lookup'."""
+        return lookup_layout(self.axes) if lookup else dict(self.axes)
+
+    def to_dict(self):
+        return {name: dict(axis=index, **calibration._asdict()) for name, (index, calibration) in self.axes.items()}
+
+    @classmethod
+    def from_dict(cls, guid, driver, name, axes):
+        return cls(guid, driver, name, collections.OrderedDict(
+            (axis_name, (int(values['axis']), AxisCalibration(
+                float(values['low']), float(values['high']), float(values['deadzone']),
+                float(values['exponent']), bool(values['centered']))))
+            for axis_name, values in axes.items() if axis_name in AXES))
+
+
+def lookup_layout(layout, size=LOOKUP_SIZE):
+    """Layout with every AxisCalibration replaced by its AxisLookup."""
+    return collections.OrderedDict(
+        (name, (index, AxisLookup(calibration, size))) for name, (index, calibration) in layout.items())
+
+
+def fit_profile(guid, name, steps, driver=None, min_deadzone=0.01, noise_margin=3.0, min_travel=0.5):
+    """
+    Fit the calibration of a device from the raw axes recorded in the CALIBRATION_STEPS.
+
+        :param steps: dict of the step names to arrays of shape (samples, axes) of raw
+            values, 'rest' is required, the other steps are optional
+        :param min_deadzone: smallest deadzone, as a fraction of the travel
+        :param noise_margin: deadzone in multiples of the peak noise of the axis at rest
+        :param min_travel: smallest raw range of the axis of a sweep step
+        :return: CalibrationProfile
+        :raise ValueError: if no axis moved in a sweep step
+    """
+    rest = np.asarray(steps['rest'], dtype=np.float64)
+    rest_value = np.median(rest, axis=0)
+    noise = np.abs(rest - rest_value).max(axis=0)
+
+    axes = collections.OrderedDict()
+    assigned = set()
+    for control in AXES:
+        if control not in steps:
+            continue
+        sweep = np.asarray(steps[control], dtype=np.float64)
+        travel = sweep.max(axis=0) - sweep.min(axis=0)
+        travel[list(assigned)] = 0.0
+        index = int(np.argmax(travel))
+        if travel[index] < min_travel:
+            raise ValueError('no axis moved during the %s step' % control)
+        assigned.add(index)
+        low, high = float(sweep[:, index].min()), float(sweep[:, index].max())
+        at_rest = float(rest_value[index])
+
+        if control == 'steer':
+            center = 2.0 * (at_rest - low) / (high - low) - 1.0
+            deadzone = max(min_deadzone, abs(center) + 2.0 * noise_margin * noise[index] / (high - low))
+            axes[control] = (index, AxisCalibration(low, high, deadzone, 1.0, True))
+            continue
+
+        # Pedal from its rest position to the far end of its travel
+        high = high if abs(high - at_rest) >= abs(low - at_rest) else low
+        low = at_rest
+        deadzone = max(min_deadzone, noise_margin * noise[index] / abs(high - low))
+        exponent = 1.0
+        half = steps.get(control + '_half')
+        if half is not None:
+            position = (float(np.median(np.asarray(half, dtype=np.float64)[:, index])) - low) / (high - low)
+            position = (position - deadzone) / (1.0 - deadzone)
+            if 0.0 < position < 1.0:
+                exponent = min(max(math.log(0.5) / math.log(position), 0.3), 3.0)
+        axes[control] = (index, AxisCalibration(low, high, deadzone, exponent, False))
+    return CalibrationProfile(guid, driver, name, axes)
+
+
+class CalibrationStore(object):
+    """Calibration profiles of a JSON file, by device guid and driver."""
+
+    def __init__(self, path):
+        self.path = path
+        self.devices = {}
+        if os.path.exists(path):
+            with open(path, 'r') as profile_file:
+                content = json.load(profile_file)
+            if content.get('version') != PROFILE_VERSION:
+                raise ValueError('%s: unsupported calibration profile version %r' % (path, content.get('version')))
+            self.devices = content['devices']
+
+    def get(self, guid, driver=None):
+        """
+        Profile of the driver on the device, the default profile of the
+        device if the driver has none, None if the device has no profile.
+        """
+        device = self.devices.get(guid)
+        if device is None:
+            return None
+        for key in (driver or '', ''):
+            if key in device['drivers']:
+                return CalibrationProfile.from_dict(guid, key or None, device['name'], device['drivers'][key])
+        return None
+
+    def put(self, profile):
+        device = self.devices.setdefault(profile.guid, {'name': profile.name, 'drivers': {}})
+        device['name'] = profile.name
+        device['drivers'][profile.driver or ''] = profile.to_dict()
+
+    def save(self):
+        # Written aside and renamed, a failed save leaves the previous profiles intact
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as profile_file:
+            json.dump({'version': PROFILE_VERSION, 'devices': self.devices}, profile_file, indent=2, sort_keys=True)
+        os.replace(temporary, self.path)
+
+
+def input_layout(path, backend, driver=None):
+    """
+    Lookup layout of the input device of the clients: the calibration
+    profile of the backend device if 'path' has one, else G27_LAYOUT.
+
+        :param path: JSON file of the calibration profiles
+        :param backend: input backend, see smartcities.controls.input_device
+        :param driver: driver name, None for the default profile of the device
+    """
+    try:
+        profile = CalibrationStore(path).get(backend.guid, driver)
+    except (IOError, OSError, ValueError, KeyError) as error:
+        print('Calibration profiles could not be read (%s). Using the G27 axis layout.' % error)
+        profile = None
+    if profile is None:
+        print('No calibration profile for %s (%s), run util/calibrate_wheel.py. Using the G27 axis layout.' % (
+            backend.name, backend.guid))
+        return lookup_layout(G27_LAYOUT)
+    print('Using the calibration profile of %s for %s' % (profile.driver or 'the default driver', profile.name))
+    return profile.layout()
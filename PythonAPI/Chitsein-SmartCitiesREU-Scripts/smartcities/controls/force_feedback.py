@@ -0,0 +1,281 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Force feedback of the steering wheel from the hero vehicle state.
+
+The render loop samples a SteeringState per frame (SteeringSampler: speed,
+road wheel angle and lateral acceleration, the physics control is read once
+per vehicle) and publishes it into a SnapshotSlot. A MotionScheduler thread
+then calls ForceFeedback.update() at its own rate, independent of the render
+and motion threads, which turns the latest state into a wheel torque
+(SteeringFeelModel) and sends it to an output backend:
+
+  * centering: spring toward the straight ahead position, stiffer with speed;
+  * self-aligning torque: follows the lateral acceleration of the vehicle and
+    fades as the tyres reach the grip limit (loss of pneumatic trail), so the
+    wheel goes light in a slide;
+  * road feel: the high frequency part of the lateral acceleration;
+  * damping: against the rate of the road wheel angle.
+
+The torque is normalized to [-1, 1], positive turning the wheel to the right,
+and its slew rate is limited at every tick, so the frame rate steps are not
+felt as jolts.
+
+Backends expose set_torque(torque) and close(): LogitechWheelSDK drives a
+Logitech wheel (G27) through the Logitech Steering Wheel SDK, and
+RecordingForceBackend records the commands for tests, see
+util/force_feedback_sim.py.
+"""
+
+import collections
+import ctypes
+import math
+import time
+
+SteeringState = collections.namedtuple('SteeringState', [
+    'timestamp', 'speed', 'steer_angle', 'max_steer_angle', 'lateral_acceleration'])
+SteeringState.__doc__ = """
+Steering related state of the hero for one simulation frame.
+
+    timestamp: simulation time in seconds
+    speed: forward speed in m/s
+    steer_angle: road wheel angle in degrees, positive to the right
+    max_steer_angle: road wheel angle at full lock in degrees
+    lateral_acceleration: acceleration along the right vector of the vehicle in m/s^2
+"""
+
+ForceCommand = collections.namedtuple('ForceCommand', ['timestamp', 'torque'])
+
+
+class SteeringSampler(object):
+    """
+    SteeringState of an actor, from the Kinematics of the frame. The physics
+    control is read once per actor, the road wheel angle once per frame.
+    """
+
+    def __init__(self, wheel_location=None, default_max_steer_angle=70.0):
+        """
+            :param wheel_location: carla.VehicleWheelLocation read with get_wheel_steer_angle(),
+                None to use the steer of the applied control instead (no server call)
+            :param default_max_steer_angle: full lock angle of actors without physics control
+        """
+        self.wheel_location = wheel_location
+        self.default_max_steer_angle = default_max_steer_angle
+        self.actor = None
+        self.max_steer_angle = default_max_steer_angle
+
+    def set_actor(self, actor):
+        """Follow 'actor', e.g. after the hero is respawned."""
+        self.actor = actor
+        self.max_steer_angle = self.default_max_steer_angle
+        try:
+            # The two front wheels steer, the rear ones report 0
+            angles = [wheel.max_steer_angle for wheel in actor.get_physics_control().wheels]
+            if angles and max(angles) > 0:
+                self.max_steer_angle = max(angles)
+        except (AttributeError, RuntimeError):
+            # Walkers have no physics control
+            pass
+
+    def sample(self, kinematics):
+        """
+            :param kinematics: Kinematics of the frame
+            :return: SteeringState, None if there is no actor
+        """
+        if self.actor is None or kinematics is None:
+            return None
+        if self.wheel_location is not None:
+            steer_angle = self.actor.get_wheel_steer_angle(self.wheel_location)
+        else:
+            steer_angle = self.actor.get_control().steer * self.max_steer_angle
+        velocity, acceleration = kinematics.velocity, kinematics.acceleration
+        forward, right = kinematics.forward, kinematics.right
+        return SteeringState(
+            kinematics.timestamp,
+            velocity.x * forward.x + velocity.y * forward.y + velocity.z * forward.z,
+            steer_angle,
+            self.max_steer_angle,
+            acceleration.x * right.x + acceleration.y * right.y + acceleration.z * right.z)
+
+
+class SteeringFeelModel(object):
+    """Wheel torque of a SteeringState, see the module documentation."""
+
+    def __init__(self, centering=0.1, speed_centering=0.3, reference_speed=20.0, aligning=0.5, grip=8.0,
+                 trail_loss=0.8, road_feel=0.15, road_feel_cutoff=3.0, damping=0.02, gain=1.0):
+        """
+            :param centering: centering torque at full lock when stopped
+            :param speed_centering: centering torque added at full lock from 'reference_speed'
+            :param reference_speed: speed in m/s of the stiffest centering
+            :param aligning: self-aligning torque at the grip limit, before the trail loss
+            :param grip: lateral acceleration of the grip limit in m/s^2
+            :param trail_loss: fraction of the self-aligning torque lost at the grip limit
+            :param road_feel: torque per 'grip' of high frequency lateral acceleration
+            :param road_feel_cutoff: cutoff frequency of the road feel high-pass filter in Hz
+            :param damping: torque per full lock per second of road wheel rate
+            :param gain: overall gain, e.g. to suit the strength of the wheel
+        """
+        self.centering = centering
+        self.speed_centering = speed_centering
+        self.reference_speed = reference_speed
+        self.aligning = aligning
+        self.grip = grip
+        self.trail_loss = trail_loss
+        self.road_feel = road_feel
+        self.road_feel_tau = 1.0 / (2.0 * math.pi * road_feel_cutoff)
+        self.damping = damping
+        self.gain = gain
+        self.reset()
+
+    def reset(self):
+        self._previous = None
+        self._high_pass = 0.0
+
+    def torque(self, state):
+        """
+        Torque of a new frame, call once per SteeringState.
+
+            :return: torque in [-1, 1], positive to the right
+        """
+        previous, self._previous = self._previous, state
+        steer = min(max(state.steer_angle / state.max_steer_angle, -1.0), 1.0)
+        speed = abs(state.speed)
+        torque = -(self.centering + self.speed_centering * min(speed / self.reference_speed, 1.0)) * steer
+
+        # No lateral force on the tyres at standstill, only the noise of the physics
+        lateral = state.lateral_acceleration * min(speed, 1.0) / self.grip
+        load = min(abs(lateral), 1.0)
+        torque -= self.aligning * math.copysign(load, lateral) * (1.0 - self.trail_loss * load * load)
+
+        dt = state.timestamp - previous.timestamp if previous is not None else 0.0
+        if dt > 0:
+            previous_lateral = previous.lateral_acceleration * min(abs(previous.speed), 1.0) / self.grip
+            alpha = self.road_feel_tau / (self.road_feel_tau + dt)
+            self._high_pass = alpha * (self._high_pass + lateral - previous_lateral)
+            previous_steer = min(max(previous.steer_angle / previous.max_steer_angle, -1.0), 1.0)
+            torque -= self.damping * (steer - previous_steer) / dt
+        torque -= self.road_feel * self._high_pass
+        return min(max(self.gain * torque, -1.0), 1.0)
+
+
+class ForceFeedback(object):
+    """
+    Callback of a MotionScheduler driving the wheel torque. The torque of the
+    latest state is reached at 'max_slew' full scale per second at most.
+    """
+
+    def __init__(self, backend, model=None, max_slew=10.0, clock=time.perf_counter):
+        """
+            :param backend: object with set_torque(torque) and close()
+            :param model: SteeringFeelModel, default settings if None
+            :param max_slew: largest torque change per second, in full scale
+            :param clock: monotonic time source in seconds
+        """
+        self.backend = backend
+        self.model = model if model is not None else SteeringFeelModel()
+        self.max_slew = max_slew
+        self.torque = 0.0
+        self.target = 0.0
+        self.states = 0
+        self.saturated = 0
+        self._state = None
+        self._last_tick = None
+        self._clock = clock
+
+    def update(self, state, timestamp=None):
+        """
+        Tick of the force feedback thread.
+
+            :param state: latest SteeringState, None if the hero is not spawned
+            :param timestamp: publication time of the state, unused
+        """
+        now = self._clock()
+        dt = now - self._last_tick if self._last_tick is not None else 0.0
+        self._last_tick = now
+        if state is not self._state:
+            self._state = state
+            if state is None:
+                self.model.reset()
+                self.target = 0.0
+            else:
+                self.target = self.model.torque(state)
+                self.states += 1
+                if abs(self.target) >= 1.0:
+                    self.saturated += 1
+        step = self.max_slew * dt
+        self.torque += min(max(self.target - self.torque, -step), step)
+        self.backend.set_torque(self.torque)
+
+    def close(self):
+        self.backend.set_torque(0.0)
+        self.backend.close()
+
+
+# ==============================================================================
+# -- Backends ------------------------------------------------------------------
+# ==============================================================================
+
+
+class LogitechWheelSDK(object):
+    """
+    Constant force of a Logitech wheel through LogitechSteeringWheelEnginesWrapper.dll
+    of the Logitech Steering Wheel SDK (Windows only). The SDK binds to the
+    foreground window, create the backend once the pygame window is shown.
+    The torque is sent in whole percents, only when it changes.
+    """
+
+    def __init__(self, dll_path, index=0, invert=False):
+        """
+            :param dll_path: path to LogitechSteeringWheelEnginesWrapper.dll
+            :param index: controller index of the wheel in the SDK
+            :param invert: reverse the torque, if the wheel turns the wrong way
+        """
+        self._sdk = ctypes.WinDLL(dll_path)
+        self._initialize = self._declare('LogiSteeringInitialize', (ctypes.c_bool,))
+        self._update = self._declare('LogiUpdate', ())
+        self._is_connected = self._declare('LogiIsConnected', (ctypes.c_int,))
+        self._play_constant_force = self._declare('LogiPlayConstantForce', (ctypes.c_int, ctypes.c_int))
+        self._stop_constant_force = self._declare('LogiStopConstantForce', (ctypes.c_int,))
+        self._shutdown = self._declare('LogiSteeringShutdown', ())
+        self._shutdown.restype = None
+        self.index = index
+        self.sign = -100 if invert else 100
+        self._percent = None
+        if not self._initialize(True):
+            raise RuntimeError('could not initialize the Logitech Steering Wheel SDK')
+
+    def _declare(self, name, argtypes):
+        function = self._sdk[name]
+        function.argtypes = argtypes
+        function.restype = ctypes.c_bool
+        return function
+
+    def set_torque(self, torque):
+        # The SDK reads the devices in LogiUpdate(), which must run at every tick
+        if not self._update() or not self._is_connected(self.index):
+            self._percent = None
+            return
+        percent = int(round(self.sign * torque))
+        if percent != self._percent:
+            self._play_constant_force(self.index, percent)
+            self._percent = percent
+
+    def close(self):
+        self._stop_constant_force(self.index)
+        self._shutdown()
+
+
+class RecordingForceBackend(object):
+    """Stand-in backend recording every ForceCommand, for tests."""
+
+    def __init__(self, history=100000, clock=time.perf_counter):
+        self.commands = collections.deque(maxlen=history)
+        self.closed = False
+        self._clock = clock
+
+    def set_torque(self, torque):
+        self.commands.append(ForceCommand(self._clock(), torque))
+
+    def close(self):
+        self.closed = True
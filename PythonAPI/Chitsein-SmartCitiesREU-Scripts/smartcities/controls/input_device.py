@@ -0,0 +1,396 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Steering wheel and pedal input, polled on a background thread.
+
+InputDeviceService polls one backend (all the axes and buttons of the G27
+wheel and pedals) at a fixed rate, independent of the render loop. A poll
+whose raw axes moved less than 'threshold' and whose buttons did not change is
+dropped, the others are calibrated (deadzone and response curve, see
+AxisCalibration) into a new immutable InputState. The control loop reads the
+latest state with InputDeviceService.latest(), a single reference read.
+
+Backends expose poll() returning (axes, buttons), the raw axis values in
+[-1, 1] and the pressed buttons as a bit mask, and the 'guid' of the device
+the calibration profiles are stored under (see smartcities.controls.calibration):
+
+  * WinMMJoystickBackend reads the device directly with joyGetPosEx (Windows),
+    so the state is fresh at every poll;
+  * PygameJoystickBackend reads a pygame joystick, whose state is only updated
+    when the main thread pumps the pygame events (once per frame). SDL
+    joystick calls are not thread safe, so this backend is not polled by the
+    thread: the main thread calls InputDeviceService.poll() once per frame,
+    after pumping the events (InputDeviceService.threaded is False);
+  * SyntheticInputBackend plays a scripted drive, for headless tests.
+
+Only the WinMM (and synthetic) backend is sampled in the background at
+'rate_hz'. The pygame backend is sampled at the render rate, once per frame,
+whatever 'rate_hz' is, so it gains nothing over reading the joystick in the
+control loop.
+
+The clients default to DEFAULT_BACKEND, WinMM on Windows and pygame elsewhere.
+"""
+
+import collections
+import ctypes
+import math
+import sys
+import threading
+import time
+
+AXES = ('steer', 'throttle', 'brake', 'clutch')
+
+
+class InputState(collections.namedtuple('InputState', ('seq', 'timestamp') + AXES + ('buttons', 'raw'))):
+    """
+    Calibrated input of one poll. 'steer' is in [-1, 1] (right positive), the
+    pedals in [0, 1] (pressed positive), 'buttons' the bit mask of the pressed
+    buttons and 'raw' the raw axis values. 'seq' is 0 before the first poll.
+    """
+
+    __slots__ = ()
+
+    def pressed(self, button):
+        return bool(self.buttons >> button & 1)
+
+
+class AxisCalibration(collections.namedtuple('AxisCalibration', ['low', 'high', 'deadzone', 'exponent', 'centered'])):
+    """
+    Mapping of a raw axis value to the calibrated input. The raw value is
+    normalized from [low, high] to [0, 1] (low may be greater than high, e.g. a
+    pedal reading 1 when released), or to [-1, 1] for a centered axis. Values
+    within 'deadzone' of the rest position are zeroed, the rest of the range is
+    rescaled to start at 0 and shaped by |x| ** exponent.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, low, high, deadzone=0.0, exponent=1.0, centered=False):
+        return super(AxisCalibration, cls).__new__(cls, low, high, deadzone, exponent, centered)
+
+    def apply(self, raw):
+        value = min(max((raw - self.low) / (self.high - self.low), 0.0), 1.0)
+        if self.centered:
+            value = 2.0 * value - 1.0
+        magnitude = abs(value)
+        if magnitude <= self.deadzone:
+            return 0.0
+        magnitude = ((magnitude - self.deadzone) / (1.0 - self.deadzone)) ** self.exponent
+        return math.copysign(magnitude, value)
+
+
+# Logitech G27 through pygame: axis 0 wheel, 1 right (throttle), 2 middle (brake) and 4 left
+# (clutch) pedal, the pedals read 1 when released. The pedal deadzones are the thresholds of
+# manual_control_Simcraft.py.
+G27_LAYOUT = collections.OrderedDict([
+    ('steer', (0, AxisCalibration(-1.0, 1.0, centered=True))),
+    ('throttle', (1, AxisCalibration(1.0, -1.0, deadzone=0.005))),
+    ('brake', (2, AxisCalibration(1.0, -1.0, deadzone=0.125))),
+    ('clutch', (4, AxisCalibration(1.0, -1.0, deadzone=0.05))),
+])
+
+
+# ==============================================================================
+# -- Backends ------------------------------------------------------------------
+# ==============================================================================
+
+
+class PygameJoystickBackend(object):
+    """
+    pygame joystick. The values only change when the main thread calls
+    pygame.event.get() (or pump()), so polling faster than the frame rate
+    only shortens the wait for the next frame. SDL is not thread safe, the
+    backend is polled by the main thread, see InputDeviceService.threaded.
+    """
+
+    thread_safe = False
+
+    def __init__(self, joystick):
+        """
+            :param joystick: initialized pygame.joystick.Joystick
+        """
+        self.joystick = joystick
+        self.name = joystick.get_name()
+        # get_guid() is new in pygame 2
+        self.guid = joystick.get_guid() if hasattr(joystick, 'get_guid') else self.name
+        self._axes = range(joystick.get_numaxes())
+        self._buttons = range(joystick.get_numbuttons())
+
+    def poll(self):
+        get_axis = self.joystick.get_axis
+        get_button = self.joystick.get_button
+        buttons = 0
+        for button in self._buttons:
+            if get_button(button):
+                buttons |= 1 << button
+        return tuple(get_axis(axis) for axis in self._axes), buttons
+
+    def close(self):
+        pass
+
+
+class _JOYINFOEX(ctypes.Structure):
+    _fields_ = [(name, ctypes.c_uint32) for name in (
+        'dwSize', 'dwFlags', 'dwXpos', 'dwYpos', 'dwZpos', 'dwRpos', 'dwUpos', 'dwVpos',
+        'dwButtons', 'dwButtonNumber', 'dwPOV', 'dwReserved1', 'dwReserved2')]
+
+
+class _JOYCAPSW(ctypes.Structure):
+    _fields_ = [('wMid', ctypes.c_uint16), ('wPid', ctypes.c_uint16), ('szPname', ctypes.c_wchar * 32)] + [
+        (name, ctypes.c_uint) for name in (
+            'wXmin', 'wXmax', 'wYmin', 'wYmax', 'wZmin', 'wZmax', 'wNumButtons', 'wPeriodMin', 'wPeriodMax',
+            'wRmin', 'wRmax', 'wUmin', 'wUmax', 'wVmin', 'wVmax', 'wCaps', 'wMaxAxes', 'wNumAxes',
+            'wMaxButtons')] + [('szRegKey', ctypes.c_wchar * 32), ('szOEMVxD', ctypes.c_wchar * 260)]
+
+
+class WinMMJoystickBackend(object):
+    """
+    Joystick read with the Windows multimedia API (joyGetPosEx), which queries
+    the driver on every call and is safe to use from any thread. The axes are
+    X, Y, Z, R, U and V, as 0 to 5, and the first 32 buttons are reported.
+    The guid is made of the manufacturer and product identifiers.
+    """
+
+    thread_safe = True
+
+    JOY_RETURNALL = 0xFF
+    JOYERR_NOERROR = 0
+    AXIS_RANGE = 65535.0
+
+    def __init__(self, device_id=0):
+        """
+            :param device_id: joystick number of the Windows game controllers (0 for JOYSTICKID1)
+        """
+        self.device_id = device_id
+        capabilities = _JOYCAPSW()
+        if ctypes.windll.winmm.joyGetDevCapsW(device_id, ctypes.byref(capabilities), ctypes.sizeof(_JOYCAPSW)) == 0:
+            self.name = capabilities.szPname
+            self.guid = 'winmm-%04x-%04x' % (capabilities.wMid, capabilities.wPid)
+        else:
+            self.name = 'WinMM joystick %d' % device_id
+            self.guid = self.name
+        self._get_pos = ctypes.windll.winmm.joyGetPosEx
+        self._get_pos.argtypes = (ctypes.c_uint, ctypes.POINTER(_JOYINFOEX))
+        self._get_pos.restype = ctypes.c_uint
+        self._info = _JOYINFOEX()
+        self._info.dwSize = ctypes.sizeof(_JOYINFOEX)
+        self._info.dwFlags = self.JOY_RETURNALL
+        self._pointer = ctypes.byref(self._info)
+        self.poll()
+
+    def poll(self):
+        result = self._get_pos(self.device_id, self._pointer)
+        if result != self.JOYERR_NOERROR:
+            raise IOError('joyGetPosEx(%d) failed with error %d' % (self.device_id, result))
+        info = self._info
+        scale = 2.0 / self.AXIS_RANGE
+        axes = (info.dwXpos, info.dwYpos, info.dwZpos, info.dwRpos, info.dwUpos, info.dwVpos)
+        return tuple(axis * scale - 1.0 for axis in axes), info.dwButtons
+
+    def close(self):
+        pass
+
+
+def synthetic_drive(t):
+    """
+    G27 axes and buttons of a scripted drive at time t: steering sweeps and
+    holds, throttle and brake presses, in the 16 bit resolution of the device.
+    """
+    def quantize(value):
+        return round(value * 32767.0) / 32767.0
+
+    cycle = t % 20.0
+    steer = 0.5 * math.sin(2.0 * math.pi * 0.1 * t) if cycle < 10.0 else 0.0
+    throttle = min(1.0, (cycle - 1.0) / 2.0) if 1.0 <= cycle < 8.0 else 0.0
+    brake = 0.8 if 12.0 <= cycle < 14.0 else 0.0
+    # Reverse gear button (11) pressed for 100 ms
+    buttons = 1 << 11 if 16.0 <= cycle < 16.1 else 0
+    axes = (quantize(steer), quantize(1.0 - 2.0 * throttle), quantize(1.0 - 2.0 * brake), 0.0, 1.0, 0.0)
+    return axes, buttons
+
+
+class SyntheticInputBackend(object):
+    """Backend playing 'drive(t)', t in seconds since the backend was created."""
+
+    thread_safe = True
+
+    def __init__(self, drive=synthetic_drive, clock=time.perf_counter):
+        self.name = 'synthetic'
+        self.guid = 'synthetic'
+        self.drive = drive
+        self.clock = clock
+        self.start = clock()
+
+    def poll(self):
+        return self.drive(self.clock() - self.start)
+
+    def close(self):
+        pass
+
+
+BACKENDS = ('pygame', 'winmm', 'synthetic')
+
+# joyGetPosEx reads the device at every poll, pygame only once per frame
+DEFAULT_BACKEND = 'winmm' if sys.platform == 'win32' else 'pygame'
+
+
+def create_backend(name, joystick=None, device_id=0):
+    """
+    Backend of the --input_backend option of the clients.
+
+        :param name: one of BACKENDS
+        :param joystick: pygame joystick of the 'pygame' backend
+        :param device_id: joystick number of the 'winmm' backend
+    """
+    if name == 'winmm':
+        return WinMMJoystickBackend(device_id)
+    if name == 'synthetic':
+        return SyntheticInputBackend()
+    if name != 'pygame':
+        raise ValueError('unknown input backend %r, expected one of %s' % (name, ', '.join(BACKENDS)))
+    if joystick is None:
+        raise RuntimeError('no joystick found, connect the wheel or use the synthetic input backend')
+    return PygameJoystickBackend(joystick)
+
+
+# ==============================================================================
+# -- InputDeviceService --------------------------------------------------------
+# ==============================================================================
+
+
+class InputDeviceService(threading.Thread):
+    """
+    Daemon thread polling an input backend into the latest InputState. The
+    thread is only started for a backend whose 'thread_safe' is true, see
+    'threaded'; the others are polled with poll() by the thread pumping the
+    pygame events.
+    """
+
+    def __init__(self, backend, layout=G27_LAYOUT, rate_hz=500.0, threshold=0.002, spin_time=0.002,
+                 clock=time.perf_counter):
+        """
+            :param backend: object whose poll() returns (axes, buttons)
+            :param layout: dict of the AXES names to (raw axis index, mapping), the mapping
+                being an AxisCalibration or any object with apply(raw) such as the lookup
+                tables of a calibration profile, a missing name reads 0
+            :param rate_hz: poll rate in Hz of the thread, not used by the backends polled with poll()
+            :param threshold: smallest raw axis change making a new state
+            :param spin_time: seconds before each poll spent yielding instead of sleeping,
+                to work around the coarse sleep resolution on Windows
+            :param clock: monotonic time source in seconds
+        """
+        super(InputDeviceService, self).__init__(name='InputDeviceService')
+        self.daemon = True
+        if rate_hz <= 0:
+            raise ValueError('rate_hz must be greater than 0')
+        self.backend = backend
+        # False for a backend that must be polled by the main thread (pygame)
+        self.threaded = getattr(backend, 'thread_safe', True)
+        self.layout = [layout.get(name) for name in AXES]
+        # (raw axis index, mapping function) per InputState axis, unmapped axes read raw axis 0 as 0
+        self._mappings = [
+            (entry[0], entry[1].apply) if entry is not None else (0, lambda raw: 0.0) for entry in self.layout]
+        self.period = 1.0 / rate_hz
+        self.threshold = threshold
+        self.spin_time = spin_time
+        self.error = None
+        self.polls = 0
+        self.changes = 0
+        self.errors = 0
+        self.max_interval = 0.0
+        self._clock = clock
+        self._stop_event = threading.Event()
+        self._state = InputState(0, None, 0.0, 0.0, 0.0, 0.0, 0, ())
+        self._first_poll = None
+        self.last_poll = None
+
+    def latest(self):
+        """Latest InputState, seq is 0 before the first poll."""
+        return self._state
+
+    def poll(self):
+        """
+        Poll the backend once, this is what the thread does at every tick.
+
+            :return: True if a new state was published
+        """
+        now = self._clock()
+        if self.last_poll is None:
+            self._first_poll = now
+        else:
+            self.max_interval = max(self.max_interval, now - self.last_poll)
+        self.last_poll = now
+        self.polls += 1
+        try:
+            raw, buttons = self.backend.poll()
+        except (IOError, OSError) as error:
+            # Unplugged or busy device, keep the last state
+            self.errors += 1
+            self.error = error
+            return False
+
+        state = self._state
+        if state.seq != 0 and buttons == state.buttons and len(raw) == len(state.raw) and all(
+                abs(value - previous) <= self.threshold for value, previous in zip(raw, state.raw)):
+            return False
+        try:
+            values = [apply(raw[index]) for index, apply in self._mappings]
+        except IndexError:
+            # Device with fewer axes than the layout
+            values = [apply(raw[index]) if index < len(raw) else 0.0 for index, apply in self._mappings]
+        self._state = InputState(state.seq + 1, now, *values, buttons=buttons, raw=tuple(raw))
+        self.changes += 1
+        return True
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+        self.backend.close()
+
+    def _wait_until(self, deadline):
+        remaining = deadline - self._clock()
+        if remaining > self.spin_time:
+            if self._stop_event.wait(remaining - self.spin_time):
+                return
+        while self._clock() < deadline:
+            time.sleep(0)
+
+    def run(self):
+        deadline = self._clock()
+        try:
+            while not self._stop_event.is_set():
+                self.poll()
+                deadline += self.period
+                now = self._clock()
+                if now > deadline:
+                    # Poll again right away, without bursting to catch up
+                    deadline = now
+                self._wait_until(deadline)
+        except Exception as error:  # pylint: disable=broad-except
+            # Keep the error for the main thread, the state stays at the last poll
+            self.error = error
+            raise
+
+    def summary(self):
+        elapsed = (self.last_poll - self._first_poll) if self.polls > 1 else 0.0
+        return {
+            'device': self.backend.name,
+            'polls': self.polls,
+            'rate_hz': (self.polls - 1) / elapsed if elapsed > 0 else 0.0,
+            # Polled once per frame by the main thread otherwise
+            'target_hz': 1.0 / self.period if self.threaded else None,
+            'max_interval_ms': self.max_interval * 1e3,
+            'changes': self.changes,
+            'errors': self.errors,
+        }
+
+    def __str__(self):
+        summary = self.summary()
+        if summary['target_hz'] is None:
+            summary['target'] = ' Hz, once per frame'
+        else:
+            summary['target'] = '/%.0f Hz' % summary['target_hz']
+        return ('%(device)s: %(polls)d polls at %(rate_hz).0f%(target)s (max interval '
+                '%(max_interval_ms).1f ms), %(changes)d state changes, %(errors)d errors' % summary)
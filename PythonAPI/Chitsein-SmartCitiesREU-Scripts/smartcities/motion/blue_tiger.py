@@ -0,0 +1,122 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Backends for the Eleetus Blue Tiger motion platform API (BTApi).
+
+BlueTigerDLL loads the vendor DLL through ctypes. FakeBlueTiger exposes the
+same functions in pure Python and records every call, so the motion stack can
+run and be timed on machines without the DLL or the platform (e.g. Linux).
+Only the functions used by MotionPlatform are declared, refer to
+Eleetus/BTApi64/BlueTiger API 2_0.pdf for the rest of the API.
+"""
+
+import collections
+import ctypes
+import time
+
+# Return code of every BTApi function on success
+BT_OK = 0
+
+_ACCELERATION_ARGS = (
+    'xAccel', 'yAccel', 'zAccel',
+    'xRotAccel', 'yRotAccel', 'zRotAccel',
+    'xForward', 'yForward', 'zForward',
+    'xRight', 'yRight', 'zRight')
+
+BlueTigerCall = collections.namedtuple('BlueTigerCall', ['timestamp', 'name', 'args'])
+
+
+class BlueTigerDLL(object):
+    """Blue Tiger API loaded from BTApi_x64.dll (Windows only)."""
+
+    def __init__(self, dll_path):
+        """
+        Load the DLL and declare the function prototypes.
+
+            :param dll_path: path to BTApi_x64.dll
+        """
+        self._api = ctypes.WinDLL(dll_path)
+
+        self.BTInit = self._declare('BTInit', (
+            ctypes.c_char_p, # Company name (null-terminated character string of up to 40 characters)
+            ctypes.c_char_p, # Software product name (null-terminated character string of up to 40 characters)
+            ctypes.c_char_p # Software version (null-terminated character string of up to 40 characters)
+        ))
+        self.BTPitchRollData = self._declare('BTPitchRollData', (
+            ctypes.c_float, # pitch
+            ctypes.c_float # roll
+        ))
+        self.BTRotationVectorData = self._declare('BTRotationVectorData', (
+            ctypes.c_float, # xRotation
+            ctypes.c_float, # yRotation
+            ctypes.c_float, # zRotation
+            ctypes.c_float # aRotation
+        ))
+        self.BTAccelerationData = self._declare('BTAccelerationData', (ctypes.c_float,) * len(_ACCELERATION_ARGS))
+        self.BTPause = self._declare('BTPause', None)
+        self.BTResume = self._declare('BTResume', None)
+        self.BTShutdown = self._declare('BTShutdown', None)
+        self.BTStatus = self._declare('BTStatus', None)
+
+    def _declare(self, name, argtypes):
+        function = self._api[name]
+        function.argtypes = argtypes
+        function.restype = ctypes.c_ushort
+        return function
+
+
+class FakeBlueTiger(object):
+    """
+    Stand-in for BlueTigerDLL. Every call is recorded with its time stamp and
+    returns 'return_code', optionally after blocking for 'call_latency' seconds
+    to mimic the DLL.
+    """
+
+    def __init__(self, return_code=BT_OK, call_latency=0.0, history=100000, clock=time.perf_counter):
+        """
+            :param return_code: value returned by every call
+            :param call_latency: seconds each call blocks for
+            :param history: number of calls kept in 'calls'
+            :param clock: time source used to stamp the calls
+        """
+        self.return_code = return_code
+        self.call_latency = call_latency
+        self.calls = collections.deque(maxlen=history)
+        self._clock = clock
+
+    def _call(self, name, args):
+        self.calls.append(BlueTigerCall(self._clock(), name, args))
+        if self.call_latency > 0:
+            time.sleep(self.call_latency)
+        return self.return_code
+
+    def calls_to(self, name):
+        """Recorded calls of the given BTApi function, oldest first."""
+        return [call for call in self.calls if call.name == name]
+
+    def BTInit(self, company, product, version):
+        return self._call('BTInit', (company, product, version))
+
+    def BTPitchRollData(self, pitch, roll):
+        return self._call('BTPitchRollData', (pitch, roll))
+
+    def BTRotationVectorData(self, x_rotation, y_rotation, z_rotation, a_rotation):
+        return self._call('BTRotationVectorData', (x_rotation, y_rotation, z_rotation, a_rotation))
+
+    def BTAccelerationData(self, *args):
+        if len(args) != len(_ACCELERATION_ARGS):
+            raise TypeError('BTAccelerationData takes %d arguments' % len(_ACCELERATION_ARGS))
+        return self._call('BTAccelerationData', args)
+
+    def BTPause(self):
+        return self._call('BTPause', ())
+
+    def BTResume(self):
+        return self._call('BTResume', ())
+
+    def BTShutdown(self):
+        return self._call('BTShutdown', ())
+
+    def BTStatus(self):
+        return self._call('BTStatus', ())
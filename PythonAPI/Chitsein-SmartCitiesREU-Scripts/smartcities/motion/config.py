@@ -0,0 +1,214 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Motion platform configuration, shared by the Eleetus and SimCraft clients.
+
+The configuration is read once at start up from config_eleetus.txt or
+config_simcraft.txt (one key=value per line, # comments), or from a .toml or
+.json file with the same keys, optionally under an [eleetus] or [simcraft]
+table. Every value is validated against the rules below, and invalid or
+missing values fall back to their default. The result is a frozen record that
+also holds the values derived for the motion hot path, so the per-command code
+does no arithmetic on configuration values.
+
+    config = load_eleetus_config('config_eleetus.txt')
+    config.rotation_factor  # rotational_sensitivity in radians per CARLA degree
+"""
+
+import json
+import math
+import os
+from dataclasses import dataclass
+
+# Platform angle range of the Blue Tiger API in radians
+ELEETUS_ANGLE_LIMIT = math.pi / 4
+
+# key: (label, default, lower bound (exclusive), upper bound (inclusive), None for paths)
+ELEETUS_KEYS = {
+    'dll_path': ('platform motion .dll path', None, None, None),
+    'wheel_sensitivity': ('wheel sensitivity', 0.25, 0.0, None),
+    'distance_sensitivity': ('distance sensitivity', 0.5, 0.0, 5.0),
+    'rotational_sensitivity': ('rotational sensitivity', 75.0, 0.0, 100.0),
+    'function_call_hertz': ('function call hertz', 20.0, 0.0, None),
+}
+
+SIMCRAFT_KEYS = {
+    'motion_exe_path': ('motion exe path', None, None, None),
+    'data_path': ('data path', None, None, None),
+    'wheel_sensitivity': ('wheel sensitivity', 0.25, 0.0, None),
+    # coefSens of SimController.cs, used by the pulse mapping of smartcities.motion.scn6
+    'pitch_sensitivity': ('pitch sensitivity', 0.7, 0.0, None),
+}
+
+
+@dataclass(frozen=True)
+class EleetusConfig(object):
+    """Validated Eleetus settings, see eleetus_config()."""
+
+    __slots__ = (
+        'dll_path', 'wheel_sensitivity', 'distance_sensitivity', 'rotational_sensitivity', 'function_call_hertz',
+        'rotation_factor', 'rotational_accel_factor', 'angle_limit', 'call_interval')
+
+    dll_path: str
+    wheel_sensitivity: float
+    distance_sensitivity: float
+    rotational_sensitivity: float
+    function_call_hertz: float
+    # Derived for the hot path, times in seconds
+    rotation_factor: float
+    rotational_accel_factor: float
+    angle_limit: float
+    call_interval: float
+
+
+@dataclass(frozen=True)
+class SimcraftConfig(object):
+    """Validated SimCraft settings, see simcraft_config()."""
+
+    __slots__ = ('motion_exe_path', 'data_path', 'wheel_sensitivity', 'pitch_sensitivity')
+
+    motion_exe_path: str
+    data_path: str
+    wheel_sensitivity: float
+    pitch_sensitivity: float
+
+
+def eleetus_config(dll_path=None, wheel_sensitivity=0.25, distance_sensitivity=0.5,
+                   rotational_sensitivity=75.0, function_call_hertz=20.0):
+    """EleetusConfig from settings already validated, with the derived values."""
+    function_call_hertz = float(function_call_hertz)
+    rotational_sensitivity = float(rotational_sensitivity)
+    return EleetusConfig(
+        dll_path=dll_path,
+        wheel_sensitivity=float(wheel_sensitivity),
+        distance_sensitivity=float(distance_sensitivity),
+        rotational_sensitivity=rotational_sensitivity,
+        function_call_hertz=function_call_hertz,
+        rotation_factor=rotational_sensitivity * math.pi / 180.0,
+        # The raw acceleration mapping was tuned with the rotational acceleration in degrees/s per millisecond
+        rotational_accel_factor=rotational_sensitivity / 1000.0,
+        angle_limit=ELEETUS_ANGLE_LIMIT,
+        call_interval=1.0 / function_call_hertz)
+
+
+def simcraft_config(motion_exe_path=None, data_path=None, wheel_sensitivity=0.25, pitch_sensitivity=0.7):
+    """SimcraftConfig from settings already validated."""
+    return SimcraftConfig(
+        motion_exe_path=motion_exe_path,
+        data_path=data_path,
+        wheel_sensitivity=float(wheel_sensitivity),
+        pitch_sensitivity=float(pitch_sensitivity))
+
+
+def read_settings(path, table=None):
+    """
+    Raw settings of a configuration file, in one pass.
+
+        :param path: key=value text file, or a .toml or .json file
+        :param table: name of the table holding the settings in a TOML or JSON
+            file, if present (e.g. 'eleetus')
+        :return: dict of key to value (strings for the text format), ValueError if a
+            TOML or JSON file does not hold a table
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.toml', '.json'):
+        if extension == '.json':
+            with open(path, 'r') as config_file:
+                settings = json.load(config_file)
+        else:
+            try:
+                import tomllib as toml_parser
+            except ImportError:
+                try:
+                    import toml as toml_parser
+                except ImportError:
+                    raise RuntimeError('cannot read %s, install the toml package (Python < 3.11)' % path)
+            with open(path, 'rb' if toml_parser.__name__ == 'tomllib' else 'r') as config_file:
+                settings = toml_parser.load(config_file)
+        if not isinstance(settings, dict):
+            raise ValueError('%s does not hold a table of settings but a %s' % (path, type(settings).__name__))
+        if table is not None and isinstance(settings.get(table), dict):
+            settings = settings[table]
+        return settings
+
+    settings = {}
+    with open(path, 'r') as config_file:
+        for line in config_file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            key, separator, value = line.partition('=')
+            if separator:
+                settings[key.strip()] = value.strip()
+    return settings
+
+
+def validate(settings, keys):
+    """
+    Check the settings against 'keys' (see ELEETUS_KEYS), printing what is
+    used. Invalid and missing values are replaced by their default.
+
+        :return: dict of every key to its value
+    """
+    values = {}
+    for key, (label, default, lower, upper) in keys.items():
+        value = settings.get(key)
+        if value is None or value == '':
+            values[key] = default
+            continue
+        print('Using %s from configuration file: %s' % (label, value))
+        if lower is None:
+            values[key] = str(value)
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            print('%s is not configured correctly. Make sure that it is only a float value. '
+                  'Setting %s to default (%s)' % (label.capitalize(), label, default))
+            value = default
+        if not math.isfinite(value) or value <= lower:
+            print('%s value is not valid. Please choose one that is greater than %s. '
+                  'Setting %s to default (%s)' % (label.capitalize(), lower, label, default))
+            value = default
+        elif upper is not None and value > upper:
+            print('Warning! %s value is set too high! Please choose one that is at most %s. '
+                  'Setting %s to default (%s)' % (label.capitalize(), upper, label, default))
+            value = default
+        values[key] = value
+    for key in settings:
+        if key not in keys:
+            print('Ignoring unknown configuration key: %s' % key)
+    return values
+
+
+def _load(path, table, keys, defaults):
+    try:
+        settings = read_settings(path, table)
+    except (IOError, OSError):
+        print('Configuration file not found. Continuing with default values.')
+        settings = {}
+    except ValueError as error:
+        # JSON and TOML syntax errors, or a file that is not a table of settings
+        print('Configuration file could not be parsed (%s). Continuing with default values.' % error)
+        settings = {}
+    values = validate(settings, keys)
+    for key, value in defaults.items():
+        if key not in settings or values[key] is None:
+            values[key] = value
+    return values
+
+
+def load_eleetus_config(path, **defaults):
+    """
+    EleetusConfig from config_eleetus.txt or its TOML/JSON equivalent.
+
+        :param defaults: values of the keys missing from the file, e.g. the dll_path
+            of the command line
+    """
+    return eleetus_config(**_load(path, 'eleetus', ELEETUS_KEYS, defaults))
+
+
+def load_simcraft_config(path, **defaults):
+    """SimcraftConfig from config_simcraft.txt or its TOML/JSON equivalent, see load_eleetus_config()."""
+    return simcraft_config(**_load(path, 'simcraft', SIMCRAFT_KEYS, defaults))
@@ -0,0 +1,189 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Eleetus Blue Tiger motion platform driven from CARLA vehicle kinematics.
+"""
+
+import math
+
+from smartcities.motion.blue_tiger import BT_OK, BlueTigerDLL
+from smartcities.motion.washout import ClassicalWashout, to_vehicle_frame
+
+
+class MotionPlatform(object):
+    def __init__(self, args, backend=None):
+        """
+        Initialize the Blue Tiger API.
+
+            :param args: parsed arguments with no_motion, washout and motion_config, the
+                EleetusConfig of smartcities.motion.config
+            :param backend: object exposing the BTApi functions, defaults to the DLL at dll_path
+        """
+        config = args.motion_config
+        self.config = config
+
+        # Load Eleetus Blue Tiger DLL into memory
+        self.blue_tiger_api = backend if backend is not None else BlueTigerDLL(config.dll_path)
+
+        company = "Chitsein Htun - UNLV Smart Cities REU"
+        product = "Manual Control - Eleetus"
+        version = "v1.0"
+
+        company_char_p = company.encode('utf-8')
+        product_char_p = product.encode('utf-8')
+        version_char_p = version.encode('utf-8')
+
+        return_code = self.blue_tiger_api.BTInit(company_char_p, product_char_p, version_char_p)
+
+        while return_code != BT_OK and args.no_motion != True:
+            print("return code error: " + str(return_code))
+            decision = input("There was an error with initializing the Blue Tiger Motion Platform. Would you like to continue without motion? (Y/N)")
+            if decision.upper() == "Y":
+                args.no_motion = True
+                return
+            elif decision.upper() == "N":
+                return_code = self.blue_tiger_api.BTInit(company_char_p, product_char_p, version_char_p)
+
+        if return_code == BT_OK:
+            print("Blue Tiger Initialization was successful.")
+
+        # For calculating angular acceleration later on
+        self.last_tick = None
+        self.prev_rot_vel = None
+        self.rot_accel = (0.0, 0.0, 0.0)
+
+        # Sensitivity parameters, rotation_factor converts CARLA degrees to scaled radians and
+        # rotational_accel_factor scales the rotational acceleration in degrees/s^2
+        self.distance_sensitivity = config.distance_sensitivity
+        self.rotational_sensitivity = config.rotational_sensitivity
+        self.rotation_factor = config.rotation_factor
+        self.rotational_accel_factor = config.rotational_accel_factor
+        self.angle_limit = config.angle_limit
+
+        # Function parameters
+        self.function_call_hertz = config.function_call_hertz
+
+        # Raw acceleration mapping by default. With --washout, motion cueing at the scheduler rate:
+        # distance_sensitivity scales the specific force and the platform is driven by pitch and
+        # roll, rotational_sensitivity only applies to the raw acceleration mapping.
+        if args.washout:
+            self.washout = ClassicalWashout(config.call_interval, accel_gain=self.distance_sensitivity)
+        else:
+            self.washout = None
+
+        # ***DLL Function Set Up***
+        # More functions can be included from the API documentation folder. These are only the few functions that may be used within this program.
+        self.blue_tiger_pitch_roll_data = self.blue_tiger_api.BTPitchRollData
+        self.blue_tiger_pitch_rotation_vector_data = self.blue_tiger_api.BTRotationVectorData
+        self.blue_tiger_acceleration_data = self.blue_tiger_api.BTAccelerationData
+        self.blue_tiger_pause = self.blue_tiger_api.BTPause
+        self.blue_tiger_resume = self.blue_tiger_api.BTResume
+        self.blue_tiger_shutdown = self.blue_tiger_api.BTShutdown
+        self.blue_tiger_status = self.blue_tiger_api.BTStatus
+
+    def status(self):
+        return self.blue_tiger_status()
+
+    def pause(self):
+        return_code = self.blue_tiger_pause()
+        if return_code != BT_OK:
+            print("Failed to pause Eleetus Blue Tiger Motion Platform")
+
+    def resume(self):
+        return_code = self.blue_tiger_resume()
+        if return_code != BT_OK:
+            print("Failed to resume Eleetus Blue Tiger Motion Platform")
+
+    def shutdown(self):
+        return_code = self.blue_tiger_shutdown()
+        if return_code != BT_OK:
+            print("Failed to shutdown Eleetus Blue Tiger Motion Platform")
+
+    def update_motion_platform(self, rotation, accel_vector, rot_velocity_vector, local_forward_vector, local_right_vector, timestamp):
+        """
+        Send one motion command to the platform. This is called by the motion
+        scheduler thread at function_call_hertz, see smartcities.motion.scheduler.
+
+            :param timestamp: time in seconds at which the kinematics were sampled
+        """
+
+        # Important Information about world axis for Eleetus Blue Tiger Motion Platform API:
+        # Forward vector -> A vector that defines the local negative z-axis in world coordinates.
+        # Right vector   -> A vector that defines the local positive x-axis in world coordinates.
+        # Up vector      -> A vector that defines the local positive y-axis in world coordinates.
+
+        # In Carla, positive x is forward vector, positive y is right vector, and positive z is up vector
+
+        if self.washout is not None:
+            return self._update_washout(rotation, accel_vector, local_forward_vector, local_right_vector)
+
+        # Angles are in radians -> Carla angles are in degrees, so must convert.
+        limit = self.angle_limit
+        pitch_raw = min(max(rotation.pitch * self.rotation_factor, -limit), limit)
+        yaw_raw = min(max(rotation.yaw * self.rotation_factor, -limit), limit)
+        roll_raw = min(max(rotation.roll * self.rotation_factor, -limit), limit)
+
+        # Refer to API Documentation for more details
+
+        # If first pass through, set the values
+        if (self.last_tick == None):
+            self.last_tick = timestamp
+        if (self.prev_rot_vel == None):
+            self.prev_rot_vel = rot_velocity_vector
+
+        # Time between the two kinematics samples, in seconds like call_interval
+        delta_t = timestamp - self.last_tick
+
+        # Calculate rotational acceleration vector. The scheduler may run faster than the
+        # samples are produced, so keep the previous value until a new sample arrives.
+        if delta_t > 0:
+            self.rot_accel = (
+                (rot_velocity_vector.x - self.prev_rot_vel.x) / delta_t,
+                (rot_velocity_vector.y - self.prev_rot_vel.y) / delta_t,
+                (rot_velocity_vector.z - self.prev_rot_vel.z) / delta_t)
+            # Store the last time and rotational velocity values
+            self.last_tick = timestamp
+            self.prev_rot_vel = rot_velocity_vector
+        xRotAccel_float, yRotAccel_float, zRotAccel_float = self.rot_accel
+
+        # Keep in mind that carla coordinate system is translated to BT coordinate system
+        xAccel = accel_vector.y * self.distance_sensitivity
+        yAccel = accel_vector.z * self.distance_sensitivity
+        zAccel = -1 * accel_vector.x * self.distance_sensitivity
+        xRotAccel = yRotAccel_float * self.rotational_accel_factor
+        yRotAccel = zRotAccel_float * self.rotational_accel_factor
+        zRotAccel = -1 * xRotAccel_float * self.rotational_accel_factor
+        xForward = local_forward_vector.y
+        yForward = local_forward_vector.z
+        zForward = -1 * local_forward_vector.x
+        xRight = local_right_vector.y
+        yRight = local_right_vector.z
+        zRight = -1 * local_right_vector.x
+
+        status = self.blue_tiger_status()
+
+        # Using pitch roll data
+        # return_code = self.blue_tiger_pitch_roll_data(pitch_raw, roll_raw)
+
+        # Using acceleration data
+        return_code = self.blue_tiger_acceleration_data(xAccel, yAccel, zAccel, xRotAccel, yRotAccel, zRotAccel, xForward, yForward, zForward, xRight, yRight, zRight)
+
+        if return_code != BT_OK:
+            print("Failed to move Eleetus Blue Tiger Motion Platform")
+
+    def _update_washout(self, rotation, accel_vector, local_forward_vector, local_right_vector):
+        forward = (local_forward_vector.x, local_forward_vector.y, local_forward_vector.z)
+        right = (local_right_vector.x, local_right_vector.y, local_right_vector.z)
+        accel = to_vehicle_frame((accel_vector.x, accel_vector.y, accel_vector.z), forward, right)
+        angles = (math.radians(rotation.roll), math.radians(rotation.pitch), math.radians(rotation.yaw))
+        cue = self.washout.step(accel, angles)
+
+        # Tilt coordination and the washed out attitude, limited to the platform range
+        limit = self.angle_limit
+        pitch = min(max(float(cue.angles[1]), -limit), limit)
+        roll = min(max(float(cue.angles[0]), -limit), limit)
+        return_code = self.blue_tiger_pitch_roll_data(pitch, roll)
+
+        if return_code != BT_OK:
+            print("Failed to move Eleetus Blue Tiger Motion Platform")
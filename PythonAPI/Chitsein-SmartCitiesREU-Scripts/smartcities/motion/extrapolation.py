@@ -0,0 +1,166 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Latency compensation of the motion cues by extrapolating the vehicle state.
+
+The seat moves one or more frames after the picture. KinematicsPredictor
+tracks the attitude, acceleration and angular velocity of the hero with a
+constant-acceleration Kalman filter and extrapolates them by the measured
+pipeline latency (see smartcities.motion.tracing) before they are sent to the
+platform.
+
+All the channels share the same normalized noise model, so they share one
+3x3 covariance and gain, and the per-sample work is a few vectorized updates
+of preallocated arrays.
+"""
+
+import math
+
+import numpy as np
+
+from smartcities.motion.telemetry import Rotation, Vector3D
+
+# Channels: pitch, yaw, roll (degrees), acceleration x, y, z, angular velocity x, y, z
+CHANNELS = 9
+_YAW = 1
+
+
+class KinematicsPredictor(object):
+    """Constant-acceleration Kalman filter and extrapolation of the motion channels."""
+
+    def __init__(self, horizon, process_noise=1000.0, angle_order=2, vector_order=1):
+        """
+            :param horizon: default extrapolation time in seconds, e.g. the median
+                server tick to motion command latency
+            :param process_noise: jerk noise relative to the measurement noise, higher
+                follows the samples more closely, lower smooths more
+            :param angle_order: extrapolation order of the attitude (2 uses the angular acceleration)
+            :param vector_order: extrapolation order of the acceleration and angular velocity
+        """
+        self.horizon = horizon
+        self.process_noise = process_noise
+        self.samples = 0
+        # State rows: value, rate, rate of rate; columns: channels
+        self.state = np.zeros((3, CHANNELS))
+        self.covariance = np.zeros((3, 3))
+        self.prediction = np.zeros(CHANNELS)
+        self._orders = np.array([angle_order] * 3 + [vector_order] * 6)
+        self._last_timestamp = None
+        self._last_yaw = 0.0
+        self._unwrapped_yaw = 0.0
+        # Preallocated work arrays
+        self._measurement = np.zeros(CHANNELS)
+        self._innovation = np.zeros(CHANNELS)
+        self._scaled = np.zeros(CHANNELS)
+        self._gain = np.zeros(3)
+        self._transition = np.eye(3)
+        self._noise = np.zeros((3, 3))
+        self._product = np.zeros((3, 3))
+        self._first_order = np.zeros(CHANNELS)
+        self._second_order = np.zeros(CHANNELS)
+
+    def reset(self):
+        self.samples = 0
+        self._last_timestamp = None
+
+    def _set_model(self, dt):
+        # Constant acceleration transition and white jerk process noise
+        self._transition[0, 1] = self._transition[1, 2] = dt
+        self._transition[0, 2] = 0.5 * dt * dt
+        q = self.process_noise
+        d2, d3, d4, d5 = dt ** 2, dt ** 3, dt ** 4, dt ** 5
+        noise = self._noise
+        noise[0, 0], noise[0, 1], noise[0, 2] = q * d5 / 20.0, q * d4 / 8.0, q * d3 / 6.0
+        noise[1, 0], noise[1, 1], noise[1, 2] = noise[0, 1], q * d3 / 3.0, q * d2 / 2.0
+        noise[2, 0], noise[2, 1], noise[2, 2] = noise[0, 2], noise[1, 2], q * dt
+
+    def update(self, timestamp, values):
+        """
+        Filter a new sample, repeated timestamps are ignored.
+
+            :param timestamp: sample time in seconds
+            :param values: the CHANNELS channel values, the yaw in degrees in [-180, 180]
+        """
+        if timestamp == self._last_timestamp:
+            return
+        measurement = self._measurement
+        measurement[:] = values
+        yaw = measurement[_YAW]
+        if self.samples:
+            self._unwrapped_yaw += (yaw - self._last_yaw + 180.0) % 360.0 - 180.0
+        else:
+            self._unwrapped_yaw = yaw
+        self._last_yaw = yaw
+        measurement[_YAW] = self._unwrapped_yaw
+
+        state = self.state
+        covariance = self.covariance
+        if not self.samples:
+            state[0] = measurement
+            state[1:] = 0.0
+            covariance[:] = np.diag((1.0, 1e4, 1e4))
+        else:
+            dt = timestamp - self._last_timestamp
+            self._set_model(dt)
+            # Predict: x = F x, P = F P F' + Q
+            np.multiply(state[1], dt, out=self._scaled)
+            state[0] += self._scaled
+            np.multiply(state[2], 0.5 * dt * dt, out=self._scaled)
+            state[0] += self._scaled
+            np.multiply(state[2], dt, out=self._scaled)
+            state[1] += self._scaled
+            np.dot(self._transition, covariance, out=self._product)
+            np.dot(self._product, self._transition.T, out=covariance)
+            covariance += self._noise
+            # Update with unit measurement noise: K = P H' / (H P H' + 1)
+            np.divide(covariance[:, 0], covariance[0, 0] + 1.0, out=self._gain)
+            np.subtract(measurement, state[0], out=self._innovation)
+            for row in range(3):
+                np.multiply(self._innovation, self._gain[row], out=self._scaled)
+                state[row] += self._scaled
+            np.outer(self._gain, covariance[0], out=self._product)
+            covariance -= self._product
+        self._last_timestamp = timestamp
+        self.samples += 1
+
+    def predict(self, horizon=None):
+        """
+        Extrapolate the filtered channels by 'horizon' seconds (default self.horizon).
+
+            :return: array of the CHANNELS predicted values, reused by the next call
+        """
+        horizon = self.horizon if horizon is None else horizon
+        np.multiply(self._orders >= 1, horizon, out=self._first_order)
+        np.multiply(self._orders >= 2, 0.5 * horizon * horizon, out=self._second_order)
+        prediction = self.prediction
+        np.multiply(self.state[1], self._first_order, out=prediction)
+        np.multiply(self.state[2], self._second_order, out=self._scaled)
+        prediction += self._scaled
+        prediction += self.state[0]
+        prediction[_YAW] = (prediction[_YAW] + 180.0) % 360.0 - 180.0
+        return prediction
+
+    def predict_motion(self, rotation, accel_vector, rot_velocity_vector, local_forward_vector, local_right_vector, timestamp):
+        """
+        Predictor stage in front of MotionPlatform.update_motion_platform.
+
+            :return: (rotation, accel_vector, rot_velocity_vector, local_forward_vector,
+                local_right_vector) extrapolated by 'horizon' past 'timestamp'
+        """
+        self.update(timestamp, (
+            rotation.pitch, rotation.yaw, rotation.roll,
+            accel_vector.x, accel_vector.y, accel_vector.z,
+            rot_velocity_vector.x, rot_velocity_vector.y, rot_velocity_vector.z))
+        pitch, yaw, roll, ax, ay, az, wx, wy, wz = self.predict().tolist()
+
+        # Unit vectors of the predicted rotation, as carla.Rotation computes them
+        cp, sp = math.cos(math.radians(pitch)), math.sin(math.radians(pitch))
+        cy, sy = math.cos(math.radians(yaw)), math.sin(math.radians(yaw))
+        cr, sr = math.cos(math.radians(roll)), math.sin(math.radians(roll))
+        return (
+            Rotation(pitch, yaw, roll),
+            Vector3D(ax, ay, az),
+            Vector3D(wx, wy, wz),
+            Vector3D(cp * cy, cp * sy, sp),
+            Vector3D(cy * sp * sr - sy * cr, sy * sp * sr + cy * cr, -cp * sr))
@@ -0,0 +1,116 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Tick rate of the headless batch mode of the manual control clients.
+
+With --headless the clients open no window, spawn no camera and read no
+driver input: the hero drives on autopilot while the loop ticks the server in
+synchronous mode with a fixed step (--fixed_delta) and publishes the hero
+kinematics of each tick to the motion stack. The next tick waits until the
+motion stack took the sample (MotionScheduler.wait_consumed() for the
+Eleetus thread, MotionRingPublisher.wait_consumed() for SimCraftApp), so the
+server runs as fast as the platform consumes the samples instead of at the
+frame rate of a window, e.g. for burn-in runs of the rig.
+
+With nothing local to wait on, the loop paces itself: the samples sent over
+UDP (--motion_udp) or written to a CSV file are paced to real time with
+TickRateMeter.pace(), one --fixed_delta per tick, as the rig consumes them.
+With --no_motion the run is unpaced, the server ticks as fast as it can, e.g.
+to record telemetry faster than real time.
+
+TickRateMeter reports the achieved ticks per second, the simulated seconds
+per wall second and the share of the wall time spent waiting for the motion
+stack (or the pacing), which tells whether the server or the platform limits
+the run. An unpaced run is reported as such.
+"""
+
+import time
+
+
+class TickRateMeter(object):
+    """Ticks per second of a headless run, overall and since the last report."""
+
+    def __init__(self, fixed_delta=None, report_interval=5.0, clock=time.perf_counter,
+                 waiting_for='the motion stack', sleep=time.sleep):
+        """
+            :param fixed_delta: simulated seconds per tick, None if the server is not on a fixed step
+            :param report_interval: seconds of wall time between two reports, 0 for none
+            :param clock: monotonic time source in seconds
+            :param waiting_for: what the ticks wait for in the reports, e.g. 'real time' with pace(),
+                None for an unpaced run
+            :param sleep: sleep function of pace(), in seconds
+        """
+        self.fixed_delta = fixed_delta
+        self.report_interval = report_interval
+        self.waiting_for = waiting_for
+        self.ticks = 0
+        self.waited = 0.0
+        self.start = None
+        self._clock = clock
+        self._sleep = sleep
+        self._deadline = None
+        self._last_report = None
+
+    def begin(self):
+        """Start the measure, e.g. after the first tick of the run. Called by the first tick() otherwise."""
+        self.start = self._clock()
+        self._last_report = (self.start, self.ticks, self.waited)
+
+    def pace(self):
+        """
+        Wait until one fixed_delta of wall time passed since the last tick, for
+        a run with no motion stack to wait on. A late tick moves the schedule
+        instead of bursting to catch up.
+
+            :return: seconds waited, to pass to tick()
+        """
+        now = self._clock()
+        self._deadline = now if self._deadline is None else max(self._deadline + self.fixed_delta, now)
+        if self._deadline > now:
+            self._sleep(self._deadline - now)
+        return self._clock() - now
+
+    def tick(self, waited=0.0):
+        """
+        Count a server tick.
+
+            :param waited: seconds the tick waited for the motion stack
+            :return: report line if 'report_interval' elapsed since the last one, else None
+        """
+        if self.start is None:
+            self.begin()
+        now = self._clock()
+        self.ticks += 1
+        self.waited += waited
+        last_time, last_ticks, last_waited = self._last_report
+        if self.report_interval <= 0 or now - last_time < self.report_interval:
+            return None
+        self._last_report = (now, self.ticks, self.waited)
+        line = '%s (last %.0f s: %.1f ticks/s' % (
+            self.summary(now), now - last_time, (self.ticks - last_ticks) / (now - last_time))
+        if self.waiting_for is None:
+            return line + ')'
+        return line + ', %.0f%% waiting)' % (100.0 * (self.waited - last_waited) / (now - last_time))
+
+    def rate(self, now=None):
+        """Ticks per second since begin()."""
+        if self.start is None:
+            return 0.0
+        return self.ticks / max((self._clock() if now is None else now) - self.start, 1e-9)
+
+    def summary(self, now=None):
+        if not self.ticks:
+            return 'headless: no tick'
+        if now is None:
+            now = self._clock()
+        elapsed = max(now - self.start, 1e-9)
+        line = 'headless: %d ticks in %.1f s, %.1f ticks/s' % (self.ticks, elapsed, self.rate(now))
+        if self.fixed_delta is not None:
+            line += ', %.2fx real time' % (self.ticks * self.fixed_delta / elapsed)
+        if self.waiting_for is None:
+            return line + ', unpaced'
+        return line + ', %.0f%% waiting for %s' % (100.0 * self.waited / elapsed, self.waiting_for)
+
+    def __str__(self):
+        return self.summary()
@@ -0,0 +1,100 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Per-frame kinematics of the hero vehicle, read from the world snapshot.
+
+Every Actor getter (get_transform, get_velocity, ...) is answered separately,
+and the values may come from different frames. The WorldSnapshot delivered by
+world.on_tick already holds the transform, velocity, acceleration and angular
+velocity of every actor for one frame, so KinematicsSampler keeps the latest
+snapshot and extracts the hero state once per frame. The motion platform, the
+HUD and the loggers then share the same, consistent values.
+"""
+
+import collections
+import weakref
+
+Kinematics = collections.namedtuple('Kinematics', [
+    'frame', 'timestamp', 'transform', 'velocity', 'acceleration', 'angular_velocity', 'forward', 'right'])
+Kinematics.__doc__ = """
+Hero state of one simulation frame.
+
+    frame: simulation frame number
+    timestamp: simulation time in seconds
+    transform: carla.Transform of the hero
+    velocity, acceleration, angular_velocity: carla.Vector3D in world coordinates
+        (m/s, m/s^2 and deg/s, as returned by CARLA)
+    forward, right: unit vectors of the hero in world coordinates
+"""
+
+
+class KinematicsSampler(object):
+    """
+    Latest kinematics of one actor.
+
+    In asynchronous mode the snapshots are pushed by world.on_tick and update()
+    makes no server call. In synchronous mode update() reads the snapshot of
+    the frame just ticked, one call per frame.
+    """
+
+    def __init__(self, world, sync=False):
+        """
+            :param world: carla.World
+            :param sync: True if the client ticks the world itself
+        """
+        self.world = world
+        self.sync = sync
+        self.actor = None
+        self.kinematics = None
+        self.snapshot_reads = 0
+        self._snapshot = None
+        weak_self = weakref.ref(self)
+        self._callback_id = world.on_tick(lambda snapshot: KinematicsSampler._on_world_tick(weak_self, snapshot))
+
+    @staticmethod
+    def _on_world_tick(weak_self, snapshot):
+        self = weak_self()
+        if not self:
+            return
+        # Only swap the reference, the work is done by update() in the client thread
+        self._snapshot = snapshot
+
+    def set_actor(self, actor):
+        """Follow 'actor', e.g. after the hero is respawned."""
+        self.actor = actor
+        self.kinematics = None
+
+    def update(self):
+        """
+        Extract the actor state of the latest frame, call once per frame.
+
+            :return: Kinematics of the latest frame, None if there is no actor
+        """
+        if self.actor is None:
+            return None
+        snapshot = self._snapshot
+        if self.sync or snapshot is None:
+            snapshot = self.world.get_snapshot()
+            self.snapshot_reads += 1
+        if self.kinematics is not None and self.kinematics.frame == snapshot.frame:
+            return self.kinematics
+
+        actor_snapshot = snapshot.find(self.actor.id)
+        if actor_snapshot is None:
+            # The actor was just spawned and is not in this frame yet
+            return self.kinematics
+        transform = actor_snapshot.get_transform()
+        self.kinematics = Kinematics(
+            snapshot.frame,
+            snapshot.timestamp.elapsed_seconds,
+            transform,
+            actor_snapshot.get_velocity(),
+            actor_snapshot.get_acceleration(),
+            actor_snapshot.get_angular_velocity(),
+            transform.get_forward_vector(),
+            transform.get_right_vector())
+        return self.kinematics
+
+    def destroy(self):
+        self.world.remove_on_tick(self._callback_id)
@@ -0,0 +1,203 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Fixed-rate motion scheduling, decoupled from the render loop.
+
+The render loop publishes the latest vehicle kinematics into a SnapshotSlot,
+and a MotionScheduler thread samples the slot and drives the motion platform at
+its own rate. A slow frame therefore delays only the next snapshot, not the
+actuator command, and the actuator rate is no longer capped by the frame rate.
+"""
+
+import math
+import threading
+import time
+
+
+class SnapshotSlot(object):
+    """
+    Single-producer latest-value slot.
+
+    The producer replaces one reference to an immutable (seq, timestamp, value)
+    tuple and the consumer reads that reference. Both operations are atomic in
+    CPython, so neither side ever takes a lock or waits for the other.
+    """
+
+    def __init__(self):
+        self._snapshot = (0, None, None)
+
+    def publish(self, value, timestamp=None):
+        """
+        Make 'value' the latest snapshot.
+
+            :param value: immutable payload (e.g. a tuple of kinematics)
+            :param timestamp: producer time in seconds, defaults to time.perf_counter()
+            :return: sequence number of the snapshot
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        seq = self._snapshot[0] + 1
+        self._snapshot = (seq, timestamp, value)
+        return seq
+
+    def latest(self):
+        """Return (seq, timestamp, value) of the latest snapshot, seq is 0 if none was published."""
+        return self._snapshot
+
+
+class JitterStats(object):
+    """Running statistics of a periodic task, O(1) memory."""
+
+    def __init__(self, period, label='motion'):
+        self.period = period
+        self.label = label
+        self.ticks = 0
+        self.missed_deadlines = 0
+        self.stale_samples = 0
+        self.max_callback_time = 0.0
+        self._first_tick = None
+        self._last_tick = None
+        # Welford accumulators of the tick-to-tick interval
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._min = math.inf
+        self._max = 0.0
+
+    def add_tick(self, now, callback_time, stale):
+        self.ticks += 1
+        if stale:
+            self.stale_samples += 1
+        self.max_callback_time = max(self.max_callback_time, callback_time)
+        if self._last_tick is None:
+            self._first_tick = now
+        else:
+            interval = now - self._last_tick
+            n = self.ticks - 1
+            delta = interval - self._mean
+            self._mean += delta / n
+            self._m2 += delta * (interval - self._mean)
+            self._min = min(self._min, interval)
+            self._max = max(self._max, interval)
+        self._last_tick = now
+
+    def summary(self):
+        """Statistics as a dict, times are in milliseconds."""
+        intervals = self.ticks - 1
+        elapsed = (self._last_tick - self._first_tick) if intervals > 0 else 0.0
+        std = math.sqrt(self._m2 / (intervals - 1)) if intervals > 1 else 0.0
+        return {
+            'ticks': self.ticks,
+            'target_hz': 1.0 / self.period,
+            'achieved_hz': intervals / elapsed if elapsed > 0 else 0.0,
+            'interval_mean_ms': self._mean * 1e3,
+            'interval_std_ms': std * 1e3,
+            'interval_min_ms': (self._min if intervals > 0 else 0.0) * 1e3,
+            'interval_max_ms': self._max * 1e3,
+            'max_callback_ms': self.max_callback_time * 1e3,
+            'missed_deadlines': self.missed_deadlines,
+            'stale_samples': self.stale_samples,
+        }
+
+    def __str__(self):
+        return self.label + (' rate %(achieved_hz).1f/%(target_hz).1f Hz, interval %(interval_mean_ms).2f '
+                '+/- %(interval_std_ms).2f ms [%(interval_min_ms).2f, %(interval_max_ms).2f], '
+                'callback max %(max_callback_ms).2f ms, %(missed_deadlines)d missed deadlines, '
+                '%(stale_samples)d stale samples' % self.summary())
+
+
+class MotionScheduler(threading.Thread):
+    """
+    Daemon thread calling 'callback(value, timestamp)' at a fixed rate with the
+    latest snapshot of a SnapshotSlot. Nothing is called until the first
+    snapshot is published.
+    """
+
+    def __init__(self, slot, callback, rate_hz, spin_time=0.002, clock=time.perf_counter,
+                 name='MotionScheduler', label='motion'):
+        """
+            :param slot: SnapshotSlot filled by the render loop
+            :param callback: function called with (value, timestamp) of the latest snapshot
+            :param rate_hz: call rate in Hz
+            :param spin_time: seconds before each deadline spent yielding instead of
+                sleeping, to work around the coarse sleep resolution on Windows
+            :param clock: monotonic time source in seconds
+            :param name: thread name
+            :param label: name of the task in the statistics
+        """
+        super(MotionScheduler, self).__init__(name=name)
+        self.daemon = True
+        if rate_hz <= 0:
+            raise ValueError('rate_hz must be greater than 0')
+        self.slot = slot
+        self.callback = callback
+        self.period = 1.0 / rate_hz
+        self.spin_time = spin_time
+        self.stats = JitterStats(self.period, label)
+        self.error = None
+        # Sequence number of the last snapshot passed to the callback, see wait_consumed()
+        self.consumed_seq = 0
+        self._consumed = threading.Condition()
+        self._clock = clock
+        self._stop_event = threading.Event()
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        with self._consumed:
+            self._consumed.notify_all()
+        if self.is_alive():
+            self.join(timeout)
+
+    def wait_consumed(self, seq, timeout=None):
+        """
+        Block until the callback was called with snapshot 'seq' or a later one,
+        for producers paced by the consumer (e.g. headless batch runs).
+
+            :return: True if consumed, False on timeout or if the thread is stopped
+        """
+        with self._consumed:
+            return self._consumed.wait_for(
+                lambda: self.consumed_seq >= seq or self._stop_event.is_set(),
+                timeout) and self.consumed_seq >= seq
+
+    def _wait_until(self, deadline):
+        remaining = deadline - self._clock()
+        if remaining > self.spin_time:
+            if self._stop_event.wait(remaining - self.spin_time):
+                return
+        while self._clock() < deadline:
+            time.sleep(0)
+
+    def run(self):
+        last_seq = 0
+        deadline = self._clock()
+        try:
+            while not self._stop_event.is_set():
+                seq, timestamp, value = self.slot.latest()
+                if seq != 0:
+                    start = self._clock()
+                    self.callback(value, timestamp)
+                    self.stats.add_tick(start, self._clock() - start, seq == last_seq)
+                    if seq != last_seq:
+                        with self._consumed:
+                            self.consumed_seq = seq
+                            self._consumed.notify_all()
+                    last_seq = seq
+
+                deadline += self.period
+                now = self._clock()
+                if now > deadline:
+                    # Skip the ticks we are late for instead of bursting to catch up
+                    missed = int((now - deadline) / self.period) + 1
+                    self.stats.missed_deadlines += missed
+                    deadline += missed * self.period
+                self._wait_until(deadline)
+        except Exception as error:  # pylint: disable=broad-except
+            # Keep the error for the main thread, the render loop must not die with the motion thread
+            self.error = error
+            raise
+        finally:
+            # Release the producers waiting in wait_consumed()
+            self._stop_event.set()
+            with self._consumed:
+                self._consumed.notify_all()
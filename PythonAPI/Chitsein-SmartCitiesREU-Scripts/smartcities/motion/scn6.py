@@ -0,0 +1,221 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Kinematics of the SimCraft platform: motion samples to SCN6 actuator pulses.
+
+This is the mapping of SimController.cs (ApplyMotionSample, UpdateAngles and
+UpdateDevice) evaluated with NumPy on a batch of samples:
+
+  * pitch and roll are converted to Unity euler angles, pitch is scaled by the
+    sensitivity and both are clamped to +/-17.5 degrees, then turned into a
+    pulse at 0.00175 degrees per pulse around the 10000 pulses center;
+  * the yaw rate, clamped to +/-6 rad/s, spans 0 to 20000 pulses;
+  * every new maximum of the speed adds a surge cue on the pitch axis.
+
+PlatformKinematics then shapes the targets with limits per SCN6 axis
+(workspace, velocity and acceleration) before the publisher hands them to
+SimController (see smartcities.motion.shared_memory), and check_limits()
+checks the targets of a whole recorded drive offline, see
+util/scn6_limit_check.py. DEFAULT_LIMITS are placeholders, not taken from the
+SCN6 datasheet nor measured on the rig: they do not protect the hardware, the
+parameters of the SCN6 controllers do.
+
+The targets are indexed by SCN6 axis: 0 roll, 1 pitch, 2 yaw rate (not
+commanded by SimController at the moment).
+"""
+
+import collections
+
+import numpy as np
+
+AXIS_NAMES = ('roll', 'pitch', 'yaw_rate')
+ROLL_AXIS, PITCH_AXIS, YAW_RATE_AXIS = range(3)
+
+PULSE_CENTER = 10000
+DEGREES_PER_PULSE = 0.00175
+# Angle range of the roll and pitch axes in degrees
+ANGLE_RANGE = 17.5
+# Yaw rate range in rad/s
+ANGULAR_VELOCITY_RANGE = 6.0
+
+AxisLimits = collections.namedtuple('AxisLimits', ['min_pulse', 'max_pulse', 'max_velocity', 'max_acceleration'])
+AxisLimits.__doc__ = """
+Limits of an SCN6 axis, positions in pulses, velocity in pulses/s and
+acceleration in pulses/s^2. Set them from the SCN6 parameters of the rig.
+"""
+
+# Fraction of the acceleration limit used to plan the braking
+BRAKING_MARGIN = 0.8
+
+# Placeholders: stroke of the SimController mapping, full stroke in 0.5 s at most. Neither from the datasheet
+# nor measured on the rig, and the pitch pulses lag the SimController ones by hundreds of pulses with them (see
+# util/scn6_limit_check.py), so the clients only apply them with --scn6_limits
+DEFAULT_LIMITS = (AxisLimits(0, 20000, 40000.0, 400000.0),) * 3
+
+LimitReport = collections.namedtuple('LimitReport', [
+    'axis', 'samples', 'workspace', 'velocity', 'acceleration', 'peak_velocity', 'peak_acceleration'])
+LimitReport.__doc__ = """
+Limit violations of one axis, see check_limits(). 'workspace', 'velocity' and
+'acceleration' are the number of samples beyond each limit.
+"""
+
+
+class PlatformKinematics(object):
+    """SimController mapping and SCN6 axis limits, for a batch or one sample at a time."""
+
+    def __init__(self, sensitivity=0.7, limits=DEFAULT_LIMITS, surge_gain=5000.0):
+        """
+            :param sensitivity: pitch sensitivity, coefSens of SimController
+            :param limits: AxisLimits of each SCN6 axis
+            :param surge_gain: pitch pulses per m/s of new maximum speed (times 5, as SimController)
+        """
+        self.sensitivity = sensitivity
+        self.limits = tuple(limits)
+        self.surge_gain = surge_gain
+        self._min = np.array([limit.min_pulse for limit in self.limits], dtype=np.float64)
+        self._max = np.array([limit.max_pulse for limit in self.limits], dtype=np.float64)
+        self._max_velocity = np.array([limit.max_velocity for limit in self.limits], dtype=np.float64)
+        self._max_acceleration = np.array([limit.max_acceleration for limit in self.limits], dtype=np.float64)
+        self.reset()
+
+    def reset(self):
+        """Forget the state of the previous samples, as a restart of SimController."""
+        # Unity angles (pitch, roll) kept by UpdateAngles, and the speed ratchet of the surge cue
+        self._angles = (0.0, 0.0)
+        self._top_speed = 0.0
+        # Commanded position, velocity and time of the limiter
+        self._position = None
+        self._velocity = np.zeros(3)
+        self._time = None
+
+    def pulse_targets(self, samples):
+        """
+        SimController pulses of a batch of samples, without the axis limits.
+
+            :param samples: array of shape (N, 5), rows of (pitch, yaw, roll,
+                angular_velocity_y, velocity) as published to the ring, angles in
+                degrees, yaw rate in degrees per second and speed in m/s
+            :return: array of shape (N, 3) of pulses per SCN6 axis
+        """
+        samples = np.asarray(samples, dtype=np.float64).reshape(-1, 5)
+        if len(samples) == 0:
+            return np.zeros((0, 3))
+
+        # Unity euler angles in [0, 360)
+        pitch = -samples[:, 0]
+        pitch += np.where(pitch < 0.0, 360.0, 0.0)
+        roll = -samples[:, 2]
+        roll += np.where(roll < 0.0, 360.0, 0.0)
+
+        # UpdateAngles scales the pitch, and keeps the previous angles for a pitch between 180 and 300
+        updated = (pitch < 180.0) | (pitch > 300.0)
+        pitch = np.where(pitch < 180.0, pitch * self.sensitivity, 360.0 - (360.0 - pitch) * self.sensitivity)
+        last = np.maximum.accumulate(np.where(updated, np.arange(len(samples)), -1))
+        pitch = np.where(last >= 0, pitch[last], self._angles[0])
+        roll = np.where(last >= 0, roll[last], self._angles[1])
+        self._angles = (float(pitch[-1]), float(roll[-1]))
+
+        # Signed angles within the platform range, AdaptAngle() is ANGLE_RANGE - angle
+        pitch = np.clip(np.where(pitch >= 270.0, pitch - 360.0, pitch), -ANGLE_RANGE, ANGLE_RANGE)
+        roll = np.clip(np.where(roll >= 270.0, roll - 360.0, roll), -ANGLE_RANGE, ANGLE_RANGE)
+        angular_velocity = np.clip(np.radians(samples[:, 3]), -ANGULAR_VELOCITY_RANGE, ANGULAR_VELOCITY_RANGE)
+
+        targets = np.empty((len(samples), 3))
+        targets[:, PITCH_AXIS] = np.trunc((ANGLE_RANGE - pitch) / DEGREES_PER_PULSE)
+        targets[:, ROLL_AXIS] = 2 * PULSE_CENTER - np.trunc((ANGLE_RANGE - roll) / DEGREES_PER_PULSE)
+        targets[:, YAW_RATE_AXIS] = np.trunc(PULSE_CENTER - angular_velocity * PULSE_CENTER / ANGULAR_VELOCITY_RANGE)
+
+        # Surge cue on each new maximum of the speed (SimController memcurvel)
+        top_speed = np.maximum.accumulate(np.concatenate(([self._top_speed], samples[:, 4] * 5.0)))
+        targets[:, PITCH_AXIS] += np.trunc(np.diff(top_speed) * self.surge_gain)
+        self._top_speed = float(top_speed[-1])
+        return targets
+
+    def apply_limits(self, timestamps, targets):
+        """
+        Follow the targets within the limits of each axis: the workspace, and
+        the velocity and acceleration of the moves between two samples. The
+        moves slow down ahead of the target so they do not overshoot it.
+
+            :param timestamps: array of shape (N,), sample times in seconds
+            :param targets: array of shape (N, 3) of pulse_targets()
+            :return: array of shape (N, 3) of integer pulses within the limits
+        """
+        targets = np.clip(np.asarray(targets, dtype=np.float64), self._min, self._max)
+        output = np.empty_like(targets)
+        for i, (timestamp, target) in enumerate(zip(timestamps, targets)):
+            dt = timestamp - self._time if self._time is not None else 0.0
+            if self._position is None:
+                self._position = target
+            elif dt > 0:
+                # Fastest speed toward the target and the workspace ends that still stops on them
+                reach = self._braking_velocity(np.abs(target - self._position), dt)
+                velocity = np.clip((target - self._position) / dt, -reach, reach)
+                upper = np.minimum(self._braking_velocity(self._max - self._position, dt), self._max_velocity)
+                lower = np.maximum(-self._braking_velocity(self._position - self._min, dt), -self._max_velocity)
+                velocity = np.clip(velocity, lower, upper)
+                velocity = np.clip(
+                    velocity, self._velocity - self._max_acceleration * dt, self._velocity + self._max_acceleration * dt)
+                position = np.clip(self._position + velocity * dt, self._min, self._max)
+                self._velocity = (position - self._position) / dt
+                self._position = position
+            if dt > 0 or self._time is None:
+                self._time = timestamp
+            output[i] = self._position
+        return np.rint(output)
+
+    def _braking_velocity(self, distance, dt):
+        # Speed from which moves of 'dt' seconds, each slower by the braking deceleration, stop
+        # within 'distance'. The braking is planned below the acceleration limit, the next moves
+        # may be shorter than 'dt' (jitter of the client frames).
+        deceleration = BRAKING_MARGIN * self._max_acceleration
+        half_step = 0.5 * deceleration * dt
+        return np.sqrt(half_step * half_step + 2.0 * deceleration * np.maximum(distance, 0.0)) - half_step
+
+    def command(self, timestamp, sample):
+        """
+        Pulses of one sample within the limits, for the live publisher.
+
+            :param sample: (pitch, yaw, roll, angular_velocity_y, velocity)
+            :return: tuple of the 3 integer pulses per SCN6 axis
+        """
+        pulses = self.apply_limits((timestamp,), self.pulse_targets(sample))
+        return tuple(int(pulse) for pulse in pulses[0])
+
+
+def check_limits(timestamps, pulses, limits=DEFAULT_LIMITS, tolerance=1.0):
+    """
+    Limit violations of the pulses of a whole drive. The velocity of a move is
+    its distance over the time since the previous sample, and the acceleration
+    the change of velocity over the time of the later move, as in
+    PlatformKinematics.apply_limits().
+
+        :param timestamps: array of shape (N,), sample times in seconds, increasing
+        :param pulses: array of shape (N, 3) of pulses per SCN6 axis
+        :param tolerance: position error in pulses ignored, for the rounding to whole pulses
+        :return: list of a LimitReport per axis
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    pulses = np.asarray(pulses, dtype=np.float64)
+    dt = np.diff(timestamps)
+    valid = dt > 0
+    dt = dt[valid]
+    velocity = np.diff(pulses, axis=0)[valid] / dt[:, None]
+    acceleration = np.diff(velocity, axis=0) / dt[1:, None]
+    velocity_slack = tolerance / dt
+    acceleration_slack = tolerance * (1.0 / dt[1:] + 1.0 / dt[:-1]) / dt[1:]
+
+    reports = []
+    for axis, limit in enumerate(limits):
+        axis_velocity = np.abs(velocity[:, axis])
+        axis_acceleration = np.abs(acceleration[:, axis])
+        reports.append(LimitReport(
+            AXIS_NAMES[axis],
+            len(pulses),
+            int(np.count_nonzero((pulses[:, axis] < limit.min_pulse) | (pulses[:, axis] > limit.max_pulse))),
+            int(np.count_nonzero(axis_velocity - velocity_slack > limit.max_velocity)),
+            int(np.count_nonzero(axis_acceleration - acceleration_slack > limit.max_acceleration)),
+            float(axis_velocity.max()) if len(axis_velocity) else 0.0,
+            float(axis_acceleration.max()) if len(axis_acceleration) else 0.0))
+    return reports
@@ -0,0 +1,297 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Memory-mapped ring buffer used to hand motion samples from the CARLA client
+to the SimCraft motion platform process (SimCraftApp.exe).
+
+The buffer is a plain file mapped into both processes, so publishing a sample
+is a handful of memory stores instead of an open/truncate/write/close cycle.
+All values are little-endian. The layout is mirrored in SimController.cs, so
+any change here must be applied there as well.
+
+    Header (64 bytes)
+        0   char[4]  magic ('SCMR')
+        4   uint32   layout version
+        8   uint32   capacity (number of slots)
+        12  uint32   slot size in bytes
+        16  uint64   sequence number of the last committed sample
+        24  ...      reserved
+        40  uint64   sequence number of the sample of the last consumer command
+        48  uint64   number of consumer reports, incremented with each report
+        56  uint32   flags, FLAG_PULSE_TARGETS: the slots carry the SCN6 pulses
+        60  ...      reserved
+
+    Slot (64 bytes), sample n lives in slot (n - 1) % capacity
+        0   uint64   sequence number (0 while the slot is being written)
+        8   float64  timestamp (time.perf_counter() of the publisher)
+        16  float32  pitch             (deg, CARLA)
+        20  float32  yaw               (deg, CARLA)
+        24  float32  roll              (deg, CARLA)
+        28  float32  angularVelocityY  (deg/s, CARLA z axis)
+        32  float32  velocity          (m/s)
+        36  float32  pulse targets of the SCN6 axes 0, 1 and 2 (roll, pitch,
+                     yaw rate), if FLAG_PULSE_TARGETS is set
+        48  float32  reserved[4]
+
+A reader accepts a slot only if its sequence number is the same before and
+after copying the payload, which rejects half-written samples.
+
+The consumer always reads the newest sample and, after each actuator command,
+reports the sample it commanded, so a publisher paced by the consumer (the
+headless batch runs) can wait until its last sample was commanded, see
+MotionRingPublisher.wait_consumed().
+
+A publisher given a PlatformKinematics (see smartcities.motion.scn6) also
+writes the actuator pulses of each sample, shaped by its axis limits, and
+SimController applies them instead of its own mapping.
+"""
+
+import collections
+import mmap
+import os
+import struct
+import time
+
+MAGIC = b'SCMR'
+LAYOUT_VERSION = 2
+
+HEADER_FORMAT = '<4sIII'
+HEADER_SIZE = 64
+WRITE_SEQ_OFFSET = 16
+CONSUMER_OFFSET = 40
+FLAGS_OFFSET = 56
+
+FLAG_PULSE_TARGETS = 0x1
+
+SLOT_PAYLOAD_FORMAT = '<d12f'
+SLOT_SIZE = 64
+SLOT_PAYLOAD_OFFSET = 8
+
+SAMPLE_FIELDS = ('pitch', 'yaw', 'roll', 'angular_velocity_y', 'velocity')
+PULSE_TARGETS = 3
+RESERVED_FIELDS = 12 - len(SAMPLE_FIELDS) - PULSE_TARGETS
+
+DEFAULT_CAPACITY = 64
+
+# pulse_targets: tuple of the SCN6 axis pulses, None if the publisher does not send them
+MotionSample = collections.namedtuple('MotionSample', ('seq', 'timestamp') + SAMPLE_FIELDS + ('pulse_targets',))
+ConsumerStatus = collections.namedtuple('ConsumerStatus', ['command_seq', 'reports'])
+
+_U32 = struct.Struct('<I')
+_U64 = struct.Struct('<Q')
+_CONSUMER = struct.Struct('<QQ')
+_PAYLOAD = struct.Struct(SLOT_PAYLOAD_FORMAT)
+_PADDING = (0.0,) * RESERVED_FIELDS
+_NO_TARGETS = (0.0,) * PULSE_TARGETS
+
+
+def buffer_size(capacity):
+    """Size in bytes of a ring buffer file holding 'capacity' samples."""
+    return HEADER_SIZE + capacity * SLOT_SIZE
+
+
+class MotionRingPublisher(object):
+    """
+    Writer side of the motion ring buffer. Only one publisher may write to a
+    given file at a time.
+    """
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY, kinematics=None):
+        """
+        Create (or reset) the ring buffer file and map it.
+
+            :param path: path of the backing file shared with the reader
+            :param capacity: number of samples kept before the oldest is overwritten
+            :param kinematics: PlatformKinematics computing the pulse targets of
+                each sample, None to leave the mapping to SimController
+        """
+        if capacity <= 0:
+            raise ValueError('capacity must be greater than 0')
+        self.path = path
+        self.capacity = capacity
+        self.kinematics = kinematics
+        self._seq = 0
+        size = buffer_size(capacity)
+
+        # Keep the file if it already has the right size: the reader may
+        # have it mapped, and Windows refuses to truncate a mapped file.
+        mode = 'r+b' if os.path.exists(path) and os.path.getsize(path) == size else 'w+b'
+        self._file = open(path, mode)
+        if mode == 'w+b':
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._map[:size] = bytes(size)
+        struct.pack_into(HEADER_FORMAT, self._map, 0, MAGIC, LAYOUT_VERSION, capacity, SLOT_SIZE)
+        _U32.pack_into(self._map, FLAGS_OFFSET, FLAG_PULSE_TARGETS if kinematics is not None else 0)
+
+    @property
+    def seq(self):
+        """Sequence number of the last published sample (0 if none)."""
+        return self._seq
+
+    def publish(self, pitch, yaw, roll, angular_velocity_y, velocity, timestamp=None):
+        """
+        Commit one motion sample to the ring.
+
+            :param timestamp: publisher time in seconds, defaults to time.perf_counter()
+            :return: sequence number assigned to the sample
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        if self.kinematics is not None:
+            targets = self.kinematics.command(timestamp, (pitch, yaw, roll, angular_velocity_y, velocity))
+        else:
+            targets = _NO_TARGETS
+        seq = self._seq + 1
+        offset = HEADER_SIZE + ((seq - 1) % self.capacity) * SLOT_SIZE
+        # Invalidate, fill, then commit the slot before advertising it.
+        _U64.pack_into(self._map, offset, 0)
+        _PAYLOAD.pack_into(
+            self._map, offset + SLOT_PAYLOAD_OFFSET, timestamp,
+            pitch, yaw, roll, angular_velocity_y, velocity, *targets, *_PADDING)
+        _U64.pack_into(self._map, offset, seq)
+        _U64.pack_into(self._map, WRITE_SEQ_OFFSET, seq)
+        self._seq = seq
+        return seq
+
+    def consumer_status(self):
+        """Last report of the consumer, a ConsumerStatus (all zero before the first report)."""
+        return ConsumerStatus(*_CONSUMER.unpack_from(self._map, CONSUMER_OFFSET))
+
+    def wait_consumed(self, max_backlog=0, timeout=1.0, poll_interval=0.001):
+        """
+        Block until the consumer commanded a sample at most 'max_backlog'
+        behind the last published one, for publishers paced by the consumer
+        (e.g. headless batch runs). The consumer reports through the file, so
+        the report is polled.
+
+            :return: True if caught up, False on timeout or if the consumer never reported
+        """
+        deadline = time.perf_counter() + timeout
+        while True:
+            status = self.consumer_status()
+            if status.reports == 0:
+                return False
+            if self._seq - status.command_seq <= max_backlog:
+                return True
+            if time.perf_counter() >= deadline:
+                return False
+            time.sleep(poll_interval)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class MotionRingReader(object):
+    """
+    Reader side of the motion ring buffer. This is the Python stand-in for
+    SimController.cs, used to benchmark and soak-test the hand-off without the
+    SimCraft hardware. The mapping is writable for the consumer reports.
+    """
+
+    def __init__(self, path, max_retries=8):
+        """
+        Map an existing ring buffer file.
+
+            :param path: path of the backing file written by MotionRingPublisher
+            :param max_retries: attempts to read a slot that is being rewritten
+        """
+        self.path = path
+        self.max_retries = max_retries
+        self._file = open(path, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, version, capacity, slot_size = struct.unpack_from(HEADER_FORMAT, self._map, 0)
+        if magic != MAGIC or version != LAYOUT_VERSION or slot_size != SLOT_SIZE:
+            self.close()
+            raise RuntimeError('%s is not a motion ring buffer (version %d)' % (path, LAYOUT_VERSION))
+        self.capacity = capacity
+        self.last_seq = 0
+
+        # Statistics
+        self.samples_read = 0
+        self.samples_missed = 0
+        self.torn_reads = 0
+
+    def latest_seq(self):
+        """Sequence number of the last sample committed by the publisher."""
+        seq = _U64.unpack_from(self._map, WRITE_SEQ_OFFSET)[0]
+        if seq < self.last_seq:
+            # The publisher was restarted and reset the buffer.
+            self.last_seq = 0
+        return seq
+
+    def _read_slot(self, seq):
+        offset = HEADER_SIZE + ((seq - 1) % self.capacity) * SLOT_SIZE
+        has_targets = _U32.unpack_from(self._map, FLAGS_OFFSET)[0] & FLAG_PULSE_TARGETS
+        for _ in range(self.max_retries):
+            before = _U64.unpack_from(self._map, offset)[0]
+            payload = _PAYLOAD.unpack_from(self._map, offset + SLOT_PAYLOAD_OFFSET)
+            after = _U64.unpack_from(self._map, offset)[0]
+            if before == after == seq:
+                values = 1 + len(SAMPLE_FIELDS)
+                targets = tuple(int(pulse) for pulse in payload[values:values + PULSE_TARGETS]) if has_targets else None
+                return MotionSample(seq, *payload[:values], pulse_targets=targets)
+            self.torn_reads += 1
+            if after > seq:
+                # The publisher lapped us, this sample is gone.
+                return None
+        return None
+
+    def read_latest(self):
+        """
+        Return the newest sample, or None if nothing was published since the
+        previous call. Skipped samples are counted in 'samples_missed'.
+        """
+        seq = self.latest_seq()
+        if seq == self.last_seq:
+            return None
+        sample = self._read_slot(seq)
+        if sample is None:
+            return None
+        self.samples_missed += seq - self.last_seq - 1
+        self.samples_read += 1
+        self.last_seq = seq
+        return sample
+
+    def read_new(self):
+        """
+        Return every sample published since the previous call, oldest first.
+        Samples already overwritten by the publisher are counted in
+        'samples_missed'.
+        """
+        seq = self.latest_seq()
+        first = max(self.last_seq + 1, seq - self.capacity + 1)
+        self.samples_missed += first - self.last_seq - 1
+        samples = []
+        for n in range(first, seq + 1):
+            sample = self._read_slot(n)
+            if sample is None:
+                self.samples_missed += 1
+            else:
+                samples.append(sample)
+        self.samples_read += len(samples)
+        self.last_seq = max(self.last_seq, seq)
+        return samples
+
+    def report(self, command_seq, reports):
+        """
+        Publish the consumer state read by MotionRingPublisher.consumer_status().
+
+            :param command_seq: sequence number of the sample of the last command
+            :param reports: report counter, incremented by the caller for each report
+        """
+        _CONSUMER.pack_into(self._map, CONSUMER_OFFSET, command_seq, reports)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
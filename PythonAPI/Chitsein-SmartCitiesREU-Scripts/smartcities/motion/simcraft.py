@@ -0,0 +1,85 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Motion samples handed to the SimCraft platform (SimcraftApp executable).
+"""
+
+import math
+
+from smartcities.motion.washout import to_vehicle_frame
+
+
+def simcraft_sample(kinematics, washout=None):
+    """
+    Convert the hero kinematics of one frame to the values read by SimController.cs.
+
+        :param kinematics: Kinematics tuple of the frame
+        :param washout: ClassicalWashout stepped once per call, None for the raw attitude
+        :return: (pitch, yaw, roll, angular_velocity_y, velocity), angles in degrees and
+            the yaw rate in degrees per second
+    """
+    rotation = kinematics.transform.rotation
+    velocity = kinematics.velocity.length()
+    if washout is None:
+        return rotation.pitch, rotation.yaw, rotation.roll, kinematics.angular_velocity.z, velocity
+
+    accel = kinematics.acceleration
+    forward = kinematics.forward
+    right = kinematics.right
+    cue = washout.step(
+        to_vehicle_frame((accel.x, accel.y, accel.z), (forward.x, forward.y, forward.z), (right.x, right.y, right.z)),
+        (math.radians(rotation.roll), math.radians(rotation.pitch), math.radians(rotation.yaw)))
+    roll, pitch, yaw = [math.degrees(angle) for angle in cue.angles]
+    return pitch, yaw, roll, math.degrees(cue.angular_velocity[2]), velocity
+
+
+class SimcraftSampler(object):
+    """
+    simcraft_sample() once per simulation frame, with the washout filter stepped
+    at the simulation step: the fixed delta of the world settings when it is set,
+    otherwise the difference of successive Kinematics timestamps. A frame sampled
+    again (the client renders faster than the server ticks) returns the same values.
+    """
+
+    def __init__(self, washout=None, fixed_delta=None):
+        """
+            :param washout: ClassicalWashout, None for the raw attitude
+            :param fixed_delta: fixed_delta_seconds of the world settings, None if variable
+        """
+        self.washout = washout
+        self.fixed_delta = fixed_delta or None
+        self._last = None
+        self._sample = None
+        # First frame of the drive while its step is not known yet
+        self._first = None
+
+    def sample(self, kinematics):
+        """
+        Values read by SimController.cs for the frame of 'kinematics', see simcraft_sample().
+        """
+        last = self._last
+        if last is not None and kinematics.frame == last.frame:
+            return self._sample
+        washout = self.washout
+        if washout is not None:
+            dt = None if last is None else kinematics.timestamp - last.timestamp
+            if dt is not None and dt <= 0.0:
+                # The client was restarted, the drive starts over
+                washout.reset()
+                dt = None
+            if self.fixed_delta is not None:
+                washout.set_dt(self.fixed_delta)
+            elif dt is None:
+                self._first = kinematics
+            elif self._first is not None:
+                # Filter the first frame again at the step of the drive, so the state is the one of that step
+                washout.reset()
+                washout.set_dt(dt)
+                simcraft_sample(self._first, washout)
+                self._first = None
+            else:
+                washout.set_dt(dt)
+        self._last = kinematics
+        self._sample = simcraft_sample(kinematics, washout)
+        return self._sample
@@ -0,0 +1,226 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Recording of the per-frame hero kinematics, for offline replay through the
+motion stack without CARLA.
+
+A recording is a NumPy .npz archive with one array per column (see COLUMNS).
+TelemetryRecorder fills a preallocated chunk while driving; each full chunk
+is written by a background thread as a part, <path>.parts/part_<index>.npz,
+while a second chunk fills, so the recorder holds two chunks at most however
+long the drive. close() joins the parts into the archive and removes them.
+load_telemetry() reads it back as a Telemetry object that rebuilds Kinematics
+tuples with the same attributes as the CARLA types used by the motion code
+(x/y/z vectors, pitch/yaw/roll rotation). The parts of a session that was
+killed before close() are read back the same way.
+"""
+
+import collections
+import glob
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from smartcities.motion.kinematics import Kinematics
+
+# Column name -> (dtype, Kinematics attribute path)
+COLUMNS = collections.OrderedDict([
+    ('frame', (np.int64, 'frame')),
+    ('timestamp', (np.float64, 'timestamp')),
+    ('location_x', (np.float64, 'transform.location.x')),
+    ('location_y', (np.float64, 'transform.location.y')),
+    ('location_z', (np.float64, 'transform.location.z')),
+    ('pitch', (np.float32, 'transform.rotation.pitch')),
+    ('yaw', (np.float32, 'transform.rotation.yaw')),
+    ('roll', (np.float32, 'transform.rotation.roll')),
+    ('velocity_x', (np.float32, 'velocity.x')),
+    ('velocity_y', (np.float32, 'velocity.y')),
+    ('velocity_z', (np.float32, 'velocity.z')),
+    ('acceleration_x', (np.float32, 'acceleration.x')),
+    ('acceleration_y', (np.float32, 'acceleration.y')),
+    ('acceleration_z', (np.float32, 'acceleration.z')),
+    ('angular_velocity_x', (np.float32, 'angular_velocity.x')),
+    ('angular_velocity_y', (np.float32, 'angular_velocity.y')),
+    ('angular_velocity_z', (np.float32, 'angular_velocity.z')),
+    ('forward_x', (np.float32, 'forward.x')),
+    ('forward_y', (np.float32, 'forward.y')),
+    ('forward_z', (np.float32, 'forward.z')),
+    ('right_x', (np.float32, 'right.x')),
+    ('right_y', (np.float32, 'right.y')),
+    ('right_z', (np.float32, 'right.z')),
+])
+
+# Directory of the parts of a recording, next to its .npz file
+PARTS_SUFFIX = '.parts'
+
+
+class Vector3D(collections.namedtuple('Vector3D', ['x', 'y', 'z'])):
+    """Replayed carla.Vector3D."""
+    __slots__ = ()
+
+    def length(self):
+        return float(np.sqrt(self.x * self.x + self.y * self.y + self.z * self.z))
+
+
+Rotation = collections.namedtuple('Rotation', ['pitch', 'yaw', 'roll'])
+Transform = collections.namedtuple('Transform', ['location', 'rotation'])
+
+
+class TelemetryRecorder(object):
+    """Appends one row per simulation frame, repeated frames are skipped."""
+
+    def __init__(self, path, chunk_size=4096):
+        """
+            :param path: output .npz file, written by close(), the full chunks go to
+                path + '.parts' until then (the parts of an earlier session are removed)
+            :param chunk_size: rows per preallocated chunk
+        """
+        self.path = path
+        self.parts_dir = path + PARTS_SUFFIX
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self.parts = 0
+        self.error = None
+        if os.path.isdir(self.parts_dir):
+            shutil.rmtree(self.parts_dir)
+        os.makedirs(self.parts_dir)
+        self._chunk = self._new_chunk()
+        # Chunk written by the part thread
+        self._spare = self._new_chunk()
+        self._row = 0
+        self._thread = None
+        self._last_frame = None
+        self._getters = [(name, self._getter(path_)) for name, (_, path_) in COLUMNS.items()]
+
+    @staticmethod
+    def _getter(attribute_path):
+        names = attribute_path.split('.')
+
+        def get(value):
+            for name in names:
+                value = getattr(value, name)
+            return value
+        return get
+
+    def _new_chunk(self):
+        return {name: np.empty(self.chunk_size, dtype) for name, (dtype, _) in COLUMNS.items()}
+
+    def record(self, kinematics):
+        """Append a Kinematics tuple (e.g. KinematicsSampler.kinematics)."""
+        if kinematics is None or kinematics.frame == self._last_frame:
+            return
+        chunk = self._chunk
+        for name, get in self._getters:
+            chunk[name][self._row] = get(kinematics)
+        self._row += 1
+        self.rows += 1
+        self._last_frame = kinematics.frame
+        if self._row == self.chunk_size:
+            self._flush()
+
+    def _wait(self):
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.error is not None:
+            raise self.error
+
+    def _flush(self):
+        """Hand the full chunk to the part thread and go on in the spare one."""
+        self._wait()
+        full, rows = self._chunk, self._row
+        self._chunk, self._spare = self._spare, full
+        self._row = 0
+        self._thread = threading.Thread(target=self._write_part, args=(full, rows, self.parts),
+                                        name='TelemetryRecorder')
+        self._thread.daemon = True
+        self._thread.start()
+        self.parts += 1
+
+    def _write_part(self, chunk, rows, index):
+        try:
+            path = os.path.join(self.parts_dir, 'part_%05d.npz' % index)
+            # Written aside then renamed, a part on disk is always complete
+            with open(path + '.tmp', 'wb') as part_file:
+                np.savez(part_file, **{name: column[:rows] for name, column in chunk.items()})
+            os.replace(path + '.tmp', path)
+        except (IOError, OSError) as error:
+            self.error = error
+
+    def close(self):
+        """Write the recording to 'path' and remove its parts."""
+        if self._row:
+            self._flush()
+        self._wait()
+        np.savez(self.path, **read_parts(self.parts_dir))
+        shutil.rmtree(self.parts_dir)
+        print('Recorded %d frames of telemetry to %s' % (self.rows, self.path))
+
+
+class Telemetry(object):
+    """Recorded drive, columns are attributes (e.g. telemetry.timestamp)."""
+
+    def __init__(self, columns):
+        missing = [name for name in COLUMNS if name not in columns]
+        if missing:
+            raise ValueError('telemetry is missing the columns %s' % ', '.join(missing))
+        self.columns = columns
+        for name in COLUMNS:
+            setattr(self, name, columns[name])
+
+    def __len__(self):
+        return len(self.frame)
+
+    def duration(self):
+        return float(self.timestamp[-1] - self.timestamp[0]) if len(self) > 1 else 0.0
+
+    def vectors(self, prefix):
+        """Column triplet 'prefix_x/y/z' as an array of shape (T, 3)."""
+        return np.stack([self.columns[prefix + axis] for axis in ('_x', '_y', '_z')], axis=1).astype(np.float64)
+
+    def kinematics(self, index):
+        """Kinematics tuple of one row."""
+        def vector(prefix):
+            return Vector3D(
+                float(self.columns[prefix + '_x'][index]),
+                float(self.columns[prefix + '_y'][index]),
+                float(self.columns[prefix + '_z'][index]))
+        return Kinematics(
+            int(self.frame[index]),
+            float(self.timestamp[index]),
+            Transform(vector('location'), Rotation(float(self.pitch[index]), float(self.yaw[index]), float(self.roll[index]))),
+            vector('velocity'),
+            vector('acceleration'),
+            vector('angular_velocity'),
+            vector('forward'),
+            vector('right'))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.kinematics(index)
+
+
+def read_parts(dirname):
+    """Columns of the parts written by a TelemetryRecorder, in order."""
+    parts = sorted(glob.glob(os.path.join(dirname, 'part_*.npz')))
+    if not parts:
+        return {name: np.empty(0, dtype) for name, (dtype, _) in COLUMNS.items()}
+    chunks = []
+    for part in parts:
+        with np.load(part) as archive:
+            chunks.append({name: archive[name] for name in archive.files})
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+
+def load_telemetry(path):
+    """
+    Load a recording written by TelemetryRecorder, or the parts recorded
+    so far if the session did not reach close().
+    """
+    if not os.path.exists(path) and os.path.isdir(path + PARTS_SUFFIX):
+        return Telemetry(read_parts(path + PARTS_SUFFIX))
+    with np.load(path) as archive:
+        return Telemetry({name: archive[name] for name in archive.files})
@@ -0,0 +1,204 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Low-overhead latency tracing of the client loop, from the server tick to the
+motion platform command.
+
+Each traced stage is a span (begin and end time) or an instant event, tagged
+with the simulation frame it works on. Events go to a preallocated ring of
+NumPy arrays: recording one costs a few array stores, about 2 microseconds or
+0.1% of a 60 fps frame for the 8 events of a client frame (measured by
+util/tracing_benchmark.py), and nothing is formatted until the report at exit.
+Matching the frame numbers of two stages gives end-to-end latencies, e.g. from
+the arrival of the server tick to the first platform command computed from
+that frame.
+
+The report prints percentiles per stage, and export_chrome_trace() writes a
+file for chrome://tracing or https://ui.perfetto.dev.
+"""
+
+import json
+import threading
+import time
+
+import numpy as np
+
+
+class LatencyTracer(object):
+    """Ring of the last 'capacity' trace events, shared by all threads."""
+
+    def __init__(self, capacity=1 << 16, clock=time.perf_counter):
+        """
+            :param capacity: number of events kept, older events are overwritten
+            :param clock: monotonic time source in seconds
+        """
+        self.capacity = capacity
+        self.clock = clock
+        self.origin = clock()
+        self._stage = np.zeros(capacity, dtype=np.int16)
+        self._begin = np.zeros(capacity)
+        self._end = np.zeros(capacity)
+        self._frame = np.zeros(capacity, dtype=np.int64)
+        self._thread = np.zeros(capacity, dtype=np.int64)
+        self._count = 0
+        self._thread_names = {}
+        # Guards the ring, its count and the thread names, so events() never sees a half-written event
+        self._record_lock = threading.Lock()
+        self._stages = {}
+        self._stage_names = []
+        self._lock = threading.Lock()
+
+    def _stage_index(self, name):
+        index = self._stages.get(name)
+        if index is None:
+            with self._lock:
+                index = self._stages.setdefault(name, len(self._stage_names))
+                if index == len(self._stage_names):
+                    self._stage_names.append(name)
+        return index
+
+    def begin(self):
+        """Start time of a span, pass it to end()."""
+        return self.clock()
+
+    def end(self, name, begin, frame=-1):
+        """
+        Record the span 'name' from 'begin' to now.
+
+            :param frame: simulation frame the span works on, -1 if none
+        """
+        self._record(name, begin, self.clock(), frame)
+
+    def mark(self, name, frame=-1):
+        """Record the instant event 'name' now."""
+        now = self.clock()
+        self._record(name, now, now, frame)
+
+    def _record(self, name, begin, end, frame):
+        stage = self._stage_index(name)
+        thread = threading.get_ident()
+        with self._record_lock:
+            if thread not in self._thread_names:
+                self._thread_names[thread] = threading.current_thread().name
+            slot = self._count % self.capacity
+            self._count += 1
+            self._stage[slot] = stage
+            self._begin[slot] = begin
+            self._end[slot] = end
+            self._frame[slot] = frame
+            self._thread[slot] = thread
+
+    def events(self):
+        """Recorded events, oldest first, as a dict of arrays."""
+        with self._record_lock:
+            count = self._count
+            order = np.arange(max(0, count - self.capacity), count) % self.capacity
+            return {
+                'stage': self._stage[order],
+                'begin': self._begin[order],
+                'end': self._end[order],
+                'frame': self._frame[order],
+                'thread': self._thread[order],
+            }
+
+    def durations(self, name, events=None):
+        """Durations in seconds of the spans 'name'."""
+        events = self.events() if events is None else events
+        if name not in self._stages:
+            return np.zeros(0)
+        selected = events['stage'] == self._stages[name]
+        return events['end'][selected] - events['begin'][selected]
+
+    def latency(self, start, stop, events=None):
+        """
+        Latency in seconds, per frame, from the first 'start' event to the end
+        of the first 'stop' event of the same frame.
+        """
+        events = self.events() if events is None else events
+        if start not in self._stages or stop not in self._stages:
+            return np.zeros(0)
+
+        def first_per_frame(name, times):
+            selected = (events['stage'] == self._stages[name]) & (events['frame'] >= 0)
+            frames, first = np.unique(events['frame'][selected], return_index=True)
+            return frames, times[selected][first]
+
+        start_frames, start_times = first_per_frame(start, events['begin'])
+        stop_frames, stop_times = first_per_frame(stop, events['end'])
+        _, start_index, stop_index = np.intersect1d(start_frames, stop_frames, return_indices=True)
+        return stop_times[stop_index] - start_times[start_index]
+
+    def report(self, latencies=(), percentiles=(50, 90, 99)):
+        """
+        Text report of the span durations and of the latencies between stages.
+
+            :param latencies: (start, stop) stage pairs passed to latency()
+        """
+        events = self.events()
+        header = '%-44s %7s' % ('stage (ms)', 'count') + ''.join('   p%-4d' % p for p in percentiles) + '    max'
+        lines = [header]
+
+        def row(name, values):
+            values = values * 1e3
+            if not len(values):
+                return '%-44s %7d' % (name, 0)
+            return '%-44s %7d' % (name, len(values)) + ''.join(
+                ' %7.2f' % v for v in np.percentile(values, percentiles)) + ' %7.2f' % values.max()
+
+        for name in self._stage_names:
+            durations = self.durations(name, events)
+            if durations.any():
+                lines.append(row(name, durations))
+        for start, stop in latencies:
+            values = self.latency(start, stop, events)
+            lines.append(row('%s -> %s' % (start, stop), values))
+            lines.extend(self._histogram(values))
+        return '\n'.join(lines)
+
+    @staticmethod
+    def _histogram(values, bins=10, width=40):
+        if len(values) < 2:
+            return []
+        counts, edges = np.histogram(values * 1e3, bins=bins)
+        scale = float(width) / counts.max()
+        return ['  %7.2f - %7.2f ms %7d %s' % (edges[i], edges[i + 1], counts[i], '#' * int(round(counts[i] * scale)))
+                for i in range(bins)]
+
+    def export_chrome_trace(self, path):
+        """Write the events in the Chrome trace event format (JSON)."""
+        events = self.events()
+        with self._record_lock:
+            thread_names = dict(self._thread_names)
+        thread_ids = {thread: index for index, thread in enumerate(sorted(thread_names))}
+        trace = [{
+            'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': index,
+            'args': {'name': thread_names[thread]}} for thread, index in thread_ids.items()]
+        begins = (events['begin'] - self.origin) * 1e6
+        durations = (events['end'] - events['begin']) * 1e6
+        for stage, begin, duration, frame, thread in zip(
+                events['stage'].tolist(), begins.tolist(), durations.tolist(),
+                events['frame'].tolist(), events['thread'].tolist()):
+            event = {'name': self._stage_names[stage], 'pid': 0, 'tid': thread_ids[thread], 'ts': begin}
+            if duration > 0:
+                event.update(ph='X', dur=duration)
+            else:
+                event.update(ph='i', s='t')
+            if frame >= 0:
+                event['args'] = {'frame': frame}
+            trace.append(event)
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, trace_file)
+
+
+class NullTracer(object):
+    """Tracer that records nothing, used when tracing is disabled."""
+
+    def begin(self):
+        return 0.0
+
+    def end(self, name, begin, frame=-1):
+        pass
+
+    def mark(self, name, frame=-1):
+        pass
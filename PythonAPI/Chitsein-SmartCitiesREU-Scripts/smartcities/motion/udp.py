@@ -0,0 +1,293 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+UDP transport of the hero kinematics, so that the motion platform can be
+driven from another host than the CARLA client.
+
+The client publishes one fixed-size datagram per frame. The receiver on the
+motion rig host keeps the newest one and runs the usual motion stack on it
+(MotionPlatform for the Eleetus, simcraft_sample and the ring buffer for the
+SimCraft), see util/motion_udp_receiver.py. A lost datagram is never resent:
+the next frame supersedes it anyway.
+
+All values are little-endian. Packet (128 bytes):
+
+        0   char[4]  magic ('SCMU')
+        4   uint16   layout version
+        6   uint16   reserved
+        8   uint32   session (random, changes when the publisher restarts)
+        12  uint64   sequence number, starts at 1
+        20  float64  send time (time.perf_counter() of the publisher)
+        28  float64  simulation timestamp (s)
+        36  int64    simulation frame
+        44  float32  location x, y, z              (m)
+        56  float32  rotation pitch, yaw, roll     (deg)
+        68  float32  velocity x, y, z              (m/s)
+        80  float32  acceleration x, y, z          (m/s^2)
+        92  float32  angular velocity x, y, z      (deg/s)
+        104 float32  forward vector x, y, z
+        116 float32  right vector x, y, z
+
+The clocks of the two hosts are not synchronized, so the receiver measures the
+transit delay relative to the fastest packet seen (receive time minus send
+time, minus its minimum). This is the queuing delay and jitter of the link,
+not the absolute latency.
+"""
+
+import collections
+import random
+import socket
+import struct
+import time
+
+from smartcities.motion.kinematics import Kinematics
+from smartcities.motion.telemetry import Rotation, Transform, Vector3D
+
+MAGIC = b'SCMU'
+LAYOUT_VERSION = 1
+DEFAULT_PORT = 2070
+
+PACKET = struct.Struct('<4sHHIQddq21f')
+PACKET_SIZE = PACKET.size
+
+# Number of sequence numbers behind the newest one tracked for late and duplicate packets
+WINDOW = 64
+
+MotionPacket = collections.namedtuple('MotionPacket', ['session', 'seq', 'send_time', 'receive_time', 'kinematics'])
+
+
+def parse_address(address, default_host=''):
+    """'host:port', 'host' or ':port' to a (host, port) tuple."""
+    host, _, port = address.rpartition(':') if ':' in address else (address, None, '')
+    return host or default_host, int(port) if port else DEFAULT_PORT
+
+
+def _vector(vector):
+    return vector.x, vector.y, vector.z
+
+
+class MotionUdpPublisher(object):
+    """Sender side, one datagram per published frame."""
+
+    def __init__(self, address, clock=time.perf_counter):
+        """
+            :param address: (host, port) of the receiver
+            :param clock: time source of the send time
+        """
+        self.address = address
+        self.clock = clock
+        self.session = random.getrandbits(32)
+        self.send_errors = 0
+        self._seq = 0
+        self._buffer = bytearray(PACKET_SIZE)
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    @property
+    def seq(self):
+        """Sequence number of the last published packet (0 if none)."""
+        return self._seq
+
+    def pack(self, kinematics):
+        """
+        Encode 'kinematics' as the next packet.
+
+            :return: the packet, a view of a buffer reused by the next call
+        """
+        self._seq += 1
+        transform = kinematics.transform
+        rotation = transform.rotation
+        PACKET.pack_into(
+            self._buffer, 0, MAGIC, LAYOUT_VERSION, 0, self.session, self._seq, self.clock(),
+            kinematics.timestamp, kinematics.frame,
+            transform.location.x, transform.location.y, transform.location.z,
+            rotation.pitch, rotation.yaw, rotation.roll,
+            *(_vector(kinematics.velocity) + _vector(kinematics.acceleration) +
+              _vector(kinematics.angular_velocity) + _vector(kinematics.forward) + _vector(kinematics.right)))
+        return memoryview(self._buffer)
+
+    def publish(self, kinematics):
+        """
+        Send 'kinematics' to the receiver. Send errors (e.g. no route to the
+        rig host) are counted in 'send_errors' and never raised, the
+        simulation goes on without motion.
+
+            :return: sequence number of the packet
+        """
+        self.send(self.pack(kinematics))
+        return self._seq
+
+    def send(self, packet):
+        """Send a packet returned by pack()."""
+        try:
+            self._socket.sendto(packet, self.address)
+        except OSError:
+            self.send_errors += 1
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+class MotionUdpReceiver(object):
+    """
+    Receiver side. Only packets newer than the last accepted one are returned,
+    the others are counted:
+
+        dropped:    sequence numbers skipped (never received so far)
+        late:       received after a newer packet, discarded (if more than
+                    WINDOW packets late, it also stays counted as dropped)
+        duplicates: sequence number already received
+        invalid:    wrong size, magic or layout version
+        restarts:   new publisher session, the sequence starts over
+    """
+
+    def __init__(self, address=('', DEFAULT_PORT), clock=time.perf_counter):
+        """
+            :param address: (host, port) to bind, port 0 picks a free port (see 'address')
+            :param clock: time source of the receive time
+        """
+        self.clock = clock
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind(address)
+        self.address = self._socket.getsockname()
+        self._timeout = None
+        self._buffer = bytearray(PACKET_SIZE + 1)
+        self.session = None
+        self.last_seq = 0
+        # Bit i is set if packet last_seq - i was received
+        self._window = 0
+
+        # Statistics
+        self.received = 0
+        self.dropped = 0
+        self.late = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.restarts = 0
+        self._min_offset = None
+        self._delay_sum = 0.0
+        self.max_delay = 0.0
+
+    def _set_timeout(self, timeout):
+        if timeout != self._timeout:
+            self._socket.settimeout(timeout)
+            self._timeout = timeout
+
+    def _accept(self, size, receive_time):
+        """Decode the packet in the buffer, return a MotionPacket or None if rejected."""
+        if size != PACKET_SIZE:
+            self.invalid += 1
+            return None
+        values = PACKET.unpack_from(self._buffer)
+        magic, version, _, session, seq, send_time, timestamp, frame = values[:8]
+        if magic != MAGIC or version != LAYOUT_VERSION:
+            self.invalid += 1
+            return None
+
+        if session != self.session:
+            if self.session is not None:
+                self.restarts += 1
+            self.session = session
+            self.last_seq = seq - 1
+            self._window = 0
+            self._min_offset = None
+        if seq <= self.last_seq:
+            age = self.last_seq - seq
+            if age < WINDOW and self._window >> age & 1:
+                self.duplicates += 1
+            else:
+                self.late += 1
+                if age < WINDOW:
+                    # It was counted as dropped when the newer packet arrived
+                    self._window |= 1 << age
+                    self.dropped -= 1
+            return None
+        self.dropped += seq - self.last_seq - 1
+        self._window = ((self._window << (seq - self.last_seq)) | 1) & ((1 << WINDOW) - 1)
+        self.last_seq = seq
+        self.received += 1
+
+        offset = receive_time - send_time
+        if self._min_offset is None or offset < self._min_offset:
+            self._min_offset = offset
+        delay = offset - self._min_offset
+        self._delay_sum += delay
+        self.max_delay = max(self.max_delay, delay)
+
+        f = values[8:]
+        kinematics = Kinematics(
+            frame,
+            timestamp,
+            Transform(Vector3D(*f[0:3]), Rotation(*f[3:6])),
+            Vector3D(*f[6:9]),
+            Vector3D(*f[9:12]),
+            Vector3D(*f[12:15]),
+            Vector3D(*f[15:18]),
+            Vector3D(*f[18:21]))
+        return MotionPacket(session, seq, send_time, receive_time, kinematics)
+
+    def receive(self, timeout=None):
+        """
+        Wait for the next accepted packet.
+
+            :param timeout: seconds to wait, None to wait forever, 0 to poll
+            :return: MotionPacket, None on timeout
+        """
+        deadline = None if timeout is None else self.clock() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - self.clock())
+            self._set_timeout(remaining)
+            try:
+                size = self._socket.recv_into(self._buffer)
+            except (socket.timeout, BlockingIOError):
+                return None
+            except ConnectionResetError:
+                # Windows reports the ICMP port unreachable of an earlier send
+                continue
+            packet = self._accept(size, self.clock())
+            if packet is not None:
+                return packet
+
+    def receive_latest(self, timeout=None):
+        """
+        Wait for a packet, then drain the socket and return the newest one.
+
+            :return: MotionPacket, None on timeout
+        """
+        latest = self.receive(timeout)
+        if latest is None:
+            return None
+        while True:
+            packet = self.receive(0)
+            if packet is None:
+                return latest
+            latest = packet
+
+    def summary(self):
+        """Statistics as a dict, delays are in milliseconds."""
+        expected = self.received + self.dropped
+        return {
+            'received': self.received,
+            'dropped': self.dropped,
+            'drop_rate': float(self.dropped) / expected if expected else 0.0,
+            'late': self.late,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'restarts': self.restarts,
+            'mean_delay_ms': self._delay_sum / self.received * 1e3 if self.received else 0.0,
+            'max_delay_ms': self.max_delay * 1e3,
+        }
+
+    def __str__(self):
+        summary = self.summary()
+        summary['drop_rate'] *= 100.0
+        return ('motion packets %(received)d received, %(dropped)d dropped (%(drop_rate).2f%%), %(late)d late, '
+                '%(duplicates)d duplicates, %(invalid)d invalid, %(restarts)d restarts, relative delay '
+                'mean %(mean_delay_ms).2f ms, max %(max_delay_ms).2f ms' % summary)
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
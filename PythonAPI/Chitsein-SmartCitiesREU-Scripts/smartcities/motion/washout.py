@@ -0,0 +1,464 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Classical washout motion cueing for the motion platforms.
+
+A platform cannot sustain the accelerations of the simulated vehicle, so the
+vehicle motion is split in three channels:
+
+  * translational: the onset of the specific force, high-pass filtered so the
+    platform returns to its neutral position;
+  * tilt coordination: the sustained (low-pass filtered) longitudinal and
+    lateral specific force, rendered by tilting the seat so that gravity is
+    felt as acceleration, with the tilt rate limited below the perception
+    threshold of the vestibular system;
+  * rotational: the vehicle attitude, high-pass filtered so that e.g. the
+    heading or a constant road grade are washed out.
+
+All the linear filters are second-order sections evaluated together in one
+IIRFilterBank. The bank runs sample by sample with O(1) state in the live loop,
+and filters a whole recorded drive in a few vectorized block operations.
+
+The filters are discretized for one sample period. When the simulation step
+changes (asynchronous mode), set_dt() discretizes them again and keeps their
+state, see smartcities.motion.simcraft.SimcraftSampler.
+"""
+
+import collections
+import math
+
+import numpy as np
+
+# Standard gravity in m/s^2
+G = 9.81
+
+MotionCue = collections.namedtuple('MotionCue', ['accel', 'angles', 'angular_velocity'])
+MotionCue.__doc__ = """
+Output of ClassicalWashout, arrays of shape (3,) per sample or (T, 3) per drive.
+
+    accel: translational acceleration onset along (forward, right, up) in m/s^2
+    angles: platform (roll, pitch, yaw) in radians, CARLA sign conventions
+    angular_velocity: rate of 'angles' in radians per second
+"""
+
+
+# ==============================================================================
+# -- Filter design -------------------------------------------------------------
+# ==============================================================================
+
+
+def highpass2(cutoff_hz, damping=1.0):
+    """Analog second-order high-pass s^2 / (s^2 + 2 zeta w s + w^2)."""
+    w = 2.0 * math.pi * cutoff_hz
+    return (1.0, 0.0, 0.0), (1.0, 2.0 * damping * w, w * w), w
+
+
+def lowpass2(cutoff_hz, damping=1.0):
+    """Analog second-order low-pass w^2 / (s^2 + 2 zeta w s + w^2)."""
+    w = 2.0 * math.pi * cutoff_hz
+    return (0.0, 0.0, w * w), (1.0, 2.0 * damping * w, w * w), w
+
+
+def highpass1(cutoff_hz):
+    """Analog first-order high-pass s / (s + w)."""
+    w = 2.0 * math.pi * cutoff_hz
+    return (0.0, 1.0, 0.0), (0.0, 1.0, w), w
+
+
+def washout_rate(cutoff_hz, smoothing):
+    """
+    Analog rate of a first-order high-passed signal, s^2 / ((s + w)(tau s + 1)).
+    The derivative is smoothed with time constant 'smoothing' (tau) in seconds
+    to stay proper, instead of finite-differencing the samples.
+    """
+    w = 2.0 * math.pi * cutoff_hz
+    return (1.0, 0.0, 0.0), (smoothing, 1.0 + smoothing * w, w), w
+
+
+def bilinear(num, den, dt, prewarp=None):
+    """
+    Discretize the analog filter num(s) / den(s) with the bilinear transform.
+
+        :param num: numerator coefficients (s^2, s, 1)
+        :param den: denominator coefficients (s^2, s, 1)
+        :param dt: sample period in seconds
+        :param prewarp: frequency in rad/s at which the response is matched exactly
+        :return: (b, a) coefficients of z^0, z^-1, z^-2 with a[0] == 1
+    """
+    if prewarp:
+        k = prewarp / math.tan(prewarp * dt / 2.0)
+    else:
+        k = 2.0 / dt
+
+    def transform(p):
+        return (p[0] * k * k + p[1] * k + p[2],
+                2.0 * (p[2] - p[0] * k * k),
+                p[0] * k * k - p[1] * k + p[2])
+
+    b = transform(num)
+    a = transform(den)
+    return tuple(x / a[0] for x in b), tuple(x / a[0] for x in a)
+
+
+def design(sections, dt):
+    """Discretize a list of (num, den, w) analog sections into (b, a) arrays of shape (C, 3)."""
+    coefficients = [bilinear(num, den, dt, prewarp=w) for num, den, w in sections]
+    return np.array([b for b, _ in coefficients]), np.array([a for _, a in coefficients])
+
+
+# ==============================================================================
+# -- IIRFilterBank -------------------------------------------------------------
+# ==============================================================================
+
+
+class IIRFilterBank(object):
+    """
+    C independent second-order sections (transposed direct form II), one per
+    channel, sharing one state array.
+
+    filter() processes T samples in blocks of 'block_size': the response within
+    a block is one batched matrix product with the precomputed impulse response,
+    and only the state at the block boundaries is propagated sequentially, so a
+    Python loop runs T / block_size times instead of T times.
+    """
+
+    def __init__(self, b, a, block_size=64):
+        """
+            :param b: numerator coefficients, shape (C, 3)
+            :param a: denominator coefficients, shape (C, 3) with a[:, 0] == 1
+            :param block_size: samples per block in filter()
+        """
+        self.b = np.array(b, dtype=np.float64)
+        self.a = np.array(a, dtype=np.float64)
+        self.channels = len(self.b)
+        self.block_size = block_size
+        # State (s1, s2) of each channel
+        self.state = np.zeros((self.channels, 2))
+        self._prepare_blocks()
+
+    def set_coefficients(self, b, a):
+        """Replace the coefficients, keeping the state. The blocks of filter() are prepared again on use."""
+        self.b = np.array(b, dtype=np.float64)
+        self.a = np.array(a, dtype=np.float64)
+        self._prepared = False
+
+    def _prepare_blocks(self):
+        b0, b1, b2 = self.b.T
+        _, a1, a2 = self.a.T
+        length = self.block_size
+
+        # State space form: x' = A x + B u, y = x[0] + b0 u
+        transition = np.zeros((self.channels, 2, 2))
+        transition[:, 0, 0] = -a1
+        transition[:, 0, 1] = 1.0
+        transition[:, 1, 0] = -a2
+        gain = np.stack((b1 - a1 * b0, b2 - a2 * b0), axis=1)[:, :, None]
+
+        powers = np.empty((length + 1, self.channels, 2, 2))
+        powers[0] = np.eye(2)
+        for m in range(1, length + 1):
+            powers[m] = transition @ powers[m - 1]
+
+        # Impulse response h[m] and the lower triangular Toeplitz matrix H[j, i] = h[j - i]
+        impulse = np.empty((self.channels, length))
+        impulse[:, 0] = b0
+        impulse[:, 1:] = (powers[:length - 1] @ gain)[:, :, 0, 0].T
+        lag = np.arange(length)[:, None] - np.arange(length)[None, :]
+        toeplitz = np.where(lag >= 0, impulse[:, np.maximum(lag, 0)], 0.0)
+        # Matrices are stored transposed, as right operands of (C, blocks, block_size) inputs
+        self._forced = np.ascontiguousarray(toeplitz.transpose(0, 2, 1))
+        # Response of each block to its initial state, y[j] = (A^j x)[0]
+        self._free = np.ascontiguousarray(powers[:length, :, 0, :].transpose(1, 2, 0))
+        # Contribution of each input of a block to the state at the end of the block
+        self._drive = np.ascontiguousarray((powers[length - 1::-1] @ gain)[:, :, :, 0].transpose(1, 0, 2))
+        # A^block_size, element-wise per channel
+        self._block_transition = [powers[length, :, i, j].copy() for i in range(2) for j in range(2)]
+        self._prepared = True
+
+    def reset(self, value=None):
+        """
+        Reset the state to rest, or to the steady state of a constant input.
+
+            :param value: constant input per channel, shape (C,)
+        """
+        if value is None:
+            self.state[:] = 0.0
+            return
+        value = np.asarray(value, dtype=np.float64)
+        output = value * self.b.sum(axis=1) / self.a.sum(axis=1)
+        self.state[:, 0] = output - self.b[:, 0] * value
+        self.state[:, 1] = self.b[:, 2] * value - self.a[:, 2] * output
+
+    def step(self, value):
+        """Filter one sample of shape (C,), returns the output of shape (C,)."""
+        output = self.b[:, 0] * value + self.state[:, 0]
+        self.state[:, 0] = self.b[:, 1] * value - self.a[:, 1] * output + self.state[:, 1]
+        self.state[:, 1] = self.b[:, 2] * value - self.a[:, 2] * output
+        return output
+
+    def filter(self, values):
+        """
+        Filter T samples of shape (T, C), continuing from and updating the
+        current state exactly like T calls to step().
+        """
+        values = np.asarray(values, dtype=np.float64)
+        output = np.empty_like(values)
+        length = self.block_size
+        blocks = len(values) // length
+        if blocks:
+            if not self._prepared:
+                self._prepare_blocks()
+            inputs = np.ascontiguousarray(
+                values[:blocks * length].reshape(blocks, length, self.channels).transpose(2, 0, 1))
+            drive = inputs @ self._drive
+            drive_0 = np.ascontiguousarray(drive[:, :, 0].T)
+            drive_1 = np.ascontiguousarray(drive[:, :, 1].T)
+            m00, m01, m10, m11 = self._block_transition
+            initial = np.empty((blocks, 2, self.channels))
+            s0 = self.state[:, 0].copy()
+            s1 = self.state[:, 1].copy()
+            for block in range(blocks):
+                initial[block, 0] = s0
+                initial[block, 1] = s1
+                s0, s1 = m00 * s0 + m01 * s1 + drive_0[block], m10 * s0 + m11 * s1 + drive_1[block]
+            self.state[:, 0] = s0
+            self.state[:, 1] = s1
+            response = inputs @ self._forced
+            response += np.ascontiguousarray(initial.transpose(2, 0, 1)) @ self._free
+            output[:blocks * length] = response.transpose(1, 2, 0).reshape(blocks * length, self.channels)
+        for index in range(blocks * length, len(values)):
+            output[index] = self.step(values[index])
+        return output
+
+
+# ==============================================================================
+# -- RateLimiter ---------------------------------------------------------------
+# ==============================================================================
+
+
+class RateLimiter(object):
+    """Limits the rate of change of C channels to 'rate' units per second."""
+
+    def __init__(self, rate, dt, channels):
+        self.rate = rate
+        self.limit = rate * dt
+        self.state = np.zeros(channels)
+        self.started = False
+
+    def reset(self, value=None):
+        self.started = value is not None
+        self.state[:] = 0.0 if value is None else value
+
+    def set_dt(self, dt):
+        self.limit = self.rate * dt
+
+    def step(self, value):
+        if not self.started:
+            self.reset(value)
+        else:
+            self.state += np.clip(value - self.state, -self.limit, self.limit)
+        return self.state.copy()
+
+    def filter(self, values):
+        """Limit T samples of shape (T, C), exactly like T calls to step()."""
+        values = np.asarray(values, dtype=np.float64)
+        output = np.empty_like(values)
+        if not len(values):
+            return output
+        if not self.started:
+            self.reset(values[0])
+        for channel in range(values.shape[1]):
+            self.state[channel] = self._filter_channel(values[:, channel], float(self.state[channel]), output[:, channel])
+        return output
+
+    def _filter_channel(self, values, current, output):
+        # While the output tracks the input, it keeps doing so until the input
+        # jumps by more than the limit, so only the limited stretches are
+        # stepped one sample at a time.
+        limit = self.limit
+        jumps = np.flatnonzero(np.abs(np.diff(values)) > limit) + 1
+        samples = values.tolist()
+        index = 0
+        while index < len(samples):
+            change = samples[index] - current
+            if -limit <= change <= limit:
+                following = np.searchsorted(jumps, index, side='right')
+                end = jumps[following] if following < len(jumps) else len(samples)
+                output[index:end] = values[index:end]
+                current = samples[end - 1]
+                index = end
+            else:
+                current += limit if change > 0 else -limit
+                output[index] = current
+                index += 1
+        return current
+
+
+# ==============================================================================
+# -- ClassicalWashout ----------------------------------------------------------
+# ==============================================================================
+
+
+def to_vehicle_frame(vector, forward, right):
+    """
+    Project a world vector (with x, y, z attributes or a sequence) on the
+    vehicle (forward, right, up) axes. CARLA is left-handed, so the up vector
+    is the right-handed cross product forward x right.
+    """
+    fx, fy, fz = forward
+    rx, ry, rz = right
+    ux, uy, uz = fy * rz - fz * ry, fz * rx - fx * rz, fx * ry - fy * rx
+    x, y, z = vector
+    return (x * fx + y * fy + z * fz,
+            x * rx + y * ry + z * rz,
+            x * ux + y * uy + z * uz)
+
+
+class ClassicalWashout(object):
+    """
+    Classical washout filter with tilt coordination.
+
+    Inputs are the vehicle acceleration along its (forward, right, up) axes in
+    m/s^2 and its (roll, pitch, yaw) attitude in radians. The first sample
+    initializes the filters to steady state, so the cue starts at rest.
+    """
+
+    # Filter bank channels: translational onset (3), tilt (2), attitude (3), attitude rate (3)
+    _ACCEL = slice(0, 3)
+    _TILT = slice(3, 5)
+    _ANGLES = slice(5, 8)
+    _RATES = slice(8, 11)
+    # Bank channel inputs, as indices in (forward, right, up, roll, pitch, yaw)
+    _INPUTS = [0, 1, 2, 0, 1, 3, 4, 5, 3, 4, 5]
+
+    def __init__(self, dt, accel_gain=0.5, rotation_gain=1.0,
+                 accel_washout_hz=0.4, accel_damping=1.0,
+                 tilt_hz=0.8, tilt_damping=1.0, tilt_rate_limit=math.radians(5.0),
+                 rotation_washout_hz=0.2, rate_smoothing=0.05, block_size=64):
+        """
+            :param dt: sample period in seconds
+            :param accel_gain: scale of the specific force (translational and tilt channels)
+            :param rotation_gain: scale of the attitude (rotational channel)
+            :param accel_washout_hz: cutoff of the translational high-pass
+            :param accel_damping: damping ratio of the translational high-pass
+            :param tilt_hz: cutoff of the tilt coordination low-pass
+            :param tilt_damping: damping ratio of the tilt coordination low-pass
+            :param tilt_rate_limit: maximum tilt rate in radians per second
+            :param rotation_washout_hz: cutoff of the rotational high-pass
+            :param rate_smoothing: time constant in seconds of the attitude rate
+            :param block_size: samples per block of the batch filter
+        """
+        self.dt = dt
+        self.accel_gain = accel_gain
+        self.rotation_gain = rotation_gain
+        self._sections = (
+            [highpass2(accel_washout_hz, accel_damping)] * 3 +
+            [lowpass2(tilt_hz, tilt_damping)] * 2 +
+            [highpass1(rotation_washout_hz)] * 3 +
+            [washout_rate(rotation_washout_hz, rate_smoothing)] * 3)
+        self.bank = IIRFilterBank(*design(self._sections, dt), block_size=block_size)
+        self.tilt_limiter = RateLimiter(tilt_rate_limit, dt, 2)
+        self.started = False
+        # Raw and unwrapped yaw of the last sample, so the heading can cross +/-180 degrees
+        self._yaw = 0.0
+        self._unwrapped_yaw = 0.0
+
+    def reset(self):
+        self.bank.reset()
+        self.tilt_limiter.reset()
+        self.started = False
+
+    def set_dt(self, dt):
+        """
+        Discretize the filters for a new sample period, keeping their state.
+
+            :param dt: sample period in seconds
+        """
+        if dt == self.dt:
+            return
+        self.dt = dt
+        self.bank.set_coefficients(*design(self._sections, dt))
+        self.tilt_limiter.set_dt(dt)
+
+    def _tilt(self, specific_force):
+        # Gravity felt as acceleration: pitch nose up to push the driver back
+        # under forward acceleration, roll left side down under right acceleration
+        ratio = np.clip(specific_force * (self.accel_gain / G), -1.0, 1.0)
+        tilt = np.arcsin(ratio)
+        tilt[..., 1] *= -1.0
+        # Columns become (roll, pitch)
+        return tilt[..., ::-1]
+
+    def step(self, accel, angles):
+        """
+        Cue one sample.
+
+            :param accel: (forward, right, up) acceleration in m/s^2
+            :param angles: (roll, pitch, yaw) in radians
+            :return: MotionCue of arrays of shape (3,)
+        """
+        roll, pitch, yaw = angles
+        delta = (yaw - self._yaw + math.pi) % (2.0 * math.pi) - math.pi
+        self._yaw = yaw
+        self._unwrapped_yaw = self._unwrapped_yaw + delta if self.started else yaw
+        inputs = np.array((accel[0], accel[1], accel[2], roll, pitch, self._unwrapped_yaw))[self._INPUTS]
+        if not self.started:
+            self.bank.reset(inputs)
+            self.started = True
+
+        filtered = self.bank.step(inputs)
+        previous_tilt = self.tilt_limiter.state.copy() if self.tilt_limiter.started else None
+        tilt = self.tilt_limiter.step(self._tilt(filtered[self._TILT]))
+        tilt_rate = np.zeros(2) if previous_tilt is None else (tilt - previous_tilt) / self.dt
+
+        angles = filtered[self._ANGLES] * self.rotation_gain
+        angles[:2] += tilt
+        rates = filtered[self._RATES] * self.rotation_gain
+        rates[:2] += tilt_rate
+        return MotionCue(filtered[self._ACCEL] * self.accel_gain, angles, rates)
+
+    def filter(self, accel, angles):
+        """
+        Cue a whole drive, continuing from and updating the current state
+        exactly like T calls to step().
+
+            :param accel: (forward, right, up) acceleration in m/s^2, shape (T, 3)
+            :param angles: (roll, pitch, yaw) in radians, shape (T, 3)
+            :return: MotionCue of arrays of shape (T, 3)
+        """
+        accel = np.asarray(accel, dtype=np.float64)
+        angles = np.array(angles, dtype=np.float64)
+        if not len(angles):
+            empty = np.zeros((0, 3))
+            return MotionCue(empty, empty.copy(), empty.copy())
+
+        yaw = angles[:, 2]
+        previous = np.concatenate(([self._yaw], yaw[:-1]))
+        delta = (yaw - previous + np.pi) % (2.0 * np.pi) - np.pi
+        if not self.started:
+            delta[0] = yaw[0]
+            start = 0.0
+        else:
+            start = self._unwrapped_yaw
+        angles[:, 2] = start + np.cumsum(delta)
+        self._yaw = float(yaw[-1])
+        self._unwrapped_yaw = float(angles[-1, 2])
+
+        inputs = np.concatenate((accel, angles), axis=1)[:, self._INPUTS]
+        if not self.started:
+            self.bank.reset(inputs[0])
+            self.started = True
+
+        filtered = self.bank.filter(inputs)
+        previous_tilt = self.tilt_limiter.state.copy() if self.tilt_limiter.started else None
+        tilt = self.tilt_limiter.filter(self._tilt(filtered[:, self._TILT]))
+        tilt_rate = np.empty_like(tilt)
+        tilt_rate[1:] = np.diff(tilt, axis=0) / self.dt
+        tilt_rate[0] = 0.0 if previous_tilt is None else (tilt[0] - previous_tilt) / self.dt
+
+        cue_angles = filtered[:, self._ANGLES] * self.rotation_gain
+        cue_angles[:, :2] += tilt
+        rates = filtered[:, self._RATES] * self.rotation_gain
+        rates[:, :2] += tilt_rate
+        return MotionCue(filtered[:, self._ACCEL] * self.accel_gain, cue_angles, rates)
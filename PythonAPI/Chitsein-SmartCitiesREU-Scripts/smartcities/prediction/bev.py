@@ -0,0 +1,306 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Bird's-eye view of the agents around the ego vehicle, rasterized with NumPy.
+
+The whole scene is drawn into one buffer (BirdEyeView.buffer, shape (height,
+width)) of 8 bit indices into an RGB palette, the road classes followed by the
+colors drawn. The client copies it into an 8 bit pygame surface holding the
+palette (pygame.surfarray.blit_array) and blits it once per frame, so the
+palette is expanded to RGB by SDL instead of NumPy; rgb() gives the RGB image:
+
+  * the road is rasterized once into a world-aligned class image (RoadRaster),
+    cached on disk for each version of the map (map_road_raster), each frame
+    samples the ego-centred, rotated viewport out of it with one gather, so
+    the cost of the road does not depend on the size of the map;
+  * the vehicles are rotated boxes, filled for all agents at once: the pixel
+    rows of every box are expanded with np.repeat and each row is clipped to
+    the box in closed form, then the spans are written through a flat index;
+  * the trajectory polylines are drawn as boxes too, one per segment.
+
+The view is heading-up: the ego is at the centre of the buffer and drives
+toward the top. World coordinates are the CARLA x and y in metres, yaw in
+degrees, as in carla.Transform.
+"""
+
+import math
+
+import numpy as np
+
+from smartcities.prediction.map_cache import CACHE_DIR, cache_path, load_arrays, save_arrays
+
+# Palette of the RoadRaster classes
+BACKGROUND = 0
+ROAD = 1
+LANE_CENTER = 2
+ROAD_PALETTE = np.array([(0, 0, 0), (64, 64, 64), (180, 180, 180)], dtype=np.uint8)
+
+
+def box_spans(cx, cy, yaw, half_length, half_width, shape):
+    """
+    Pixel spans covered by rotated boxes, in pixel coordinates (x to the right,
+    y down). A pixel is covered if its centre is inside the box.
+
+        :param cx, cy, yaw, half_length, half_width: arrays of the centre, heading
+            in radians and half sizes of the boxes, in pixels
+        :param shape: (height, width) of the target
+        :return: (box, row, x0, x1) arrays, x1 inclusive, of the non empty spans
+    """
+    height, width = shape
+    cx = np.asarray(cx, dtype=np.float64)
+    cy = np.asarray(cy, dtype=np.float64)
+    cos_yaw = np.cos(yaw)
+    sin_yaw = np.sin(yaw)
+    # Keep the divisions below finite, a 1e-9 slope is a row or column of the box anyway
+    cos_yaw = np.where(np.abs(cos_yaw) < 1e-9, 1e-9, cos_yaw)
+    sin_yaw = np.where(np.abs(sin_yaw) < 1e-9, 1e-9, sin_yaw)
+    half_length = np.broadcast_to(half_length, cx.shape)
+    half_width = np.broadcast_to(half_width, cx.shape)
+
+    reach_y = np.abs(half_length * sin_yaw) + np.abs(half_width * cos_yaw)
+    reach_x = np.abs(half_length * cos_yaw) + np.abs(half_width * sin_yaw)
+    visible = np.flatnonzero(
+        (cx + reach_x >= 0) & (cx - reach_x <= width) & (cy + reach_y >= 0) & (cy - reach_y <= height))
+    y0 = np.maximum(np.ceil(cy[visible] - reach_y[visible] - 0.5), 0).astype(np.int64)
+    y1 = np.minimum(np.floor(cy[visible] + reach_y[visible] - 0.5), height - 1).astype(np.int64)
+    counts = np.maximum(y1 - y0 + 1, 0)
+    box = np.repeat(visible, counts)
+    first = np.cumsum(counts) - counts
+    row = np.repeat(y0, counts) + np.arange(box.size) - np.repeat(first, counts)
+
+    # Along the heading |(x - cx) cos + dy sin| <= half_length, across it |-(x - cx) sin + dy cos| <= half_width
+    dy = row + 0.5 - cy[box]
+    c, s = cos_yaw[box], sin_yaw[box]
+    length, lateral = half_length[box], half_width[box]
+    a0, a1 = (-length - dy * s) / c, (length - dy * s) / c
+    b0, b1 = (dy * c - lateral) / s, (dy * c + lateral) / s
+    low = np.maximum(np.minimum(a0, a1), np.minimum(b0, b1)) + cx[box]
+    high = np.minimum(np.maximum(a0, a1), np.maximum(b0, b1)) + cx[box]
+    x0 = np.ceil(np.clip(low - 0.5, -1.0, width)).astype(np.int64)
+    x1 = np.floor(np.clip(high - 0.5, -1.0, width)).astype(np.int64)
+    x0 = np.maximum(x0, 0)
+    x1 = np.minimum(x1, width - 1)
+    keep = x0 <= x1
+    return box[keep], row[keep], x0[keep], x1[keep]
+
+
+def fill_spans(target, row, x0, x1, value):
+    """Write 'value' to the pixels of the spans of box_spans() in a 2D array."""
+    lengths = x1 - x0 + 1
+    first = np.cumsum(lengths) - lengths
+    flat = np.repeat(row * target.shape[1] + x0 - first, lengths) + np.arange(int(lengths.sum()))
+    target.reshape(-1)[flat] = value
+
+
+def fill_boxes(target, cx, cy, yaw, half_length, half_width, value):
+    """Fill rotated boxes in pixel coordinates, see box_spans()."""
+    _, row, x0, x1 = box_spans(cx, cy, yaw, half_length, half_width, target.shape[:2])
+    fill_spans(target, row, x0, x1, value)
+
+
+def segment_boxes(points, thickness):
+    """
+    Boxes of the segments of polylines, overlapping by the thickness at the
+    joints.
+
+        :param points: array of shape (N, H, 2) of the polylines, NaN points are skipped
+        :return: (cx, cy, yaw, half_length, half_width) arrays of the N * (H - 1) segments
+    """
+    start = points[:, :-1].reshape(-1, 2)
+    end = points[:, 1:].reshape(-1, 2)
+    valid = np.isfinite(start).all(axis=1) & np.isfinite(end).all(axis=1)
+    start, end = start[valid], end[valid]
+    delta = end - start
+    center = 0.5 * (start + end)
+    half_length = 0.5 * (np.hypot(delta[:, 0], delta[:, 1]) + thickness)
+    return center[:, 0], center[:, 1], np.arctan2(delta[:, 1], delta[:, 0]), half_length, 0.5 * thickness
+
+
+class RoadRaster(object):
+    """
+    Road classes (BACKGROUND, ROAD, LANE_CENTER) of the whole map in a
+    world-aligned uint8 image, rasterized once.
+    """
+
+    def __init__(self, x, y, yaw, lane_width, spacing, pixels_per_meter, margin=50.0, max_size=8192):
+        """
+            :param x, y, yaw, lane_width: arrays of the lane centre waypoints, in metres and degrees,
+                e.g. of Map.generate_waypoints(spacing)
+            :param spacing: distance between the waypoints in metres
+            :param pixels_per_meter: resolution of the image, lowered if the image would exceed 'max_size'
+            :param margin: metres of background around the waypoints
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        self.origin_x = float(x.min()) - margin
+        self.origin_y = float(y.min()) - margin
+        extent = max(float(x.max()) + margin - self.origin_x, float(y.max()) + margin - self.origin_y)
+        self.pixels_per_meter = min(float(pixels_per_meter), (max_size - 1) / extent)
+        size = int(math.ceil(extent * self.pixels_per_meter)) + 1
+        self.image = np.zeros((size, size), dtype=np.uint8)
+
+        px, py = self.to_pixels(x, y)
+        heading = np.radians(yaw)
+        # A box per waypoint, long enough to join the next one
+        fill_boxes(self.image, px, py, heading, 0.5 * (spacing + 0.2) * self.pixels_per_meter,
+                   0.5 * np.asarray(lane_width) * self.pixels_per_meter, ROAD)
+        fill_boxes(self.image, px, py, heading, 0.5 * spacing * self.pixels_per_meter,
+                   max(0.1 * self.pixels_per_meter, 0.5), LANE_CENTER)
+
+    @classmethod
+    def from_image(cls, image, origin_x, origin_y, pixels_per_meter):
+        """RoadRaster of an image rasterized before, as returned by arrays()."""
+        road = cls.__new__(cls)
+        road.image = np.ascontiguousarray(image, dtype=np.uint8)
+        road.origin_x = float(origin_x)
+        road.origin_y = float(origin_y)
+        road.pixels_per_meter = float(pixels_per_meter)
+        return road
+
+    def arrays(self):
+        """Dictionary of the image and its placement, the arguments of from_image()."""
+        return {'image': self.image, 'origin_x': np.float64(self.origin_x), 'origin_y': np.float64(self.origin_y),
+                'pixels_per_meter': np.float64(self.pixels_per_meter)}
+
+    def to_pixels(self, x, y):
+        return ((np.asarray(x) - self.origin_x) * self.pixels_per_meter,
+                (np.asarray(y) - self.origin_y) * self.pixels_per_meter)
+
+
+def map_road_raster(carla_map, lanes, spacing, pixels_per_meter, dirname=CACHE_DIR):
+    """
+    RoadRaster of a carla.Map, loaded from the cache when rasterized before for the same OpenDRIVE.
+
+        :param lanes: lane centre waypoints of the map, with x, y, yaw and lane_width arrays,
+            e.g. the smartcities.prediction.lanes.LaneGraph, only read when not cached
+        :param spacing: distance between the waypoints in metres
+    """
+    path = cache_path(carla_map, 'road', '%gm_%gppm' % (spacing, pixels_per_meter), dirname)
+    arrays = load_arrays(path)
+    if arrays is None:
+        road = RoadRaster(lanes.x, lanes.y, lanes.yaw, lanes.lane_width, spacing, pixels_per_meter)
+        save_arrays(path, road.arrays(), compressed=True)
+        return road
+    return RoadRaster.from_image(**arrays)
+
+
+class BirdEyeView(object):
+    """Heading-up view around the ego, see the module documentation."""
+
+    def __init__(self, width, height, pixels_per_meter, road=None, palette=ROAD_PALETTE, block_rows=64):
+        """
+            :param pixels_per_meter: scale of the view
+            :param road: RoadRaster, None for a black background
+            :param palette: RGB color of each RoadRaster class
+            :param block_rows: rows of the view sampled from the road image at once, sized
+                for the temporary indices to stay in cache
+        """
+        self.width = width
+        self.height = height
+        self.pixels_per_meter = float(pixels_per_meter)
+        self.road = road
+        self.palette = np.zeros((256, 3), dtype=np.uint8)
+        self.palette[:len(palette)] = palette
+        self.colors = len(palette)
+        self.buffer = np.zeros((height, width), dtype=np.uint8)
+        self.block_rows = block_rows
+        # Pixel centres relative to the centre of the view
+        self._du = np.arange(width) + 0.5 - 0.5 * width
+        self._dv = np.arange(height) + 0.5 - 0.5 * height
+        self._column = np.empty((block_rows, width), dtype=np.int64)
+        self._row = np.empty((block_rows, width), dtype=np.int64)
+        self._color_index = {}
+        self._rotation = (1.0, 0.0)
+        self._ego = (0.0, 0.0)
+
+    def color(self, rgb):
+        """Palette index of an RGB color, added to the palette on first use."""
+        rgb = tuple(int(value) for value in rgb)
+        index = self._color_index.get(rgb)
+        if index is None:
+            if self.colors == len(self.palette):
+                raise ValueError('the palette of the view is full')
+            index = self._color_index[rgb] = self.colors
+            self.palette[index] = rgb
+            self.colors += 1
+        return index
+
+    def rgb(self):
+        """RGB image of the view, array of shape (height, width, 3)."""
+        return self.palette[self.buffer]
+
+    def begin(self, ego_x, ego_y, ego_yaw):
+        """Start a frame centred on the ego pose, with the road layer as background."""
+        # Rotation of the world into the view, the ego heading points up (-90 degrees in pixel coordinates)
+        angle = math.radians(-90.0 - ego_yaw)
+        self._rotation = (math.cos(angle), math.sin(angle))
+        self._ego = (float(ego_x), float(ego_y))
+        if self.road is None:
+            self.buffer.fill(BACKGROUND)
+            return
+        # Road image pixel of every view pixel, p = ego + R(-angle) (du, dv) / scale, in 16.16 fixed
+        # point: the rotation is applied to the row and column vectors, a view pixel costs two adds
+        road = self.road
+        cos_a, sin_a = self._rotation
+        ratio = road.pixels_per_meter / self.pixels_per_meter * 65536.0
+        tx, ty = road.to_pixels(ego_x, ego_y)
+        column_u = np.round(cos_a * ratio * self._du + tx * 65536.0).astype(np.int64)
+        column_v = np.round(sin_a * ratio * self._dv).astype(np.int64)
+        row_u = np.round(-sin_a * ratio * self._du + ty * 65536.0).astype(np.int64)
+        row_v = np.round(cos_a * ratio * self._dv).astype(np.int64)
+        size = road.image.shape[0]
+        limit = (size - 1) << 16
+        inside = (column_u.min() + column_v.min() >= 0 and column_u.max() + column_v.max() < limit and
+                  row_u.min() + row_v.min() >= 0 and row_u.max() + row_v.max() < limit)
+        image = road.image.reshape(-1)
+        for start in range(0, self.height, self.block_rows):
+            stop = min(start + self.block_rows, self.height)
+            column = self._column[:stop - start]
+            row = self._row[:stop - start]
+            np.add(column_u[np.newaxis, :], column_v[start:stop, np.newaxis], out=column)
+            np.add(row_u[np.newaxis, :], row_v[start:stop, np.newaxis], out=row)
+            if not inside:
+                # Near the border of the road image, the outer pixels are background
+                np.clip(column, 0, limit, out=column)
+                np.clip(row, 0, limit, out=row)
+            np.right_shift(column, 16, out=column)
+            np.right_shift(row, 16, out=row)
+            row *= size
+            row += column
+            np.take(image, row, out=self.buffer[start:stop])
+
+    def to_view(self, x, y):
+        """Pixel coordinates of world points, arrays of any shape."""
+        cos_a, sin_a = self._rotation
+        dx = (np.asarray(x, dtype=np.float64) - self._ego[0]) * self.pixels_per_meter
+        dy = (np.asarray(y, dtype=np.float64) - self._ego[1]) * self.pixels_per_meter
+        return cos_a * dx - sin_a * dy + 0.5 * self.width, sin_a * dx + cos_a * dy + 0.5 * self.height
+
+    def draw_boxes(self, x, y, yaw, half_length, half_width, color):
+        """
+        Draw rotated boxes, e.g. the bounding boxes of the vehicles.
+
+            :param x, y, yaw: arrays of the box centres in metres and headings in degrees
+            :param half_length, half_width: half sizes in metres, arrays or scalars
+            :param color: RGB color
+        """
+        px, py = self.to_view(x, y)
+        heading = np.radians(yaw) + math.atan2(self._rotation[1], self._rotation[0])
+        fill_boxes(self.buffer, px, py, heading, np.asarray(half_length) * self.pixels_per_meter,
+                   np.asarray(half_width) * self.pixels_per_meter, self.color(color))
+
+    def draw_polylines(self, points, color, thickness=2.0):
+        """
+        Draw polylines, e.g. the predicted trajectories.
+
+            :param points: array of shape (N, H, 2) of world points in metres, NaN points are skipped
+            :param color: RGB color
+            :param thickness: line thickness in pixels
+        """
+        points = np.asarray(points, dtype=np.float64)
+        if points.ndim != 3 or points.shape[1] < 2:
+            return
+        px, py = self.to_view(points[..., 0], points[..., 1])
+        cx, cy, yaw, half_length, half_width = segment_boxes(np.stack((px, py), axis=-1), thickness)
+        fill_boxes(self.buffer, cx, cy, yaw, half_length, half_width, self.color(color))
@@ -0,0 +1,281 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Lane centre waypoints as arrays, with a vectorized nearest lane lookup and
+arc length propagation along the lanes.
+
+carla.Map.get_waypoint() and Waypoint.next() are one server call per point,
+far too slow to move the predicted trajectories of every actor along the
+lanes each frame. LaneIndex keeps lane centre waypoints in NumPy arrays,
+bucketed in a grid of square cells sorted by cell key, and finds the nearest
+waypoint of many points at once among the waypoints of the 3x3 cells around
+each of them: the search radius is at least one cell.
+
+LaneGraph adds the lane segments of the map topology (Map.get_topology), one
+run of waypoints per segment, and the segment following each one, so the
+positions a distance ahead of many actors are found with a few array
+operations. map_lane_graph() builds it once per OpenDRIVE version and caches
+it on disk (smartcities.prediction.map_cache).
+"""
+
+import math
+
+import numpy as np
+
+from smartcities.prediction.map_cache import CACHE_DIR, cache_path, load_arrays, save_arrays
+
+# Points looked up at once, bounds the size of the candidate arrays
+CHUNK = 4096
+# Segments crossed at most by one propagation
+MAX_SEGMENTS = 100
+
+
+class LaneIndex(object):
+    """Nearest lane centre waypoint lookup, see the module documentation."""
+
+    def __init__(self, x, y, yaw, lane_width, cell_size=2.5):
+        """
+            :param x, y: lane centre waypoints in metres
+            :param yaw: direction of the lane at each waypoint in degrees
+            :param lane_width: lane width at each waypoint in metres
+            :param cell_size: side of the grid cells in metres, the minimum search radius
+        """
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.yaw = np.asarray(yaw, dtype=np.float64)
+        self.lane_width = np.broadcast_to(np.asarray(lane_width, dtype=np.float64), self.x.shape)
+        self.cos = np.cos(np.radians(self.yaw))
+        self.sin = np.sin(np.radians(self.yaw))
+        self.cell_size = float(cell_size)
+        count = self.x.size
+
+        # A waypoint at infinity pads the candidate lists, so the lookups need no mask
+        self._x = np.append(self.x, np.inf)
+        self._y = np.append(self.y, np.inf)
+        self._cos = np.append(self.cos, 0.0)
+        self._sin = np.append(self.sin, 0.0)
+
+        # Each waypoint is a candidate of the 3x3 cells around its own, with a margin of two
+        # cells on each side so the keys of the neighbour cells never wrap
+        self._min_x = self.x.min() - 2.0 * self.cell_size if count else 0.0
+        self._min_y = self.y.min() - 2.0 * self.cell_size if count else 0.0
+        cell_x, cell_y = self._cells(self.x, self.y)
+        self._rows = int(cell_y.max()) + 3 if count else 1
+        offsets = np.arange(-1, 2)
+        keys = ((cell_x[:, np.newaxis, np.newaxis] + offsets[:, np.newaxis]) * self._rows +
+                cell_y[:, np.newaxis, np.newaxis] + offsets).reshape(count, 9)
+        waypoints = np.repeat(np.arange(count), 9)
+        order = np.argsort(keys.ravel(), kind='stable')
+        self._keys, starts, counts = np.unique(keys.ravel()[order], return_index=True, return_counts=True)
+
+        # Candidates of each cell, one row per key plus a last row of padding for the empty cells
+        width = int(counts.max()) if count else 1
+        self._candidates = np.full((len(self._keys) + 1, width), count, dtype=np.int64)
+        cells = np.repeat(np.arange(len(self._keys)), counts)
+        self._candidates[cells, np.arange(len(order)) - starts[cells]] = waypoints[order]
+
+    def __len__(self):
+        return self.x.size
+
+    def _cells(self, x, y):
+        return (np.floor((x - self._min_x) / self.cell_size).astype(np.int64),
+                np.floor((y - self._min_y) / self.cell_size).astype(np.int64))
+
+    def nearest(self, x, y, yaw=None, max_distance=None):
+        """
+        Index of the nearest waypoint of each point, -1 if there is none in range.
+
+            :param x, y: arrays of any shape, in metres
+            :param yaw: heading of the points in degrees, same shape, only the waypoints of the
+                lanes going within 90 degrees of it are considered
+            :param max_distance: in metres, at most the search radius, default cell_size
+            :return: int64 array of the shape of x
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        shape = x.shape
+        x, y = x.ravel(), y.ravel()
+        if yaw is not None:
+            yaw = np.radians(np.broadcast_to(np.asarray(yaw, dtype=np.float64), shape).ravel())
+        if max_distance is None:
+            max_distance = self.cell_size
+        result = np.empty(x.size, dtype=np.int64)
+        for start in range(0, x.size, CHUNK):
+            part = slice(start, start + CHUNK)
+            result[part] = self._nearest(x[part], y[part], None if yaw is None else yaw[part], max_distance)
+        return result.reshape(shape)
+
+    def _nearest(self, x, y, yaw, max_distance):
+        cell_x, cell_y = self._cells(x, y)
+        keys = cell_x * self._rows + cell_y
+        slot = np.searchsorted(self._keys, keys)
+        # Points outside the cells of the waypoints get the padding row, the rows out of the grid
+        # would alias the keys of the neighbour column
+        missing = (slot == len(self._keys)) | (cell_y < 0) | (cell_y >= self._rows)
+        slot[missing] = 0
+        slot[missing | (self._keys[slot] != keys)] = len(self._keys)
+        candidates = self._candidates[slot]
+
+        distance = (self._x[candidates] - x[:, np.newaxis]) ** 2
+        distance += (self._y[candidates] - y[:, np.newaxis]) ** 2
+        rows = np.arange(len(x))
+        best = np.argmin(distance, axis=1)
+        if yaw is not None:
+            cos, sin = np.cos(yaw), np.sin(yaw)
+            nearest = candidates[rows, best]
+            # The nearest waypoint is almost always on a lane going the right way, only the other
+            # points are looked up again among the candidates facing their heading
+            wrong = np.flatnonzero(self._cos[nearest] * cos + self._sin[nearest] * sin <= 0.0)
+            if wrong.size:
+                facing = self._cos[candidates[wrong]] * cos[wrong, np.newaxis]
+                facing += self._sin[candidates[wrong]] * sin[wrong, np.newaxis]
+                distance[wrong] = np.where(facing > 0.0, distance[wrong], np.inf)
+                best[wrong] = np.argmin(distance[wrong], axis=1)
+        return np.where(distance[rows, best] <= max_distance * max_distance, candidates[rows, best], -1)
+
+    def project(self, x, y, index):
+        """
+        Points moved onto the lane centre line of their waypoint, unchanged where index is -1.
+
+            :param x, y: arrays of the same shape, in metres
+            :param index: waypoint of each point, as returned by nearest()
+            :return: x and y arrays of that shape
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        missing = index < 0
+        if not len(self):
+            return x, y
+        safe = np.where(missing, 0, index)
+        lane_x, lane_y, cos, sin = self.x[safe], self.y[safe], self.cos[safe], self.sin[safe]
+        along = (x - lane_x) * cos + (y - lane_y) * sin
+        return np.where(missing, x, lane_x + along * cos), np.where(missing, y, lane_y + along * sin)
+
+
+class LaneGraph(LaneIndex):
+    """Lane segments of the map topology, see the module documentation."""
+
+    def __init__(self, x, y, yaw, lane_width, segment_starts, next_starts, next_segments, cell_size=2.5):
+        """
+            :param x, y, yaw, lane_width: waypoints of all the segments, segment after segment
+            :param segment_starts: first waypoint of each segment, increasing
+            :param next_starts, next_segments: segments reachable from the end of each segment,
+                next_segments[next_starts[i]:next_starts[i + 1]] for segment i
+        """
+        super(LaneGraph, self).__init__(x, y, yaw, lane_width, cell_size)
+        self.segment_starts = np.asarray(segment_starts, dtype=np.int64)
+        self.next_starts = np.asarray(next_starts, dtype=np.int64)
+        self.next_segments = np.asarray(next_segments, dtype=np.int64)
+        segments = len(self.segment_starts)
+        counts = np.diff(np.append(self.segment_starts, self.x.size))
+        self.segment_ends = self.segment_starts + counts - 1
+        # Segment of each waypoint, and its arc length from the start of the segment
+        self.segment = np.repeat(np.arange(segments), counts)
+        step = np.zeros(self.x.size)
+        step[1:] = np.hypot(np.diff(self.x), np.diff(self.y))
+        step[self.segment_starts] = 0.0
+        total = np.cumsum(step)
+        self.s = total - total[self.segment_starts][self.segment]
+        self.segment_length = self.s[self.segment_ends]
+        # Arc length along all the segments one after the other, with a gap so it increases
+        # strictly, to find the waypoint before a point of a segment with one searchsorted()
+        self._offset = np.cumsum(np.append(0.0, self.segment_length[:-1] + 1.0))
+        self._key = self.s + self._offset[self.segment]
+
+        # Followed segment: the one going the straightest on, -1 at the dead ends
+        self.straight = np.full(segments, -1, dtype=np.int64)
+        origin = np.repeat(np.arange(segments), np.diff(self.next_starts))
+        if origin.size:
+            turn = (self.yaw[self.segment_starts[self.next_segments]] - self.yaw[self.segment_ends[origin]] +
+                    180.0) % 360.0 - 180.0
+            order = np.lexsort((np.abs(turn), origin))
+            _, first = np.unique(origin[order], return_index=True)
+            self.straight[origin[order][first]] = self.next_segments[order][first]
+
+    def arrays(self):
+        """Dictionary of the arrays the graph is built from, as saved in the cache."""
+        return {'x': self.x, 'y': self.y, 'yaw': self.yaw, 'lane_width': np.array(self.lane_width),
+                'segment_starts': self.segment_starts, 'next_starts': self.next_starts,
+                'next_segments': self.next_segments}
+
+    def along(self, x, y, index):
+        """Arc length of the points projected on the segment of their waypoint, for follow()."""
+        return self.s[index] + (x - self.x[index]) * self.cos[index] + (y - self.y[index]) * self.sin[index]
+
+    def follow(self, index, distance):
+        """
+        Positions along the lanes, going straight on at the junctions.
+
+            :param index: waypoint of each actor, array (N,) of valid indices
+            :param distance: arc length from the start of the segment of the waypoint of each
+                actor, array (N, H); along() gives the arc length of the actor
+            :return: x, y and yaw arrays (N, H), stopped at the end of the dead end lanes
+        """
+        segment = np.repeat(self.segment[index][:, np.newaxis], distance.shape[1], axis=1)
+        s = np.maximum(np.array(distance, dtype=np.float64), 0.0)
+        for _ in range(MAX_SEGMENTS):
+            length = self.segment_length[segment]
+            over = (s > length) & (self.straight[segment] >= 0)
+            if not over.any():
+                break
+            s[over] -= length[over]
+            segment[over] = self.straight[segment[over]]
+        s = np.minimum(s, self.segment_length[segment])
+
+        # Waypoints before and after each position, linear interpolation between them
+        before = np.searchsorted(self._key, s + self._offset[segment], side='right') - 1
+        before = np.clip(before, self.segment_starts[segment], np.maximum(self.segment_ends[segment] - 1,
+                                                                            self.segment_starts[segment]))
+        after = np.minimum(before + 1, self.segment_ends[segment])
+        gap = self.s[after] - self.s[before]
+        fraction = np.where(gap > 0.0, (s - self.s[before]) / np.where(gap > 0.0, gap, 1.0), 0.0)
+        turn = (self.yaw[after] - self.yaw[before] + 180.0) % 360.0 - 180.0
+        return (self.x[before] + fraction * (self.x[after] - self.x[before]),
+                self.y[before] + fraction * (self.y[after] - self.y[before]),
+                self.yaw[before] + fraction * turn)
+
+
+def _node(location):
+    # Rounded as GlobalRoutePlanner does, the end of a segment and the start of the next one match
+    return tuple(np.round([location.x, location.y, location.z], 0))
+
+
+def build_lane_graph(carla_map, spacing):
+    """LaneGraph of the topology of a carla.Map, waypoints every spacing metres along each segment."""
+    waypoints = []
+    segment_starts = []
+    entries = {}
+    exits = []
+    for entry, exit_waypoint in carla_map.get_topology():
+        end = exit_waypoint.transform.location
+        path = [entry] + entry.next_until_lane_end(spacing)
+        last = path[-1].transform.location
+        # The exit replaces the last waypoint when it is closer than half a step
+        if len(path) > 1 and math.hypot(last.x - end.x, last.y - end.y) < 0.5 * spacing:
+            path.pop()
+        path.append(exit_waypoint)
+        segment_starts.append(len(waypoints))
+        waypoints.extend((waypoint.transform.location.x,
+                          waypoint.transform.location.y,
+                          waypoint.transform.rotation.yaw,
+                          waypoint.lane_width) for waypoint in path)
+        entries.setdefault(_node(entry.transform.location), []).append(len(exits))
+        exits.append(_node(end))
+
+    next_segments = [entries.get(node, []) for node in exits]
+    next_starts = np.cumsum([0] + [len(segments) for segments in next_segments])
+    waypoints = np.array(waypoints, dtype=np.float64).reshape(-1, 4)
+    return LaneGraph(waypoints[:, 0], waypoints[:, 1], waypoints[:, 2], waypoints[:, 3], segment_starts,
+                     next_starts, [segment for segments in next_segments for segment in segments])
+
+
+def map_lane_graph(carla_map, spacing, dirname=CACHE_DIR):
+    """LaneGraph of a carla.Map, loaded from the cache when built before for the same OpenDRIVE."""
+    path = cache_path(carla_map, 'lanes', '%gm' % spacing, dirname)
+    arrays = load_arrays(path)
+    if arrays is None:
+        graph = build_lane_graph(carla_map, spacing)
+        save_arrays(path, graph.arrays())
+        return graph
+    return LaneGraph(**arrays)
@@ -0,0 +1,68 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Disk cache of the arrays computed from a map, as no_rendering_mode.MapImage
+caches its rendered map: the file name holds the town name and the SHA-1 of the
+OpenDRIVE content, so a changed map is computed again, and the older versions
+of a town are removed when a new one is saved.
+"""
+
+import glob
+import hashlib
+import os
+
+import numpy as np
+
+CACHE_DIR = 'cache'
+
+
+def opendrive_hash(carla_map):
+    """SHA-1 of the OpenDRIVE content of a carla.Map, in hexadecimal."""
+    hash_func = hashlib.sha1()
+    hash_func.update(carla_map.to_opendrive().encode('UTF-8'))
+    return str(hash_func.hexdigest())
+
+
+def cache_path(carla_map, name, tag='', dirname=CACHE_DIR):
+    """
+    Path of a cache file of a map, <dirname>/<name>/<town>_<tag>_<hash>.npz.
+
+        :param name: kind of arrays cached, the sub directory
+        :param tag: parameters the arrays were computed with, as '1.0m'
+    """
+    town = carla_map.name.split('/')[-1]
+    filename = '_'.join(part for part in (town, tag, opendrive_hash(carla_map)) if part) + '.npz'
+    return os.path.join(dirname, name, filename)
+
+
+def load_arrays(path):
+    """Dictionary of the arrays of a cache file, None if there is none."""
+    if not os.path.isfile(path):
+        return None
+    with np.load(path) as arrays:
+        return {key: arrays[key] for key in arrays.files}
+
+
+def save_arrays(path, arrays, compressed=False):
+    """
+    Save a dictionary of arrays to a cache file, replacing the other versions of the town.
+
+    The arrays are written to a temporary file first, so a client reading the
+    cache never sees a partial file.
+
+        :param compressed: zip the arrays, for the images mostly of one value
+    """
+    dirname, filename = os.path.split(path)
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+    # Town and tag, the hash is the last part of the name and has no underscore
+    prefix = filename.rsplit('_', 1)[0] + '_'
+    for town_filename in glob.glob(os.path.join(dirname, prefix + '*.npz')):
+        other_hash = os.path.basename(town_filename)[len(prefix):-len('.npz')]
+        if town_filename != path and '_' not in other_hash:
+            os.remove(town_filename)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as output:
+        (np.savez_compressed if compressed else np.savez)(output, **arrays)
+    os.replace(temporary, path)
@@ -0,0 +1,150 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Trajectory predictors, one batched call for all the tracked actors.
+
+A predictor takes the history of every actor as one array of shape (N, T, F),
+oldest frame first, with the fields of smartcities.prediction.tracking
+(STATE_FIELDS: x, y, yaw in degrees, vx, vy), as ActorTracker.history()
+returns it, and the time between two frames of the history. It returns the
+positions of each actor at the horizon time steps as an array of shape
+(N, H, 2). The baselines run on the CPU with NumPy:
+
+  * ConstantVelocity: straight on at the last velocity;
+  * ConstantTurnRate: the last speed and the yaw rate of the last frames
+    (CTRV), so vehicles keep turning;
+  * LaneFollowing: the last speed along the centre line of the nearest lane
+    going the same way, straight on at the junctions
+    (smartcities.prediction.lanes.LaneGraph).
+
+Other predictors derive from TrajectoryPredictor and are added to PREDICTORS
+to be chosen by name with create_predictor().
+"""
+
+import numpy as np
+
+from smartcities.prediction.tracking import STATE_FIELDS
+
+X, Y, YAW, VX, VY = [STATE_FIELDS.index(field) for field in ('x', 'y', 'yaw', 'vx', 'vy')]
+
+# Below this speed in m/s the yaw gives the direction of an actor rather than its velocity
+MIN_SPEED = 0.1
+
+
+class TrajectoryPredictor(object):
+    """Base of the predictors, see the module documentation."""
+
+    def __init__(self, horizon=30, step=0.1):
+        """
+            :param horizon: number of predicted positions (H)
+            :param step: time between two predicted positions in seconds
+        """
+        self.horizon = int(horizon)
+        self.step = float(step)
+        # Time of each predicted position after the last frame, (H,)
+        self.times = self.step * np.arange(1, self.horizon + 1)
+
+    def predict(self, history, dt):
+        """
+        Predicted positions of every actor.
+
+            :param history: array of shape (N, T, len(STATE_FIELDS)), oldest frame first
+            :param dt: time between two frames of the history in seconds
+            :return: array of shape (N, H, 2) of x and y
+        """
+        raise NotImplementedError
+
+
+class ConstantVelocity(TrajectoryPredictor):
+    """Straight on at the velocity of the last frame."""
+
+    def predict(self, history, dt):
+        last = history[:, -1]
+        return np.stack((last[:, X, np.newaxis] + last[:, VX, np.newaxis] * self.times,
+                         last[:, Y, np.newaxis] + last[:, VY, np.newaxis] * self.times), axis=-1)
+
+
+class ConstantTurnRate(TrajectoryPredictor):
+    """Speed of the last frame and yaw rate of the last window frames, along an arc (CTRV)."""
+
+    def __init__(self, horizon=30, step=0.1, window=5):
+        """
+            :param window: frames of history the yaw rate is measured over
+        """
+        super(ConstantTurnRate, self).__init__(horizon, step)
+        self.window = int(window)
+
+    def yaw_rate(self, history, dt):
+        """Yaw rate of each actor in radians per second, 0 with less than two frames."""
+        frames = min(self.window, history.shape[1])
+        if frames < 2 or dt <= 0.0:
+            return np.zeros(len(history))
+        yaw = history[:, -frames:, YAW]
+        # Each step wrapped to [-180, 180) so crossing +-180 degrees is not a full turn
+        turn = (np.diff(yaw, axis=1) + 180.0) % 360.0 - 180.0
+        return np.radians(turn.sum(axis=1)) / ((frames - 1) * dt)
+
+    def predict(self, history, dt):
+        last = history[:, -1]
+        speed = np.hypot(last[:, VX], last[:, VY])[:, np.newaxis]
+        # Direction of travel, the velocity rather than the yaw so reversing vehicles go backwards
+        course = np.arctan2(last[:, VY], last[:, VX])[:, np.newaxis]
+        half_turn = 0.5 * self.yaw_rate(history, dt)[:, np.newaxis] * self.times
+        # Chord of the arc: its length v t sin(w t / 2) / (w t / 2) along the mean heading, exact
+        # down to a yaw rate of 0 where it is the straight line
+        chord = speed * self.times * np.sinc(half_turn / np.pi)
+        return np.stack((last[:, X, np.newaxis] + chord * np.cos(course + half_turn),
+                         last[:, Y, np.newaxis] + chord * np.sin(course + half_turn)), axis=-1)
+
+
+class LaneFollowing(ConstantVelocity):
+    """Speed of the last frame along the nearest lane going the same way, constant velocity off the lanes."""
+
+    def __init__(self, horizon=30, step=0.1, lanes=None, max_distance=None):
+        """
+            :param lanes: smartcities.prediction.lanes.LaneGraph of the map
+            :param max_distance: in metres, actors farther from a lane go on at constant velocity,
+                default the search radius of the graph
+        """
+        super(LaneFollowing, self).__init__(horizon, step)
+        if lanes is None:
+            raise ValueError('the lane following predictor needs the lanes of the map')
+        self.lanes = lanes
+        self.max_distance = max_distance
+
+    def predict(self, history, dt):
+        points = super(LaneFollowing, self).predict(history, dt)
+        last = history[:, -1]
+        speed = np.hypot(last[:, VX], last[:, VY])
+        course = np.where(speed >= MIN_SPEED, np.degrees(np.arctan2(last[:, VY], last[:, VX])), last[:, YAW])
+        # Only the current positions are looked up, the trajectories follow the lane graph
+        index = self.lanes.nearest(last[:, X], last[:, Y], course, self.max_distance)
+        on_lane = np.flatnonzero(index >= 0)
+        if on_lane.size:
+            index = index[on_lane]
+            along = self.lanes.along(last[on_lane, X], last[on_lane, Y], index)
+            x, y, _ = self.lanes.follow(index, along[:, np.newaxis] + speed[on_lane, np.newaxis] * self.times)
+            points[on_lane] = np.stack((x, y), axis=-1)
+        return points
+
+
+# Predictors by name, as the --predictor argument of the clients
+PREDICTORS = {
+    'cv': ConstantVelocity,
+    'ctrv': ConstantTurnRate,
+    'lane': LaneFollowing,
+}
+
+
+def create_predictor(name, horizon=30, step=0.1, lanes=None):
+    """
+    Predictor of PREDICTORS by name.
+
+        :param lanes: LaneGraph of the map, only used by the lane following predictor
+    """
+    if name not in PREDICTORS:
+        raise ValueError('unknown predictor %r, expected one of %s' % (name, ', '.join(sorted(PREDICTORS))))
+    if name == 'lane':
+        return LaneFollowing(horizon, step, lanes)
+    return PREDICTORS[name](horizon, step)
@@ -0,0 +1,270 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Columnar log of the actor tracks, for training the trajectory predictors.
+
+TrackLogger appends the rows of an ActorTracker (smartcities.prediction
+.tracking), one per actor and frame, to a preallocated chunk of one array per
+column (see COLUMNS). A full chunk becomes a shard, written by a background
+thread while the logger fills a second chunk, so two chunks are all the memory
+it ever uses however long the session. A shard is a directory of one .npy file
+per column, <dirname>/shard_<index>/<column>.npy, with the rows sorted by actor
+and frame so the track of an actor is a contiguous run of rows. The last
+window - 1 frames of a shard are written again at the start of the next one,
+so a window of up to 'window' frames is never cut by a shard boundary.
+<dirname>/index.json lists the shards with the frames they hold, and the type
+ids the 'type' column counts.
+
+TrackDataset memory-maps the shards and yields (N, T, F) windows of the
+tracks, the layout of ActorTracker.history(), by slicing the columns.
+"""
+
+import collections
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from smartcities.prediction.tracking import STATE_FIELDS
+
+INDEX_FILE = 'index.json'
+
+# Column name -> dtype, the state fields in the order of STATE_FIELDS
+COLUMNS = collections.OrderedDict([
+    ('frame', np.int64),
+    ('timestamp', np.float64),
+    ('id', np.int64),
+    ('x', np.float32),
+    ('y', np.float32),
+    ('yaw', np.float32),
+    ('vx', np.float32),
+    ('vy', np.float32),
+    ('half_length', np.float32),
+    ('half_width', np.float32),
+    ('type', np.int16),
+])
+
+# Windows of the tracks, the arrays are (N,) but 'states' (N, T, len(fields))
+TrackWindows = collections.namedtuple('TrackWindows', ['ids', 'frames', 'types', 'states'])
+
+
+class TrackLogger(object):
+    """Appends the rows of an ActorTracker to columnar shards on disk, see the module documentation."""
+
+    def __init__(self, dirname, chunk_rows=1 << 20, window=64):
+        """
+            :param dirname: output directory, created if missing
+            :param chunk_rows: rows of a chunk, about 1M rows is 100 s of 500 actors at 20 Hz
+            :param window: longest window of frames a shard boundary never cuts
+        """
+        if window < 1:
+            raise ValueError('window must be at least 1 frame')
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self.dirname = dirname
+        self.window = window
+        self.rows = 0
+        self.frames = 0
+        self.types = []
+        self._type_codes = {}
+        self._chunk = self._new_chunk(chunk_rows)
+        # Chunk written by the shard thread
+        self._spare = self._new_chunk(chunk_rows)
+        self._row = 0
+        # Row of each frame in the chunk, and the first frame not written to a shard yet
+        self._frame_rows = []
+        self._first_frame = None
+        self._last_frame = None
+        self._shards = []
+        self._thread = None
+        self.error = None
+
+    @staticmethod
+    def _new_chunk(rows):
+        return {name: np.empty(rows, dtype) for name, dtype in COLUMNS.items()}
+
+    @property
+    def chunk_rows(self):
+        return len(self._chunk['frame'])
+
+    @property
+    def nbytes(self):
+        """Memory of the preallocated chunks in bytes."""
+        return sum(column.nbytes for chunk in (self._chunk, self._spare) for column in chunk.values())
+
+    def record(self, tracker):
+        """Append the latest frame of an ActorTracker, call after each update() returning True."""
+        if tracker.frame is None or tracker.frame == self._last_frame:
+            return
+        count = tracker.count
+        if self._row + count > self.chunk_rows:
+            self._flush()
+            if self._row + count > self.chunk_rows:
+                # The carried frames and this one do not fit, more actors than ever before
+                self._grow(2 * (self._row + count))
+        codes = self._type_codes
+        for type_id in tracker.type_ids:
+            if type_id not in codes:
+                codes[type_id] = len(self.types)
+                self.types.append(type_id)
+
+        rows = slice(self._row, self._row + count)
+        chunk = self._chunk
+        chunk['frame'][rows] = tracker.frame
+        chunk['timestamp'][rows] = tracker.timestamp
+        chunk['id'][rows] = tracker.ids
+        state = tracker.state()
+        for field, name in enumerate(STATE_FIELDS):
+            chunk[name][rows] = state[:, field]
+        chunk['half_length'][rows] = tracker.half_length
+        chunk['half_width'][rows] = tracker.half_width
+        chunk['type'][rows] = [codes[type_id] for type_id in tracker.type_ids]
+
+        if self._first_frame is None:
+            self._first_frame = tracker.frame
+        self._frame_rows.append(self._row)
+        self._row += count
+        self._last_frame = tracker.frame
+        self.rows += count
+        self.frames += 1
+
+    def _grow(self, rows):
+        self._wait()
+        for chunk in (self._chunk, self._spare):
+            for name in COLUMNS:
+                chunk[name] = np.resize(chunk[name], rows)
+
+    def _wait(self):
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.error is not None:
+            raise self.error
+
+    def _flush(self, final=False):
+        """Hand the chunk to the shard thread, the last window - 1 frames go on in the next chunk."""
+        if not self._frame_rows:
+            return
+        self._wait()
+        full, rows = self._chunk, self._row
+        keep = 0 if final else min(self.window - 1, len(self._frame_rows))
+        carry = self._frame_rows[len(self._frame_rows) - keep] if keep else rows
+        self._chunk, self._spare = self._spare, full
+        for name in COLUMNS:
+            self._chunk[name][:rows - carry] = full[name][carry:rows]
+        self._row = rows - carry
+        self._frame_rows = [row - carry for row in self._frame_rows[len(self._frame_rows) - keep:]]
+
+        shard = {
+            'name': 'shard_%05d' % len(self._shards),
+            'rows': rows,
+            # Frames before first_frame are the carried ones, written in the shard before
+            'first_frame': int(self._first_frame),
+            'last_frame': int(self._last_frame),
+        }
+        self._first_frame = None
+        self._thread = threading.Thread(target=self._write_shard, args=(full, shard, list(self.types)),
+                                        name='TrackLogger')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _write_shard(self, chunk, shard, types):
+        try:
+            rows = shard['rows']
+            order = np.lexsort((chunk['frame'][:rows], chunk['id'][:rows]))
+            path = os.path.join(self.dirname, shard['name'])
+            temporary = path + '.tmp'
+            if os.path.exists(temporary):
+                shutil.rmtree(temporary)
+            os.makedirs(temporary)
+            for name in COLUMNS:
+                np.save(os.path.join(temporary, name + '.npy'), chunk[name][:rows][order])
+            os.replace(temporary, path)
+            self._shards.append(shard)
+            # The index is replaced at once, a reader sees every listed shard complete
+            index = {'window': self.window, 'columns': list(COLUMNS), 'types': types, 'shards': self._shards}
+            with open(os.path.join(self.dirname, INDEX_FILE + '.tmp'), 'w') as index_file:
+                json.dump(index, index_file, indent=1)
+            os.replace(os.path.join(self.dirname, INDEX_FILE + '.tmp'), os.path.join(self.dirname, INDEX_FILE))
+        except (IOError, OSError) as error:
+            self.error = error
+
+    def close(self):
+        """Write the rows left as the last shard."""
+        self._flush(final=True)
+        self._wait()
+        print('Logged %d rows of %d frames to %s' % (self.rows, self.frames, self.dirname))
+
+
+class TrackDataset(object):
+    """Memory-mapped shards of a TrackLogger, see the module documentation."""
+
+    def __init__(self, dirname):
+        with open(os.path.join(dirname, INDEX_FILE)) as index_file:
+            index = json.load(index_file)
+        self.dirname = dirname
+        self.window = index['window']
+        self.types = index['types']
+        self.shards = index['shards']
+
+    def __len__(self):
+        """Rows of the shards, the carried frames included."""
+        return sum(shard['rows'] for shard in self.shards)
+
+    def columns(self, shard):
+        """Dictionary of the memory-mapped columns of a shard of self.shards."""
+        path = os.path.join(self.dirname, shard['name'])
+        return {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in COLUMNS}
+
+    @staticmethod
+    def window_starts(columns, length, first_frame, stride=1):
+        """
+        First rows of the windows of a shard, on consecutive frames of one actor.
+
+            :param first_frame: frames before are carried from the shard before, their windows
+                were yielded with it
+            :param stride: frames between the first frames of two windows of an actor
+        """
+        ids, frames = columns['id'], columns['frame']
+        if len(ids) < length:
+            return np.zeros(0, dtype=np.int64)
+        last = length - 1
+        valid = ((ids[last:] == ids[:len(ids) - last]) & (frames[last:] - frames[:len(frames) - last] == last) &
+                 (frames[last:] >= first_frame))
+        if stride > 1:
+            valid &= frames[:len(frames) - last] % stride == 0
+        return np.flatnonzero(valid)
+
+    def windows(self, length, fields=STATE_FIELDS, stride=1, batch_size=1024, frames=None):
+        """
+        Windows of consecutive frames of each actor, shard after shard.
+
+            :param length: frames per window (T), at most the window of the logger
+            :param fields: columns of the states (F), default the fields of ActorTracker.history()
+            :param batch_size: windows per TrackWindows yielded (N)
+            :param frames: (first, last) simulation frames of the windows, default all
+            :return: generator of TrackWindows, ids, frames of the last row and types are (N,),
+                states are float32 (N, T, F)
+        """
+        if length > self.window:
+            raise ValueError('windows of %d frames cross the shards logged for %d' % (length, self.window))
+        offsets = np.arange(length)
+        for shard in self.shards:
+            if frames is not None and (shard['last_frame'] < frames[0] or shard['first_frame'] > frames[1]):
+                continue
+            columns = self.columns(shard)
+            starts = self.window_starts(columns, length, shard['first_frame'], stride)
+            if frames is not None:
+                ends = columns['frame'][starts + length - 1]
+                starts = starts[(ends >= frames[0]) & (ends <= frames[1])]
+            for batch in range(0, len(starts), batch_size):
+                rows = starts[batch:batch + batch_size, np.newaxis] + offsets
+                last = rows[:, -1]
+                yield TrackWindows(
+                    np.asarray(columns['id'][last]),
+                    np.asarray(columns['frame'][last]),
+                    np.asarray(columns['type'][last]),
+                    np.stack([columns[name][rows] for name in fields], axis=-1))
@@ -0,0 +1,230 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Live state of every tracked actor, as a struct of arrays.
+
+The WorldSnapshot delivered by world.on_tick holds the transform and velocity
+of every actor for one frame. ActorTracker keeps the latest snapshot and, once
+per frame, writes the state of the actors matching its filter into parallel
+NumPy arrays (ids, x, y, yaw, vx, vy and the bounding box half sizes), one row
+per actor, which the renderer and the predictors use as they are.
+
+Only the spawned actors cost a server call: their type and bounding box are
+read with one world.get_actors() call for all the actors new in the frame.
+A destroyed actor is removed by moving the last row into its place, so the
+rows stay packed; use index() or the ids array rather than keeping rows
+across frames.
+
+The tracker also keeps the state of the last history_length frames of every
+actor in a ring, history() returns it as one (N, T, F) array, oldest frame
+first, for the trajectory predictors (smartcities.prediction.predictors).
+The history of a spawned actor is padded with its first state.
+"""
+
+import fnmatch
+import weakref
+
+import numpy as np
+
+# Per actor arrays, in the order of ActorTracker.state()
+STATE_FIELDS = ('x', 'y', 'yaw', 'vx', 'vy')
+
+
+class ActorTracker(object):
+    """Struct of arrays of the actors matching a type filter, see the module documentation."""
+
+    def __init__(self, world, actor_filter='vehicle.*', capacity=256, history_length=10):
+        """
+            :param world: carla.World
+            :param actor_filter: fnmatch pattern of the tracked type ids, as the --filter of the clients,
+                or a tuple of patterns
+            :param capacity: initial number of rows, doubled when full
+            :param history_length: frames kept by history()
+        """
+        self.world = world
+        self.actor_filter = actor_filter
+        self._patterns = (actor_filter,) if isinstance(actor_filter, str) else tuple(actor_filter)
+        self.count = 0
+        self.frame = None
+        self.timestamp = None
+        self.spawned = 0
+        self.destroyed = 0
+        self.type_ids = []
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._state = np.zeros((capacity, len(STATE_FIELDS)))
+        self._extent = np.zeros((capacity, 2))
+        # Ring of the last frames, slot _head is the next one written
+        self._history = np.zeros((capacity, history_length, len(STATE_FIELDS)))
+        self._times = np.zeros(history_length)
+        self._head = 0
+        self._frames = 0
+        self._index = {}
+        # Ids of the actors not matching the filter (sensors, walkers, ...), never looked up again
+        self._ignored = set()
+        self._snapshot = None
+        weak_self = weakref.ref(self)
+        self._callback_id = world.on_tick(lambda snapshot: ActorTracker._on_world_tick(weak_self, snapshot))
+
+    @staticmethod
+    def _on_world_tick(weak_self, snapshot):
+        self = weak_self()
+        if not self:
+            return
+        # Only swap the reference, the work is done by update() in the client thread
+        self._snapshot = snapshot
+
+    @property
+    def ids(self):
+        return self._ids[:self.count]
+
+    @property
+    def x(self):
+        return self._state[:self.count, 0]
+
+    @property
+    def y(self):
+        return self._state[:self.count, 1]
+
+    @property
+    def yaw(self):
+        """Heading in degrees."""
+        return self._state[:self.count, 2]
+
+    @property
+    def vx(self):
+        return self._state[:self.count, 3]
+
+    @property
+    def vy(self):
+        return self._state[:self.count, 4]
+
+    @property
+    def half_length(self):
+        return self._extent[:self.count, 0]
+
+    @property
+    def half_width(self):
+        return self._extent[:self.count, 1]
+
+    def state(self):
+        """Array of shape (count, len(STATE_FIELDS)) of the latest frame, a view on the rows."""
+        return self._state[:self.count]
+
+    def history(self):
+        """Array of shape (count, history_length, len(STATE_FIELDS)) of the last frames, oldest first, a copy."""
+        order = (self._head + np.arange(self.history_length)) % self.history_length
+        return self._history[:self.count][:, order]
+
+    @property
+    def history_length(self):
+        return len(self._times)
+
+    @property
+    def history_dt(self):
+        """Mean time between two frames of the history in seconds, 0 before the second frame."""
+        frames = min(self._frames, self.history_length)
+        if frames < 2:
+            return 0.0
+        newest = self._times[(self._head - 1) % self.history_length]
+        oldest = self._times[(self._head - frames) % self.history_length]
+        return (newest - oldest) / (frames - 1)
+
+    def index(self, actor_id):
+        """Row of an actor, None if it is not tracked."""
+        return self._index.get(actor_id)
+
+    def update(self, snapshot=None):
+        """
+        Apply the latest snapshot, call once per frame.
+
+            :param snapshot: carla.WorldSnapshot, default the latest one of world.on_tick
+            :return: True if a new frame was applied
+        """
+        if snapshot is None:
+            snapshot = self._snapshot
+        if snapshot is None or snapshot.frame == self.frame:
+            return False
+        self.frame = snapshot.frame
+        self.timestamp = snapshot.timestamp.elapsed_seconds
+
+        index = self._index
+        ignored = self._ignored
+        ids = []
+        values = []
+        new = {}
+        for actor_snapshot in snapshot:
+            actor_id = actor_snapshot.id
+            if actor_id in index:
+                transform = actor_snapshot.get_transform()
+                velocity = actor_snapshot.get_velocity()
+                ids.append(actor_id)
+                values.append((transform.location.x, transform.location.y, transform.rotation.yaw,
+                               velocity.x, velocity.y))
+            elif actor_id not in ignored:
+                new[actor_id] = actor_snapshot
+
+        if len(ids) != self.count:
+            for actor_id in set(index).difference(ids):
+                self._remove(actor_id)
+        if ids:
+            rows = np.fromiter((index[actor_id] for actor_id in ids), dtype=np.int64, count=len(ids))
+            self._state[rows] = values
+        if new:
+            self._spawn(new)
+        self._history[:self.count, self._head] = self._state[:self.count]
+        self._times[self._head] = self.timestamp
+        self._head = (self._head + 1) % self.history_length
+        self._frames += 1
+        return True
+
+    def _spawn(self, snapshots):
+        found = set()
+        for actor in self.world.get_actors(list(snapshots)):
+            found.add(actor.id)
+            extent = actor.bounding_box.extent
+            matches = any(fnmatch.fnmatch(actor.type_id, pattern) for pattern in self._patterns)
+            if not matches or extent.x <= 0 or extent.y <= 0:
+                self._ignored.add(actor.id)
+                continue
+            if self.count == len(self._ids):
+                self._grow()
+            row = self.count
+            transform = snapshots[actor.id].get_transform()
+            velocity = snapshots[actor.id].get_velocity()
+            self._ids[row] = actor.id
+            self._state[row] = (transform.location.x, transform.location.y, transform.rotation.yaw,
+                                velocity.x, velocity.y)
+            self._extent[row] = (extent.x, extent.y)
+            self._history[row] = self._state[row]
+            self.type_ids.append(actor.type_id)
+            self._index[actor.id] = row
+            self.count += 1
+            self.spawned += 1
+        # Destroyed between the tick and the call, they leave the next snapshots
+        self._ignored.update(set(snapshots).difference(found))
+
+    def _remove(self, actor_id):
+        row = self._index.pop(actor_id)
+        last = self.count - 1
+        if row != last:
+            moved = int(self._ids[last])
+            self._ids[row] = moved
+            self._state[row] = self._state[last]
+            self._extent[row] = self._extent[last]
+            self._history[row] = self._history[last]
+            self.type_ids[row] = self.type_ids[last]
+            self._index[moved] = row
+        self.type_ids.pop()
+        self.count = last
+        self.destroyed += 1
+
+    def _grow(self):
+        capacity = 2 * len(self._ids)
+        self._ids = np.resize(self._ids, capacity)
+        self._state = np.resize(self._state, (capacity, len(STATE_FIELDS)))
+        self._extent = np.resize(self._extent, (capacity, 2))
+        self._history = np.resize(self._history, (capacity,) + self._history.shape[1:])
+
+    def destroy(self):
+        self.world.remove_on_tick(self._callback_id)
@@ -0,0 +1,370 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Background writer of the sensor data of sensor_data_collection.py, one record
+per simulation frame.
+
+The sensor callbacks only copy the raw buffer of a measurement into NumPy
+arrays (camera_arrays(), lidar_arrays(), gnss_arrays(), ...), or the regions
+of interest of a camera (roi_arrays()), and hand them to DatasetWriter.put(),
+which joins the streams by frame. Once every expected stream of a frame has
+arrived, the record goes into a bounded queue and a pool of worker threads
+encodes it into the shards on disk, so no encoding or disk I/O runs in the
+callbacks. A frame still missing a stream max_lag frames later is written with
+the streams it has. When the queue is full a record waits up to block_timeout
+seconds and is then dropped, the statistics of the writer count both: they are
+the backpressure of the pipeline.
+
+Each worker writes its own shards, <dirname>/shard_<worker>_<index>.npz, zip
+archives of one .npy member per array named '<frame>/<stream>/<field>', so
+np.load() reads a shard and read_dataset() yields the records in frame order.
+"""
+
+import collections
+import glob
+import os
+import queue
+import threading
+import time
+import zipfile
+
+import numpy as np
+
+# carla.DVSEvent as laid out in the raw buffer of a carla.DVSEventArray
+DVS_EVENT = np.dtype([('x', np.uint16), ('y', np.uint16), ('t', np.int64), ('pol', np.bool_)])
+
+# carla.SemanticLidarDetection as laid out in the raw buffer of a carla.SemanticLidarMeasurement
+SEMANTIC_LIDAR_DETECTION = np.dtype([
+    ('x', np.float32), ('y', np.float32), ('z', np.float32), ('cos_inc_angle', np.float32),
+    ('object_idx', np.uint32), ('object_tag', np.uint32)])
+
+
+# ==============================================================================
+# -- Measurements --------------------------------------------------------------
+# ==============================================================================
+
+
+def _measurement(data, **arrays):
+    """Arrays of a carla.SensorData with its timestamp and sensor transform (x, y, z, pitch, yaw, roll)."""
+    location, rotation = data.transform.location, data.transform.rotation
+    arrays['timestamp'] = np.array(data.timestamp)
+    arrays['transform'] = np.array([location.x, location.y, location.z, rotation.pitch, rotation.yaw, rotation.roll])
+    return arrays
+
+
+def camera_arrays(image):
+    """Copy of the BGRA pixels (H, W, 4) of a carla.Image, before any conversion."""
+    pixels = np.frombuffer(image.raw_data, dtype=np.uint8).reshape(image.height, image.width, 4)
+    return _measurement(image, image=pixels.copy())
+
+
+def roi_arrays(cropper):
+    """Copy function of the regions of interest of a RoiCropper (smartcities.sensors.roi), RGB per region."""
+    # The cropper writes every region into a new buffer, the record is its only copy
+    return lambda image: _measurement(image, **cropper.crop(image.raw_data))
+
+
+def optical_flow_arrays(image):
+    """Copy of the flow (H, W, 2) of a carla.OpticalFlowImage, in pixels."""
+    flow = np.frombuffer(image.raw_data, dtype=np.float32).reshape(image.height, image.width, 2)
+    return _measurement(image, flow=flow.copy())
+
+
+def dvs_arrays(events):
+    """Copy of the events of a carla.DVSEventArray, a structured array of DVS_EVENT."""
+    return _measurement(events, events=np.frombuffer(events.raw_data, dtype=DVS_EVENT).copy())
+
+
+def lidar_arrays(measurement):
+    """Copy of the points (N, 4) of x, y, z and intensity of a carla.LidarMeasurement."""
+    points = np.frombuffer(measurement.raw_data, dtype=np.float32).reshape(-1, 4)
+    return _measurement(measurement, points=points.copy())
+
+
+def semantic_lidar_arrays(measurement):
+    """Copy of the detections of a carla.SemanticLidarMeasurement, a structured array of SEMANTIC_LIDAR_DETECTION."""
+    return _measurement(
+        measurement, detections=np.frombuffer(measurement.raw_data, dtype=SEMANTIC_LIDAR_DETECTION).copy())
+
+
+def radar_arrays(measurement):
+    """Copy of the detections (N, 4) of velocity, altitude, azimuth and depth of a carla.RadarMeasurement."""
+    detections = np.frombuffer(measurement.raw_data, dtype=np.float32).reshape(-1, 4)
+    return _measurement(measurement, detections=detections.copy())
+
+
+def gnss_arrays(event):
+    """Latitude, longitude and altitude of a carla.GnssMeasurement."""
+    return _measurement(event, position=np.array([event.latitude, event.longitude, event.altitude]))
+
+
+def imu_arrays(event):
+    """Accelerometer in m/s^2, gyroscope in rad/s and compass in radians of a carla.IMUMeasurement."""
+    accelerometer, gyroscope = event.accelerometer, event.gyroscope
+    return _measurement(
+        event,
+        accelerometer=np.array([accelerometer.x, accelerometer.y, accelerometer.z]),
+        gyroscope=np.array([gyroscope.x, gyroscope.y, gyroscope.z]),
+        compass=np.array(event.compass))
+
+
+# Copy function of the measurements of each sensor type, the first matching type id prefix wins
+MEASUREMENT_ARRAYS = (
+    ('sensor.lidar.ray_cast_semantic', semantic_lidar_arrays),
+    ('sensor.lidar', lidar_arrays),
+    ('sensor.camera.dvs', dvs_arrays),
+    ('sensor.camera.optical_flow', optical_flow_arrays),
+    ('sensor.camera', camera_arrays),
+    ('sensor.other.radar', radar_arrays),
+    ('sensor.other.gnss', gnss_arrays),
+    ('sensor.other.imu', imu_arrays),
+)
+
+
+def measurement_arrays(type_id):
+    """Copy function of the measurements of a sensor type id, as 'sensor.camera.rgb'."""
+    for prefix, arrays in MEASUREMENT_ARRAYS:
+        if type_id.startswith(prefix):
+            return arrays
+    raise ValueError('no dataset arrays for the measurements of %s' % type_id)
+
+
+# ==============================================================================
+# -- DatasetWriter -------------------------------------------------------------
+# ==============================================================================
+
+
+class DatasetWriter(object):
+    """Joins the sensor streams by frame and writes the records from a pool of worker threads."""
+
+    def __init__(self, dirname, streams, workers=2, queue_size=16, shard_records=100, max_lag=10,
+                 block_timeout=0.0, compresslevel=1):
+        """
+            :param dirname: output directory, created if missing
+            :param streams: names of the streams of a complete record, as ('camera', 'gnss', 'imu')
+            :param workers: encoding threads, each writing its own shards
+            :param queue_size: records waiting for a worker before the next ones are dropped
+            :param shard_records: records per shard, a shard is renamed from .tmp when complete
+            :param max_lag: frames a record waits for its missing streams
+            :param block_timeout: seconds put() waits for room in a full queue before dropping the
+                record, 0 drops it at once and never slows the callbacks down
+            :param compresslevel: zlib level of the arrays, 0 stores them uncompressed
+        """
+        if workers < 1 or queue_size < 1 or shard_records < 1:
+            raise ValueError('workers, queue_size and shard_records must be at least 1')
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self.dirname = dirname
+        self.streams = frozenset(streams)
+        self.shard_records = shard_records
+        self.max_lag = max_lag
+        self.block_timeout = block_timeout
+        self.compression = zipfile.ZIP_DEFLATED if compresslevel > 0 else zipfile.ZIP_STORED
+        self.compresslevel = compresslevel if compresslevel > 0 else None
+        self.error = None
+        # Statistics, see summary()
+        self.received = 0
+        self.records = 0
+        self.incomplete = 0
+        self.late = 0
+        self.dropped = 0
+        self.written = 0
+        self.errors = 0
+        self.bytes_written = 0
+        self.max_queue_depth = 0
+        self.max_put_time = 0.0
+        self.max_wait_time = 0.0
+        self.encode_time = 0.0
+        self._lock = threading.Lock()
+        # Frame -> {stream: arrays} of the records still missing a stream
+        self._pending = {}
+        self._newest = None
+        self._closed = False
+        self._queue = queue.Queue(queue_size)
+        self._workers = [threading.Thread(target=self._work, args=(worker,), name='DatasetWriter-%d' % worker)
+                         for worker in range(workers)]
+        for worker in self._workers:
+            worker.daemon = True
+            worker.start()
+
+    def set_streams(self, streams):
+        """Change the streams of a complete record, as when the main sensor of the client changes."""
+        with self._lock:
+            self.streams = frozenset(streams)
+
+    def put(self, stream, frame, arrays):
+        """
+        Add the arrays of one stream at a frame, called from the sensor callbacks.
+
+            :param stream: name of the stream, as 'camera'
+            :param frame: simulation frame of the measurement
+            :param arrays: dict of field name to array, owned by the writer from now on
+            :return: False if the data was late, or a record was dropped on a full queue
+        """
+        start = time.perf_counter()
+        ready = []
+        with self._lock:
+            if self._closed:
+                return False
+            self.received += 1
+            if self._newest is not None and frame < self._newest - self.max_lag:
+                # Its record was written already
+                self.late += 1
+                return False
+            self._newest = frame if self._newest is None else max(self._newest, frame)
+            record = self._pending.setdefault(frame, {})
+            record[stream] = arrays
+            if self.streams.issubset(record):
+                ready.append((frame, self._pending.pop(frame)))
+            # A stream missed the older frames, write them with the streams they have
+            for old in sorted(old for old in self._pending if old < self._newest - self.max_lag):
+                self.incomplete += 1
+                ready.append((old, self._pending.pop(old)))
+            self.records += len(ready)
+        queued = [self._enqueue(item) for item in ready]
+        put_time = time.perf_counter() - start
+        with self._lock:
+            self.max_put_time = max(self.max_put_time, put_time)
+        return all(queued)
+
+    def _enqueue(self, item):
+        start = time.perf_counter()
+        try:
+            if self.block_timeout > 0:
+                self._queue.put(item, True, self.block_timeout)
+            else:
+                self._queue.put_nowait(item)
+            queued = True
+        except queue.Full:
+            queued = False
+        wait_time = time.perf_counter() - start
+        with self._lock:
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+            if queued:
+                self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+            else:
+                self.dropped += 1
+        return queued
+
+    def _open_shard(self, worker, index):
+        path = os.path.join(self.dirname, 'shard_%02d_%05d.npz' % (worker, index))
+        shard = zipfile.ZipFile(path + '.tmp', 'w', self.compression, allowZip64=True,
+                                compresslevel=self.compresslevel)
+        return shard, path
+
+    @staticmethod
+    def _close_shard(shard, path):
+        shard.close()
+        os.replace(path + '.tmp', path)
+
+    def _work(self, worker):
+        shard, path = None, None
+        index = 0
+        records = 0
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                frame, record = item
+                start = time.perf_counter()
+                size = 0
+                try:
+                    if shard is None:
+                        shard, path = self._open_shard(worker, index)
+                        index += 1
+                    for stream, arrays in sorted(record.items()):
+                        for field, array in sorted(arrays.items()):
+                            name = '%08d/%s/%s.npy' % (frame, stream, field)
+                            with shard.open(name, 'w', force_zip64=True) as member:
+                                np.lib.format.write_array(member, np.asanyarray(array), allow_pickle=False)
+                            size += shard.infolist()[-1].compress_size
+                    records += 1
+                    if records == self.shard_records:
+                        self._close_shard(shard, path)
+                        shard, records = None, 0
+                except (IOError, OSError, ValueError) as error:
+                    with self._lock:
+                        self.errors += 1
+                        self.error = error
+                    continue
+                with self._lock:
+                    self.written += 1
+                    self.bytes_written += size
+                    self.encode_time += time.perf_counter() - start
+        finally:
+            if shard is not None:
+                self._close_shard(shard, path)
+
+    def close(self):
+        """Write the pending records, wait for the workers and close the shards."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            ready = sorted(self._pending.items())
+            self._pending.clear()
+            self.incomplete += len(ready)
+            self.records += len(ready)
+        # Nothing is dropped on close, the queue is drained by the workers
+        for item in ready:
+            self._queue.put(item)
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def summary(self):
+        """Statistics as a dict, times are in milliseconds."""
+        with self._lock:
+            return {
+                'received': self.received,
+                'records': self.records,
+                'incomplete': self.incomplete,
+                'late': self.late,
+                'dropped': self.dropped,
+                'written': self.written,
+                'errors': self.errors,
+                'megabytes': self.bytes_written / 1e6,
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self.max_queue_depth,
+                'max_put_ms': self.max_put_time * 1e3,
+                'max_wait_ms': self.max_wait_time * 1e3,
+                'encode_ms': self.encode_time / self.written * 1e3 if self.written else 0.0,
+            }
+
+    def __str__(self):
+        return ('dataset %(written)d/%(records)d records written (%(megabytes).1f MB), %(incomplete)d incomplete, '
+                '%(dropped)d dropped, %(late)d late measurements, %(errors)d errors, queue %(queue_depth)d '
+                '(max %(max_queue_depth)d), put max %(max_put_ms).2f ms, wait max %(max_wait_ms).2f ms, '
+                'encode %(encode_ms).2f ms' % self.summary())
+
+
+# ==============================================================================
+# -- Reading -------------------------------------------------------------------
+# ==============================================================================
+
+
+def read_dataset(dirname):
+    """
+    Records written by a DatasetWriter, in frame order.
+
+        :return: generator of (frame, {stream: {field: array}})
+    """
+    shards = [np.load(path) for path in sorted(glob.glob(os.path.join(dirname, 'shard_*.npz')))]
+    try:
+        # Frame -> [(shard, key)], the arrays are only read when their record is yielded
+        members = collections.defaultdict(list)
+        for shard in shards:
+            for key in shard.files:
+                members[int(key.split('/', 1)[0])].append((shard, key))
+        for frame in sorted(members):
+            record = collections.defaultdict(dict)
+            for shard, key in members[frame]:
+                _, stream, field = key.split('/')
+                record[stream][field] = shard[key]
+            yield frame, dict(record)
+    finally:
+        for shard in shards:
+            shard.close()
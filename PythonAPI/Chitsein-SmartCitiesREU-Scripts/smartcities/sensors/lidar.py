@@ -0,0 +1,149 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Bird's-eye view of the LiDAR sweeps shown by the sensor callbacks of the
+clients.
+
+LidarRasterizer draws the points of a carla.LidarMeasurement straight from
+its raw buffer, without copying it, into an image it keeps from one sweep
+to the next, in the (x, y, 3) layout of pygame.surfarray. The pixel index of
+every point is computed in place in scratch arrays that only grow with the
+largest sweep, so a sweep allocates no array of the size of the point cloud. A last
+pixel past the image takes the points out of range, so the points need no
+filtering. The modes colour the pixels by:
+
+  * occupancy: white where there is a point, as the clients drew it before;
+  * intensity: the intensity of the last point of the pixel;
+  * height: the height of the last point of the pixel within height_range;
+  * count: the number of points of the pixel, up to max_count.
+"""
+
+import numpy as np
+
+MODES = ('occupancy', 'intensity', 'height', 'count')
+
+# Colours of the intensity, height and count modes, from the lowest value to the highest
+COLORMAP_ANCHORS = ((0, 0, 96), (0, 96, 255), (0, 255, 255), (255, 255, 0), (255, 64, 0))
+
+
+def colormap(size, anchors=COLORMAP_ANCHORS):
+    """Table (size, 3) of uint8 colours interpolated between the anchor colours."""
+    position = np.linspace(0.0, len(anchors) - 1, size)
+    anchors = np.array(anchors, dtype=np.float64)
+    return np.stack([np.interp(position, np.arange(len(anchors)), anchors[:, channel]) for channel in range(3)],
+                    axis=-1).round().astype(np.uint8)
+
+
+class LidarRasterizer(object):
+    """Top view of LiDAR sweeps into a preallocated image, see the module documentation."""
+
+    def __init__(self, width, height, lidar_range, mode='occupancy', height_range=(-3.0, 3.0), max_count=16):
+        """
+            :param width: image width in pixels, the x axis of the sensor
+            :param height: image height in pixels, the y axis of the sensor
+            :param lidar_range: metres from the sensor to the closest image border
+            :param mode: one of MODES
+            :param height_range: (lowest, highest) z in metres of the height mode
+            :param max_count: points of a pixel drawn with the last colour of the count mode
+        """
+        if mode not in MODES:
+            raise ValueError('unknown mode %r, expected one of %s' % (mode, ', '.join(MODES)))
+        self.width = int(width)
+        self.height = int(height)
+        self.mode = mode
+        self.height_range = height_range
+        self.max_count = max_count
+        self.scale = min(self.width, self.height) / (2.0 * lidar_range)
+        self.colormap = colormap(256)
+        # The count mode draws empty pixels black
+        self.count_colormap = np.concatenate((np.zeros((1, 3), dtype=np.uint8), colormap(max_count)))
+        # One pixel per row, then the pixel of the points out of the image
+        self._pixels = np.zeros((self.width * self.height + 1, 3), dtype=np.uint8)
+        self._outside = self.width * self.height
+        self.image = self._pixels[:-1].reshape(self.width, self.height, 3)
+        self._capacity = -1
+        self._reserve(0)
+
+    def _reserve(self, points):
+        """Scratch arrays of at least 'points' rows, grown by half so a slowly growing sweep seldom grows them."""
+        if points <= self._capacity:
+            return
+        capacity = max(points + points // 2, 1024)
+        self._capacity = capacity
+        self._x = np.empty(capacity, dtype=np.float32)
+        self._y = np.empty(capacity, dtype=np.float32)
+        self._column = np.empty(capacity, dtype=np.int32)
+        self._row = np.empty(capacity, dtype=np.int32)
+        self._index = np.empty(capacity, dtype=np.intp)
+        self._inside = np.empty(capacity, dtype=np.bool_)
+        self._mask = np.empty(capacity, dtype=np.bool_)
+        self._level = np.empty(capacity, dtype=np.uint8)
+        self._colors = np.empty((capacity, 3), dtype=np.uint8)
+
+    def pixel_index(self, points):
+        """
+        Row of self._pixels of each point, the last row for the points out of the image.
+
+            :param points: array (N, 4) of x, y, z and intensity
+            :return: view of a scratch array, valid until the next call
+        """
+        count = len(points)
+        self._reserve(count)
+        x, y = self._x[:count], self._y[:count]
+        column, row = self._column[:count], self._row[:count]
+        index, inside, mask = self._index[:count], self._inside[:count], self._mask[:count]
+        # Pixel of each point, in place: the image centre plus the scaled position, floored
+        np.multiply(points[:, 0], self.scale, out=x)
+        np.add(x, 0.5 * self.width, out=x)
+        np.floor(x, out=x)
+        np.multiply(points[:, 1], self.scale, out=y)
+        np.add(y, 0.5 * self.height, out=y)
+        np.floor(y, out=y)
+        np.copyto(column, x, casting='unsafe')
+        np.copyto(row, y, casting='unsafe')
+        # As unsigned integers the negative pixels are past the image too, one comparison per axis
+        np.less(column.view(np.uint32), self.width, out=inside)
+        np.logical_and(inside, np.less(row.view(np.uint32), self.height, out=mask), out=inside)
+        np.multiply(column, self.height, out=index)
+        np.add(index, row, out=index)
+        np.logical_not(inside, out=mask)
+        np.copyto(index, self._outside, where=mask)
+        return index
+
+    def _levels(self, values, low, high):
+        """Colormap row of each value between low and high, in the scratch arrays."""
+        count = len(values)
+        scaled, level = self._x[:count], self._level[:count]
+        np.subtract(values, low, out=scaled)
+        np.multiply(scaled, (len(self.colormap) - 1) / float(high - low), out=scaled)
+        np.clip(scaled, 0, len(self.colormap) - 1, out=scaled)
+        np.copyto(level, scaled, casting='unsafe')
+        return level
+
+    def rasterize(self, raw_data):
+        """
+        Draw one sweep.
+
+            :param raw_data: raw buffer of a carla.LidarMeasurement, 4 float32 per point
+            :return: self.image, array (width, height, 3) of uint8 overwritten by the next call
+        """
+        points = np.frombuffer(raw_data, dtype=np.float32).reshape(-1, 4)
+        index = self.pixel_index(points)
+        pixels = self._pixels
+        if self.mode == 'count':
+            counts = np.bincount(index, minlength=len(pixels))
+            np.take(self.count_colormap, counts, axis=0, out=pixels, mode='clip')
+            return self.image
+        pixels.fill(0)
+        if self.mode == 'occupancy':
+            pixels[index] = 255
+            return self.image
+        if self.mode == 'intensity':
+            level = self._levels(points[:, 3], 0.0, 1.0)
+        else:
+            level = self._levels(points[:, 2], self.height_range[0], self.height_range[1])
+        colors = self._colors[:len(points)]
+        np.take(self.colormap, level, axis=0, out=colors)
+        pixels[index] = colors
+        return self.image
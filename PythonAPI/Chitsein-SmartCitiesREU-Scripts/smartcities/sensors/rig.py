@@ -0,0 +1,243 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Declarative rigs of roadside sensor units for sensor_data_collection.py.
+
+A rig file is a JSON object:
+
+    {
+      "name": "town10hd_intersection",
+      "defaults": {"sensor.camera.rgb": {"image_size_x": 256, "image_size_y": 256}},
+      "units": [
+        {"name": "mast", "location": [-61.8, 133.0, 6.5], "rotation": [0.0, 0.0, 0.0],
+         "sensors": [
+           {"name": "camera", "type": "sensor.camera.rgb", "rotation": [-20.0, 0.0, 0.0],
+            "attributes": {"fov": 90}, "rois": {"crosswalk": [0, 152, 256, 48]}},
+           {"name": "gnss", "type": "sensor.other.gnss"}]}
+      ]
+    }
+
+Locations are in metres and rotations in degrees (pitch, yaw, roll), as
+carla.Location and carla.Rotation. The transform of a sensor is relative to
+its unit and both default to zero. The attributes of a sensor override the
+defaults of its type, and every value is given to the blueprint as a string.
+The "rois" of a camera are its regions of interest (smartcities.sensors.roi),
+in pixels of its image_size_x and image_size_y: only they are recorded.
+
+Each sensor is a stream '<unit>.<sensor>' of the rig. The client spawns all
+of them with one batch of SpawnActor commands at the world transforms of
+Rig.sensors(), and a RigCollector takes their measurements: it counts the
+measurements and bytes of each stream for the throughput of the rig, and
+hands copies to the DatasetWriter (smartcities.sensors.dataset) while
+recording, which joins every stream of the rig by frame.
+"""
+
+import collections
+import json
+import math
+import threading
+import time
+import weakref
+
+import numpy as np
+
+from smartcities.sensors.dataset import camera_arrays, measurement_arrays, roi_arrays
+from smartcities.sensors.roi import RoiCropper, parse_rois
+
+SensorSpec = collections.namedtuple('SensorSpec', ['name', 'type_id', 'location', 'rotation', 'attributes', 'rois'])
+RigUnit = collections.namedtuple('RigUnit', ['name', 'location', 'rotation', 'sensors'])
+
+
+def rotation_matrix(rotation):
+    """Rotation matrix (3, 3) of a (pitch, yaw, roll) in degrees, as carla.Transform.get_matrix()."""
+    pitch, yaw, roll = np.radians(rotation)
+    cp, sp = math.cos(pitch), math.sin(pitch)
+    cy, sy = math.cos(yaw), math.sin(yaw)
+    cr, sr = math.cos(roll), math.sin(roll)
+    return np.array([
+        [cp * cy, cy * sp * sr - sy * cr, -cy * sp * cr - sy * sr],
+        [cp * sy, sy * sp * sr + cy * cr, -sy * sp * cr + cy * sr],
+        [sp, -cp * sr, cp * cr]])
+
+
+def compose(parent, child):
+    """
+    World transform of a child transform relative to a parent one.
+
+        :param parent: (location, rotation) tuples of 3 values
+        :param child: (location, rotation) relative to the parent
+        :return: (location, rotation) tuples
+    """
+    parent_matrix = rotation_matrix(parent[1])
+    location = parent_matrix.dot(child[0]) + parent[0]
+    matrix = parent_matrix.dot(rotation_matrix(child[1]))
+    pitch = math.degrees(math.asin(max(-1.0, min(1.0, matrix[2, 0]))))
+    yaw = math.degrees(math.atan2(matrix[1, 0], matrix[0, 0]))
+    roll = math.degrees(math.atan2(-matrix[2, 1], matrix[2, 2]))
+    return tuple(location.tolist()), (pitch, yaw, roll)
+
+
+def _vector(value, what):
+    if value is None:
+        return (0.0, 0.0, 0.0)
+    if not isinstance(value, (list, tuple)) or len(value) != 3:
+        raise ValueError('%s must be a list of 3 numbers, not %r' % (what, value))
+    return tuple(float(item) for item in value)
+
+
+def _cropper(type_id, attributes, rois, what):
+    """RoiCropper of the regions of interest of a sensor, ValueError if the sensor cannot have them."""
+    if measurement_arrays(type_id) is not camera_arrays:
+        raise ValueError('%s is not a camera of BGRA images, it has no regions of interest' % what)
+    if 'image_size_x' not in attributes or 'image_size_y' not in attributes:
+        raise ValueError('%s needs image_size_x and image_size_y for its regions of interest' % what)
+    return RoiCropper(rois, int(attributes['image_size_x']), int(attributes['image_size_y']))
+
+
+def _name(value, what):
+    if not isinstance(value, str) or not value or '.' in value or '/' in value:
+        raise ValueError('%s must be a non empty name without "." or "/", not %r' % (what, value))
+    return value
+
+
+class Rig(object):
+    """Units of a rig file, see the module documentation."""
+
+    def __init__(self, name, units):
+        self.name = name
+        self.units = units
+
+    @classmethod
+    def from_dict(cls, content):
+        """Rig of the content of a rig file, ValueError if it is not valid."""
+        defaults = content.get('defaults', {})
+        units = []
+        for unit in content.get('units', []):
+            unit_name = _name(unit.get('name'), 'unit name')
+            sensors = []
+            for sensor in unit.get('sensors', []):
+                what = 'sensor %s of unit %s' % (sensor.get('name'), unit_name)
+                type_id = sensor.get('type')
+                if not isinstance(type_id, str) or not type_id.startswith('sensor.'):
+                    raise ValueError('%s has no sensor type' % what)
+                attributes = dict(defaults.get(type_id, {}))
+                attributes.update(sensor.get('attributes', {}))
+                attributes = {key: str(value).lower() if isinstance(value, bool) else str(value)
+                              for key, value in attributes.items()}
+                rois = parse_rois(sensor['rois'], what + ' rois') if 'rois' in sensor else ()
+                if rois:
+                    _cropper(type_id, attributes, rois, what)
+                sensors.append(SensorSpec(
+                    _name(sensor.get('name'), 'sensor name'), type_id,
+                    _vector(sensor.get('location'), what + ' location'),
+                    _vector(sensor.get('rotation'), what + ' rotation'),
+                    attributes, rois))
+            if len(set(sensor.name for sensor in sensors)) != len(sensors):
+                raise ValueError('unit %s has two sensors of the same name' % unit_name)
+            units.append(RigUnit(unit_name, _vector(unit.get('location'), 'unit %s location' % unit_name),
+                                 _vector(unit.get('rotation'), 'unit %s rotation' % unit_name), sensors))
+        if not units:
+            raise ValueError('the rig has no unit')
+        if len(set(unit.name for unit in units)) != len(units):
+            raise ValueError('the rig has two units of the same name')
+        return cls(content.get('name', 'rig'), units)
+
+    @property
+    def streams(self):
+        """Stream names '<unit>.<sensor>' of every sensor."""
+        return tuple('%s.%s' % (unit.name, sensor.name) for unit in self.units for sensor in unit.sensors)
+
+    def sensors(self):
+        """(stream, SensorSpec, world location, world rotation) of every sensor, in the order of streams."""
+        result = []
+        for unit in self.units:
+            for sensor in unit.sensors:
+                location, rotation = compose((unit.location, unit.rotation), (sensor.location, sensor.rotation))
+                result.append(('%s.%s' % (unit.name, sensor.name), sensor, location, rotation))
+        return result
+
+
+def load_rig(path):
+    """Rig of a rig file."""
+    with open(path) as rig_file:
+        return Rig.from_dict(json.load(rig_file))
+
+
+class RigCollector(object):
+    """Measurements of every stream of a rig, counted and handed to the dataset writer while recording."""
+
+    def __init__(self, rig, clock=time.perf_counter):
+        self.rig = rig
+        # DatasetWriter of the recording, None otherwise
+        self.writer = None
+        self.callback_time = 0.0
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._streams = rig.streams
+        self.reset()
+
+    def reset(self):
+        """Start the throughput measure again."""
+        with self._lock:
+            self._measurements = dict.fromkeys(self._streams, 0)
+            self._bytes = dict.fromkeys(self._streams, 0)
+            self._start = self._clock()
+            self.callback_time = 0.0
+
+    def callback(self, stream, sensor):
+        """Function to give to the listen() of the sensor of a stream, of its SensorSpec."""
+        weak_self = weakref.ref(self)
+        if sensor.rois:
+            arrays = roi_arrays(_cropper(sensor.type_id, sensor.attributes, sensor.rois, stream))
+        else:
+            arrays = measurement_arrays(sensor.type_id)
+        return lambda data: RigCollector._on_measurement(weak_self, stream, arrays, data)
+
+    @staticmethod
+    def _on_measurement(weak_self, stream, arrays, data):
+        self = weak_self()
+        if not self:
+            return
+        start = self._clock()
+        raw_data = getattr(data, 'raw_data', None)
+        writer = self.writer
+        if writer is not None:
+            # Only a copy of the raw buffer here, the writer threads encode and save it
+            writer.put(stream, data.frame, arrays(data))
+        with self._lock:
+            self._measurements[stream] += 1
+            self._bytes[stream] += len(raw_data) if raw_data is not None else 0
+            self.callback_time += self._clock() - start
+
+    def summary(self):
+        """Throughput of each unit and of the rig, in measurements and megabytes per second."""
+        with self._lock:
+            elapsed = max(self._clock() - self._start, 1e-9)
+            measurements = sum(self._measurements.values())
+            units = collections.OrderedDict()
+            for unit in self.rig.units:
+                streams = ['%s.%s' % (unit.name, sensor.name) for sensor in unit.sensors]
+                units[unit.name] = {
+                    'measurements_per_s': sum(self._measurements[stream] for stream in streams) / elapsed,
+                    'megabytes_per_s': sum(self._bytes[stream] for stream in streams) / elapsed / 1e6,
+                }
+            return {
+                'sensors': len(self._streams),
+                'seconds': elapsed,
+                'measurements': measurements,
+                'measurements_per_s': measurements / elapsed,
+                'megabytes_per_s': sum(self._bytes.values()) / elapsed / 1e6,
+                'callback_ms': self.callback_time / measurements * 1e3 if measurements else 0.0,
+                'units': units,
+            }
+
+    def __str__(self):
+        summary = self.summary()
+        lines = ['rig %s: %d sensors, %.1f measurements/s, %.2f MB/s, callback %.3f ms' % (
+            self.rig.name, summary['sensors'], summary['measurements_per_s'], summary['megabytes_per_s'],
+            summary['callback_ms'])]
+        for name, unit in summary['units'].items():
+            lines.append('  %s: %.1f measurements/s, %.2f MB/s' % (
+                name, unit['measurements_per_s'], unit['megabytes_per_s']))
+        return '\n'.join(lines)
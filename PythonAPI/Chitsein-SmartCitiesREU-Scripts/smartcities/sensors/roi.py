@@ -0,0 +1,112 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Regions of interest of the cameras of sensor_data_collection.py.
+
+A camera with regions of interest, as the crosswalks and stop lines seen by a
+roadside unit, keeps only their rectangles: RoiCropper copies each one from
+the BGRA raw buffer of a carla.Image straight into RGB, one after the other in
+a single compact buffer, so the full frame is never converted nor copied. The
+dataset records the regions instead of the image (see roi_arrays() of
+smartcities.sensors.dataset) and the display blits them at their place.
+
+A region is a rectangle of pixels of the image, given as name=x,y,width,height
+on the command line (parse_roi()) or as "rois": {"name": [x, y, width, height]}
+in a sensor of a rig file (parse_rois()). Its name is the dataset field of its
+pixels.
+"""
+
+import collections
+
+import numpy as np
+
+Roi = collections.namedtuple('Roi', ['name', 'x', 'y', 'width', 'height'])
+
+# Dataset fields of every measurement, no region can take their name
+RESERVED_NAMES = ('timestamp', 'transform')
+
+
+def _roi(name, box, what):
+    if not isinstance(name, str) or not name or '/' in name or name in RESERVED_NAMES:
+        raise ValueError('%s must be a non empty name without "/" other than %s, not %r' % (
+            what, ', '.join(RESERVED_NAMES), name))
+    if not isinstance(box, (list, tuple)) or len(box) != 4 or \
+            not all(isinstance(value, int) and not isinstance(value, bool) for value in box):
+        raise ValueError('%s must be a list of 4 integers x, y, width and height, not %r' % (what, box))
+    if box[0] < 0 or box[1] < 0 or box[2] <= 0 or box[3] <= 0:
+        raise ValueError('%s must have a positive size inside the image, not %r' % (what, box))
+    return Roi(name, *box)
+
+
+def parse_roi(text):
+    """Roi of the text name=x,y,width,height, ValueError if it is not valid."""
+    name, _, box = text.partition('=')
+    try:
+        box = [int(value) for value in box.split(',')]
+    except ValueError:
+        raise ValueError('region of interest %r is not name=x,y,width,height' % text)
+    return _roi(name, box, 'region of interest %r' % text)
+
+
+def parse_rois(content, what='regions of interest'):
+    """Tuple of Roi of the "rois" object of a rig file, {name: [x, y, width, height]}."""
+    if not isinstance(content, dict):
+        raise ValueError('%s must be an object of name: [x, y, width, height], not %r' % (what, content))
+    return tuple(_roi(name, box, '%s %s' % (what, name)) for name, box in content.items())
+
+
+class RoiCropper(object):
+    """Regions of interest of the images of a camera into one compact RGB buffer, see the module documentation."""
+
+    def __init__(self, rois, width, height):
+        """
+            :param rois: Roi of the regions, in the order of the buffer
+            :param width: image width of the camera in pixels
+            :param height: image height of the camera in pixels
+        """
+        if not rois:
+            raise ValueError('a cropper needs at least one region of interest')
+        if len(set(roi.name for roi in rois)) != len(rois):
+            raise ValueError('two regions of interest have the same name')
+        for roi in rois:
+            if roi.x + roi.width > width or roi.y + roi.height > height:
+                raise ValueError('region of interest %s %r is not inside the %dx%d image' % (
+                    roi.name, tuple(roi[1:]), width, height))
+        self.rois = tuple(rois)
+        self.width = int(width)
+        self.height = int(height)
+        # Start of each region in the buffer, regions are contiguous (height, width, 3) arrays
+        self._offsets = np.cumsum([0] + [roi.width * roi.height * 3 for roi in self.rois]).tolist()
+        self.size = self._offsets[-1]
+
+    @property
+    def ratio(self):
+        """Bytes of the BGRA image per byte of the regions."""
+        return self.width * self.height * 4 / float(self.size)
+
+    def crop(self, raw_data, out=None):
+        """
+        RGB pixels of each region of an image.
+
+            :param raw_data: raw buffer of a carla.Image, BGRA pixels of the camera size
+            :param out: array of self.size uint8 the regions are written to, a new one by default
+            :return: OrderedDict of name and array (height, width, 3) of uint8, views of out
+        """
+        pixels = np.frombuffer(raw_data, dtype=np.uint8)
+        if pixels.size != self.width * self.height * 4:
+            raise ValueError('image of %d bytes for regions of interest of a %dx%d camera' % (
+                pixels.size, self.width, self.height))
+        pixels = pixels.reshape(self.height, self.width, 4)
+        if out is None:
+            out = np.empty(self.size, dtype=np.uint8)
+        regions = collections.OrderedDict()
+        for roi, start, end in zip(self.rois, self._offsets, self._offsets[1:]):
+            region = out[start:end].reshape(roi.height, roi.width, 3)
+            bgra = pixels[roi.y:roi.y + roi.height, roi.x:roi.x + roi.width]
+            # BGR to RGB in the copy itself, one channel at a time: numpy copies long strided rows far
+            # faster than the 3 bytes of each pixel reversed
+            for channel in range(3):
+                np.copyto(region[:, :, channel], bgra[:, :, 2 - channel])
+            regions[roi.name] = region
+        return regions
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Check and benchmark of the actor tracker of prediction_visualization.py
+(smartcities.prediction.tracking), without CARLA.
+
+A simulated world moves --actors vehicles, next to sensors and walkers the
+tracker must ignore, and spawns and destroys vehicles at random while its
+snapshots are pushed through on_tick the way CARLA does. After every frame
+the arrays of the tracker, and its history of the last frames, are compared
+with the simulated world. The check fails (exit status 1) if a row differs,
+if an ignored actor is tracked or if the tracker calls the server for
+anything else than the spawned actors.
+
+    python actor_tracker_check.py --actors 500 --frames 600
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartcities.prediction.tracking import ActorTracker  # pylint: disable=import-error
+
+# Stand-ins of the carla types read by the tracker
+Vector = collections.namedtuple('Vector', ['x', 'y', 'z'])
+Rotation = collections.namedtuple('Rotation', ['pitch', 'yaw', 'roll'])
+Transform = collections.namedtuple('Transform', ['location', 'rotation'])
+BoundingBox = collections.namedtuple('BoundingBox', ['extent'])
+Actor = collections.namedtuple('Actor', ['id', 'type_id', 'bounding_box'])
+Timestamp = collections.namedtuple('Timestamp', ['elapsed_seconds'])
+
+
+class ActorSnapshot(object):
+
+    __slots__ = ('id', '_transform', '_velocity')
+
+    def __init__(self, actor_id, transform, velocity):
+        self.id = actor_id
+        self._transform = transform
+        self._velocity = velocity
+
+    def get_transform(self):
+        return self._transform
+
+    def get_velocity(self):
+        return self._velocity
+
+
+class WorldSnapshot(object):
+
+    def __init__(self, frame, actors):
+        self.frame = frame
+        self.timestamp = Timestamp(frame * 0.05)
+        self._actors = actors
+
+    def __iter__(self):
+        return iter(self._actors)
+
+
+class SimulatedWorld(object):
+    """Vehicles driving in circles, with sensors and walkers, and random spawns and despawns."""
+
+    def __init__(self, vehicles, seed):
+        self.rng = np.random.RandomState(seed)
+        self.actors = collections.OrderedDict()
+        self.state = {}
+        # States of each actor since its spawn, the expected history
+        self.log = collections.defaultdict(list)
+        self.callbacks = {}
+        self.get_actors_calls = 0
+        self.frame = 0
+        self._next_id = 1
+        for _ in range(vehicles):
+            self.spawn('vehicle.tesla.model3')
+        for _ in range(20):
+            self.spawn('sensor.camera.rgb')
+            self.spawn('walker.pedestrian.0001')
+
+    def spawn(self, type_id):
+        actor_id = self._next_id
+        self._next_id += 1
+        extent = Vector(2.4, 1.0, 0.8) if type_id.startswith('vehicle') else Vector(0.3, 0.3, 0.9)
+        self.actors[actor_id] = Actor(actor_id, type_id, BoundingBox(extent))
+        self.state[actor_id] = self.rng.uniform(-200.0, 200.0, 5)
+
+    def destroy(self, actor_id):
+        del self.actors[actor_id]
+        del self.state[actor_id]
+        self.log.pop(actor_id, None)
+
+    def on_tick(self, callback):
+        self.callbacks[len(self.callbacks)] = callback
+        return len(self.callbacks) - 1
+
+    def remove_on_tick(self, callback_id):
+        del self.callbacks[callback_id]
+
+    def get_actors(self, ids):
+        self.get_actors_calls += 1
+        return [self.actors[actor_id] for actor_id in ids if actor_id in self.actors]
+
+    def tick(self, churn):
+        self.frame += 1
+        vehicles = [actor_id for actor_id, actor in self.actors.items() if actor.type_id.startswith('vehicle')]
+        for actor_id in self.rng.choice(vehicles, min(self.rng.poisson(churn), len(vehicles)), replace=False):
+            self.destroy(int(actor_id))
+        for _ in range(self.rng.poisson(churn)):
+            self.spawn('vehicle.audi.tt')
+        actors = []
+        for actor_id, state in self.state.items():
+            state[:2] += 0.05 * state[3:5]
+            state[2] = (state[2] + 1.0) % 360.0
+            self.log[actor_id].append(state.copy())
+            actors.append(ActorSnapshot(
+                actor_id, Transform(Vector(state[0], state[1], 0.0), Rotation(0.0, state[2], 0.0)),
+                Vector(state[3], state[4], 0.0)))
+        snapshot = WorldSnapshot(self.frame, actors)
+        for callback in list(self.callbacks.values()):
+            callback(snapshot)
+        return snapshot
+
+
+def compare(world, tracker):
+    vehicles = {actor_id for actor_id, actor in world.actors.items() if actor.type_id.startswith('vehicle')}
+    tracked = set(tracker.ids.tolist())
+    if tracked != vehicles:
+        return '%d tracked actors instead of %d vehicles (%d ignored actors tracked)' % (
+            len(tracked), len(vehicles), len(tracked - vehicles))
+    expected = np.array([world.state[actor_id] for actor_id in tracker.ids.tolist()])
+    if not np.array_equal(expected, tracker.state()):
+        return 'the state of %d actors differs' % np.count_nonzero((expected != tracker.state()).any(axis=1))
+    if not (tracker.half_length == 2.4).all() or not (tracker.half_width == 1.0).all():
+        return 'wrong bounding boxes'
+    history = tracker.history()
+    for row, actor_id in enumerate(tracker.ids.tolist()):
+        log = world.log[actor_id][-tracker.history_length:]
+        # Padded with the first state seen
+        log = [log[0]] * (tracker.history_length - len(log)) + log
+        if not np.array_equal(history[row], np.array(log)):
+            return 'history of actor %d differs' % actor_id
+        if tracker.index(actor_id) != row or tracker.type_ids[row] != world.actors[actor_id].type_id:
+            return 'index of actor %d out of date' % actor_id
+    return None
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--actors',
+        default=500,
+        type=int,
+        help='number of vehicles (default: 500)')
+    argparser.add_argument(
+        '--frames',
+        default=600,
+        type=int,
+        help='frames simulated (default: 600)')
+    argparser.add_argument(
+        '--churn',
+        default=0.5,
+        type=float,
+        help='mean number of vehicles spawned and destroyed per frame (default: 0.5)')
+    argparser.add_argument(
+        '--seed',
+        default=1,
+        type=int,
+        help='seed of the simulated world (default: 1)')
+    args = argparser.parse_args()
+
+    world = SimulatedWorld(args.actors, args.seed)
+    tracker = ActorTracker(world, 'vehicle.*', capacity=16)
+    failed = []
+    times = []
+    spawn_frames = 0
+    for _ in range(args.frames):
+        previous = set(world.actors)
+        world.tick(args.churn)
+        spawn_frames += bool(set(world.actors) - previous)
+        start = time.perf_counter()
+        tracker.update()
+        times.append(time.perf_counter() - start)
+        failure = compare(world, tracker)
+        if failure is not None:
+            failed.append('frame %d: %s' % (world.frame, failure))
+            break
+    if tracker.update():
+        failed.append('the same snapshot was applied twice')
+    if abs(tracker.history_dt - 0.05) > 1e-9:
+        failed.append('history_dt %.6f instead of 0.05' % tracker.history_dt)
+    tracker.destroy()
+    if world.callbacks:
+        failed.append('the on_tick callback was not removed')
+
+    # The first frame looks up every actor, then only the frames with spawns call the server
+    if world.get_actors_calls > spawn_frames + 1:
+        failed.append('%d get_actors() calls for %d frames with spawns' % (world.get_actors_calls, spawn_frames))
+
+    times = np.array(times[1:]) * 1e3
+    print('%d frames, %d vehicles tracked at the end, %d spawned, %d destroyed' % (
+        args.frames, tracker.count, tracker.spawned, tracker.destroyed))
+    print('update(): mean %.3f ms, p99 %.3f ms, %d get_actors() calls' % (
+        times.mean(), np.percentile(times, 99), world.get_actors_calls))
+    for failure in failed:
+        print('FAILED: %s' % failure)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Benchmark of the bird's-eye view renderer of prediction_visualization.py
+(smartcities.prediction.bev), without CARLA or a display.
+
+A synthetic town (a grid of two lane roads, waypoints every metre) is
+rasterized once, then the ego drives a loop among --actors vehicles, each
+with a predicted trajectory, and every frame is rendered into the view buffer.
+The script prints the time per frame of each layer and fails (exit status 1)
+if:
+
+  * the rotated box fill differs from a per pixel point-in-box test;
+  * the ego does not sit at the centre of the view heading up, or the road
+    under it is not sampled from the road raster;
+  * the road raster loaded from the disk cache (map_road_raster) differs from
+    the rasterized one, or is rasterized again for the same OpenDRIVE;
+  * the frames take longer than --target_fps allows.
+
+    python bev_render_benchmark.py --actors 500 --res 1280x720
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartcities.prediction.bev import BACKGROUND, LANE_CENTER, ROAD, BirdEyeView, RoadRaster, fill_boxes, map_road_raster  # pylint: disable=import-error
+
+BLOCK = 100.0
+LANE_WIDTH = 3.5
+
+# Lane centre waypoints, as the lane graph gives them to map_road_raster()
+Lanes = collections.namedtuple('Lanes', ['x', 'y', 'yaw', 'lane_width'])
+
+
+class GridTownMap(object):
+    """Stand-in of the carla.Map of the grid town, only read for the cache file name."""
+
+    name = 'Carla/Maps/GridTown'
+
+    def to_opendrive(self):
+        return '<OpenDRIVE grid="%g"/>' % BLOCK
+
+
+def grid_town(blocks):
+    """Lane centre waypoints (x, y, yaw, lane width) of a grid of two lane roads."""
+    size = blocks * BLOCK
+    along = np.arange(0.0, size, 1.0)
+    x, y, yaw = [], [], []
+    for line in np.arange(blocks + 1) * BLOCK:
+        for offset, heading in ((-0.5 * LANE_WIDTH, 0.0), (0.5 * LANE_WIDTH, 180.0)):
+            x.append(along), y.append(np.full_like(along, line + offset)), yaw.append(np.full_like(along, heading))
+            x.append(np.full_like(along, line + offset)), y.append(along), yaw.append(np.full_like(along, heading + 90.0))
+    x, y, yaw = np.concatenate(x), np.concatenate(y), np.concatenate(yaw)
+    return x, y, yaw, np.full_like(x, LANE_WIDTH)
+
+
+def check_fill(rng):
+    height, width, boxes = 120, 160, 60
+    cx, cy = rng.uniform(-10, width + 10, boxes), rng.uniform(-10, height + 10, boxes)
+    yaw = rng.uniform(-math.pi, math.pi, boxes)
+    half_length, half_width = rng.uniform(0.5, 20.0, boxes), rng.uniform(0.5, 8.0, boxes)
+    image = np.zeros((height, width), dtype=np.uint8)
+    fill_boxes(image, cx, cy, yaw, half_length, half_width, 1)
+    u, v = np.meshgrid(np.arange(width) + 0.5, np.arange(height) + 0.5)
+    expected = np.zeros((height, width), dtype=bool)
+    for i in range(boxes):
+        du, dv = u - cx[i], v - cy[i]
+        expected |= ((np.abs(du * math.cos(yaw[i]) + dv * math.sin(yaw[i])) <= half_length[i]) &
+                     (np.abs(-du * math.sin(yaw[i]) + dv * math.cos(yaw[i])) <= half_width[i]))
+    return np.count_nonzero(expected != (image > 0))
+
+
+def check_view(width, height, road):
+    view = BirdEyeView(width, height, 10.0)
+    failed = []
+    for yaw in (0.0, 37.0, 90.0, -135.0):
+        view.begin(12.0, -7.0, yaw)
+        view.draw_boxes([12.0], [-7.0], [yaw], 2.0, 1.0, (255, 0, 0))
+        rows, columns = np.nonzero(view.buffer)
+        # 4 m long and 2 m wide, pointing up
+        if abs(columns.mean() - 0.5 * width) > 1.0 or abs(rows.mean() - 0.5 * height) > 1.0 or \
+                np.ptp(rows) < np.ptp(columns):
+            failed.append('ego box off centre or not heading up at yaw %.0f' % yaw)
+        ahead_x, ahead_y = view.to_view(12.0 + 5.0 * math.cos(math.radians(yaw)), -7.0 + 5.0 * math.sin(math.radians(yaw)))
+        if abs(ahead_x - 0.5 * width) > 1e-6 or abs(ahead_y - (0.5 * height - 50.0)) > 1e-6:
+            failed.append('point ahead of the ego not above it at yaw %.0f' % yaw)
+
+    # On the lane centre of the first road, then in the middle of the first block
+    view = BirdEyeView(width, height, 10.0, road)
+    for ego_x, ego_y, expected in ((30.0, -0.5 * LANE_WIDTH, (LANE_CENTER,)), (30.0, 1.0, (ROAD,)),
+                                   (50.0, 50.0, (BACKGROUND,))):
+        view.begin(ego_x, ego_y, 33.0)
+        if view.buffer[height // 2, width // 2] not in expected:
+            failed.append('road class %d under the ego at (%.1f, %.1f)' % (
+                view.buffer[height // 2, width // 2], ego_x, ego_y))
+    return failed
+
+
+def check_cache(lanes, scale):
+    """Rasterize through the cache, then load the raster from it, the milliseconds of each."""
+    failed = []
+    dirname = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        built = map_road_raster(GridTownMap(), lanes, 1.0, scale, dirname)
+        build_time = time.perf_counter() - start
+        # No waypoints, the raster must come from the cache
+        start = time.perf_counter()
+        loaded = map_road_raster(GridTownMap(), None, 1.0, scale, dirname)
+        load_time = time.perf_counter() - start
+        if not np.array_equal(built.image, loaded.image) or \
+                (built.origin_x, built.origin_y, built.pixels_per_meter) != \
+                (loaded.origin_x, loaded.origin_y, loaded.pixels_per_meter):
+            failed.append('road raster loaded from the cache differs from the rasterized one')
+        print('Road raster cache: rasterized and saved in %.0f ms, loaded in %.0f ms' % (
+            build_time * 1e3, load_time * 1e3))
+    finally:
+        shutil.rmtree(dirname)
+    return failed
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--actors',
+        default=500,
+        type=int,
+        help='number of vehicles (default: 500)')
+    argparser.add_argument(
+        '--horizon',
+        default=30,
+        type=int,
+        help='points per predicted trajectory (default: 30)')
+    argparser.add_argument(
+        '--res',
+        metavar='WIDTHxHEIGHT',
+        default='1280x720',
+        help='view resolution (default: 1280x720)')
+    argparser.add_argument(
+        '--scale',
+        default=20.0,
+        type=float,
+        help='pixels per metre (default: 20, as prediction_visualization.py)')
+    argparser.add_argument(
+        '--frames',
+        default=300,
+        type=int,
+        help='frames rendered (default: 300)')
+    argparser.add_argument(
+        '--target_fps',
+        default=60.0,
+        type=float,
+        help='frame rate the mean frame time must allow, 0 to skip the check (default: 60)')
+    args = argparser.parse_args()
+    width, height = [int(x) for x in args.res.split('x')]
+    rng = np.random.RandomState(1)
+    failed = []
+
+    mismatches = check_fill(rng)
+    if mismatches:
+        failed.append('%d pixels of the box fill differ from the point-in-box test' % mismatches)
+
+    x, y, yaw, lane_width = grid_town(4)
+    start = time.perf_counter()
+    road = RoadRaster(x, y, yaw, lane_width, 1.0, args.scale)
+    print('Road raster: %d waypoints, %dx%d pixels at %.1f px/m in %.0f ms' % (
+        x.size, road.image.shape[1], road.image.shape[0], road.pixels_per_meter, (time.perf_counter() - start) * 1e3))
+    failed.extend(check_view(width, height, road))
+    failed.extend(check_cache(Lanes(x, y, yaw, lane_width), args.scale))
+
+    # Vehicles on random waypoints, trajectories along their lane
+    lanes = rng.randint(0, x.size, args.actors)
+    actor_x, actor_y, actor_yaw = x[lanes], y[lanes], yaw[lanes]
+    steps = np.arange(1, args.horizon + 1) * 0.5
+    heading = np.radians(actor_yaw)[:, np.newaxis]
+    trajectories = np.stack((actor_x[:, np.newaxis] + steps * np.cos(heading),
+                             actor_y[:, np.newaxis] + steps * np.sin(heading)), axis=-1)
+
+    view = BirdEyeView(width, height, args.scale, road)
+    times = np.zeros((args.frames, 3))
+    for frame in range(args.frames):
+        # The ego circles the first block
+        angle = 2.0 * math.pi * frame / args.frames
+        ego_x, ego_y = 50.0 + 45.0 * math.cos(angle), 50.0 + 45.0 * math.sin(angle)
+        ego_yaw = math.degrees(angle) + 90.0
+        begin = time.perf_counter()
+        view.begin(ego_x, ego_y, ego_yaw)
+        road_done = time.perf_counter()
+        view.draw_polylines(trajectories, (255, 255, 255), 3.0)
+        view.draw_boxes(actor_x, actor_y, actor_yaw, 2.4, 1.0, (0, 255, 0))
+        view.draw_boxes([ego_x], [ego_y], [ego_yaw], 2.4, 1.0, (255, 0, 0))
+        boxes_done = time.perf_counter()
+        times[frame] = (road_done - begin, boxes_done - road_done, boxes_done - begin)
+
+    times *= 1e3
+    total = times[:, 2]
+    print('Frame %dx%d, %d actors, %d trajectory points each' % (width, height, args.actors, args.horizon))
+    print('  road layer:               mean %.2f ms, p99 %.2f ms' % (times[:, 0].mean(), np.percentile(times[:, 0], 99)))
+    print('  trajectories and vehicles: mean %.2f ms, p99 %.2f ms' % (times[:, 1].mean(), np.percentile(times[:, 1], 99)))
+    print('  frame:                    mean %.2f ms, p99 %.2f ms, %.0f FPS' % (
+        total.mean(), np.percentile(total, 99), 1e3 / total.mean()))
+    if args.target_fps > 0 and total.mean() > 1e3 / args.target_fps:
+        failed.append('%.2f ms per frame, above the %.2f ms of %.0f FPS' % (
+            total.mean(), 1e3 / args.target_fps, args.target_fps))
+
+    for failure in failed:
+        print('FAILED: %s' % failure)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Calibrate the steering wheel and pedals for a driver.
+
+The driver follows the calibration steps (rest, full sweeps of the wheel and
+of each pedal, each pedal held at half) while the raw axes are recorded, and
+the fitted profile (axis of each control, range, deadzone and pedal response
+curve, see smartcities.controls.calibration) is saved under the guid of the
+device. The clients load it with --calibration and --driver.
+
+    python calibrate_wheel.py --driver alex
+    python calibrate_wheel.py --backend winmm --calibration D:\\rig\\calibration_profiles.json
+
+With --simulate, a simulated driver calibrates a wheel with the G29 axis
+layout, offsets, noise and a non linear brake: the fitted profile must find
+the axes and reproduce the pedal curve, and the cost of the lookup tables is
+compared with the calibration arithmetic. Nothing is saved unless
+--calibration is given.
+"""
+
+from __future__ import print_function
+
+import argparse
+import math
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartcities.controls.calibration import (  # pylint: disable=import-error
+    CALIBRATION_STEPS, CalibrationStore, calibrate_array, fit_profile)
+from smartcities.controls.input_device import AXES, BACKENDS, DEFAULT_BACKEND, create_backend  # pylint: disable=import-error
+
+# Raw axes of the simulated wheel, G29 layout of wheel_config.ini: wheel 0, clutch 1, throttle 2, brake 3
+SIMULATED_AXES = {'steer': 0, 'clutch': 1, 'throttle': 2, 'brake': 3}
+# Brake pedal position felt as half braking by the simulated driver
+SIMULATED_HALF_BRAKE = 0.7
+
+
+class SimulatedDriver(object):
+    """Raw axes of a simulated G29 and of a driver following the calibration steps."""
+
+    def __init__(self, step_time, seed=1):
+        self.step_time = step_time
+        self.rng = np.random.RandomState(seed)
+        self.step = 'rest'
+        self.start = time.perf_counter()
+        self.name = 'simulated G29'
+        self.guid = 'simulated'
+
+    def begin(self, step):
+        self.step = step
+        self.start = time.perf_counter()
+
+    def poll(self):
+        # One sweep per step
+        t = (time.perf_counter() - self.start) / self.step_time
+        # Pedals at rest read slightly below 1, the wheel rests slightly right of center
+        axes = np.array([0.02, 0.97, 0.98, 0.96, 1.0, 0.0])
+        sweep = 0.5 - 0.5 * math.cos(2.0 * math.pi * t)
+        if self.step == 'steer':
+            axes[SIMULATED_AXES['steer']] = math.sin(2.0 * math.pi * t)
+        elif self.step in SIMULATED_AXES:
+            index = SIMULATED_AXES[self.step]
+            axes[index] = axes[index] - sweep * (axes[index] + 0.99)
+        elif self.step == 'throttle_half':
+            axes[SIMULATED_AXES['throttle']] = 0.97 - 0.5 * (0.97 + 0.99)
+        elif self.step == 'brake_half':
+            axes[SIMULATED_AXES['brake']] = 0.96 - SIMULATED_HALF_BRAKE * (0.96 + 0.99)
+        axes += self.rng.normal(0.0, 0.002, axes.shape)
+        # 16 bit resolution of the device
+        return tuple(np.round(np.clip(axes, -1.0, 1.0) * 32767.0) / 32767.0), 0
+
+    def close(self):
+        pass
+
+
+def record(backend, seconds, rate=500.0, pump=None):
+    samples = []
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        if pump is not None:
+            pump()
+        samples.append(backend.poll()[0])
+        time.sleep(1.0 / rate)
+    return np.array(samples)
+
+
+def check_simulated(profile):
+    failed = []
+    for control, index in SIMULATED_AXES.items():
+        if profile.axes[control][0] != index:
+            failed.append('%s found on axis %d instead of %d' % (control, profile.axes[control][0], index))
+    steer = profile.axes['steer'][1]
+    if steer.low > -0.99 or steer.high < 0.99 or steer.deadzone > 0.05:
+        failed.append('steering range [%.3f, %.3f] or deadzone %.3f' % (steer.low, steer.high, steer.deadzone))
+    brake = profile.axes['brake'][1]
+    half = calibrate_array(brake, [0.96 - SIMULATED_HALF_BRAKE * (0.96 + 0.99)])[0]
+    print('Simulated half braking position reads %.3f' % half)
+    if abs(half - 0.5) > 0.02:
+        failed.append('half braking reads %.3f instead of 0.5' % half)
+    return failed
+
+
+def benchmark(profile, samples=20000):
+    raw = np.random.RandomState(0).uniform(-1.0, 1.0, samples).tolist()
+    layout = profile.layout()
+    for name, (index, lookup) in layout.items():
+        calibration = profile.axes[name][1]
+        start = time.perf_counter()
+        for value in raw:
+            calibration.apply(value)
+        arithmetic = time.perf_counter() - start
+        apply = lookup.apply
+        start = time.perf_counter()
+        for value in raw:
+            apply(value)
+        table = time.perf_counter() - start
+        error = max(abs(lookup.apply(value) - calibration.apply(value)) for value in raw)
+        print('  %-8s %.3f us arithmetic, %.3f us table lookup, largest difference %.1e' % (
+            name, arithmetic / samples * 1e6, table / samples * 1e6, error))
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--backend',
+        choices=[backend for backend in BACKENDS if backend != 'synthetic'],
+        default=DEFAULT_BACKEND,
+        help='how the wheel is read, the profiles are stored per backend device so use the --input_backend of the '
+             'clients (default: winmm on Windows, pygame elsewhere)')
+    argparser.add_argument(
+        '--calibration',
+        default=None,
+        help='JSON file of the calibration profiles (default: calibration_profiles.json in the current directory)')
+    argparser.add_argument(
+        '--driver',
+        default=None,
+        help='driver name of the profile (default: the default profile of the device)')
+    argparser.add_argument(
+        '--step_time',
+        default=4.0,
+        type=float,
+        help='seconds recorded per calibration step (default: 4)')
+    argparser.add_argument(
+        '--simulate',
+        action='store_true',
+        help='calibrate a simulated wheel and check the fitted profile')
+    args = argparser.parse_args()
+
+    pump = None
+    if args.simulate:
+        backend = SimulatedDriver(args.step_time)
+    else:
+        joystick = None
+        if args.backend == 'pygame':
+            import pygame  # pylint: disable=import-error
+            pygame.init()
+            pygame.joystick.init()
+            if pygame.joystick.get_count():
+                joystick = pygame.joystick.Joystick(0)
+                joystick.init()
+            pump = pygame.event.pump
+        backend = create_backend(args.backend, joystick)
+        print('Calibrating %s (%s)' % (backend.name, backend.guid))
+
+    steps = {}
+    for step, instruction in CALIBRATION_STEPS:
+        if args.simulate:
+            backend.begin(step)
+        else:
+            try:
+                input('%s, then press Enter (Ctrl+C to skip the remaining steps) ' % instruction)
+            except KeyboardInterrupt:
+                print()
+                break
+        steps[step] = record(backend, args.step_time, pump=pump)
+    backend.close()
+
+    profile = fit_profile(backend.guid, backend.name, steps, driver=args.driver)
+    print('\n%-8s %4s %9s %9s %9s %9s' % ('control', 'axis', 'low', 'high', 'deadzone', 'exponent'))
+    for name in AXES:
+        if name in profile.axes:
+            index, calibration = profile.axes[name]
+            print('%-8s %4d %9.4f %9.4f %9.4f %9.3f' % (
+                name, index, calibration.low, calibration.high, calibration.deadzone, calibration.exponent))
+
+    print('\nCost per axis value')
+    benchmark(profile)
+
+    if args.simulate:
+        failed = check_simulated(profile)
+        for failure in failed:
+            print('FAILED: %s' % failure)
+        if failed:
+            sys.exit(1)
+        if args.calibration is None:
+            return
+
+    path = args.calibration or os.path.join(os.getcwd(), 'calibration_profiles.json')
+    store = CalibrationStore(path)
+    store.put(profile)
+    store.save()
+    print('Profile of %s saved to %s' % (args.driver or 'the default driver', path))
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Check and benchmark of the dataset writer of sensor_data_collection.py
+(smartcities.sensors.dataset), without CARLA.
+
+Simulated camera, LiDAR, GNSS and IMU sensors deliver --frames measurements
+from their own threads, as the CARLA callbacks do, and the camera misses one
+frame in --gap. The callbacks copy the measurements into a DatasetWriter and
+the records are read back with read_dataset(). The script fails (exit status
+1) if:
+
+  * a frame is missing, out of order, has a stream it should not, or an array
+    differs from the measurement, including after the sensor buffer is reused;
+  * with a queue of one record and one slow worker, the dropped records are
+    not counted or are written all the same.
+
+The time spent in the callbacks is printed next to the time of saving each
+record synchronously, as the callbacks did before.
+
+    python dataset_writer_check.py --frames 200 --width 800 --height 600
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartcities.sensors.dataset import DatasetWriter, read_dataset  # pylint: disable=import-error
+from smartcities.sensors.dataset import camera_arrays, gnss_arrays, imu_arrays, lidar_arrays  # pylint: disable=import-error
+
+# Stand-ins of the carla types read by the writer
+Vector = collections.namedtuple('Vector', ['x', 'y', 'z'])
+Rotation = collections.namedtuple('Rotation', ['pitch', 'yaw', 'roll'])
+Transform = collections.namedtuple('Transform', ['location', 'rotation'])
+Image = collections.namedtuple('Image', ['frame', 'timestamp', 'transform', 'width', 'height', 'raw_data'])
+LidarMeasurement = collections.namedtuple('LidarMeasurement', ['frame', 'timestamp', 'transform', 'raw_data'])
+GnssMeasurement = collections.namedtuple('GnssMeasurement', [
+    'frame', 'timestamp', 'transform', 'latitude', 'longitude', 'altitude'])
+IMUMeasurement = collections.namedtuple('IMUMeasurement', [
+    'frame', 'timestamp', 'transform', 'accelerometer', 'gyroscope', 'compass'])
+
+STREAMS = ('camera', 'lidar', 'gnss', 'imu')
+TRANSFORM = Transform(Vector(-61.8, 133.0, 6.5), Rotation(0.0, 90.0, 0.0))
+
+
+def pixels(frame, args):
+    """Camera image of a frame, mostly smooth as the rendered images."""
+    row = (np.arange(args.width * 4) // 16 + frame) % 256
+    return np.broadcast_to(row, (args.height, args.width * 4)).reshape(args.height, args.width, 4).astype(np.uint8)
+
+
+def points(frame, args):
+    return np.random.RandomState(frame).uniform(-50.0, 50.0, (args.points, 4)).astype(np.float32)
+
+
+class Sensor(threading.Thread):
+    """Delivers the measurements of one stream to its callback, reusing one raw buffer as CARLA does."""
+
+    def __init__(self, stream, args, callback, period):
+        super(Sensor, self).__init__(name=stream)
+        self.stream = stream
+        self.args = args
+        self.callback = callback
+        self.period = period
+        self.callback_times = []
+
+    def measurement(self, frame, buffer):
+        timestamp = frame * 0.05
+        if self.stream == 'camera':
+            buffer[:] = pixels(frame, self.args).tobytes()
+            return Image(frame, timestamp, TRANSFORM, self.args.width, self.args.height, buffer)
+        if self.stream == 'lidar':
+            buffer[:] = points(frame, self.args).tobytes()
+            return LidarMeasurement(frame, timestamp, TRANSFORM, buffer)
+        if self.stream == 'gnss':
+            return GnssMeasurement(frame, timestamp, TRANSFORM, 49.0 + frame * 1e-6, 8.0, 6.5)
+        return IMUMeasurement(frame, timestamp, TRANSFORM, Vector(0.0, 0.0, 9.81), Vector(0.0, 0.0, frame * 1e-3),
+                              frame * 1e-3)
+
+    def run(self):
+        size = {'camera': self.args.width * self.args.height * 4, 'lidar': self.args.points * 16}
+        buffer = bytearray(size.get(self.stream, 0))
+        start = time.perf_counter()
+        for frame in range(1, self.args.frames + 1):
+            if self.stream == 'camera' and frame % self.args.gap == 0:
+                continue
+            data = self.measurement(frame, buffer)
+            tick = time.perf_counter()
+            self.callback(self.stream, data)
+            self.callback_times.append(time.perf_counter() - tick)
+            # The simulation runs on while the data is written
+            time.sleep(max(0.0, start + frame * self.period - time.perf_counter()))
+
+
+COPY = {'camera': camera_arrays, 'lidar': lidar_arrays, 'gnss': gnss_arrays, 'imu': imu_arrays}
+
+
+def record(writer, args, period):
+    sensors = [Sensor(stream, args, lambda stream, data: writer.put(stream, data.frame, COPY[stream](data)), period)
+               for stream in STREAMS]
+    for sensor in sensors:
+        sensor.start()
+    for sensor in sensors:
+        sensor.join()
+    writer.close()
+    return np.concatenate([sensor.callback_times for sensor in sensors if sensor.stream == 'camera'])
+
+
+def check_records(dirname, args):
+    failed = []
+    frames = []
+    for frame, streams in read_dataset(dirname):
+        frames.append(frame)
+        expected = set(STREAMS) - ({'camera'} if frame % args.gap == 0 else set())
+        if set(streams) != expected:
+            failed.append('frame %d has the streams %s' % (frame, sorted(streams)))
+            continue
+        if 'camera' in streams and not np.array_equal(streams['camera']['image'], pixels(frame, args)):
+            failed.append('camera image of frame %d differs' % frame)
+        if not np.array_equal(streams['lidar']['points'], points(frame, args)):
+            failed.append('lidar points of frame %d differ' % frame)
+        if streams['gnss']['position'][0] != 49.0 + frame * 1e-6 or streams['imu']['compass'] != frame * 1e-3:
+            failed.append('GNSS or IMU of frame %d differs' % frame)
+        if streams['lidar']['timestamp'] != frame * 0.05 or streams['imu']['transform'][4] != 90.0:
+            failed.append('timestamp or transform of frame %d differs' % frame)
+    if frames != list(range(1, args.frames + 1)):
+        failed.append('%d frames read back instead of %d, in order' % (len(frames), args.frames))
+    return failed
+
+
+def check_backpressure(dirname, args):
+    """One slow worker and a queue of one record, the simulation must not wait and the drops must be counted."""
+    writer = DatasetWriter(dirname, STREAMS, workers=1, queue_size=1, compresslevel=9)
+    record(writer, args, 0.0)
+    stats = writer.summary()
+    written = sum(1 for _ in read_dataset(dirname))
+    print('Backpressure: ' + str(writer))
+    failed = []
+    if stats['dropped'] == 0:
+        failed.append('no record dropped with a queue of one record')
+    if stats['written'] + stats['dropped'] != stats['records'] or written != stats['written']:
+        failed.append('%d records, %d written, %d dropped but %d read back' % (
+            stats['records'], stats['written'], stats['dropped'], written))
+    return failed
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--frames',
+        default=200,
+        type=int,
+        help='frames recorded (default: 200)')
+    argparser.add_argument(
+        '--width',
+        default=800,
+        type=int,
+        help='camera image width (default: 800)')
+    argparser.add_argument(
+        '--height',
+        default=600,
+        type=int,
+        help='camera image height (default: 600)')
+    argparser.add_argument(
+        '--points',
+        default=50000,
+        type=int,
+        help='LiDAR points per frame (default: 50000)')
+    argparser.add_argument(
+        '--gap',
+        default=17,
+        type=int,
+        help='the camera misses every frame multiple of this (default: 17)')
+    argparser.add_argument(
+        '--workers',
+        default=2,
+        type=int,
+        help='writer threads (default: 2)')
+    argparser.add_argument(
+        '--fps',
+        default=20.0,
+        type=float,
+        help='simulated frame rate (default: 20)')
+    args = argparser.parse_args()
+    failed = []
+
+    dirname = tempfile.mkdtemp()
+    try:
+        writer = DatasetWriter(os.path.join(dirname, 'run'), STREAMS, workers=args.workers, queue_size=64,
+                               shard_records=50)
+        callback_times = record(writer, args, 1.0 / args.fps)
+        print(writer)
+        stats = writer.summary()
+        if stats['dropped'] or stats['late'] or stats['errors']:
+            failed.append('%(dropped)d records dropped, %(late)d late, %(errors)d errors at %(fps).0f FPS' % dict(
+                stats, fps=args.fps))
+        if stats['incomplete'] != args.frames // args.gap:
+            failed.append('%d incomplete records for %d frames without camera' % (
+                stats['incomplete'], args.frames // args.gap))
+        failed += check_records(os.path.join(dirname, 'run'), args)
+
+        # Saving each record in the callback, as before
+        synchronous = []
+        for frame in range(1, 11):
+            image, lidar = pixels(frame, args), points(frame, args)
+            start = time.perf_counter()
+            np.savez_compressed(os.path.join(dirname, '%08d.npz' % frame), image=image, points=lidar)
+            synchronous.append(time.perf_counter() - start)
+        print('Camera callback: median %.2f ms, max %.2f ms, saving in the callback: median %.2f ms' % (
+            np.median(callback_times) * 1e3, callback_times.max() * 1e3, np.median(synchronous) * 1e3))
+
+        failed += check_backpressure(os.path.join(dirname, 'backpressure'), args)
+    finally:
+        shutil.rmtree(dirname)
+
+    for failure in failed:
+        print('FAILED: %s' % failure)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    main()
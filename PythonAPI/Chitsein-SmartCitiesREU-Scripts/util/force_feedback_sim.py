@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Force feedback test on a simulated drive, without CARLA or a wheel.
+
+A kinematic bicycle model drives 40 s of slalom of growing amplitude, up to
+turns beyond the grip limit where the lateral acceleration saturates, with
+some road noise. The render loop publishes a SteeringState per frame into a
+SnapshotSlot while the force feedback thread (MotionScheduler calling
+ForceFeedback.update) sends the torque to a RecordingForceBackend. The drive is
+then replayed on a virtual clock, with exact tick times.
+
+The test fails (exit status 1) if:
+
+  * the torque does not oppose the road wheel angle in the turns within grip
+    (centering and self-aligning torque);
+  * the torque per degree of road wheel angle in the slides is not lighter
+    than in the firm turns within grip;
+  * a tick of the replay changes the torque faster than the slew limit.
+
+    python force_feedback_sim.py --rate 500 --fps 30
+"""
+
+from __future__ import print_function
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartcities.controls.force_feedback import (  # pylint: disable=import-error
+    ForceFeedback, RecordingForceBackend, SteeringFeelModel, SteeringState)
+from smartcities.motion.scheduler import MotionScheduler, SnapshotSlot  # pylint: disable=import-error
+
+DRIVE_TIME = 40.0
+WHEELBASE = 2.9
+MAX_STEER_ANGLE = 70.0
+# Lateral acceleration at which the simulated tyres slide, in m/s^2
+SLIDE = 9.0
+
+
+def simulated_state(t, speed, rng):
+    # Slalom at 0.25 Hz, the amplitude grows from 1 to 12 degrees of road wheel angle
+    amplitude = 1.0 + 11.0 * min(t / DRIVE_TIME, 1.0)
+    steer_angle = amplitude * math.sin(2.0 * math.pi * 0.25 * t)
+    lateral = speed * speed * math.tan(math.radians(steer_angle)) / WHEELBASE
+    lateral = min(max(lateral, -SLIDE), SLIDE) + rng.gauss(0.0, 0.2)
+    return SteeringState(t, speed, steer_angle, MAX_STEER_ANGLE, lateral)
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--rate',
+        default=200.0,
+        type=float,
+        help='force feedback rate in Hz (default: 200)')
+    argparser.add_argument(
+        '--fps',
+        default=60.0,
+        type=float,
+        help='simulated render frame rate (default: 60)')
+    argparser.add_argument(
+        '--speed',
+        default=15.0,
+        type=float,
+        help='vehicle speed in m/s (default: 15)')
+    argparser.add_argument(
+        '--max_slew',
+        default=10.0,
+        type=float,
+        help='slew limit of the torque in full scale per second (default: 10)')
+    argparser.add_argument(
+        '--duration',
+        default=10.0,
+        type=float,
+        help='seconds of wall time the 40 s drive is played in (default: 10)')
+    argparser.add_argument(
+        '--seed',
+        default=1,
+        type=int,
+        help='seed of the road noise (default: 1)')
+    args = argparser.parse_args()
+
+    rng = random.Random(args.seed)
+    backend = RecordingForceBackend()
+    force_feedback = ForceFeedback(backend, max_slew=args.max_slew)
+    slot = SnapshotSlot()
+    scheduler = MotionScheduler(
+        slot, force_feedback.update, args.rate, name='ForceFeedback', label='force feedback')
+    scheduler.start()
+
+    states = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < args.duration:
+        frame_start = time.perf_counter()
+        state = simulated_state(DRIVE_TIME / args.duration * (frame_start - start), args.speed, rng)
+        states.append(state)
+        slot.publish(state)
+        time.sleep(max(0.0, 1.0 / args.fps - (time.perf_counter() - frame_start)))
+    scheduler.stop()
+    force_feedback.close()
+
+    # Torque of each state, on a model of its own
+    model = SteeringFeelModel()
+    targets = np.array([model.torque(state) for state in states])
+    steer = np.array([state.steer_angle for state in states])
+    lateral = np.array([state.lateral_acceleration for state in states])
+    within_grip = (np.abs(steer) > 0.5) & (np.abs(lateral) < 0.6 * SLIDE)
+    opposing = np.mean(targets[within_grip] * steer[within_grip] < 0) if within_grip.any() else 0.0
+
+    # Torque per degree of road wheel angle in the slides against the firm turns within grip
+    firm = within_grip & (np.abs(lateral) > 0.3 * SLIDE)
+    sliding = (np.abs(steer) > 0.5) & (np.abs(lateral) > 0.95 * SLIDE)
+    grip_stiffness = np.median(np.abs(targets[firm] / steer[firm])) if firm.any() else float('nan')
+    slide_stiffness = np.median(np.abs(targets[sliding] / steer[sliding])) if sliding.any() else float('nan')
+
+    commands = np.array([(command.timestamp, command.torque) for command in backend.commands])
+
+    # Replay with ticks at exactly the rate, the states arriving at the frame rate
+    virtual_time = [0.0]
+    replay_backend = RecordingForceBackend(clock=lambda: virtual_time[0])
+    replay = ForceFeedback(replay_backend, max_slew=args.max_slew, clock=lambda: virtual_time[0])
+    frame_time = args.duration / len(states)
+    for tick in range(int(args.duration * args.rate)):
+        virtual_time[0] = tick / args.rate
+        replay.update(states[min(int(virtual_time[0] / frame_time), len(states) - 1)])
+    replayed = np.array([(command.timestamp, command.torque) for command in replay_backend.commands])
+    steps = np.abs(np.diff(replayed[:, 1]))
+    slew = steps / np.diff(replayed[:, 0])
+    slew_excess = steps - args.max_slew * np.diff(replayed[:, 0])
+
+    print('Render loop: %d frames' % len(states))
+    print('Thread:      %s' % scheduler.stats)
+    print('Torque:      %d commands, range [%.2f, %.2f], %d saturated states' % (
+        len(commands), commands[:, 1].min(), commands[:, 1].max(), force_feedback.saturated))
+    print('  opposing the road wheel angle within grip: %.1f%% of %d states' % (
+        100.0 * opposing, np.count_nonzero(within_grip)))
+    print('  torque per degree of road wheel angle: %.4f in firm turns, %.4f sliding' % (
+        grip_stiffness, slide_stiffness))
+    print('Replay:      %d ticks, largest slew %.2f/s (limit %.2f/s)' % (len(replayed), slew.max(), args.max_slew))
+
+    failed = []
+    if scheduler.error is not None:
+        failed.append('thread error: %s' % scheduler.error)
+    if opposing < 0.95:
+        failed.append('the torque does not center the wheel within grip')
+    if not firm.any() or not sliding.any():
+        print('The drive has no firm turn or no slide at this speed, the slide check is skipped')
+    elif not slide_stiffness < grip_stiffness:
+        failed.append('the wheel does not go light in the slides')
+    if (slew_excess > 1e-9).any():
+        failed.append('%d ticks above the slew limit' % np.count_nonzero(slew_excess > 1e-9))
+    if not backend.closed:
+        failed.append('the backend was not closed')
+    for failure in failed:
+        print('FAILED: %s' % failure)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    main()
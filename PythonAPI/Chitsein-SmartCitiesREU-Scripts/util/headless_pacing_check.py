@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Check of the pacing of the headless batch mode (smartcities.motion.headless),
+without CARLA or a motion platform.
+
+A simulated server tick (a sleep of --tick_cost) feeds the two motion stacks
+the way the headless clients do:
+
+  * Eleetus: a MotionScheduler thread at --rate takes the snapshots, each
+    tick waits in MotionScheduler.wait_consumed();
+  * SimCraft: a thread reads the newest sample of the ring buffer at --rate
+    and reports the sample of each command as SimController.cs does, each
+    tick waits in MotionRingPublisher.wait_consumed();
+  * UDP: nothing to wait on, each tick is paced to real time with
+    TickRateMeter.pace().
+
+The check fails (exit status 1) if a sample is skipped by the consumer, if the
+ticks run faster than the consumer or much slower than the slower of the
+consumer and the server, if the paced ticks are not at 1 / --fixed_delta, or
+if a ring publisher without consumer blocks.
+
+    python headless_pacing_check.py --rate 100 --tick_cost 0.002
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartcities.motion.headless import TickRateMeter  # pylint: disable=import-error
+from smartcities.motion.scheduler import MotionScheduler, SnapshotSlot  # pylint: disable=import-error
+from smartcities.motion.shared_memory import MotionRingPublisher, MotionRingReader  # pylint: disable=import-error
+
+
+def run_scheduler(args):
+    consumed = []
+    slot = SnapshotSlot()
+    scheduler = MotionScheduler(slot, lambda value, timestamp: consumed.append(value), args.rate)
+    scheduler.start()
+    meter = TickRateMeter(args.fixed_delta, report_interval=0)
+    meter.begin()
+    try:
+        for tick in range(args.ticks):
+            time.sleep(args.tick_cost)
+            seq = slot.publish(tick)
+            begin = time.perf_counter()
+            scheduler.wait_consumed(seq, timeout=1.0)
+            meter.tick(time.perf_counter() - begin)
+    finally:
+        scheduler.stop()
+    # The scheduler passes the latest snapshot again when nothing new was published
+    skipped = args.ticks - len(set(consumed))
+    return meter.rate(), str(meter), skipped
+
+
+def run_ring(args, path):
+    publisher = MotionRingPublisher(path)
+    reader = MotionRingReader(path)
+    stop = threading.Event()
+
+    def consume():
+        reports = 0
+        next_time = time.perf_counter()
+        while not stop.is_set():
+            sample = reader.read_latest()
+            if sample is not None:
+                reports += 1
+                reader.report(sample.seq, reports)
+            next_time += 1.0 / args.rate
+            time.sleep(max(0.0, next_time - time.perf_counter()))
+
+    consumer = threading.Thread(target=consume, name='SimulatedSimController')
+    consumer.daemon = True
+    consumer.start()
+    meter = TickRateMeter(args.fixed_delta, report_interval=0)
+    try:
+        # The first sample starts the consumer, nothing to wait for before its first report
+        publisher.publish(0.0, 0.0, 0.0, 0.0, 0.0)
+        while publisher.consumer_status().reports == 0:
+            time.sleep(0.001)
+        meter.begin()
+        for tick in range(args.ticks):
+            time.sleep(args.tick_cost)
+            publisher.publish(0.0, float(tick), 0.0, 0.0, 0.0)
+            begin = time.perf_counter()
+            publisher.wait_consumed(timeout=1.0)
+            meter.tick(time.perf_counter() - begin)
+        rate = meter.rate()
+    finally:
+        stop.set()
+        consumer.join(1.0)
+        reader.close()
+        publisher.close()
+    return rate, str(meter), reader.samples_missed
+
+
+def run_paced(args):
+    meter = TickRateMeter(args.fixed_delta, report_interval=0, waiting_for='real time')
+    meter.begin()
+    for _ in range(args.paced_ticks):
+        time.sleep(args.tick_cost)
+        meter.tick(meter.pace())
+    return meter.rate(), str(meter), 0
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--rate',
+        default=100.0,
+        type=float,
+        help='consumer rate in Hz (default: 100)')
+    argparser.add_argument(
+        '--tick_cost',
+        default=0.002,
+        type=float,
+        help='seconds of a simulated server tick (default: 0.002)')
+    argparser.add_argument(
+        '--ticks',
+        default=300,
+        type=int,
+        help='ticks per run (default: 300)')
+    argparser.add_argument(
+        '--fixed_delta',
+        default=0.05,
+        type=float,
+        help='simulation step in seconds (default: 0.05)')
+    argparser.add_argument(
+        '--paced_ticks',
+        default=40,
+        type=int,
+        help='ticks of the run paced to real time (default: 40)')
+    args = argparser.parse_args()
+
+    # Ticks per second of an ideal run, paced by the slower of the two sides
+    expected = min(args.rate, 1.0 / args.tick_cost) if args.tick_cost > 0 else args.rate
+    failed = []
+
+    path = os.path.join(tempfile.mkdtemp(), 'MOTION_DATA_PIPE.bin')
+    runs = [('MotionScheduler', run_scheduler(args)), ('ring buffer', run_ring(args, path))]
+
+    for name, (rate, summary, skipped) in runs:
+        print('%-16s %s, %d samples skipped' % (name + ':', summary, skipped))
+        if skipped:
+            failed.append('%s: %d samples skipped by the consumer' % (name, skipped))
+        if rate > 1.1 * args.rate:
+            failed.append('%s: %.1f ticks/s, faster than the consumer' % (name, rate))
+        if rate < 0.5 * expected:
+            failed.append('%s: %.1f ticks/s, expected about %.1f' % (name, rate, expected))
+
+    rate, summary, _ = run_paced(args)
+    print('%-16s %s' % ('UDP:', summary))
+    if abs(rate * args.fixed_delta - 1.0) > 0.1:
+        failed.append('UDP: %.1f ticks/s, expected %.1f' % (rate, 1.0 / args.fixed_delta))
+    unpaced = TickRateMeter(args.fixed_delta, report_interval=0, waiting_for=None)
+    unpaced.tick()
+    if 'unpaced' not in str(unpaced) or 'waiting' in str(unpaced):
+        failed.append('an unpaced run is reported as %r' % str(unpaced))
+
+    # Without consumer report (SimcraftApp not started) the run must not block
+    publisher = MotionRingPublisher(path)
+    publisher.publish(0.0, 0.0, 0.0, 0.0, 0.0)
+    begin = time.perf_counter()
+    if publisher.wait_consumed(timeout=1.0) or time.perf_counter() - begin > 0.1:
+        failed.append('the ring publisher waited without consumer')
+    publisher.close()
+    os.remove(path)
+
+    for failure in failed:
+        print('FAILED: %s' % failure)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    main()
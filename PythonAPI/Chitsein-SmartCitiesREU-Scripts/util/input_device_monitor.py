@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Monitor of the wheel and pedal input service (smartcities.controls.input_device).
+
+The InputDeviceService thread polls the backend while a simulated render loop
+reads latest() at the frame rate, as KeyboardControl does. The pygame backend
+is polled by the render loop itself, so its effective poll rate is the frame
+rate (--fps), not --rate. The report shows the achieved poll rate, how many
+polls were coalesced (no axis or button change), the cost of a latest() read
+and the time since the last poll when a frame reads the state (the age of the
+input it acts on). With the synthetic
+backend (default, no wheel needed) the states read are also checked against
+the scripted drive.
+
+    python input_device_monitor.py --duration 20
+    python input_device_monitor.py --backend winmm --print
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartcities.controls.input_device import BACKENDS, G27_LAYOUT, InputDeviceService, create_backend  # pylint: disable=import-error
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--backend',
+        choices=BACKENDS,
+        default='synthetic',
+        help='input backend (default: synthetic)')
+    argparser.add_argument(
+        '--rate',
+        default=500.0,
+        type=float,
+        help='poll rate in Hz of the input thread, not used by the pygame backend (default: 500)')
+    argparser.add_argument(
+        '--fps',
+        default=60.0,
+        type=float,
+        help='simulated render frame rate (default: 60)')
+    argparser.add_argument(
+        '--duration',
+        default=10.0,
+        type=float,
+        help='seconds to run (default: 10)')
+    argparser.add_argument(
+        '--print',
+        action='store_true',
+        help='print the state read by each frame when it changed')
+    args = argparser.parse_args()
+
+    pygame = None
+    joystick = None
+    if args.backend == 'pygame':
+        import pygame  # pylint: disable=import-error
+        pygame.init()
+        pygame.joystick.init()
+        if pygame.joystick.get_count():
+            joystick = pygame.joystick.Joystick(0)
+            joystick.init()
+    backend = create_backend(args.backend, joystick)
+    service = InputDeviceService(backend, rate_hz=args.rate)
+    if service.threaded:
+        service.start()
+
+    frame_period = 1.0 / args.fps
+    ages = []
+    read_times = []
+    errors = []
+    seq = None
+    start = time.perf_counter()
+    try:
+        while time.perf_counter() - start < args.duration:
+            frame_start = time.perf_counter()
+            if pygame is not None:
+                pygame.event.pump()
+            if not service.threaded:
+                # pygame backend, polled by the frame loop as in KeyboardControl
+                service.poll()
+            begin = time.perf_counter()
+            state = service.latest()
+            read_times.append(time.perf_counter() - begin)
+            if state.seq:
+                ages.append(frame_start - service.last_poll)
+                if args.backend == 'synthetic':
+                    raw, buttons = backend.drive(state.timestamp - backend.start)
+                    errors.append(max(
+                        abs(calibration.apply(raw[index]) - getattr(state, name))
+                        for name, (index, calibration) in G27_LAYOUT.items()))
+                if args.print and state.seq != seq:
+                    print('%8.3f s  steer %+.3f  throttle %.3f  brake %.3f  clutch %.3f  buttons %s' % (
+                        state.timestamp - start, state.steer, state.throttle, state.brake, state.clutch,
+                        bin(state.buttons)))
+                seq = state.seq
+            time.sleep(max(0.0, frame_period - (time.perf_counter() - frame_start)))
+    finally:
+        service.stop()
+        if pygame is not None:
+            pygame.quit()
+
+    print(service)
+    if not service.threaded:
+        print('  polled by the frame loop, effective poll rate %.0f Hz at --fps %.0f, --rate %.0f not used' % (
+            service.summary()['rate_hz'], args.fps, args.rate))
+    if service.polls:
+        print('  %.1f%% of the polls coalesced' % (100.0 * (service.polls - service.changes) / service.polls))
+    print('  latest(): %.2f us per read (%d frames)' % (np.mean(read_times) * 1e6, len(read_times)))
+    if ages:
+        ages = np.array(ages) * 1e3
+        print('  time since the last poll at the frame: median %.2f ms, p99 %.2f ms, max %.2f ms' % (
+            np.median(ages), np.percentile(ages, 99), ages.max()))
+    if errors:
+        print('  largest calibration error against the scripted drive: %.2e' % max(errors))
+    if service.error is not None:
+        print('  last backend error: %s' % service.error)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Check and benchmark of the lane graph of the lane following predictor
+(smartcities.prediction.lanes.LaneGraph) and of its disk cache, without CARLA.
+
+A simulated map, a crossing of two two-lane roads with a connecting lane in
+the junction from each incoming lane to each outgoing one, answers
+get_topology() and Waypoint.next_until_lane_end() as carla.Map does. The
+script fails (exit status 1) if:
+
+  * the graph does not go straight on at the junction or does not stop at the
+    dead ends;
+  * LaneGraph.follow() differs from a walk along the waypoints, one actor at a
+    time;
+  * map_lane_graph() builds the graph again for the same OpenDRIVE, does not
+    for a changed one, or leaves the older version of the town in the cache.
+
+    python lane_graph_check.py --actors 1000 --horizon 30
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartcities.prediction.lanes import build_lane_graph, map_lane_graph  # pylint: disable=import-error
+
+# Stand-ins of the carla types read when building the graph
+Location = collections.namedtuple('Location', ['x', 'y', 'z'])
+Rotation = collections.namedtuple('Rotation', ['pitch', 'yaw', 'roll'])
+Transform = collections.namedtuple('Transform', ['location', 'rotation'])
+
+ARM = 100.0
+JUNCTION = 10.0
+OFFSET = 1.75
+LANE_WIDTH = 3.5
+
+
+class Waypoint(object):
+    """Point of a straight lane from start to end."""
+
+    def __init__(self, start, end, distance):
+        self._start, self._end = start, end
+        self._length = math.hypot(end[0] - start[0], end[1] - start[1])
+        self._distance = distance
+        heading = math.atan2(end[1] - start[1], end[0] - start[0])
+        self.transform = Transform(Location(start[0] + distance * math.cos(heading),
+                                            start[1] + distance * math.sin(heading), 0.0),
+                                   Rotation(0.0, math.degrees(heading), 0.0))
+        self.lane_width = LANE_WIDTH
+
+    def next_until_lane_end(self, distance):
+        steps = np.arange(self._distance + distance, self._length, distance).tolist() + [self._length]
+        return [Waypoint(self._start, self._end, step) for step in steps]
+
+
+class CrossingMap(object):
+    """Crossing of two two-lane roads at the origin."""
+
+    def __init__(self, name='Town_Crossing', version=1):
+        self.name = 'Carla/Maps/' + name
+        self.version = version
+        self.topology_calls = 0
+        incoming, outgoing = [], []
+        for angle in (0.0, 90.0, 180.0, 270.0):
+            # Arm of the road in this direction from the centre, lanes as seen driving towards it
+            c, s = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+            far, near = (ARM * c, ARM * s), (JUNCTION * c, JUNCTION * s)
+            side = (OFFSET * -s, OFFSET * c)
+            incoming.append(((far[0] + side[0], far[1] + side[1]), (near[0] + side[0], near[1] + side[1])))
+            outgoing.append(((near[0] - side[0], near[1] - side[1]), (far[0] - side[0], far[1] - side[1])))
+        self.lanes = incoming + outgoing
+        # Connecting lanes, from each incoming lane to the outgoing lanes of the three other arms
+        self.connections = {}
+        for arm, (_, end) in enumerate(incoming):
+            for other, (start, _) in enumerate(outgoing):
+                if other != arm:
+                    self.connections[(arm, other)] = len(self.lanes)
+                    self.lanes.append((end, start))
+
+    def to_opendrive(self):
+        return '<OpenDRIVE version="%d"/>' % self.version
+
+    def get_topology(self):
+        self.topology_calls += 1
+        return [(Waypoint(start, end, 0.0), Waypoint(start, end, math.hypot(end[0] - start[0], end[1] - start[1])))
+                for start, end in self.lanes]
+
+
+def walk(graph, index, distance):
+    """Position at an arc length from the start of the segment of a waypoint, one step at a time."""
+    segment = graph.segment[index]
+    s = max(distance, 0.0)
+    for _ in range(100):
+        if s <= graph.segment_length[segment] or graph.straight[segment] < 0:
+            break
+        s -= graph.segment_length[segment]
+        segment = graph.straight[segment]
+    s = min(s, graph.segment_length[segment])
+    start, end = graph.segment_starts[segment], graph.segment_ends[segment]
+    for waypoint in range(start, end):
+        if graph.s[waypoint + 1] >= s:
+            gap = graph.s[waypoint + 1] - graph.s[waypoint]
+            fraction = (s - graph.s[waypoint]) / gap if gap > 0 else 0.0
+            return (graph.x[waypoint] + fraction * (graph.x[waypoint + 1] - graph.x[waypoint]),
+                    graph.y[waypoint] + fraction * (graph.y[waypoint + 1] - graph.y[waypoint]))
+    return graph.x[end], graph.y[end]
+
+
+def check_graph(town, graph, rng):
+    failed = []
+    if len(graph.segment_starts) != len(town.lanes):
+        failed.append('%d segments for %d lanes' % (len(graph.segment_starts), len(town.lanes)))
+    for arm in range(4):
+        straight = town.connections[(arm, (arm + 2) % 4)]
+        if graph.straight[arm] != straight or graph.straight[straight] != 4 + (arm + 2) % 4:
+            failed.append('arm %d does not go straight on through the junction' % arm)
+        if graph.straight[4 + arm] != -1:
+            failed.append('outgoing lane %d is not a dead end' % arm)
+
+    # From the start of the first incoming lane (east arm, driving west) to the far end of the west arm
+    x, y, _ = graph.follow(np.array([0]), np.array([[0.0, ARM - JUNCTION + 1.0, 1000.0]]))
+    expected = [(ARM, OFFSET), (JUNCTION - 1.0, OFFSET), (-ARM, OFFSET)]
+    if not np.allclose(np.stack((x[0], y[0]), axis=-1), expected, atol=1e-6):
+        failed.append('positions %s along the east arm instead of %s' % (np.stack((x[0], y[0]), -1).round(2), expected))
+
+    count = 300
+    index = rng.randint(0, len(graph), count)
+    distance = rng.uniform(-5.0, 250.0, (count, 7))
+    x, y, _ = graph.follow(index, distance)
+    expected = np.array([[walk(graph, index[i], distance[i, j]) for j in range(distance.shape[1])]
+                         for i in range(count)])
+    error = np.hypot(x - expected[..., 0], y - expected[..., 1])
+    if error.max() > 1e-6:
+        failed.append('follow() differs from the walk along the waypoints by up to %.3g m' % error.max())
+    return failed
+
+
+def check_cache(spacing):
+    failed = []
+    dirname = tempfile.mkdtemp()
+    try:
+        town = CrossingMap()
+        built = map_lane_graph(town, spacing, dirname)
+        loaded = map_lane_graph(town, spacing, dirname)
+        if town.topology_calls != 1:
+            failed.append('graph built %d times for the same OpenDRIVE' % town.topology_calls)
+        for key, value in built.arrays().items():
+            if not np.array_equal(value, loaded.arrays()[key]):
+                failed.append('cached %s differs from the built one' % key)
+        if not np.array_equal(built.straight, loaded.straight):
+            failed.append('cached graph goes another way at the junction')
+
+        # A town whose name starts as the other one keeps its cache
+        other = CrossingMap('Town_Crossing_Opt')
+        map_lane_graph(other, spacing, dirname)
+        changed = CrossingMap(version=2)
+        map_lane_graph(changed, spacing, dirname)
+        files = sorted(os.listdir(os.path.join(dirname, 'lanes')))
+        if changed.topology_calls != 1:
+            failed.append('graph not built again for a changed OpenDRIVE')
+        if len(files) != 2 or not any(name.startswith('Town_Crossing_Opt_') for name in files):
+            failed.append('cache files %s, expected the new version of each town' % files)
+    finally:
+        shutil.rmtree(dirname)
+    return failed
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--actors',
+        default=1000,
+        type=int,
+        help='actors followed in the benchmark (default: 1000)')
+    argparser.add_argument(
+        '--horizon',
+        default=30,
+        type=int,
+        help='positions per actor (default: 30)')
+    argparser.add_argument(
+        '--spacing',
+        default=1.0,
+        type=float,
+        help='distance between the waypoints in metres (default: 1)')
+    args = argparser.parse_args()
+    rng = np.random.RandomState(1)
+
+    town = CrossingMap()
+    start = time.perf_counter()
+    graph = build_lane_graph(town, args.spacing)
+    print('Lane graph: %d waypoints, %d segments in %.1f ms' % (
+        len(graph), len(graph.segment_starts), (time.perf_counter() - start) * 1e3))
+    failed = check_graph(town, graph, rng) + check_cache(args.spacing)
+
+    x, y = rng.uniform(-ARM, ARM, args.actors), rng.choice([-OFFSET, OFFSET], args.actors)
+    distance = rng.uniform(0.0, 15.0, (args.actors, 1)) * 0.1 * np.arange(1, args.horizon + 1)
+    times = []
+    for _ in range(50):
+        start = time.perf_counter()
+        index = graph.nearest(x, y, np.where(y > 0.0, 180.0, 0.0))
+        found = np.flatnonzero(index >= 0)
+        graph.follow(index[found], graph.along(x[found], y[found], index[found])[:, np.newaxis] + distance[found])
+        times.append(time.perf_counter() - start)
+    print('nearest() and follow() of %d actors, %d positions each: median %.3f ms' % (
+        args.actors, args.horizon, np.median(times) * 1e3))
+
+    for failure in failed:
+        print('FAILED: %s' % failure)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Check and benchmark of the LiDAR bird's-eye view of the sensor callbacks
+(smartcities.sensors.lidar), without CARLA.
+
+Simulated sweeps of --points points within the range of the sensor, plus
+points beyond it, are drawn by the code the callbacks ran before (a copy of
+the points, then one new array per step and a new image per sweep) and by a
+LidarRasterizer in each mode. The script fails (exit status 1) if:
+
+  * the occupancy image differs from the one drawn before, for the points in
+    range;
+  * a point out of range is drawn, or the count mode loses points;
+  * the intensity or height of a pixel drawn by a single point is not the
+    colour of that point.
+
+    python lidar_raster_benchmark.py --points 100000 300000 1000000
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartcities.sensors.lidar import MODES, LidarRasterizer  # pylint: disable=import-error
+
+LIDAR_RANGE = 50.0
+
+
+def draw_before(raw_data, dim, lidar_range):
+    """The LiDAR image of SensorManager._parse_image before the rasterizer, without the pygame surface."""
+    points = np.frombuffer(raw_data, dtype=np.dtype('f4'))
+    points = np.reshape(points, (int(points.shape[0] / 4), 4))
+    lidar_data = np.array(points[:, :2])
+    lidar_data *= min(dim) / (2.0 * lidar_range)
+    lidar_data += (0.5 * dim[0], 0.5 * dim[1])
+    lidar_data = np.fabs(lidar_data)  # pylint: disable=E1111
+    lidar_data = lidar_data.astype(np.int32)
+    lidar_data = np.reshape(lidar_data, (-1, 2))
+    lidar_img_size = (dim[0], dim[1], 3)
+    lidar_img = np.zeros((lidar_img_size), dtype=np.uint8)
+    lidar_img[tuple(lidar_data.T)] = (255, 255, 255)
+    return lidar_img
+
+
+def sweep(rng, count, lidar_range):
+    """Raw buffer of a sweep, points within the range of the sensor, heights from -2.5 to 3 m."""
+    angle = rng.uniform(0.0, 2.0 * np.pi, count)
+    distance = lidar_range * np.sqrt(rng.uniform(0.0, 0.999, count))
+    points = np.stack((distance * np.cos(angle), distance * np.sin(angle), rng.uniform(-2.5, 3.0, count),
+                       rng.uniform(0.0, 1.0, count)), axis=-1).astype(np.float32)
+    return points.tobytes()
+
+
+def check(args, rng):
+    failed = []
+    dim = tuple(args.dim)
+    raw_data = sweep(rng, 20000, LIDAR_RANGE)
+    rasterizer = LidarRasterizer(dim[0], dim[1], LIDAR_RANGE)
+    if not np.array_equal(rasterizer.rasterize(raw_data), draw_before(raw_data, dim, LIDAR_RANGE)):
+        failed.append('occupancy image differs from the one drawn before')
+
+    # Points past each side of the image, the image must stay the same. The range is to the closest border, the
+    # y axis of a wide image, x reaches further.
+    image = rasterizer.rasterize(raw_data).copy()
+    x_out = 0.5 * dim[0] / rasterizer.scale + 1.0
+    y_out = 0.5 * dim[1] / rasterizer.scale + 1.0
+    far = np.array([[x, y, 0.0, 1.0] for x in (-4.0 * x_out, -x_out, 0.0, x_out, 4.0 * x_out)
+                    for y in (-4.0 * y_out, -y_out, 0.0, y_out, 4.0 * y_out) if (x, y) != (0.0, 0.0)], dtype=np.float32)
+    if not np.array_equal(rasterizer.rasterize(raw_data + far.tobytes()), image):
+        failed.append('points out of range are drawn')
+
+    count = LidarRasterizer(dim[0], dim[1], LIDAR_RANGE, mode='count', max_count=1 << 20)
+    index = count.pixel_index(np.frombuffer(raw_data, dtype=np.float32).reshape(-1, 4))
+    if np.bincount(index, minlength=dim[0] * dim[1] + 1)[:-1].sum() != 20000:
+        failed.append('count mode loses points')
+
+    # Pixels of a single point have its colour
+    points = np.frombuffer(raw_data, dtype=np.float32).reshape(-1, 4)
+    index = index.copy()
+    single = np.flatnonzero(np.bincount(index, minlength=dim[0] * dim[1] + 1)[index] == 1)
+    for mode, values, low, high in (('intensity', points[:, 3], 0.0, 1.0), ('height', points[:, 2], -3.0, 3.0)):
+        rasterizer = LidarRasterizer(dim[0], dim[1], LIDAR_RANGE, mode=mode)
+        image = rasterizer.rasterize(raw_data).reshape(-1, 3)
+        level = np.clip((values[single] - low) * 255.0 / (high - low), 0, 255).astype(np.uint8)
+        if not np.array_equal(image[index[single]], rasterizer.colormap[level]):
+            failed.append('%s colours differ from the points' % mode)
+    return failed
+
+
+def timed(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return np.median(times) * 1e3
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--points',
+        default=[100000, 300000, 1000000],
+        type=int,
+        nargs='+',
+        help='points per sweep benchmarked (default: 100000 300000 1000000)')
+    argparser.add_argument(
+        '--dim',
+        default=[1280, 720],
+        type=int,
+        nargs=2,
+        help='image width and height (default: 1280 720)')
+    argparser.add_argument(
+        '--repeat',
+        default=20,
+        type=int,
+        help='sweeps timed per case (default: 20)')
+    args = argparser.parse_args()
+    rng = np.random.RandomState(1)
+
+    failed = check(args, rng)
+
+    print('Median milliseconds per sweep, %dx%d image' % tuple(args.dim))
+    print('%8s%10s' % ('points', 'before') + ''.join('%11s' % mode for mode in MODES))
+    for count in args.points:
+        raw_data = sweep(rng, count, LIDAR_RANGE)
+        line = '%8d%10.2f' % (count, timed(lambda: draw_before(raw_data, tuple(args.dim), LIDAR_RANGE), args.repeat))
+        for mode in MODES:
+            rasterizer = LidarRasterizer(args.dim[0], args.dim[1], LIDAR_RANGE, mode=mode)
+            line += '%11.2f' % timed(lambda: rasterizer.rasterize(raw_data), args.repeat)
+        print(line)
+
+    for failure in failed:
+        print('FAILED: %s' % failure)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    main()
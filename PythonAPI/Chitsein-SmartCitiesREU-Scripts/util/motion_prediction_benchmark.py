@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Benchmark of the motion latency compensation on a telemetry recording.
+
+For each horizon, every recorded frame is filtered by KinematicsPredictor and
+extrapolated by the horizon. The prediction is compared with the recording at
+the predicted time, next to the error of sending the latest frame as is (what
+the platform gets without compensation).
+
+    python motion_prediction_benchmark.py drive.npz --horizons 0.033 0.05 0.1
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartcities.motion.extrapolation import KinematicsPredictor  # pylint: disable=import-error
+from smartcities.motion.telemetry import load_telemetry  # pylint: disable=import-error
+
+GROUPS = [
+    ('attitude (deg)', slice(0, 3)),
+    ('acceleration (m/s^2)', slice(3, 6)),
+    ('angular velocity (deg/s)', slice(6, 9)),
+]
+
+
+def channels(telemetry):
+    """Recorded channels in KinematicsPredictor order, with the yaw unwrapped."""
+    values = np.stack([
+        telemetry.pitch, np.degrees(np.unwrap(np.radians(telemetry.yaw))), telemetry.roll,
+        telemetry.acceleration_x, telemetry.acceleration_y, telemetry.acceleration_z,
+        telemetry.angular_velocity_x, telemetry.angular_velocity_y, telemetry.angular_velocity_z], axis=1)
+    return values.astype(np.float64)
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        'recording',
+        help='telemetry .npz file')
+    argparser.add_argument(
+        '--horizons',
+        nargs='+',
+        default=[0.033, 0.05, 0.1],
+        type=float,
+        help='prediction horizons in seconds (default: 0.033 0.05 0.1)')
+    argparser.add_argument(
+        '--process_noise',
+        default=1000.0,
+        type=float,
+        help='KinematicsPredictor process noise (default: 1000)')
+    args = argparser.parse_args()
+
+    telemetry = load_telemetry(args.recording)
+    timestamps = telemetry.timestamp.astype(np.float64)
+    values = channels(telemetry)
+    print('%d frames (%.1f s)' % (len(telemetry), telemetry.duration()))
+
+    for horizon in args.horizons:
+        predictor = KinematicsPredictor(horizon, process_noise=args.process_noise)
+        predictions = np.empty_like(values)
+        start = time.perf_counter()
+        for index in range(len(values)):
+            predictor.update(timestamps[index], values[index])
+            predictions[index] = predictor.predict()
+        cost = (time.perf_counter() - start) / len(values)
+
+        # Ground truth at the predicted time, only where the recording covers it
+        valid = timestamps + horizon <= timestamps[-1]
+        truth = np.stack([np.interp(timestamps[valid] + horizon, timestamps, values[:, i])
+                          for i in range(values.shape[1])], axis=1)
+        predicted_error = predictions[valid] - truth
+        held_error = values[valid] - truth
+        for error in (predicted_error, held_error):
+            error[:, 1] = (error[:, 1] + 180.0) % 360.0 - 180.0
+
+        print('\nHorizon %.0f ms (%.1f us/sample)' % (horizon * 1e3, cost * 1e6))
+        print('  %-26s %12s %12s' % ('RMS error', 'latest frame', 'predicted'))
+        for name, columns in GROUPS:
+            held = np.sqrt(np.mean(np.square(held_error[:, columns])))
+            predicted = np.sqrt(np.mean(np.square(predicted_error[:, columns])))
+            print('  %-26s %12.4f %12.4f' % (name, held, predicted))
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Replay a telemetry recording through the motion stack, without CARLA or pygame.
+
+Record a drive with the --record option of manual_control_Eleetus.py or
+manual_control_Simcraft.py, then replay it:
+
+  * eleetus: MotionPlatform is driven at function_call_hertz against a fake
+    Blue Tiger API, with the latest recorded frame at each call like the motion
+    scheduler thread does;
+  * simcraft: each frame is converted like the SimCraft client does, and is
+    optionally published to the motion ring buffer of SimcraftApp.
+
+Time is virtual, so a replay runs as fast as possible by default (--speed 0)
+or paced at any multiple of real time. The commands sent to the platform can
+be saved with --output and compared with a previous run with --compare.
+
+    python motion_replay.py drive.npz --platform eleetus --output reference.npz
+    python motion_replay.py drive.npz --platform eleetus --compare reference.npz
+    python motion_replay.py drive.npz --platform simcraft --speed 1 --ring MOTION_DATA_PIPE.bin
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartcities.motion.blue_tiger import FakeBlueTiger  # pylint: disable=import-error
+from smartcities.motion.config import eleetus_config  # pylint: disable=import-error
+from smartcities.motion.eleetus import MotionPlatform  # pylint: disable=import-error
+from smartcities.motion.extrapolation import KinematicsPredictor  # pylint: disable=import-error
+from smartcities.motion.shared_memory import MotionRingPublisher  # pylint: disable=import-error
+from smartcities.motion.simcraft import SimcraftSampler  # pylint: disable=import-error
+from smartcities.motion.telemetry import load_telemetry  # pylint: disable=import-error
+from smartcities.motion.washout import ClassicalWashout  # pylint: disable=import-error
+
+
+class VirtualClock(object):
+    """Replay time, optionally paced against the wall clock."""
+
+    def __init__(self, start, speed):
+        self.now = start
+        self.speed = speed
+        self._start = start
+        self._wall_start = time.perf_counter()
+
+    def advance(self, now):
+        self.now = now
+        if self.speed > 0:
+            delay = self._wall_start + (now - self._start) / self.speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def __call__(self):
+        return self.now
+
+
+def replay_eleetus(telemetry, args, clock):
+    backend = FakeBlueTiger(history=None, clock=clock)
+    motion_platform = MotionPlatform(args, backend)
+    predictor = KinematicsPredictor(args.predict_latency) if args.predict_latency > 0 else None
+    period = motion_platform.config.call_interval
+    ticks = np.arange(telemetry.timestamp[0], telemetry.timestamp[-1], period)
+    # Latest recorded frame at each scheduler tick
+    indices = np.searchsorted(telemetry.timestamp, ticks, side='right') - 1
+    for tick, index in zip(ticks, indices):
+        clock.advance(tick)
+        kinematics = telemetry.kinematics(index)
+        motion = (
+            kinematics.transform.rotation,
+            kinematics.acceleration,
+            kinematics.angular_velocity,
+            kinematics.forward,
+            kinematics.right)
+        if predictor is not None:
+            motion = predictor.predict_motion(*motion, kinematics.timestamp)
+        motion_platform.update_motion_platform(*motion, kinematics.timestamp)
+    motion_platform.shutdown()
+
+    commands = {}
+    for name in ('BTPitchRollData', 'BTAccelerationData'):
+        calls = backend.calls_to(name)
+        if calls:
+            commands[name + '_time'] = np.array([call.timestamp for call in calls])
+            commands[name + '_args'] = np.array([call.args for call in calls], dtype=np.float64)
+    return commands
+
+
+def replay_simcraft(telemetry, args, clock):
+    # The washout follows the step of the recording timestamps
+    sampler = SimcraftSampler(ClassicalWashout(1.0 / 60) if args.washout else None)
+    publisher = MotionRingPublisher(args.ring) if args.ring else None
+    samples = np.empty((len(telemetry), 5))
+    try:
+        for index in range(len(telemetry)):
+            kinematics = telemetry.kinematics(index)
+            clock.advance(kinematics.timestamp)
+            samples[index] = sampler.sample(kinematics)
+            if publisher is not None:
+                publisher.publish(*samples[index])
+    finally:
+        if publisher is not None:
+            publisher.close()
+    return {'simcraft_time': telemetry.timestamp.astype(np.float64), 'simcraft_samples': samples}
+
+
+def compare(commands, reference_path, tolerance):
+    """Print the largest difference to a previous replay, return False if above tolerance."""
+    matches = True
+    with np.load(reference_path) as reference:
+        for name in sorted(set(commands) | set(reference.files)):
+            if name not in commands or name not in reference.files:
+                print('  %-26s missing in %s' % (name, 'replay' if name not in commands else 'reference'))
+                matches = False
+                continue
+            if commands[name].shape != reference[name].shape:
+                print('  %-26s shape %s != %s' % (name, commands[name].shape, reference[name].shape))
+                matches = False
+                continue
+            error = np.abs(commands[name] - reference[name]).max() if commands[name].size else 0.0
+            print('  %-26s max difference %.3g' % (name, error))
+            matches = matches and error <= tolerance
+    return matches
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        'recording',
+        help='telemetry .npz file')
+    argparser.add_argument(
+        '--platform',
+        choices=['eleetus', 'simcraft'],
+        default='eleetus',
+        help='motion stack to replay through (default: eleetus)')
+    argparser.add_argument(
+        '--speed',
+        default=0.0,
+        type=float,
+        help='replay speed as a multiple of real time, 0 for as fast as possible (default: 0)')
+    argparser.add_argument(
+        '--distance_sensitivity',
+        default=0.5,
+        type=float,
+        help='Eleetus distance sensitivity (default: 0.5)')
+    argparser.add_argument(
+        '--rotational_sensitivity',
+        default=75.0,
+        type=float,
+        help='Eleetus rotational sensitivity (default: 75)')
+    argparser.add_argument(
+        '--function_call_hertz',
+        default=20.0,
+        type=float,
+        help='Eleetus motion command rate in Hz (default: 20)')
+    argparser.add_argument(
+        '--predict_latency',
+        metavar='SECONDS',
+        default=0.0,
+        type=float,
+        help='Eleetus only, extrapolate the motion cues by this latency (default: 0, off)')
+    argparser.add_argument(
+        '--washout',
+        action='store_true',
+        help='replay the washout filter cues instead of the raw mapping, as the client with --washout')
+    argparser.add_argument(
+        '--ring',
+        metavar='PATH',
+        default=None,
+        help='SimCraft only, publish the samples to this motion ring buffer file')
+    argparser.add_argument(
+        '--output',
+        metavar='PATH',
+        default=None,
+        help='save the platform commands to a .npz file')
+    argparser.add_argument(
+        '--compare',
+        metavar='PATH',
+        default=None,
+        help='compare the platform commands with a previous --output')
+    argparser.add_argument(
+        '--tolerance',
+        default=1e-6,
+        type=float,
+        help='largest accepted difference for --compare (default: 1e-6)')
+    args = argparser.parse_args()
+    args.no_motion = False
+    args.motion_config = eleetus_config(
+        distance_sensitivity=args.distance_sensitivity,
+        rotational_sensitivity=args.rotational_sensitivity,
+        function_call_hertz=args.function_call_hertz)
+
+    telemetry = load_telemetry(args.recording)
+    if len(telemetry) < 2:
+        sys.exit('%s has less than two frames' % args.recording)
+    print('Replaying %d frames (%.1f s) through %s' % (len(telemetry), telemetry.duration(), args.platform))
+
+    clock = VirtualClock(float(telemetry.timestamp[0]), args.speed)
+    start = time.perf_counter()
+    if args.platform == 'eleetus':
+        commands = replay_eleetus(telemetry, args, clock)
+    else:
+        commands = replay_simcraft(telemetry, args, clock)
+    elapsed = time.perf_counter() - start
+    print('Replayed in %.2f s (%.1fx real time)' % (elapsed, telemetry.duration() / elapsed))
+
+    if args.output:
+        np.savez(args.output, **commands)
+        print('Saved the platform commands to %s' % args.output)
+    if args.compare:
+        print('Comparing with %s' % args.compare)
+        if not compare(commands, args.compare, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Soak test and benchmark for the SimCraft motion ring buffer.
+
+A publisher process writes synthetic motion samples at the CARLA client frame
+rate while this process polls them the way SimController.cs does (latest
+sample on a fixed timer). Every sample encodes its own sequence number, so any
+torn or mixed-up read is detected. No CARLA server or SimCraft hardware is
+needed.
+
+    python motion_ring_soak.py --rate 60 --reader-rate 50 --duration 600
+    python motion_ring_soak.py --compare-csv
+"""
+
+from __future__ import print_function
+
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartcities.motion.shared_memory import MotionRingPublisher, MotionRingReader  # pylint: disable=import-error
+
+
+def synthetic_sample(seq):
+    """Values that can be recomputed from the sequence number by the reader."""
+    return (np.float32(seq % 360 - 180), np.float32(seq % 1000),
+            np.float32(-(seq % 90)), np.float32((seq % 7) - 3), np.float32(seq % 50))
+
+
+def run_publisher(path, capacity, rate, duration, ready, results):
+    publisher = MotionRingPublisher(path, capacity)
+    ready.set()
+    period = 1.0 / rate
+    costs = []
+    end = time.perf_counter() + duration
+    next_time = time.perf_counter()
+    while time.perf_counter() < end:
+        values = synthetic_sample(publisher.seq + 1)
+        start = time.perf_counter()
+        publisher.publish(*[float(v) for v in values])
+        costs.append(time.perf_counter() - start)
+        next_time += period
+        delay = next_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    # Only send the summary, a large queue item would block the exit.
+    costs = np.array(costs) * 1e6
+    results.put((publisher.seq, costs.mean(), np.percentile(costs, 99), costs.max()))
+    publisher.close()
+
+
+def compare_csv(path, iterations):
+    values = [float(v) for v in synthetic_sample(1)]
+    start = time.perf_counter()
+    for _ in range(iterations):
+        # Same work as the former store_car_motion_info()
+        with open(path + '.csv', 'w', newline="") as csvfile:
+            datawriter = csv.writer(csvfile, delimiter=',', quotechar='|', quoting=csv.QUOTE_MINIMAL)
+            datawriter.writerow(["pitch", "yaw", "roll", "angularVelocityY", "velocity"])
+            datawriter.writerow([str(v) for v in values])
+    csv_cost = (time.perf_counter() - start) / iterations
+    os.remove(path + '.csv')
+
+    publisher = MotionRingPublisher(path)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        publisher.publish(*values)
+    ring_cost = (time.perf_counter() - start) / iterations
+    publisher.close()
+
+    print('CSV rewrite:  %8.2f us/sample' % (csv_cost * 1e6))
+    print('Ring publish: %8.2f us/sample (%.0fx faster)' % (ring_cost * 1e6, csv_cost / ring_cost))
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--path',
+        default=os.path.join(tempfile.gettempdir(), 'MOTION_DATA_PIPE.bin'),
+        help='ring buffer file (default: MOTION_DATA_PIPE.bin in the temp directory)')
+    argparser.add_argument(
+        '--capacity',
+        default=64,
+        type=int,
+        help='ring buffer capacity in samples (default: 64)')
+    argparser.add_argument(
+        '--rate',
+        default=60.0,
+        type=float,
+        help='publisher rate in Hz (default: 60)')
+    argparser.add_argument(
+        '--reader-rate',
+        default=50.0,
+        type=float,
+        help='reader polling rate in Hz, 0 to busy-poll every sample (default: 50)')
+    argparser.add_argument(
+        '--duration',
+        default=10.0,
+        type=float,
+        help='soak duration in seconds (default: 10)')
+    argparser.add_argument(
+        '--compare-csv',
+        action='store_true',
+        help='only benchmark the per-sample cost against the former CSV hand-off')
+    argparser.add_argument(
+        '--iterations',
+        default=10000,
+        type=int,
+        help='iterations for --compare-csv (default: 10000)')
+    args = argparser.parse_args()
+
+    if args.compare_csv:
+        compare_csv(args.path, args.iterations)
+        return
+
+    ready = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    publisher = multiprocessing.Process(
+        target=run_publisher, args=(args.path, args.capacity, args.rate, args.duration, ready, results))
+    publisher.start()
+    ready.wait()
+
+    reader = MotionRingReader(args.path)
+    corrupt = 0
+    latencies = []
+    period = 1.0 / args.reader_rate if args.reader_rate > 0 else 0.0
+    while publisher.is_alive():
+        if args.reader_rate > 0:
+            samples = [reader.read_latest()]
+        else:
+            samples = reader.read_new()
+        now = time.perf_counter()
+        for sample in samples:
+            if sample is None:
+                continue
+            latencies.append(now - sample.timestamp)
+            if tuple(sample[2:7]) != tuple(float(v) for v in synthetic_sample(sample.seq)):
+                corrupt += 1
+        if period:
+            time.sleep(period)
+    published, cost_mean, cost_p99, cost_max = results.get()
+    publisher.join()
+    reader.close()
+
+    latencies = np.array(latencies) * 1e3
+    print('Published:     %d samples at %.1f Hz' % (published, args.rate))
+    print('Publish cost:  mean %.2f us, p99 %.2f us, max %.2f us' % (cost_mean, cost_p99, cost_max))
+    print('Read:          %d samples, %d skipped' % (reader.samples_read, reader.samples_missed))
+    print('Torn retries:  %d' % reader.torn_reads)
+    print('Corrupt:       %d' % corrupt)
+    if len(latencies):
+        print('Sample age:    p50 %.3f ms, p99 %.3f ms, max %.3f ms' % (
+            np.percentile(latencies, 50), np.percentile(latencies, 99), latencies.max()))
+    if corrupt:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    main()
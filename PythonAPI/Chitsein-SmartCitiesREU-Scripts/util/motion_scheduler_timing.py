@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Timing test of the Eleetus motion scheduler thread against a fake Blue Tiger
+API. A simulated render loop publishes kinematics at the frame rate with
+occasional slow frames, while the scheduler drives MotionPlatform at the
+requested actuator rate. The intervals between the motion commands sent to the
+API show whether the actuator rate stays independent of rendering.
+
+    python motion_scheduler_timing.py --hz 100 --fps 30 --slow-frame 0.2
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import os
+import random
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartcities.motion.blue_tiger import FakeBlueTiger  # pylint: disable=import-error
+from smartcities.motion.config import eleetus_config  # pylint: disable=import-error
+from smartcities.motion.eleetus import MotionPlatform  # pylint: disable=import-error
+from smartcities.motion.scheduler import MotionScheduler, SnapshotSlot  # pylint: disable=import-error
+
+Rotation = collections.namedtuple('Rotation', ['pitch', 'yaw', 'roll'])
+Vector = collections.namedtuple('Vector', ['x', 'y', 'z'])
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--hz',
+        default=20.0,
+        type=float,
+        help='actuator rate (function_call_hertz) in Hz (default: 20)')
+    argparser.add_argument(
+        '--fps',
+        default=60.0,
+        type=float,
+        help='simulated render frame rate (default: 60)')
+    argparser.add_argument(
+        '--slow-frame',
+        default=0.1,
+        type=float,
+        help='duration in seconds of the occasional slow frame (default: 0.1)')
+    argparser.add_argument(
+        '--slow-probability',
+        default=0.02,
+        type=float,
+        help='probability of a frame being slow (default: 0.02)')
+    argparser.add_argument(
+        '--call-latency',
+        default=0.0005,
+        type=float,
+        help='simulated duration of a BTApi call in seconds (default: 0.0005)')
+    argparser.add_argument(
+        '--washout',
+        action='store_true',
+        help='send the washout filter cues instead of raw accelerations')
+    argparser.add_argument(
+        '--duration',
+        default=10.0,
+        type=float,
+        help='test duration in seconds (default: 10)')
+    args = argparser.parse_args()
+
+    args.no_motion = False
+    args.motion_config = eleetus_config(function_call_hertz=args.hz)
+
+    backend = FakeBlueTiger(call_latency=args.call_latency)
+    motion_platform = MotionPlatform(args, backend)
+    slot = SnapshotSlot()
+    scheduler = MotionScheduler(
+        slot,
+        lambda sample, timestamp: motion_platform.update_motion_platform(*sample, timestamp),
+        motion_platform.function_call_hertz)
+    scheduler.start()
+
+    frames = 0
+    slow_frames = 0
+    end = time.perf_counter() + args.duration
+    while time.perf_counter() < end:
+        t = time.perf_counter()
+        slot.publish((
+            Rotation(math_wave(t, 0.5, 2.0), 90.0, math_wave(t, 0.3, 1.0)),
+            Vector(math_wave(t, 0.2, 3.0), math_wave(t, 0.7, 1.5), 0.0),
+            Vector(0.0, 0.0, math_wave(t, 0.4, 10.0)),
+            Vector(1.0, 0.0, 0.0),
+            Vector(0.0, 1.0, 0.0)))
+        frames += 1
+        frame_time = 1.0 / args.fps
+        if random.random() < args.slow_probability:
+            frame_time = args.slow_frame
+            slow_frames += 1
+        time.sleep(frame_time)
+    scheduler.stop()
+
+    command = 'BTPitchRollData' if args.washout else 'BTAccelerationData'
+    calls = np.array([call.timestamp for call in backend.calls_to(command)])
+    intervals = np.diff(calls) * 1e3
+    print('Render loop: %d frames (%d slow frames of %.0f ms)' % (frames, slow_frames, args.slow_frame * 1e3))
+    print('Scheduler:   %s' % scheduler.stats)
+    if len(intervals):
+        print('%s: %d calls, %.1f Hz, interval p50 %.2f ms, p99 %.2f ms, max %.2f ms' % (
+            command, len(calls), len(intervals) / (calls[-1] - calls[0]),
+            np.percentile(intervals, 50), np.percentile(intervals, 99), intervals.max()))
+
+
+def math_wave(t, frequency, amplitude):
+    return amplitude * np.sin(2.0 * np.pi * frequency * t)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Loopback test of the motion UDP transport.
+
+A publisher thread sends synthetic kinematics at the CARLA client frame rate
+to a receiver on 127.0.0.1, and withholds, reorders or repeats packets at the
+given rates. Every packet encodes its own sequence number, so the receiver
+checks the decoded values and that its dropped, late and duplicate counters
+match what was injected. No CARLA server or motion platform is needed.
+
+    python motion_udp_loopback.py --rate 60 --duration 10 --drop 0.02 --reorder 0.01 --duplicate 0.01
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartcities.motion.kinematics import Kinematics  # pylint: disable=import-error
+from smartcities.motion.telemetry import Rotation, Transform, Vector3D  # pylint: disable=import-error
+from smartcities.motion.udp import MotionUdpPublisher, MotionUdpReceiver  # pylint: disable=import-error
+
+
+def synthetic_kinematics(seq):
+    """Values that can be recomputed from the sequence number by the receiver."""
+    values = [float(np.float32((seq * (i + 1)) % 1000 - 500) / 4.0) for i in range(21)]
+    vectors = [Vector3D(*values[i:i + 3]) for i in range(0, 21, 3)]
+    return Kinematics(
+        seq, seq / 60.0, Transform(vectors[0], Rotation(*vectors[1])),
+        vectors[2], vectors[3], vectors[4], vectors[5], vectors[6])
+
+
+def run_publisher(address, args, injected, done):
+    publisher = MotionUdpPublisher(address)
+    period = 1.0 / args.rate
+    held = None
+    end = time.perf_counter() + args.duration
+    next_time = time.perf_counter()
+    while time.perf_counter() < end:
+        seq = publisher.seq + 1
+        packet = bytes(publisher.pack(synthetic_kinematics(seq)))
+        draw = random.random()
+        if draw < args.drop:
+            injected['dropped'] += 1
+        elif draw < args.drop + args.reorder and held is None:
+            # Sent after the next packet
+            held = packet
+        else:
+            publisher.send(packet)
+            if held is not None:
+                publisher.send(held)
+                injected['late'] += 1
+                held = None
+            if random.random() < args.duplicate:
+                publisher.send(packet)
+                injected['duplicates'] += 1
+        next_time += period
+        delay = next_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    # The receiver only sees a gap once a newer packet arrives
+    publisher.publish(synthetic_kinematics(publisher.seq + 1))
+    if held is not None:
+        publisher.send(held)
+        injected['late'] += 1
+    injected['published'] = publisher.seq
+    publisher.close()
+    done.set()
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--rate',
+        default=60.0,
+        type=float,
+        help='publisher rate in Hz (default: 60)')
+    argparser.add_argument(
+        '--duration',
+        default=10.0,
+        type=float,
+        help='test duration in seconds (default: 10)')
+    argparser.add_argument(
+        '--drop',
+        default=0.02,
+        type=float,
+        help='fraction of packets withheld (default: 0.02)')
+    argparser.add_argument(
+        '--reorder',
+        default=0.01,
+        type=float,
+        help='fraction of packets sent after the next one (default: 0.01)')
+    argparser.add_argument(
+        '--duplicate',
+        default=0.01,
+        type=float,
+        help='fraction of packets sent twice (default: 0.01)')
+    args = argparser.parse_args()
+
+    receiver = MotionUdpReceiver(('127.0.0.1', 0))
+    injected = {'dropped': 0, 'late': 0, 'duplicates': 0}
+    done = threading.Event()
+    publisher = threading.Thread(target=run_publisher, args=(receiver.address, args, injected, done))
+    publisher.start()
+
+    corrupt = 0
+    last_seq = None
+    while not done.is_set() or last_seq != injected.get('published'):
+        packet = receiver.receive(timeout=0.5)
+        if packet is None:
+            if done.is_set():
+                break
+            continue
+        last_seq = packet.seq
+        if packet.kinematics != synthetic_kinematics(packet.seq):
+            corrupt += 1
+    publisher.join()
+    # Packets still in flight after the last accepted one
+    while receiver.receive(timeout=0.1) is not None:
+        pass
+    receiver.close()
+
+    print('Published:  %d packets at %.1f Hz' % (injected['published'], args.rate))
+    print('Received:   %s' % receiver)
+    print('Injected:   %(dropped)d dropped, %(late)d late, %(duplicates)d duplicates' % injected)
+    print('Corrupt:    %d' % corrupt)
+    failed = corrupt or any(getattr(receiver, name) != injected[name] for name in ('dropped', 'late', 'duplicates'))
+    if failed:
+        print('FAILED: the receiver statistics do not match the injected faults')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Motion platform driver for the rig host, fed over UDP by a CARLA client
+started with --motion_udp HOST:PORT (see smartcities.motion.udp).
+
+  * eleetus: MotionPlatform is driven at function_call_hertz from the motion
+    scheduler thread with the newest received kinematics, as the client does
+    when the platform is attached to the same host;
+  * simcraft: every received frame is converted like the SimCraft client does
+    and published to the motion ring buffer read by SimCraftApp.exe, with the
+    actuator pulses computed in Python with --scn6_limits.
+
+The packet statistics (dropped, late, duplicate packets and the relative
+transit delay) are printed every --report_interval seconds and on exit.
+
+    python motion_udp_receiver.py --platform eleetus --dll_path BTApi_x64.dll
+    python motion_udp_receiver.py --platform simcraft --ring MOTION_DATA_PIPE.bin
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartcities.motion.blue_tiger import FakeBlueTiger  # pylint: disable=import-error
+from smartcities.motion.config import eleetus_config  # pylint: disable=import-error
+from smartcities.motion.eleetus import MotionPlatform  # pylint: disable=import-error
+from smartcities.motion.extrapolation import KinematicsPredictor  # pylint: disable=import-error
+from smartcities.motion.scheduler import MotionScheduler, SnapshotSlot  # pylint: disable=import-error
+from smartcities.motion.scn6 import PlatformKinematics  # pylint: disable=import-error
+from smartcities.motion.shared_memory import MotionRingPublisher  # pylint: disable=import-error
+from smartcities.motion.simcraft import SimcraftSampler  # pylint: disable=import-error
+from smartcities.motion.udp import MotionUdpReceiver, parse_address  # pylint: disable=import-error
+from smartcities.motion.washout import ClassicalWashout  # pylint: disable=import-error
+
+
+def run_eleetus(receiver, args, report):
+    motion_platform = MotionPlatform(args, FakeBlueTiger() if args.fake_motion else None)
+    if args.no_motion:
+        return
+    predictor = KinematicsPredictor(args.predict_latency) if args.predict_latency > 0 else None
+
+    def drive_motion_platform(kinematics, timestamp):
+        motion = (
+            kinematics.transform.rotation,
+            kinematics.acceleration,
+            kinematics.angular_velocity,
+            kinematics.forward,
+            kinematics.right)
+        if predictor is not None:
+            motion = predictor.predict_motion(*motion, timestamp)
+        motion_platform.update_motion_platform(*motion, timestamp)
+
+    motion_snapshot = SnapshotSlot()
+    motion_scheduler = MotionScheduler(motion_snapshot, drive_motion_platform, motion_platform.function_call_hertz)
+    motion_scheduler.start()
+    try:
+        while motion_scheduler.error is None:
+            packet = receiver.receive_latest(timeout=args.report_interval)
+            if packet is not None:
+                motion_snapshot.publish(packet.kinematics, packet.kinematics.timestamp)
+            report()
+    finally:
+        motion_scheduler.stop()
+        print(motion_scheduler.stats)
+        motion_platform.shutdown()
+
+
+def run_simcraft(receiver, args, report):
+    # The washout follows the step of the packet timestamps
+    sampler = SimcraftSampler(ClassicalWashout(1.0 / 60) if args.washout else None)
+    kinematics = PlatformKinematics(args.pitch_sensitivity) if args.scn6_limits else None
+    publisher = MotionRingPublisher(args.ring, kinematics=kinematics)
+    try:
+        while True:
+            # Every frame goes through the washout filter
+            packet = receiver.receive(timeout=args.report_interval)
+            if packet is not None:
+                publisher.publish(*sampler.sample(packet.kinematics))
+            report()
+    finally:
+        publisher.close()
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--listen',
+        metavar='HOST:PORT',
+        default=':2070',
+        help='address to receive the motion packets on (default: :2070, all interfaces)')
+    argparser.add_argument(
+        '--platform',
+        choices=['eleetus', 'simcraft'],
+        default='eleetus',
+        help='motion platform attached to this host (default: eleetus)')
+    argparser.add_argument(
+        '--report_interval',
+        metavar='SECONDS',
+        default=10.0,
+        type=float,
+        help='print the packet statistics every SECONDS (default: 10)')
+    argparser.add_argument(
+        '--dll_path',
+        default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Eleetus', 'BTApi_x64.dll'),
+        help='Eleetus Blue Tiger API (default: Eleetus/BTApi_x64.dll)')
+    argparser.add_argument(
+        '--fake_motion',
+        action='store_true',
+        help='Eleetus only, use a fake Blue Tiger API instead of the DLL')
+    argparser.add_argument(
+        '--distance_sensitivity',
+        default=0.5,
+        type=float,
+        help='Eleetus distance sensitivity (default: 0.5)')
+    argparser.add_argument(
+        '--rotational_sensitivity',
+        default=75.0,
+        type=float,
+        help='Eleetus rotational sensitivity (default: 75)')
+    argparser.add_argument(
+        '--function_call_hertz',
+        default=20.0,
+        type=float,
+        help='Eleetus motion command rate in Hz (default: 20)')
+    argparser.add_argument(
+        '--predict_latency',
+        metavar='SECONDS',
+        default=0.0,
+        type=float,
+        help='Eleetus only, extrapolate the motion cues by this latency (default: 0, off)')
+    argparser.add_argument(
+        '--ring',
+        metavar='PATH',
+        default='MOTION_DATA_PIPE.bin',
+        help='SimCraft only, motion ring buffer read by SimCraftApp.exe (default: MOTION_DATA_PIPE.bin)')
+    argparser.add_argument(
+        '--scn6_limits',
+        action='store_true',
+        help='SimCraft only, compute the actuator pulses in Python, shaped by the placeholder SCN6 axis limits of '
+             'smartcities.motion.scn6, instead of the SimCraftApp mapping. Experimental, the limits are neither '
+             'from the datasheet nor measured on the rig and do not protect the hardware (off by default)')
+    argparser.add_argument(
+        '--pitch_sensitivity',
+        default=0.7,
+        type=float,
+        help='SimCraft only, pitch sensitivity of the --scn6_limits pulses, coefSens of SimController (default: 0.7)')
+    argparser.add_argument(
+        '--washout',
+        action='store_true',
+        help='send the washout filter cues instead of the raw mapping, as the client with --washout')
+    args = argparser.parse_args()
+    args.no_motion = False
+    args.motion_config = eleetus_config(
+        dll_path=args.dll_path,
+        distance_sensitivity=args.distance_sensitivity,
+        rotational_sensitivity=args.rotational_sensitivity,
+        function_call_hertz=args.function_call_hertz)
+
+    receiver = MotionUdpReceiver(parse_address(args.listen))
+    print('Listening for motion packets on %s:%d' % receiver.address)
+    last_report = [time.perf_counter()]
+
+    def report():
+        now = time.perf_counter()
+        if now - last_report[0] >= args.report_interval:
+            print(receiver)
+            last_report[0] = now
+
+    try:
+        if args.platform == 'eleetus':
+            run_eleetus(receiver, args, report)
+        else:
+            run_simcraft(receiver, args, report)
+    except KeyboardInterrupt:
+        print('\nCancelled by user. Bye!')
+    finally:
+        print(receiver)
+        receiver.close()
+
+
+if __name__ == '__main__':
+
+    main()
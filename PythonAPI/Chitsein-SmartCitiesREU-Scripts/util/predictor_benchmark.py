@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Check and benchmark of the trajectory predictors (smartcities.prediction
+.predictors) used by prediction_visualization.py and sensor_data_collection.py,
+without CARLA.
+
+The predictions are compared with the exact motion they model:
+
+  * constant velocity: straight lines;
+  * constant turn rate: circles, turning through +-180 degrees of yaw;
+  * lane following: two ring roads going opposite ways, the positions must go
+    round the centre line of the ring of the actor at its speed, never on the
+    other one; the nearest waypoint lookup is compared with a brute force
+    search.
+
+Then each predictor predicts --horizon positions for N actors from a
+(N, --history, F) history, one batched call per frame, and the latency per
+call is printed for each N of --actors. The script fails (exit status 1) if a
+prediction is wrong or if a call at the largest N takes longer than
+--budget_ms.
+
+    python predictor_benchmark.py --actors 50 200 1000
+"""
+
+from __future__ import print_function
+
+import argparse
+import math
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartcities.prediction.lanes import LaneGraph  # pylint: disable=import-error
+from smartcities.prediction.predictors import PREDICTORS, create_predictor  # pylint: disable=import-error
+from smartcities.prediction.tracking import STATE_FIELDS  # pylint: disable=import-error
+
+RADIUS = 40.0
+LANE_WIDTH = 3.5
+DT = 0.05
+
+
+def ring_lanes():
+    """Two ring roads around the origin, counter-clockwise at RADIUS, clockwise one lane outside.
+
+    Each ring is one segment, closed on its first waypoint and followed by itself.
+    """
+    x, y, yaw, starts = [], [], [], []
+    for radius, direction in ((RADIUS, 1.0), (RADIUS + LANE_WIDTH, -1.0)):
+        angle = direction * np.linspace(0.0, 2.0 * math.pi, int(2.0 * math.pi * radius) + 1)
+        starts.append(sum(len(part) for part in x))
+        x.append(radius * np.cos(angle))
+        y.append(radius * np.sin(angle))
+        yaw.append(np.degrees(angle) + direction * 90.0)
+    x, y, yaw = np.concatenate(x), np.concatenate(y), np.concatenate(yaw)
+    return LaneGraph(x, y, yaw, LANE_WIDTH, starts, [0, 1, 2], [0, 1])
+
+
+def arc_history(x, y, course, speed, rate, frames):
+    """History (N, frames, F) of actors on circles (straight lines where rate is 0), ending at x, y."""
+    times = DT * np.arange(-frames + 1, 1)[:, np.newaxis]
+    state = np.zeros((len(x), frames, len(STATE_FIELDS)))
+    heading, position_x, position_y = arc(x, y, course, speed, rate, times.T)
+    state[..., 0], state[..., 1] = position_x, position_y
+    state[..., 2] = (np.degrees(heading) + 180.0) % 360.0 - 180.0
+    state[..., 3], state[..., 4] = speed[:, np.newaxis] * np.cos(heading), speed[:, np.newaxis] * np.sin(heading)
+    return state
+
+
+def arc(x, y, course, speed, rate, times):
+    """Heading and position at times (1, K) after x, y of actors along circles, arrays (N, K)."""
+    course, speed, rate = course[:, np.newaxis], speed[:, np.newaxis], rate[:, np.newaxis]
+    heading = course + rate * times
+    turning = rate != 0.0
+    safe_rate = np.where(turning, rate, 1.0)
+    position_x = np.where(turning, speed / safe_rate * (np.sin(heading) - np.sin(course)), speed * times * np.cos(course))
+    position_y = np.where(turning, speed / safe_rate * (np.cos(course) - np.cos(heading)), speed * times * np.sin(course))
+    return heading, x[:, np.newaxis] + position_x, y[:, np.newaxis] + position_y
+
+
+def check_motion(rng, frames, horizon):
+    failed = []
+    count = 200
+    x, y = rng.uniform(-500, 500, count), rng.uniform(-500, 500, count)
+    # Headings around +-180 degrees, the yaw wraps within the history
+    course = math.pi + rng.uniform(-0.3, 0.3, count)
+    speed = rng.uniform(0.0, 30.0, count)
+
+    straight = arc_history(x, y, course, speed, np.zeros(count), frames)
+    predictor = create_predictor('cv', horizon, 0.1)
+    _, expected_x, expected_y = arc(x, y, course, speed, np.zeros(count), predictor.times[np.newaxis])
+    error = np.hypot(predictor.predict(straight, DT)[..., 0] - expected_x, predictor.predict(straight, DT)[..., 1] - expected_y)
+    if error.max() > 1e-6:
+        failed.append('constant velocity off a straight line by %.3g m' % error.max())
+
+    rate = rng.uniform(-0.5, 0.5, count)
+    turning = arc_history(x, y, course, speed, rate, frames)
+    predictor = create_predictor('ctrv', horizon, 0.1)
+    _, expected_x, expected_y = arc(x, y, course, speed, rate, predictor.times[np.newaxis])
+    predicted = predictor.predict(turning, DT)
+    error = np.hypot(predicted[..., 0] - expected_x, predicted[..., 1] - expected_y)
+    if error.max() > 1e-6:
+        failed.append('constant turn rate off a circle by %.3g m' % error.max())
+    if not np.allclose(predictor.predict(straight, DT), create_predictor('cv', horizon, 0.1).predict(straight, DT)):
+        failed.append('constant turn rate differs from constant velocity without turning')
+    if predictor.predict(turning[:, -1:], 0.0).shape != (count, horizon, 2):
+        failed.append('constant turn rate fails on a history of one frame')
+    return failed
+
+
+def check_lanes(rng, frames, horizon):
+    failed = []
+    lanes = ring_lanes()
+    count = 300
+    points_x, points_y = rng.uniform(-60, 60, (count, 7)), rng.uniform(-60, 60, (count, 7))
+    for max_distance in (1.0, lanes.cell_size):
+        expected = nearest_brute_force(lanes, points_x, points_y, max_distance)
+        found = lanes.nearest(points_x, points_y, max_distance=max_distance)
+        if not np.array_equal(found, expected):
+            failed.append('%d of %d nearest waypoints differ from the brute force search' % (
+                np.count_nonzero(found != expected), found.size))
+
+    # Counter-clockwise on the inner ring and clockwise on the outer one, off the centre line by up
+    # to 1 m, for several turns at the highest speeds
+    direction = np.where(np.arange(count) % 2, -1.0, 1.0)
+    centre = np.where(direction > 0, RADIUS, RADIUS + LANE_WIDTH)
+    angle = rng.uniform(0.0, 2.0 * math.pi, count)
+    radius = centre + rng.uniform(-1.0, 1.0, count)
+    speed = rng.uniform(0.0, 100.0, count)
+    history = arc_history(radius * np.cos(angle), radius * np.sin(angle), angle + direction * 0.5 * math.pi, speed,
+                          direction * speed / radius, frames)
+    predictor = create_predictor('lane', horizon, 0.1, lanes)
+    predicted = predictor.predict(history, DT)
+    expected = angle[:, np.newaxis] + direction[:, np.newaxis] * speed[:, np.newaxis] * predictor.times / centre[:, np.newaxis]
+    error = np.hypot(predicted[..., 0] - centre[:, np.newaxis] * np.cos(expected),
+                     predicted[..., 1] - centre[:, np.newaxis] * np.sin(expected))
+    if error.max() > 0.05:
+        failed.append('lane following off the ring of the actor by up to %.3f m' % error.max())
+    return failed
+
+
+def nearest_brute_force(lanes, x, y, max_distance):
+    result = []
+    for point_x, point_y in zip(x.ravel(), y.ravel()):
+        distance = np.hypot(lanes.x - point_x, lanes.y - point_y)
+        best = int(np.argmin(distance))
+        result.append(best if distance[best] <= max_distance else -1)
+    return np.array(result).reshape(x.shape)
+
+
+def benchmark(rng, args, lanes, count):
+    """Median milliseconds per predict() call of each predictor for count actors."""
+    angle = rng.uniform(0.0, 2.0 * math.pi, count)
+    speed = rng.uniform(0.0, 15.0, count)
+    history = arc_history(RADIUS * np.cos(angle), RADIUS * np.sin(angle), angle + 0.5 * math.pi, speed,
+                          speed / RADIUS, args.history)
+    latency = {}
+    for name in sorted(PREDICTORS):
+        predictor = create_predictor(name, args.horizon, 0.1, lanes)
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            predicted = predictor.predict(history, DT)
+            times.append(time.perf_counter() - start)
+        assert predicted.shape == (count, args.horizon, 2)
+        latency[name] = np.median(times) * 1e3
+    return latency
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--actors',
+        default=[50, 200, 1000],
+        type=int,
+        nargs='+',
+        help='numbers of actors benchmarked (default: 50 200 1000)')
+    argparser.add_argument(
+        '--history',
+        default=10,
+        type=int,
+        help='frames of history (default: 10)')
+    argparser.add_argument(
+        '--horizon',
+        default=30,
+        type=int,
+        help='predicted positions per actor (default: 30)')
+    argparser.add_argument(
+        '--repeat',
+        default=50,
+        type=int,
+        help='calls timed per predictor (default: 50)')
+    argparser.add_argument(
+        '--budget_ms',
+        default=50.0,
+        type=float,
+        help='milliseconds allowed per call at the largest number of actors, 0 to skip the check '
+             '(default: 50, a step of the 20 Hz simulation)')
+    args = argparser.parse_args()
+    rng = np.random.RandomState(1)
+
+    failed = check_motion(rng, args.history, args.horizon) + check_lanes(rng, args.history, args.horizon)
+
+    lanes = ring_lanes()
+    print('History of %d frames, %d predicted positions, %d lane waypoints' % (args.history, args.horizon, len(lanes)))
+    print('%8s' % 'actors' + ''.join('%12s' % name for name in sorted(PREDICTORS)))
+    for count in args.actors:
+        latency = benchmark(rng, args, lanes, count)
+        print('%8d' % count + ''.join('%9.3f ms' % latency[name] for name in sorted(PREDICTORS)))
+        if args.budget_ms > 0 and count == max(args.actors):
+            for name, milliseconds in sorted(latency.items()):
+                if milliseconds > args.budget_ms:
+                    failed.append('%s: %.2f ms for %d actors, above %.2f ms' % (name, milliseconds, count, args.budget_ms))
+
+    for failure in failed:
+        print('FAILED: %s' % failure)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Check and benchmark of the roadside sensor rigs of sensor_data_collection.py
+(smartcities.sensors.rig), without CARLA.
+
+A rig of --units units around an intersection, each with a camera, a LiDAR,
+a GNSS and an IMU, is written as a rig file and loaded, then every sensor
+delivers --frames measurements to a RigCollector recording into a
+DatasetWriter, from one thread per unit as the CARLA callbacks do, all in step
+as in synchronous mode. The script fails (exit status 1) if:
+
+  * the rig files of Motion_Prediction/rigs do not load, or an invalid rig
+    loads;
+  * the world transform of a sensor is not its transform relative to its
+    unit, turned and moved by the unit;
+  * a record lacks a sensor of the rig, or the throughput of the units does
+    not add up to the one of the rig.
+
+    python rig_check.py --units 24 --frames 100
+"""
+
+from __future__ import print_function
+
+import argparse
+import glob
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataset_writer_check import (TRANSFORM, GnssMeasurement, IMUMeasurement, Image, LidarMeasurement,
+                                  Vector)
+from smartcities.sensors.dataset import DatasetWriter, read_dataset  # pylint: disable=import-error
+from smartcities.sensors.rig import Rig, RigCollector, load_rig, rotation_matrix  # pylint: disable=import-error
+
+RIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Motion_Prediction', 'rigs')
+WIDTH, HEIGHT, POINTS = 256, 256, 20000
+
+
+def intersection_rig(units):
+    """Rig content of units on a circle around the origin, looking at the centre."""
+    content = {'name': 'check', 'defaults': {'sensor.camera.rgb': {'image_size_x': WIDTH, 'fov': 90}}, 'units': []}
+    for unit in range(units):
+        yaw = 360.0 * unit / units
+        content['units'].append({
+            'name': 'unit%02d' % unit,
+            'location': [30.0 * math.cos(math.radians(yaw)), 30.0 * math.sin(math.radians(yaw)), 6.0],
+            'rotation': [0.0, yaw + 180.0, 0.0],
+            'sensors': [
+                {'name': 'camera', 'type': 'sensor.camera.rgb', 'location': [0.5, 0.2, 0.0],
+                 'rotation': [-20.0, 10.0, 5.0], 'attributes': {'fov': 60, 'enable_postprocess_effects': False}},
+                {'name': 'lidar', 'type': 'sensor.lidar.ray_cast', 'location': [0.0, 0.0, 0.5]},
+                {'name': 'gnss', 'type': 'sensor.other.gnss'},
+                {'name': 'imu', 'type': 'sensor.other.imu'}]})
+    return content
+
+
+def check_loading(content):
+    failed = []
+    for path in sorted(glob.glob(os.path.join(RIG_DIR, '*.json'))):
+        try:
+            load_rig(path)
+        except ValueError as error:
+            failed.append('%s: %s' % (os.path.basename(path), error))
+    rig = Rig.from_dict(content)
+    camera = rig.units[0].sensors[0]
+    if camera.attributes != {'image_size_x': str(WIDTH), 'fov': '60', 'enable_postprocess_effects': 'false'}:
+        failed.append('camera attributes %s' % camera.attributes)
+    invalid = {
+        'no unit': {'units': []},
+        'two units of the same name': {'units': [content['units'][0], content['units'][0]]},
+        'a unit named with a dot': {'units': [dict(content['units'][0], name='a.b')]},
+        'a location of 2 values': {'units': [dict(content['units'][0], location=[1.0, 2.0])]},
+        'a sensor without type': {'units': [dict(content['units'][0], sensors=[{'name': 'camera'}])]},
+    }
+    for what, invalid_content in invalid.items():
+        try:
+            Rig.from_dict(invalid_content)
+            failed.append('a rig with %s loads' % what)
+        except ValueError:
+            pass
+    return failed
+
+
+def check_transforms(rig):
+    failed = []
+    # Pitch turns the x axis up, yaw towards y, as in CARLA
+    if not np.allclose(rotation_matrix((90.0, 0.0, 0.0)).dot((1.0, 0.0, 0.0)), (0.0, 0.0, 1.0)) or \
+            not np.allclose(rotation_matrix((0.0, 90.0, 0.0)).dot((1.0, 0.0, 0.0)), (0.0, 1.0, 0.0)):
+        failed.append('rotation matrix does not turn as carla.Transform')
+    sensors = iter(rig.sensors())
+    for unit in rig.units:
+        for sensor in unit.sensors:
+            _, _, location, rotation = next(sensors)
+            unit_matrix = rotation_matrix(unit.rotation)
+            expected = unit_matrix.dot(sensor.location) + unit.location
+            if not np.allclose(location, expected) or \
+                    not np.allclose(rotation_matrix(rotation), unit_matrix.dot(rotation_matrix(sensor.rotation))):
+                failed.append('world transform of %s.%s is %s %s' % (unit.name, sensor.name, location, rotation))
+    return failed
+
+
+def measurement(type_id, frame):
+    timestamp = frame * 0.05
+    if type_id.startswith('sensor.camera'):
+        return Image(frame, timestamp, TRANSFORM, WIDTH, HEIGHT, bytes(WIDTH * HEIGHT * 4))
+    if type_id.startswith('sensor.lidar'):
+        return LidarMeasurement(frame, timestamp, TRANSFORM, bytes(POINTS * 16))
+    if type_id == 'sensor.other.gnss':
+        return GnssMeasurement(frame, timestamp, TRANSFORM, 49.0, 8.0, 6.5)
+    return IMUMeasurement(frame, timestamp, TRANSFORM, Vector(0.0, 0.0, 9.81), Vector(0.0, 0.0, 0.0), 0.0)
+
+
+def check_collector(rig, args, dirname):
+    collector = RigCollector(rig)
+    collector.writer = DatasetWriter(dirname, rig.streams, workers=args.workers, queue_size=256, compresslevel=0)
+    callbacks = [(collector.callback(stream, sensor), stream, sensor) for stream, sensor, _, _ in rig.sensors()]
+
+    # The server ticks once all the measurements of a frame are sent, as in synchronous mode
+    tick = threading.Barrier(len(rig.units))
+
+    def unit_thread(unit):
+        for frame in range(1, args.frames + 1):
+            for callback, stream, sensor in callbacks:
+                if stream.startswith(unit.name + '.'):
+                    callback(measurement(sensor.type_id, frame))
+            tick.wait()
+
+    threads = [threading.Thread(target=unit_thread, args=(unit,)) for unit in rig.units]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer, collector.writer = collector.writer, None
+    writer.close()
+    print(writer)
+    print(collector)
+
+    failed = []
+    summary = collector.summary()
+    if summary['measurements'] != args.frames * len(rig.streams):
+        failed.append('%d measurements counted for %d' % (summary['measurements'], args.frames * len(rig.streams)))
+    units_rate = sum(unit['megabytes_per_s'] for unit in summary['units'].values())
+    if not np.isclose(units_rate, summary['megabytes_per_s']):
+        failed.append('units add up to %.3f MB/s, the rig to %.3f MB/s' % (units_rate, summary['megabytes_per_s']))
+    frames = 0
+    for frame, streams in read_dataset(dirname):
+        frames += 1
+        if set(streams) != set(rig.streams):
+            failed.append('record of frame %d lacks %d sensors' % (frame, len(set(rig.streams) - set(streams))))
+            break
+    if frames != args.frames or writer.dropped:
+        failed.append('%d records read back, %d dropped, for %d frames' % (frames, writer.dropped, args.frames))
+    return failed
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--units',
+        default=24,
+        type=int,
+        help='roadside units of the rig (default: 24)')
+    argparser.add_argument(
+        '--frames',
+        default=100,
+        type=int,
+        help='measurements per sensor (default: 100)')
+    argparser.add_argument(
+        '--workers',
+        default=4,
+        type=int,
+        help='dataset writer threads (default: 4)')
+    args = argparser.parse_args()
+
+    content = intersection_rig(args.units)
+    dirname = tempfile.mkdtemp()
+    try:
+        path = os.path.join(dirname, 'rig.json')
+        with open(path, 'w') as rig_file:
+            json.dump(content, rig_file)
+        rig = load_rig(path)
+        print('Rig of %d units, %d sensors' % (len(rig.units), len(rig.streams)))
+        failed = check_loading(content) + check_transforms(rig)
+        failed += check_collector(rig, args, os.path.join(dirname, 'records'))
+    finally:
+        shutil.rmtree(dirname)
+
+    for failure in failed:
+        print('FAILED: %s' % failure)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Check and benchmark of the regions of interest of the cameras of
+sensor_data_collection.py (smartcities.sensors.roi), without CARLA.
+
+The rig files of Motion_Prediction/rigs are recorded for --frames frames
+twice, with the regions of interest of their cameras and without them, and
+the display conversion of a --res camera is timed on its full frame and on
+the --roi regions. The script fails (exit status 1) if:
+
+  * an invalid region loads, or a region is set on a sensor that is not a
+    camera of BGRA images;
+  * the pixels of a region are not the ones of the full frame converted to
+    RGB, shown or read back from the dataset;
+  * the regions of a rig do not cut the bytes of its cameras written per
+    frame by --min_ratio.
+
+    python roi_check.py --frames 50 --res 1280x720 --roi crosswalk=0,480,1280,160
+"""
+
+from __future__ import print_function
+
+import argparse
+import copy
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataset_writer_check import TRANSFORM, Image
+from rig_check import RIG_DIR, measurement
+from smartcities.sensors.dataset import DatasetWriter, read_dataset  # pylint: disable=import-error
+from smartcities.sensors.rig import Rig, RigCollector  # pylint: disable=import-error
+from smartcities.sensors.roi import Roi, RoiCropper, parse_roi, parse_rois  # pylint: disable=import-error
+
+
+def image(frame, width, height):
+    """Camera image of a frame, noise so the compression of the writer keeps every byte."""
+    raw_data = np.random.RandomState(frame).randint(0, 256, (height, width, 4)).astype(np.uint8).tobytes()
+    return Image(frame, frame * 0.05, TRANSFORM, width, height, raw_data)
+
+
+def full_frame(raw_data, width, height):
+    """RGB image (width, height, 3) the display converted each frame before, with the copy of make_surface."""
+    array = np.frombuffer(raw_data, dtype=np.dtype("uint8"))
+    array = np.reshape(array, (height, width, 4))
+    array = array[:, :, :3]
+    array = array[:, :, ::-1]
+    return np.ascontiguousarray(array.swapaxes(0, 1))
+
+
+def check_parsing():
+    failed = []
+    if parse_roi('stop_line=32,120,192,16') != Roi('stop_line', 32, 120, 192, 16):
+        failed.append('parse_roi gives %s' % (parse_roi('stop_line=32,120,192,16'),))
+    for text in ('stop_line', 'stop_line=1,2,3', 'stop_line=0,0,0,4', '=0,0,4,4', 'timestamp=0,0,4,4',
+                 'a/b=0,0,4,4', 'stop_line=-1,0,4,4', 'stop_line=a,0,4,4'):
+        try:
+            parse_roi(text)
+            failed.append('region %r loads' % text)
+        except ValueError:
+            pass
+    for content in ([[0, 0, 4, 4]], {'a': [0, 0, 4.5, 4]}, {'a': [0, 0, True, 4]}):
+        try:
+            parse_rois(content)
+            failed.append('regions %r load' % (content,))
+        except ValueError:
+            pass
+    camera = {'name': 'camera', 'type': 'sensor.camera.rgb', 'rois': {'crosswalk': [0, 152, 256, 48]},
+              'attributes': {'image_size_x': 256, 'image_size_y': 256}}
+    Rig.from_dict({'units': [{'name': 'mast', 'sensors': [camera]}]})
+    invalid = {
+        'outside the image': dict(camera, rois={'crosswalk': [0, 152, 256, 128]}),
+        'on a LiDAR': dict(camera, type='sensor.lidar.ray_cast'),
+        'on a DVS camera': dict(camera, type='sensor.camera.dvs'),
+        'without image size': dict(camera, attributes={}),
+        'not as an object': dict(camera, rois=[['crosswalk', [0, 0, 4, 4]]]),
+    }
+    for what, sensor in invalid.items():
+        try:
+            Rig.from_dict({'units': [{'name': 'mast', 'sensors': [sensor]}]})
+            failed.append('a rig with regions %s loads' % what)
+        except ValueError:
+            pass
+    try:
+        RoiCropper((Roi('a', 0, 0, 4, 4), Roi('a', 4, 4, 4, 4)), 16, 16)
+        failed.append('a cropper with two regions of the same name is made')
+    except ValueError:
+        pass
+    return failed
+
+
+def check_display(args, width, height, rois):
+    failed = []
+    cropper = RoiCropper(rois, width, height)
+    data = image(1, width, height)
+    full = full_frame(data.raw_data, width, height)
+    out = np.empty(cropper.size, dtype=np.uint8)
+    regions = cropper.crop(data.raw_data, out)
+    for roi, region in zip(rois, regions.values()):
+        if not np.array_equal(region.swapaxes(0, 1), full[roi.x:roi.x + roi.width, roi.y:roi.y + roi.height]):
+            failed.append('region %s differs from the full frame' % roi.name)
+        if not region.flags.c_contiguous or not np.shares_memory(region, out):
+            failed.append('region %s is not a contiguous view of the buffer' % roi.name)
+    try:
+        cropper.crop(image(1, width, height + 1).raw_data, out)
+        failed.append('an image of another size is cropped')
+    except ValueError:
+        pass
+
+    times = {'full frame': [], 'regions': []}
+    for frame in range(args.frames):
+        data = image(frame, width, height)
+        start = time.perf_counter()
+        full_frame(data.raw_data, width, height)
+        times['full frame'].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        for region in cropper.crop(data.raw_data, out).values():
+            np.ascontiguousarray(region.swapaxes(0, 1))
+        times['regions'].append(time.perf_counter() - start)
+    print('Display of a %dx%d camera, %d regions, 1/%.1f of the image: full frame %.3f ms, regions %.3f ms' % (
+        width, height, len(rois), cropper.ratio, np.median(times['full frame']) * 1e3,
+        np.median(times['regions']) * 1e3))
+    return failed
+
+
+def record(rig, args, dirname):
+    """Collector of --frames frames of every sensor of a rig, recorded into dirname."""
+    collector = RigCollector(rig)
+    collector.writer = DatasetWriter(dirname, rig.streams, workers=args.workers, queue_size=256, compresslevel=0)
+    callbacks = [(collector.callback(stream, sensor), sensor) for stream, sensor, _, _ in rig.sensors()]
+    for frame in range(1, args.frames + 1):
+        for callback, sensor in callbacks:
+            if sensor.type_id.startswith('sensor.camera'):
+                callback(image(frame, int(sensor.attributes['image_size_x']), int(sensor.attributes['image_size_y'])))
+            else:
+                callback(measurement(sensor.type_id, frame))
+    writer, collector.writer = collector.writer, None
+    writer.close()
+    return collector
+
+
+def check_read_back(stream, sensor, arrays):
+    """Regions of the first frame of a camera as read back from the dataset."""
+    width, height = int(sensor.attributes['image_size_x']), int(sensor.attributes['image_size_y'])
+    full = full_frame(image(1, width, height).raw_data, width, height)
+    if set(arrays) != set(roi.name for roi in sensor.rois) | {'timestamp', 'transform'}:
+        return ['%s is recorded with the fields %s' % (stream, ', '.join(sorted(arrays)))]
+    return ['region %s of %s differs from the full frame once read back' % (roi.name, stream)
+            for roi in sensor.rois if not np.array_equal(
+                arrays[roi.name].swapaxes(0, 1), full[roi.x:roi.x + roi.width, roi.y:roi.y + roi.height])]
+
+
+def check_rig(path, args, dirname):
+    failed = []
+    with open(path) as rig_file:
+        content = json.load(rig_file)
+    without = copy.deepcopy(content)
+    for unit in without['units']:
+        for sensor in unit['sensors']:
+            sensor.pop('rois', None)
+    rig = Rig.from_dict(content)
+    cameras = set('%s.%s' % (unit.name, sensor.name) for unit in rig.units for sensor in unit.sensors if sensor.rois)
+    if not cameras:
+        return []
+
+    camera_bytes = {}
+    for name, rig in (('full frames', Rig.from_dict(without)), ('regions', rig)):
+        records = os.path.join(dirname, name.replace(' ', '_'))
+        collector = record(rig, args, records)
+        camera_bytes[name] = 0
+        sensors = dict((stream, sensor) for stream, sensor, _, _ in rig.sensors())
+        for frame, streams in read_dataset(records):
+            for stream in cameras:
+                camera_bytes[name] += sum(array.nbytes for field, array in streams[stream].items()
+                                          if field not in ('timestamp', 'transform'))
+                if sensors[stream].rois and frame == 1:
+                    failed += check_read_back(stream, sensors[stream], streams[stream])
+        files = sum(os.path.getsize(shard) for shard in glob.glob(os.path.join(records, 'shard_*.npz')))
+        print('%s %s: %.2f MB written, camera streams %.1f kB per frame, callback %.3f ms' % (
+            rig.name, name, files / 1e6, camera_bytes[name] / 1e3 / args.frames, collector.summary()['callback_ms']))
+    ratio = camera_bytes['full frames'] / float(max(camera_bytes['regions'], 1))
+    if ratio < args.min_ratio:
+        failed.append('the regions of %s cut the camera bytes by %.1f, not %.1f' % (
+            os.path.basename(path), ratio, args.min_ratio))
+    return failed
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--frames',
+        default=50,
+        type=int,
+        help='frames recorded and timed (default: 50)')
+    argparser.add_argument(
+        '--res',
+        metavar='WIDTHxHEIGHT',
+        default='1280x720',
+        help='size of the displayed camera (default: 1280x720)')
+    argparser.add_argument(
+        '--roi',
+        metavar='NAME=X,Y,W,H',
+        action='append',
+        type=parse_roi,
+        help='region of interest of the displayed camera (default: crosswalk=0,480,1280,160)')
+    argparser.add_argument(
+        '--min_ratio',
+        default=5.0,
+        type=float,
+        help='least cut of the camera bytes of the rig files (default: 5)')
+    argparser.add_argument(
+        '--workers',
+        default=2,
+        type=int,
+        help='dataset writer threads (default: 2)')
+    args = argparser.parse_args()
+    width, height = [int(x) for x in args.res.split('x')]
+
+    failed = check_parsing()
+    failed += check_display(args, width, height, args.roi or [Roi('crosswalk', 0, 480, 1280, 160)])
+    dirname = tempfile.mkdtemp()
+    try:
+        for path in sorted(glob.glob(os.path.join(RIG_DIR, '*.json'))):
+            failed += check_rig(path, args, os.path.join(dirname, os.path.splitext(os.path.basename(path))[0]))
+    finally:
+        shutil.rmtree(dirname)
+
+    for failure in failed:
+        print('FAILED: %s' % failure)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Offline check of a recorded drive against the SCN6 axis limits of the
+SimCraft platform (the placeholder DEFAULT_LIMITS of smartcities.motion.scn6
+unless given on the command line).
+
+Every frame of the recording is converted like the SimCraft client does, and
+mapped to actuator pulses with PlatformKinematics (see smartcities.motion.scn6):
+
+  * the vectorized mapping is compared with a sample by sample port of
+    SimController.cs, which it must match to within one pulse (float32
+    rounding of the C# code);
+  * the limit violations of the SimController pulses are reported per axis;
+  * the pulses sent with the limits applied must have no violation, and their
+    tracking error against the SimController pulses is reported.
+
+The exit status is 1 if the limited pulses violate a limit or the mapping does
+not match SimController.
+
+    python scn6_limit_check.py drive.npz
+    python scn6_limit_check.py drive.npz --washout --max_velocity 20000
+"""
+
+from __future__ import print_function
+
+import argparse
+import math
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartcities.motion.scn6 import AXIS_NAMES, AxisLimits, PlatformKinematics, check_limits  # pylint: disable=import-error
+from smartcities.motion.simcraft import SimcraftSampler  # pylint: disable=import-error
+from smartcities.motion.telemetry import load_telemetry  # pylint: disable=import-error
+from smartcities.motion.washout import ClassicalWashout  # pylint: disable=import-error
+
+
+class SimControllerReference(object):
+    """Sample by sample port of the pulse computation of SimController.cs."""
+
+    def __init__(self, sensitivity):
+        self.sensitivity = sensitivity
+        self.angles = (0.0, 0.0, 0.0)
+        self.memcurvel = 0.0
+
+    @staticmethod
+    def clamp(value):
+        return min(max(value, 342.5), 360.0) if value >= 270.0 else min(max(value, 0.0), 17.5)
+
+    @staticmethod
+    def adapt_angle(value):
+        return 17.5 - value if 0.0 <= value <= 17.5 else 360.0 - value + 17.5
+
+    def pulses(self, pitch, yaw, roll, angular_velocity_y, velocity):
+        # ApplyMotionSample
+        angular_velocity_y = angular_velocity_y * 2 * math.pi / 360
+        pitch, yaw, roll = -pitch, -yaw, -roll
+        pitch += 360 if pitch < 0 else 0
+        yaw += 360 if yaw < 0 else 0
+        roll += 360 if roll < 0 else 0
+        velocity *= 5
+        # UpdateAngles
+        if pitch < 180:
+            self.angles = (pitch * self.sensitivity, yaw, roll)
+        if pitch > 300:
+            self.angles = (360 - (360 - pitch) * self.sensitivity, yaw, roll)
+        self.angles = tuple(self.clamp(angle) for angle in self.angles)
+        x, _, z = self.angles
+        # UpdateDevice
+        angular_velocity_y = min(max(angular_velocity_y, -6.0), 6.0)
+        pulses = [
+            int(self.adapt_angle(x) / .00175),
+            int(10000 - angular_velocity_y * 10000 / 6),
+            20000 - int(self.adapt_angle(z) / .00175)]
+        if velocity > self.memcurvel:
+            pulses[0] = pulses[0] + int((velocity - self.memcurvel) * 5000)
+            self.memcurvel = velocity
+        # SimController order (pitch, yaw rate, roll) to SCN6 axes (roll, pitch, yaw rate)
+        return pulses[2], pulses[0], pulses[1]
+
+
+def print_reports(title, reports):
+    print('\n%s' % title)
+    print('  %-9s %10s %10s %13s %15s %17s' % (
+        'axis', 'workspace', 'velocity', 'acceleration', 'peak velocity', 'peak acceleration'))
+    for report in reports:
+        print('  %-9s %10d %10d %13d %11.0f p/s %15.0f p/s2' % (
+            report.axis, report.workspace, report.velocity, report.acceleration,
+            report.peak_velocity, report.peak_acceleration))
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        'recording',
+        help='telemetry .npz file')
+    argparser.add_argument(
+        '--washout',
+        action='store_true',
+        help='check the washout filter cues instead of the raw attitude, as the client with --washout')
+    argparser.add_argument(
+        '--sensitivity',
+        default=0.7,
+        type=float,
+        help='pitch sensitivity, coefSens of SimController (default: 0.7)')
+    argparser.add_argument(
+        '--min_pulse',
+        default=0,
+        type=int,
+        help='lowest position of every axis in pulses (default: 0)')
+    argparser.add_argument(
+        '--max_pulse',
+        default=20000,
+        type=int,
+        help='highest position of every axis in pulses (default: 20000)')
+    argparser.add_argument(
+        '--max_velocity',
+        default=40000.0,
+        type=float,
+        help='velocity limit of every axis in pulses/s (default: 40000)')
+    argparser.add_argument(
+        '--max_acceleration',
+        default=400000.0,
+        type=float,
+        help='acceleration limit of every axis in pulses/s^2 (default: 400000)')
+    args = argparser.parse_args()
+
+    telemetry = load_telemetry(args.recording)
+    # The washout follows the step of the recording timestamps
+    sampler = SimcraftSampler(ClassicalWashout(1.0 / 60) if args.washout else None)
+    samples = np.array([sampler.sample(kinematics) for kinematics in telemetry], dtype=np.float64)
+    timestamps = telemetry.timestamp.astype(np.float64)
+    limits = (AxisLimits(args.min_pulse, args.max_pulse, args.max_velocity, args.max_acceleration),) * 3
+    print('%d frames (%.1f s)' % (len(telemetry), telemetry.duration()))
+
+    start = time.perf_counter()
+    targets = PlatformKinematics(args.sensitivity, limits).pulse_targets(samples)
+    vectorized_time = time.perf_counter() - start
+    reference = SimControllerReference(args.sensitivity)
+    start = time.perf_counter()
+    expected = np.array([reference.pulses(*sample) for sample in samples.astype(np.float32).tolist()])
+    reference_time = time.perf_counter() - start
+    mismatch = np.abs(targets - expected).max(axis=0)
+    print('\nMapping: %.2f us/sample vectorized, %.2f us/sample sample by sample' % (
+        vectorized_time / len(samples) * 1e6, reference_time / len(samples) * 1e6))
+    print('  largest difference with SimController: %s pulses' % ', '.join(
+        '%s %d' % (name, value) for name, value in zip(AXIS_NAMES, mismatch)))
+
+    print_reports('SimController pulses', check_limits(timestamps, targets, limits))
+
+    kinematics = PlatformKinematics(args.sensitivity, limits)
+    start = time.perf_counter()
+    pulses = kinematics.apply_limits(timestamps, targets)
+    limit_time = time.perf_counter() - start
+    reports = check_limits(timestamps, pulses, limits)
+    print_reports('Limited pulses (%.2f us/sample)' % (limit_time / len(samples) * 1e6), reports)
+    error = np.sqrt(np.mean(np.square(pulses - np.clip(targets, args.min_pulse, args.max_pulse)), axis=0))
+    print('  RMS tracking error: %s pulses' % ', '.join(
+        '%s %.0f' % (name, value) for name, value in zip(AXIS_NAMES, error)))
+
+    failed = (mismatch > 1).any() or any(
+        report.workspace or report.velocity or report.acceleration for report in reports)
+    if failed:
+        print('FAILED')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Benchmark of the latency tracing of the clients (smartcities.motion.tracing),
+without CARLA.
+
+A client frame records about --events trace events (server tick, the spans of
+the game loop and the motion hand-off). The cost of a span is timed with the
+LatencyTracer and with the NullTracer of untraced runs, alone and while
+--threads other threads record too (the motion scheduler thread), and the
+difference per frame is given as a share of a --fps frame. The script fails
+(exit status 1) if:
+
+  * the events, durations or latencies read back are not the ones recorded,
+    before and after the ring wraps around;
+  * an event read while other threads record is not one recorded, or its
+    thread has no name for the Chrome trace yet;
+  * the tracing costs more than --max_overhead percent of a frame.
+
+    python tracing_benchmark.py --fps 60 --events 8 --threads 1
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartcities.motion.tracing import LatencyTracer, NullTracer  # pylint: disable=import-error
+
+
+class FakeClock(object):
+    """Clock advanced by hand, one millisecond per reading by default."""
+
+    def __init__(self, step=1e-3):
+        self.now = 0.0
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+def check(capacity=64):
+    failed = []
+    tracer = LatencyTracer(capacity=capacity, clock=FakeClock())
+    frames = 3 * capacity // 2
+    for frame in range(frames):
+        tracer.mark('server_tick', frame)
+        begin = tracer.begin()
+        tracer.end('store_car_motion_info', begin, frame)
+    events = tracer.events()
+    if len(events['frame']) != capacity:
+        failed.append('%d events kept by a ring of %d' % (len(events['frame']), capacity))
+    expected = np.repeat(np.arange(frames - capacity // 2, frames), 2)
+    if not np.array_equal(events['frame'], expected):
+        failed.append('the ring does not keep the last events in order')
+    durations = tracer.durations('store_car_motion_info', events)
+    if not np.allclose(durations, 1e-3):
+        failed.append('span durations %s, not 1 ms' % np.unique(durations))
+    # Mark at t, begin at t + 1 ms and end at t + 2 ms
+    latency = tracer.latency('server_tick', 'store_car_motion_info', events)
+    if len(latency) != capacity // 2 or not np.allclose(latency, 2e-3):
+        failed.append('%d latencies of %s, not %d of 2 ms' % (len(latency), np.unique(latency), capacity // 2))
+    if len(tracer.latency('server_tick', 'missing', events)):
+        failed.append('latency to a stage never recorded')
+    # A ring that wraps and one that does not, where a slot not written yet reads as zeros
+    for threads_capacity in (capacity, 1 << 17):
+        failed.extend(check_threads(threads_capacity))
+    return failed
+
+
+def check_threads(capacity, threads=4, spans=20000):
+    """
+    Events read while 'threads' threads record, each with its index as the
+    frame, into a ring of 'capacity' events.
+    """
+    failed = []
+    tracer = LatencyTracer(capacity=capacity)
+    names = ['thread_%d' % index for index in range(threads)]
+    # All alive at once, so no thread gets the identifier of a finished one
+    started = threading.Barrier(threads)
+
+    def record(index):
+        started.wait()
+        for _ in range(spans):
+            begin = tracer.begin()
+            tracer.end(names[index], begin, index)
+
+    workers = [threading.Thread(target=record, args=(index,), name=names[index]) for index in range(threads)]
+    # Switch threads as often as possible, so a reader lands between the stores of an event
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    for worker in workers:
+        worker.start()
+    torn = unnamed = 0
+    try:
+        while any(worker.is_alive() for worker in workers):
+            events = tracer.events()
+            # Frame of each stage, and thread identifier of each frame, -1 until known
+            stage_frames = np.array([names.index(name) for name in tracer._stage_names])  # pylint: disable=protected-access
+            idents = {name: thread for thread, name in tracer._thread_names.items()}  # pylint: disable=protected-access
+            frame_threads = np.array([idents.get(name, -1) for name in names])
+            torn += int(np.count_nonzero(stage_frames[events['stage']] != events['frame']))
+            unnamed += int(np.count_nonzero(frame_threads[events['frame']] != events['thread']))
+    finally:
+        for worker in workers:
+            worker.join()
+        sys.setswitchinterval(switch_interval)
+    if torn:
+        failed.append('%d events read mix two recorded events (ring of %d)' % (torn, capacity))
+    if unnamed:
+        failed.append('%d events read without the name of their thread (ring of %d)' % (unnamed, capacity))
+    return failed
+
+
+def span_cost(tracer, spans):
+    """Seconds per begin() and end() pair."""
+    begin_time = time.perf_counter()
+    for frame in range(spans):
+        begin = tracer.begin()
+        tracer.end('game_loop', begin, frame)
+    return (time.perf_counter() - begin_time) / spans
+
+
+def contended_cost(tracer, spans, threads):
+    """Seconds per span of the main thread while 'threads' other threads record spans."""
+    stop = threading.Event()
+
+    def record():
+        while not stop.is_set():
+            begin = tracer.begin()
+            tracer.end('update_motion_platform', begin)
+            time.sleep(0)
+
+    workers = [threading.Thread(target=record) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    try:
+        return span_cost(tracer, spans)
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--spans',
+        default=200000,
+        type=int,
+        help='spans timed per case (default: 200000)')
+    argparser.add_argument(
+        '--events',
+        default=8,
+        type=int,
+        help='trace events per client frame (default: 8)')
+    argparser.add_argument(
+        '--fps',
+        default=60.0,
+        type=float,
+        help='client frame rate (default: 60)')
+    argparser.add_argument(
+        '--threads',
+        default=1,
+        type=int,
+        help='other threads recording during the contended case (default: 1)')
+    argparser.add_argument(
+        '--repeat',
+        default=5,
+        type=int,
+        help='runs per case, the fastest is kept (default: 5)')
+    argparser.add_argument(
+        '--max_overhead',
+        default=1.0,
+        type=float,
+        help='largest tracing cost in percent of a frame (default: 1)')
+    args = argparser.parse_args()
+
+    failed = check()
+
+    frame_time = 1.0 / args.fps
+    cases = (
+        ('alone', lambda tracer: span_cost(tracer, args.spans)),
+        ('contended, %d more' % args.threads, lambda tracer: contended_cost(tracer, args.spans, args.threads)),
+    )
+    print('%-20s %12s %12s %16s' % ('case', 'null (us)', 'traced (us)', '% of a frame'))
+    for name, cost in cases:
+        null = min(cost(NullTracer()) for _ in range(args.repeat))
+        traced = min(cost(LatencyTracer()) for _ in range(args.repeat))
+        overhead = 100.0 * args.events * (traced - null) / frame_time
+        print('%-20s %12.2f %12.2f %16.3f' % (name, null * 1e6, traced * 1e6, overhead))
+        if overhead > args.max_overhead:
+            failed.append('%d events per frame cost %.3f%% of a %.0f fps frame (%s), over %.3f%%' % (
+                args.events, overhead, args.fps, name, args.max_overhead))
+
+    for failure in failed:
+        print('FAILED: %s' % failure)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Check and benchmark of the actor track log of sensor_data_collection.py
+(smartcities.prediction.track_log), without CARLA.
+
+The simulated world of actor_tracker_check.py moves --actors vehicles and
+walkers, spawning and destroying vehicles, and an ActorTracker of both feeds a
+TrackLogger with small chunks, so the session spans many shards. The windows
+read back by TrackDataset are compared with the states of the simulated world.
+The script fails (exit status 1) if:
+
+  * a window of an actor on consecutive frames is missing, in particular one
+    across a shard boundary, or is yielded twice;
+  * the states of a window differ from the simulated ones;
+  * the chunks of the logger grew during the session.
+
+    python track_log_check.py --actors 500 --frames 1500
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from actor_tracker_check import SimulatedWorld
+from smartcities.prediction.track_log import TrackDataset, TrackLogger  # pylint: disable=import-error
+from smartcities.prediction.tracking import STATE_FIELDS, ActorTracker  # pylint: disable=import-error
+
+TRACKED_ACTORS = ('vehicle.*', 'walker.*')
+
+
+def expected_windows(rows, length):
+    """Dictionary of (id, last frame) to the states (T, F) of every window, from the rows of each frame."""
+    frame, actor, state = [np.concatenate(column) for column in zip(*rows)]
+    order = np.lexsort((frame, actor))
+    frame, actor, state = frame[order], actor[order], state[order]
+    windows = {}
+    for row in range(length - 1, len(frame)):
+        first = row - length + 1
+        if actor[first] == actor[row] and frame[row] - frame[first] == length - 1:
+            windows[(int(actor[row]), int(frame[row]))] = state[first:row + 1]
+    return windows
+
+
+def check_windows(dataset, rows, length, stride):
+    failed = []
+    expected = expected_windows(rows, length)
+    if stride > 1:
+        expected = {key: value for key, value in expected.items() if (key[1] - length + 1) % stride == 0}
+    seen = set()
+    for windows in dataset.windows(length, stride=stride, batch_size=500):
+        for actor, frame, states in zip(windows.ids.tolist(), windows.frames.tolist(), windows.states):
+            key = (actor, frame)
+            if key in seen:
+                failed.append('window of actor %d at frame %d yielded twice' % key)
+            elif key not in expected:
+                failed.append('window of actor %d at frame %d is not on consecutive frames' % key)
+            elif not np.array_equal(states, expected[key]):
+                failed.append('states of actor %d at frame %d differ' % key)
+            seen.add(key)
+    if len(seen) < len(expected):
+        missing = sorted(set(expected) - seen)
+        failed.append('%d of %d windows of %d frames missing, as actor %d at frame %d' % (
+            len(missing), len(expected), length, missing[0][0], missing[0][1]))
+    return failed[:10]
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--actors',
+        default=500,
+        type=int,
+        help='number of vehicles (default: 500)')
+    argparser.add_argument(
+        '--frames',
+        default=1500,
+        type=int,
+        help='frames simulated (default: 1500)')
+    argparser.add_argument(
+        '--churn',
+        default=2.0,
+        type=float,
+        help='mean number of vehicles spawned and destroyed per frame (default: 2)')
+    argparser.add_argument(
+        '--chunk_rows',
+        default=50000,
+        type=int,
+        help='rows per chunk of the logger (default: 50000, about 100 frames)')
+    argparser.add_argument(
+        '--window',
+        default=16,
+        type=int,
+        help='frames per window (default: 16)')
+    args = argparser.parse_args()
+    failed = []
+
+    world = SimulatedWorld(args.actors, 1)
+    tracker = ActorTracker(world, TRACKED_ACTORS, history_length=1)
+    dirname = tempfile.mkdtemp()
+    try:
+        logger = TrackLogger(dirname, args.chunk_rows, args.window)
+        nbytes = logger.nbytes
+        rows = []
+        times = []
+        for _ in range(args.frames):
+            world.tick(args.churn)
+            tracker.update()
+            start = time.perf_counter()
+            logger.record(tracker)
+            times.append(time.perf_counter() - start)
+            rows.append((np.full(tracker.count, tracker.frame), tracker.ids.copy(), tracker.state().astype(np.float32)))
+        logger.close()
+        tracker.destroy()
+        if logger.nbytes != nbytes:
+            failed.append('the chunks grew from %d to %d bytes' % (nbytes, logger.nbytes))
+
+        dataset = TrackDataset(dirname)
+        times = np.array(times) * 1e3
+        print('%d rows of %d frames in %d shards, %.1f MB of chunks' % (
+            logger.rows, logger.frames, len(dataset.shards), nbytes / 1e6))
+        print('record(): mean %.3f ms, p99 %.3f ms, max %.3f ms (%.0f rows/s)' % (
+            times.mean(), np.percentile(times, 99), times.max(), logger.rows / times.sum() * 1e3))
+        if dataset.types != ['vehicle.tesla.model3', 'walker.pedestrian.0001', 'vehicle.audi.tt']:
+            failed.append('types %s' % dataset.types)
+
+        failed += check_windows(dataset, rows, args.window, 1)
+        failed += check_windows(dataset, rows, 5, 3)
+
+        start = time.perf_counter()
+        count = 0
+        for windows in dataset.windows(args.window, batch_size=1024):
+            count += len(windows.ids)
+            assert windows.states.shape[1:] == (args.window, len(STATE_FIELDS))
+        elapsed = time.perf_counter() - start
+        print('%d windows of %d frames read in %.0f ms (%.0f windows/s)' % (
+            count, args.window, elapsed * 1e3, count / elapsed))
+    finally:
+        shutil.rmtree(dirname)
+
+    for failure in failed:
+        print('FAILED: %s' % failure)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    main()
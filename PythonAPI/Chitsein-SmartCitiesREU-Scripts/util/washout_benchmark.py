@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Benchmark of the classical washout filter on a synthetic drive.
+
+The whole drive is cued once in batch (offline) mode and once sample by sample
+(live mode). Both must give the same cues; the script prints the time of each
+mode and the largest difference between them, and fails (exit status 1) if
+the difference is over --tolerance.
+
+    python washout_benchmark.py --minutes 30 --rate 60
+"""
+
+from __future__ import print_function
+
+import argparse
+import math
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('cannot import numpy, make sure numpy package is installed')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartcities.motion.washout import ClassicalWashout  # pylint: disable=import-error
+
+
+def synthetic_drive(samples, dt, seed):
+    """Braking, accelerating and cornering on a hilly road, with sensor noise."""
+    rng = np.random.RandomState(seed)
+    t = np.arange(samples) * dt
+    accel = np.stack((
+        3.0 * np.sin(2.0 * np.pi * 0.05 * t) + np.where(np.sin(2.0 * np.pi * 0.01 * t) > 0.95, -6.0, 0.0),
+        4.0 * np.sin(2.0 * np.pi * 0.03 * t) ** 3,
+        0.3 * np.sin(2.0 * np.pi * 1.5 * t)), axis=1)
+    accel += rng.normal(0.0, 0.2, accel.shape)
+    yaw_rate = 0.3 * np.sin(2.0 * np.pi * 0.03 * t)
+    angles = np.stack((
+        0.02 * np.sin(2.0 * np.pi * 0.2 * t),
+        0.05 * np.sin(2.0 * np.pi * 0.005 * t),
+        (np.cumsum(yaw_rate) * dt + math.pi) % (2.0 * math.pi) - math.pi), axis=1)
+    return accel, angles
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--minutes',
+        default=30.0,
+        type=float,
+        help='length of the synthetic drive in minutes (default: 30)')
+    argparser.add_argument(
+        '--rate',
+        default=60.0,
+        type=float,
+        help='sample rate in Hz (default: 60)')
+    argparser.add_argument(
+        '--seed',
+        default=0,
+        type=int,
+        help='random seed (default: 0)')
+    argparser.add_argument(
+        '--tolerance',
+        default=1e-9,
+        type=float,
+        help='largest difference allowed between the batch and live cues (default: 1e-9)')
+    args = argparser.parse_args()
+
+    dt = 1.0 / args.rate
+    samples = int(args.minutes * 60.0 * args.rate)
+    accel, angles = synthetic_drive(samples, dt, args.seed)
+
+    batch = ClassicalWashout(dt)
+    start = time.perf_counter()
+    cues = batch.filter(accel, angles)
+    batch_time = time.perf_counter() - start
+
+    live = ClassicalWashout(dt)
+    start = time.perf_counter()
+    steps = [live.step(accel[i], angles[i]) for i in range(samples)]
+    live_time = time.perf_counter() - start
+
+    error = max(np.abs(cues[k] - np.array([cue[k] for cue in steps])).max() for k in range(len(cues)))
+    print('Drive:       %d samples (%.1f min at %.0f Hz)' % (samples, args.minutes, args.rate))
+    print('Batch mode:  %.1f ms' % (batch_time * 1e3))
+    print('Live mode:   %.1f ms (%.1f us/sample)' % (live_time * 1e3, live_time / samples * 1e6))
+    print('Max difference: %.3g' % error)
+    print('Peak tilt:   %.1f deg, peak onset %.2f m/s^2' % (
+        math.degrees(np.abs(cues.angles[:, :2]).max()), np.abs(cues.accel).max()))
+    if not error <= args.tolerance:
+        print('FAILED: batch and live cues differ by %.3g, over %.3g' % (error, args.tolerance))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    main()